@@ -0,0 +1,345 @@
+"""
+📥 Gravação Assíncrona de Analytics em Lote
+Tira a escrita de analytics do caminho dos comandos:
+
+- ``track_command_usage`` / ``log_error`` só colocam o evento numa fila em
+  memória e retornam na hora; nada de sessão, commit ou ``time.sleep`` no
+  event loop do bot;
+- Uma tarefa em segundo plano esvazia a fila a cada ``ANALYTICS_FLUSH_MS`` ms
+  ou quando ``ANALYTICS_BATCH_SIZE`` eventos se acumulam, e grava o lote numa
+  thread (um INSERT em lote e os contadores de usuários diários atualizados
+  de uma vez, ver ``BotAnalyticsPostgreSQL.write_batch``);
+- A fila é limitada (``ANALYTICS_QUEUE_MAX``): quando está cheia o evento é
+  descartado e contado em ``stats()['descartados']``;
+- Um lote que falha fica separado da fila e é regravado sozinho, com espera
+  crescente, antes dos eventos novos; depois de ``ANALYTICS_MAX_TENTATIVAS``
+  falhas ele é dividido ao meio, até isolar o evento que o banco rejeita,
+  que é descartado. Um lote ruim não trava a gravação dos demais;
+- ``parar()`` (chamado no post_shutdown da aplicação) grava o que restou;
+- Sketches de latência por (hora, comando) das últimas
+  ``ANALYTICS_SKETCH_HORAS`` horas ficam em memória (``latencias_recentes``),
+  para p50/p95/p99 do processo sem ir ao banco;
+- Cada comando também entra no histograma de handlers de ``metricas`` e o
+  estado da fila é exposto no ``/metrics``.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import metricas
+from analytics.latency_sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+FLUSH_MS = int(os.getenv("ANALYTICS_FLUSH_MS", "1000"))
+MAX_ESPERA_FALHA_S = 30
+BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "200"))
+QUEUE_MAX = int(os.getenv("ANALYTICS_QUEUE_MAX", "10000"))
+SKETCH_HORAS = int(os.getenv("ANALYTICS_SKETCH_HORAS", "24"))
+MAX_TENTATIVAS = int(os.getenv("ANALYTICS_MAX_TENTATIVAS", "3"))
+
+# (comandos, erros, tentativas já feitas)
+LoteRetido = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]
+
+
+class AnalyticsBatchWriter:
+    """Fila limitada de eventos de analytics gravada em lote por uma tarefa assíncrona."""
+
+    def __init__(self, backend, flush_ms: int = FLUSH_MS, batch_size: int = BATCH_SIZE,
+                 max_fila: int = QUEUE_MAX):
+        self.backend = backend
+        self.flush_ms = flush_ms
+        self.batch_size = batch_size
+        self.max_fila = max_fila
+        self._comandos: List[Dict[str, Any]] = []
+        self._erros: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self._cheio: Optional[asyncio.Event] = None
+        self.enfileirados = 0
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+        self.lotes = 0
+        self._falhas_seguidas = 0
+        self._retidos: Deque[LoteRetido] = deque()
+        self._em_retentativa = 0
+        self._sketches: Dict[Tuple[datetime, str], LatencySketch] = {}
+
+    # ------------------------------------------------------------------
+    #  Produtores (chamados pelos handlers, nunca bloqueiam)
+    # ------------------------------------------------------------------
+
+    def track_command_usage(self, user_id: int, username: str, command: str,
+                            success: bool = True, execution_time_ms: Optional[int] = 0,
+                            parameters: Dict = None) -> None:
+        metricas.registrar_comando(command, execution_time_ms, success)
+        # Um único relógio (UTC, como os rollups) para o evento, o dia e o momento
+        agora = datetime.utcnow()
+        self._enfileirar(self._comandos, {
+            "user_id": user_id,
+            "username": username,
+            "command": command,
+            "success": success,
+            "execution_time_ms": execution_time_ms,
+            "parameters": parameters,
+            "timestamp": agora,
+            "dia": agora.date(),
+            "momento": agora,
+        })
+
+    def log_error(self, error_type: str = None, error_message: str = None, stack_trace: str = None,
+                  user_id: int = None, username: str = None, command: str = None,
+                  metadata: Dict = None) -> None:
+        self._enfileirar(self._erros, {
+            "user_id": user_id,
+            "username": username,
+            "command": command,
+            "error_type": error_type or "Erro",
+            "error_message": error_message or "",
+            "stack_trace": stack_trace,
+            "metadata": metadata,
+            "timestamp": datetime.utcnow(),
+        })
+
+    def _registrar_latencias(self, comandos: List[Dict[str, Any]]) -> None:
+        limite = datetime.utcnow() - timedelta(hours=SKETCH_HORAS)
+        with self._lock:
+            for evento in comandos:
+                hora = evento["timestamp"].replace(minute=0, second=0, microsecond=0)
+                chave = (hora, evento["command"] or "")
+                self._sketches.setdefault(chave, LatencySketch()).add(evento["execution_time_ms"] or 0)
+            for chave in [c for c in self._sketches if c[0] < limite]:
+                del self._sketches[chave]
+
+    def latencias_recentes(self, horas: int = 1) -> Dict[str, LatencySketch]:
+        """Sketch de latência de cada comando nas últimas ``horas`` horas (em memória, deste processo)."""
+        desde = (datetime.utcnow() - timedelta(hours=horas - 1)).replace(minute=0, second=0, microsecond=0)
+        por_comando: Dict[str, LatencySketch] = {}
+        with self._lock:
+            for (hora, comando), sketch in self._sketches.items():
+                if hora >= desde:
+                    por_comando.setdefault(comando, LatencySketch()).merge(sketch)
+        return por_comando
+
+    def _enfileirar(self, fila: List[Dict[str, Any]], evento: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._comandos) + len(self._erros) + self._em_retentativa >= self.max_fila:
+                self.descartados += 1
+                return
+            fila.append(evento)
+            self.enfileirados += 1
+            tamanho = len(self._comandos) + len(self._erros)
+        self._garantir_tarefa()
+        if tamanho >= self.batch_size and self._cheio is not None and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._cheio.set)
+            except RuntimeError:
+                pass  # loop já encerrado; parar() grava o restante
+
+    # ------------------------------------------------------------------
+    #  Consumidor
+    # ------------------------------------------------------------------
+
+    def _garantir_tarefa(self) -> None:
+        if self._tarefa is not None and not self._tarefa.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # fora do event loop: a tarefa sobe no próximo evento (ou em iniciar())
+        self._loop = loop
+        self._cheio = asyncio.Event()
+        self._tarefa = loop.create_task(self._drenar())
+
+    async def iniciar(self) -> None:
+        """Sobe a tarefa de gravação (post_init da aplicação)."""
+        self._garantir_tarefa()
+
+    async def _drenar(self) -> None:
+        while True:
+            espera = self.flush_ms / 1000
+            if self._falhas_seguidas:
+                # Banco fora do ar: espaça as tentativas em vez de martelar a cada ciclo
+                espera = min(espera * 2 ** self._falhas_seguidas, MAX_ESPERA_FALHA_S)
+            try:
+                await asyncio.wait_for(self._cheio.wait(), timeout=espera)
+            except asyncio.TimeoutError:
+                pass
+            self._cheio.clear()
+            await self.flush()
+
+    def _retirar_lote(self):
+        with self._lock:
+            comandos, self._comandos = self._comandos, []
+            erros, self._erros = self._erros, []
+        return comandos, erros
+
+    async def flush(self) -> None:
+        """Grava numa thread os lotes retidos (primeiro) e tudo o que está na fila."""
+        while self._retidos:
+            comandos, erros, tentativas = self._retidos.popleft()
+            if not await self._tentar(comandos, erros, tentativas):
+                return  # banco ainda falhando: espera o próximo ciclo (com backoff)
+        comandos, erros = self._retirar_lote()
+        # Latências entram uma única vez, quando o evento sai da fila (não a cada nova tentativa)
+        self._registrar_latencias(comandos)
+        if comandos or erros:
+            await self._tentar(comandos, erros, 0)
+
+    async def _tentar(self, comandos: List[Dict[str, Any]], erros: List[Dict[str, Any]],
+                      tentativas: int) -> bool:
+        if await asyncio.to_thread(self._gravar, comandos, erros):
+            if tentativas:
+                with self._lock:
+                    self._em_retentativa -= len(comandos) + len(erros)
+            return True
+        self._reter(comandos, erros, tentativas + 1)
+        return False
+
+    def _gravar(self, comandos: List[Dict[str, Any]], erros: List[Dict[str, Any]]) -> bool:
+        try:
+            if hasattr(self.backend, "write_batch"):
+                self.backend.write_batch(comandos, erros)
+            else:
+                self._gravar_um_a_um(comandos, erros)
+            self.gravados += len(comandos) + len(erros)
+            self.lotes += 1
+            self._falhas_seguidas = 0
+            return True
+        except Exception as e:
+            self.falhas += 1
+            self._falhas_seguidas += 1
+            logger.error(f"❌ Erro ao gravar lote de analytics ({len(comandos)} comandos, {len(erros)} erros): {e}")
+            return False
+
+    def _gravar_um_a_um(self, comandos: List[Dict[str, Any]], erros: List[Dict[str, Any]]) -> None:
+        # Backends sem gravação em lote (mock local)
+        for evento in comandos:
+            self.backend.track_command_usage(
+                evento["user_id"], evento["username"], evento["command"],
+                evento["success"], evento["execution_time_ms"],
+            )
+        log_error = getattr(self.backend, "log_error", None)
+        for evento in erros if log_error else ():
+            log_error(
+                error_type=evento["error_type"], error_message=evento["error_message"],
+                stack_trace=evento["stack_trace"], user_id=evento["user_id"],
+                username=evento["username"], command=evento["command"],
+            )
+
+    def _reter(self, comandos: List[Dict[str, Any]], erros: List[Dict[str, Any]], tentativas: int) -> None:
+        """
+        Guarda um lote que falhou para ser regravado antes dos eventos novos. Esgotadas
+        as tentativas, divide o lote ao meio (cada metade recomeça a contagem); um evento
+        sozinho que continua falhando é descartado.
+        """
+        total = len(comandos) + len(erros)
+        with self._lock:
+            if tentativas == 1:
+                self._em_retentativa += total
+            if tentativas < MAX_TENTATIVAS:
+                self._retidos.appendleft((comandos, erros, tentativas))
+                return
+            if total == 1:
+                self._em_retentativa -= 1
+                self.descartados += 1
+                logger.error(f"🗑️ Evento de analytics descartado após {tentativas} tentativas de gravação")
+                return
+            # Metades recomeçam em 1 tentativa (já contam em _em_retentativa); nenhuma fica vazia
+            if comandos and erros:
+                metades = [(comandos, [], 1), ([], erros, 1)]
+            else:
+                eventos, eh_comando = (comandos, True) if comandos else (erros, False)
+                meio = len(eventos) // 2
+                metades = [(parte, [], 1) if eh_comando else ([], parte, 1)
+                           for parte in (eventos[:meio], eventos[meio:])]
+            self._retidos.extendleft(reversed(metades))
+
+    async def parar(self) -> None:
+        """Encerra a tarefa de gravação e tenta gravar uma última vez o que restou (post_shutdown)."""
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        comandos, erros = self._retirar_lote()
+        self._registrar_latencias(comandos)
+        pendentes = list(self._retidos) + [(comandos, erros, 0)]
+        self._retidos.clear()
+        for comandos, erros, _ in pendentes:
+            if (comandos or erros) and not await asyncio.to_thread(self._gravar, comandos, erros):
+                self.descartados += len(comandos) + len(erros)
+        self._em_retentativa = 0
+        logger.info(f"📥 Analytics encerrado: {self.gravados} evento(s) gravado(s), {self.descartados} descartado(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            na_fila = len(self._comandos) + len(self._erros)
+            em_retentativa = self._em_retentativa
+        return {
+            "na_fila": na_fila,
+            "em_retentativa": em_retentativa,
+            "enfileirados": self.enfileirados,
+            "gravados": self.gravados,
+            "descartados": self.descartados,
+            "falhas": self.falhas,
+            "lotes": self.lotes,
+        }
+
+    def __getattr__(self, nome):
+        # Consultas (get_daily_stats etc.) continuam indo direto ao backend
+        if nome == "backend":
+            raise AttributeError(nome)
+        return getattr(self.backend, nome)
+
+
+_writer: Optional[AnalyticsBatchWriter] = None
+
+
+def _coletar_fila():
+    dados = _writer.stats() if _writer is not None else {}
+    prefixo = f"{metricas.PREFIXO}_analytics"
+    yield f"{prefixo}_queue_depth", "gauge", "Eventos de analytics aguardando gravação.", [({}, dados.get("na_fila", 0))]
+    yield f"{prefixo}_events_dropped_total", "counter", "Eventos de analytics descartados (fila cheia).", [({}, dados.get("descartados", 0))]
+    yield f"{prefixo}_write_failures_total", "counter", "Lotes de analytics que falharam ao gravar.", [({}, dados.get("falhas", 0))]
+
+
+def get_batch_writer(backend=None) -> AnalyticsBatchWriter:
+    """Retorna o gravador em lote compartilhado (criado sobre ``backend`` na primeira chamada)."""
+    global _writer
+    if _writer is None:
+        if backend is None:
+            from analytics.bot_analytics_postgresql import get_analytics
+            backend = get_analytics()
+        _writer = AnalyticsBatchWriter(backend)
+        metricas.get_registro().registrar_coletor(_coletar_fila)
+    return _writer
+
+
+async def iniciar_analytics(application) -> None:
+    """post_init: sobe a gravação de analytics no event loop da aplicação."""
+    if _writer is not None:
+        await _writer.iniciar()
+
+
+async def encerrar_analytics(application) -> None:
+    """post_shutdown: grava os eventos que ainda estão na fila."""
+    if _writer is not None:
+        await _writer.parar()
+
+
+__all__ = [
+    'AnalyticsBatchWriter',
+    'encerrar_analytics',
+    'get_batch_writer',
+    'iniciar_analytics',
+]
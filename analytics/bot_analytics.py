@@ -26,8 +26,9 @@ def _initialize_analytics():
     try:
         # Se estiver no Render, usar PostgreSQL
         if os.environ.get('DATABASE_URL'):
+            from analytics.batch_writer import get_batch_writer
             from analytics.bot_analytics_postgresql import get_analytics
-            _analytics_instance = get_analytics()
+            _analytics_instance = get_batch_writer(get_analytics())
             logger.info("✅ Analytics PostgreSQL carregado via compatibilidade")
         else:
             # Modo local - criar mock básico
@@ -6,20 +6,28 @@ Sistema de analytics que usa o PostgreSQL em vez de SQLite
 import logging
 import json
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import os
-from sqlalchemy import create_engine, Column, BigInteger, String, DateTime, Boolean, Text, Float
+from sqlalchemy import create_engine, Column, BigInteger, String, Date, DateTime, Boolean, Text, Float, Index, LargeBinary, UniqueConstraint, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.sql import func
 
 import functools
 
+import metricas
+
 # Base para modelos SQLAlchemy
 Base = declarative_base()
 
 class CommandUsage(Base):
     __tablename__ = 'analytics_command_usage'
+    __table_args__ = (
+        Index('ix_analytics_command_usage_timestamp', 'timestamp'),
+        Index('ix_analytics_command_usage_command_timestamp', 'command', 'timestamp'),
+        Index('ix_analytics_command_usage_user_id', 'user_id'),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, nullable=False)  # ✅ BigInteger para IDs do Telegram
@@ -32,16 +40,25 @@ class CommandUsage(Base):
 
 class DailyUsers(Base):
     __tablename__ = 'analytics_daily_users'
+    __table_args__ = (
+        # Uma linha por usuário por dia: o contador é um INSERT ... ON CONFLICT DO UPDATE
+        UniqueConstraint('user_id', 'day', name='uq_analytics_daily_users_user_day'),
+        Index('ix_analytics_daily_users_day', 'day'),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, nullable=False)  # ✅ BigInteger para IDs do Telegram
     username = Column(String(255))
-    date = Column(DateTime, nullable=False)
+    date = Column(DateTime, nullable=False)  # momento do primeiro comando do dia (UTC)
+    day = Column(Date, nullable=False)  # dia UTC
     first_command = Column(String(255))
     total_commands = Column(BigInteger, default=1)  # ✅ BigInteger para contadores
 
 class ErrorLogs(Base):
     __tablename__ = 'analytics_error_logs'
+    __table_args__ = (
+        Index('ix_analytics_error_logs_timestamp', 'timestamp'),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger)  # ✅ BigInteger para IDs do Telegram
@@ -53,6 +70,45 @@ class ErrorLogs(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     extra_data = Column(Text)  # JSON - renomeado de 'metadata'
 
+class _RollupComandos:
+    """Contadores somáveis de um comando num intervalo (mantidos pelo gravador em lote)."""
+    command = Column(String(255), nullable=False)  # '' para erros sem comando
+    total = Column(BigInteger, nullable=False, default=0, server_default='0')
+    successes = Column(BigInteger, nullable=False, default=0, server_default='0')
+    error_logs = Column(BigInteger, nullable=False, default=0, server_default='0')
+    latency_sum_ms = Column(BigInteger, nullable=False, default=0, server_default='0')
+    latency_max_ms = Column(BigInteger, nullable=False, default=0, server_default='0')
+    # Histograma de latência: b_N conta execuções em (limite anterior, N] ms
+    b_100 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_250 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_500 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_1000 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_2500 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_5000 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_10000 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_30000 = Column(BigInteger, nullable=False, default=0, server_default='0')
+    b_inf = Column(BigInteger, nullable=False, default=0, server_default='0')
+    # Sketch de latência mesclável (analytics/latency_sketch.py) para p50/p95/p99
+    latency_sketch = Column(LargeBinary)
+
+class CommandRollupHourly(_RollupComandos, Base):
+    __tablename__ = 'analytics_rollup_hourly'
+    __table_args__ = (
+        UniqueConstraint('hour', 'command', name='uq_analytics_rollup_hourly_hour_command'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    hour = Column(DateTime, nullable=False)  # início da hora (UTC, como CommandUsage.timestamp)
+
+class CommandRollupDaily(_RollupComandos, Base):
+    __tablename__ = 'analytics_rollup_daily'
+    __table_args__ = (
+        UniqueConstraint('day', 'command', name='uq_analytics_rollup_daily_day_command'),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)  # dia UTC
+
 class BotAnalyticsPostgreSQL:
     def __init__(self):
         """Inicializa analytics com PostgreSQL"""
@@ -92,6 +148,7 @@ class BotAnalyticsPostgreSQL:
                 **ssl_args
             )
             self.Session = sessionmaker(bind=self.engine)
+            metricas.registrar_engine("analytics", self.engine)
             
             # Criar tabelas
             Base.metadata.create_all(self.engine)
@@ -138,32 +195,92 @@ class BotAnalyticsPostgreSQL:
                     import time
                     time.sleep(0.5 * (attempt + 1))  # Backoff progressivo
     
+    def write_batch(self, commands: List[Dict[str, Any]], errors: List[Dict[str, Any]] = ()):
+        """
+        Grava um lote de eventos do AnalyticsBatchWriter numa única transação:
+        INSERT em lote dos comandos e erros, os contadores de usuários
+        diários incrementados de uma vez por (usuário, dia) e os rollups
+        horário/diário por comando (analytics/rollups.py).
+        """
+        if not self.Session:
+            return
+
+        with self.Session() as session:
+            if commands:
+                session.execute(insert(CommandUsage), [
+                    {
+                        'user_id': c['user_id'],
+                        'username': c['username'],
+                        'command': c['command'],
+                        'success': c['success'],
+                        'execution_time_ms': c['execution_time_ms'],
+                        'parameters': json.dumps(c['parameters']) if c.get('parameters') else None,
+                        'timestamp': c['timestamp'],
+                    }
+                    for c in commands
+                ])
+                self._upsert_daily_users(session, commands)
+            if errors:
+                session.execute(insert(ErrorLogs), [
+                    {
+                        'user_id': e['user_id'],
+                        'username': e['username'],
+                        'command': e['command'],
+                        'error_type': e['error_type'],
+                        'error_message': e['error_message'],
+                        'stack_trace': e['stack_trace'],
+                        'extra_data': json.dumps(e['metadata']) if e.get('metadata') else None,
+                        'timestamp': e['timestamp'],
+                    }
+                    for e in errors
+                ])
+            # Rollups do dashboard na mesma transação dos eventos brutos
+            from analytics.rollups import gravar_rollups
+            gravar_rollups(session, commands, errors)
+            session.commit()
+
+    def _upsert_daily_users(self, session: Session, commands: List[Dict[str, Any]]):
+        """Soma os comandos do lote por (usuário, dia) e grava tudo num único INSERT ... ON CONFLICT."""
+        linhas: Dict[Any, Dict[str, Any]] = {}
+        for c in commands:
+            if c['user_id'] is None:
+                continue
+            atual = linhas.setdefault((c['user_id'], c['dia']), {
+                'user_id': c['user_id'],
+                'day': c['dia'],
+                'username': c['username'],
+                'date': c['momento'],
+                'first_command': c['command'],
+                'total_commands': 0,
+            })
+            atual['username'] = c['username']
+            atual['total_commands'] += 1
+        if linhas:
+            session.execute(self._upsert_daily_users_stmt(session), list(linhas.values()))
+
+    def _upsert_daily_users_stmt(self, session: Session):
+        dialeto = postgresql if session.get_bind().dialect.name == 'postgresql' else sqlite
+        stmt = dialeto.insert(DailyUsers)
+        return stmt.on_conflict_do_update(
+            index_elements=[DailyUsers.user_id, DailyUsers.day],
+            set_={
+                'total_commands': DailyUsers.total_commands + stmt.excluded.total_commands,
+                'username': stmt.excluded.username,
+            },
+        )
+
     def _update_daily_user(self, session: Session, user_id: int, username: str, command: str):
         """Atualiza estatísticas de usuário diário"""
         try:
-            today = datetime.now().date()
-            
-            # Buscar usuário do dia
-            daily_user = session.query(DailyUsers).filter(
-                DailyUsers.user_id == user_id,
-                func.date(DailyUsers.date) == today
-            ).first()
-            
-            if daily_user:
-                # Incrementar comandos
-                daily_user.total_commands += 1
-                daily_user.username = username
-            else:
-                # Criar novo usuário do dia
-                daily_user = DailyUsers(
-                    user_id=user_id,
-                    username=username,
-                    date=datetime.now(),
-                    first_command=command,
-                    total_commands=1
-                )
-                session.add(daily_user)
-            
+            agora = datetime.utcnow()
+            session.execute(self._upsert_daily_users_stmt(session), [{
+                'user_id': user_id,
+                'day': agora.date(),
+                'username': username,
+                'date': agora,
+                'first_command': command,
+                'total_commands': 1,
+            }])
             session.commit()
             
         except Exception as e:
@@ -207,53 +324,50 @@ class BotAnalyticsPostgreSQL:
             return {'error': 'Analytics não disponível'}
             
         if not date:
-            date = datetime.now().date()
+            date = datetime.utcnow().date()
+        elif isinstance(date, str):
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        # Intervalo meio-aberto sobre o timestamp: usa os índices em vez de date(timestamp)
+        inicio, fim = _intervalo_dias(date, date)
         
         try:
             with self.Session() as session:
                 # Usuários únicos
-                unique_users = session.query(DailyUsers).filter(
-                    func.date(DailyUsers.date) == date
-                ).count()
+                unique_users = session.query(func.count(DailyUsers.id)).filter(
+                    DailyUsers.day == date
+                ).scalar() or 0
                 
-                # Total de comandos
-                total_commands = session.query(CommandUsage).filter(
-                    func.date(CommandUsage.timestamp) == date
-                ).count()
+                # Total de comandos, sucessos e tempo médio numa única varredura
+                total_commands, success_count, avg_time = session.query(
+                    func.count(CommandUsage.id),
+                    func.count(CommandUsage.id).filter(CommandUsage.success == True),
+                    func.avg(CommandUsage.execution_time_ms).filter(CommandUsage.execution_time_ms > 0),
+                ).filter(
+                    CommandUsage.timestamp >= inicio,
+                    CommandUsage.timestamp < fim
+                ).one()
                 
                 # Comandos mais usados
                 top_commands = session.query(
                     CommandUsage.command,
                     func.count(CommandUsage.id).label('count')
                 ).filter(
-                    func.date(CommandUsage.timestamp) == date
+                    CommandUsage.timestamp >= inicio,
+                    CommandUsage.timestamp < fim
                 ).group_by(CommandUsage.command).order_by(
                     func.count(CommandUsage.id).desc()
                 ).limit(10).all()
                 
                 # Erros do dia
-                errors_count = session.query(ErrorLogs).filter(
-                    func.date(ErrorLogs.timestamp) == date
-                ).count()
-                
-                # Taxa de sucesso
-                success_count = session.query(CommandUsage).filter(
-                    func.date(CommandUsage.timestamp) == date,
-                    CommandUsage.success == True
-                ).count()
+                errors_count = session.query(func.count(ErrorLogs.id)).filter(
+                    ErrorLogs.timestamp >= inicio,
+                    ErrorLogs.timestamp < fim
+                ).scalar() or 0
                 
                 success_rate = 0
                 if total_commands > 0:
                     success_rate = (success_count / total_commands) * 100
                 
-                # Tempo médio de execução
-                avg_time = session.query(
-                    func.avg(CommandUsage.execution_time_ms)
-                ).filter(
-                    func.date(CommandUsage.timestamp) == date,
-                    CommandUsage.execution_time_ms > 0
-                ).scalar() or 0
-                
                 return {
                     'date': str(date),
                     'unique_users': unique_users,
@@ -274,21 +388,22 @@ class BotAnalyticsPostgreSQL:
             return {'error': 'Analytics não disponível'}
             
         try:
-            end_date = datetime.now().date() - timedelta(weeks=weeks_back * 7)
+            end_date = datetime.utcnow().date() - timedelta(weeks=weeks_back * 7)
             start_date = end_date - timedelta(days=6)
+            inicio, fim = _intervalo_dias(start_date, end_date)
             
             with self.Session() as session:
                 # Usuários únicos da semana
                 unique_users = session.query(func.count(func.distinct(DailyUsers.user_id))).filter(
-                    func.date(DailyUsers.date) >= start_date,
-                    func.date(DailyUsers.date) <= end_date
+                    DailyUsers.day >= start_date,
+                    DailyUsers.day <= end_date
                 ).scalar() or 0
                 
                 # Total de comandos
-                total_commands = session.query(CommandUsage).filter(
-                    func.date(CommandUsage.timestamp) >= start_date,
-                    func.date(CommandUsage.timestamp) <= end_date
-                ).count()
+                total_commands = session.query(func.count(CommandUsage.id)).filter(
+                    CommandUsage.timestamp >= inicio,
+                    CommandUsage.timestamp < fim
+                ).scalar() or 0
                 
                 return {
                     'period': f"{start_date} a {end_date}",
@@ -300,6 +415,14 @@ class BotAnalyticsPostgreSQL:
             logging.error(f"❌ Erro ao obter estatísticas semanais: {e}")
             return {'error': str(e)}
 
+
+def _intervalo_dias(primeiro_dia, ultimo_dia):
+    """[00:00 do primeiro dia, 00:00 do dia seguinte ao último) para filtrar timestamps por faixa."""
+    return (
+        datetime.combine(primeiro_dia, datetime.min.time()),
+        datetime.combine(ultimo_dia + timedelta(days=1), datetime.min.time()),
+    )
+
 # Singleton global para uso no sistema
 analytics_pg = None
 
@@ -328,8 +451,9 @@ def track_command(command_name: str):
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(update, context, *args, **kwargs):
-            # Obter a instância correta do analytics
-            pg_analytics = get_analytics()
+            # Eventos vão para a fila do gravador em lote, nunca direto ao banco
+            from analytics.batch_writer import get_batch_writer
+            pg_analytics = get_batch_writer(get_analytics())
             
             user = update.effective_user
             user_id = user.id if user else None
@@ -10,7 +10,7 @@ import logging
 import json
 from functools import wraps
 from flask import Flask, render_template, jsonify, request, g
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +18,7 @@ logger = logging.getLogger(__name__)
 
 # Cache simples em memória (para substituir Redis em ambiente local)
 _cache = {}
+_cache_contagem = {'hits': 0, 'misses': 0}
 CACHE_TTL = 300  # 5 minutos
 
 def cache_key(*args):
@@ -37,7 +38,9 @@ def cached(ttl=CACHE_TTL):
                 cached_data, cached_time = _cache[key]
                 if now - cached_time < ttl:
                     logger.debug(f"Cache hit: {func.__name__}")
+                    _cache_contagem['hits'] += 1
                     return cached_data
+            _cache_contagem['misses'] += 1
             
             # Executar função e cachear resultado
             result = func(*args, **kwargs)
@@ -54,6 +57,14 @@ template_dir = os.path.join(parent_dir, 'templates')
 static_dir = os.path.join(parent_dir, 'static')
 sys.path.insert(0, parent_dir)
 
+import metricas
+
+HTTP_DURACAO = metricas.get_registro().histograma(
+    f"{metricas.PREFIXO}_http_request_duration_seconds", "Duração das requisições do dashboard.", ("endpoint",))
+HTTP_RESPOSTAS = metricas.get_registro().contador(
+    f"{metricas.PREFIXO}_http_responses_total", "Respostas do dashboard por endpoint e status.", ("endpoint", "status"))
+metricas.registrar_cache("dashboard_api", lambda: _cache_contagem)
+
 # Criar app Flask
 app = Flask(__name__, 
            template_folder=template_dir,
@@ -103,6 +114,22 @@ def execute_with_retry(func, max_retries=3):
                 raise
     return None
 
+def _consultar(consulta):
+    """Executa ``consulta(session)`` numa sessão do analytics e fecha a sessão."""
+    from analytics.bot_analytics_postgresql import get_session
+    session = get_session()
+    if not session:
+        raise Exception("Sessão não criada")
+    try:
+        return consulta(session)
+    finally:
+        session.close()
+
+def _hora_local(hora_utc):
+    """Rótulo HH:00 no fuso do servidor para uma hora UTC dos rollups."""
+    deslocamento = timedelta(minutes=round((datetime.now() - datetime.utcnow()).total_seconds() / 60))
+    return (hora_utc + deslocamento).strftime('%H:00')
+
 # Middleware para timing de requisições
 @app.before_request
 def before_request():
@@ -113,6 +140,10 @@ def after_request(response):
     if hasattr(g, 'start_time'):
         duration = (datetime.now() - g.start_time).total_seconds() * 1000
         response.headers['X-Response-Time'] = f"{duration:.2f}ms"
+        # Rótulo pela regra da rota (/api/...), não pela URL, para manter a cardinalidade fixa
+        endpoint = request.url_rule.rule if request.url_rule else 'desconhecido'
+        HTTP_DURACAO.observe(duration / 1000, endpoint=endpoint)
+        HTTP_RESPOSTAS.inc(endpoint=endpoint, status=response.status_code)
     return response
 
 # --- ROTAS PRINCIPAIS ---
@@ -149,40 +180,21 @@ def realtime_stats():
         return jsonify(get_fallback_data())
     
     def get_real_data():
-        from analytics.bot_analytics_postgresql import get_session
-        from sqlalchemy import text
-        
-        session = get_session()
-        if not session:
-            raise Exception("Sessão não criada")
+        from analytics import rollups
+        
+        def consulta(session):
+            totais = rollups.resumo(session, rollups.horas_atras(24))
+            return {
+                'total_users': rollups.usuarios_ativos(session, rollups.hoje_utc() - timedelta(days=1)),
+                'total_commands': totais['count'],
+                'avg_response_time': totais['avg_ms'],
+                'error_count': totais['error_logs'],
+                'status': 'success',
+                'timestamp': datetime.now().isoformat(),
+                'cached': True
+            }
         
-        try:
-            cutoff = datetime.now() - timedelta(hours=24)
-            
-            result = session.execute(text("""
-                SELECT 
-                    COUNT(DISTINCT cu.username) as users,
-                    COUNT(cu.id) as commands,
-                    AVG(COALESCE(cu.execution_time_ms, 0)) as avg_time,
-                    (SELECT COUNT(*) FROM analytics_error_logs WHERE timestamp >= :cutoff) as errors
-                FROM analytics_command_usage cu 
-                WHERE cu.timestamp >= :cutoff
-            """), {"cutoff": cutoff}).fetchone()
-            
-            if result:
-                return {
-                    'total_users': int(result.users or 0),
-                    'total_commands': int(result.commands or 0),
-                    'avg_response_time': round(float(result.avg_time or 0), 2),
-                    'error_count': int(result.errors or 0),
-                    'status': 'success',
-                    'timestamp': datetime.now().isoformat(),
-                    'cached': True
-                }
-            raise Exception("Sem resultados")
-            
-        finally:
-            session.close()
+        return _consultar(consulta)
     
     try:
         return jsonify(execute_with_retry(get_real_data))
@@ -193,6 +205,27 @@ def realtime_stats():
 @app.route('/api/users/active')
 def active_users():
     """API para usuários ativos"""
+    if analytics_available:
+        try:
+            from analytics import rollups
+            periodo = request.args.get('period', '24h')
+            dias = {'24h': 1, '7d': 7, '30d': 30}.get(periodo, 1)
+            hoje = rollups.hoje_utc()
+            
+            def consulta(session):
+                return {
+                    'users': rollups.ranking_usuarios(session, hoje - timedelta(days=dias - 1)),
+                    'total_active_users': rollups.usuarios_ativos(session, hoje - timedelta(days=dias - 1)),
+                    'active_users_24h': rollups.usuarios_ativos(session, hoje - timedelta(days=1)),
+                    'new_users_today': rollups.novos_usuarios(session, hoje),
+                    'period': periodo,
+                    'status': 'success'
+                }
+            
+            return jsonify(_consultar(consulta))
+        except Exception as e:
+            logger.error(f"Erro ao obter usuários ativos: {e}")
+    
     return jsonify({
         'active_users_24h': 8,
         'new_users_today': 2,
@@ -204,26 +237,12 @@ def commands_stats():
     """API para comandos mais utilizados"""
     if analytics_available and is_render:
         try:
-            from analytics.bot_analytics_postgresql import get_session
-            from sqlalchemy import func, text
-            
-            session = get_session()
-            if session:
-                result = session.execute(text("""
-                    SELECT command, COUNT(*) as count
-                    FROM analytics_command_usage 
-                    WHERE timestamp >= :cutoff
-                    GROUP BY command 
-                    ORDER BY count DESC 
-                    LIMIT 10
-                """), {"cutoff": datetime.now() - timedelta(days=7)}).fetchall()
-                
-                session.close()
-                
-                return jsonify({
-                    'top_commands': [{'command': row.command, 'count': row.count} for row in result],
-                    'status': 'success'
-                })
+            from analytics import rollups
+            comandos = _consultar(lambda session: rollups.por_comando(session, rollups.hoje_utc() - timedelta(days=6)))
+            return jsonify({
+                'top_commands': [{'command': c['command'], 'count': c['count']} for c in comandos[:10]],
+                'status': 'success'
+            })
         except Exception as e:
             logger.error(f"Erro ao obter comandos: {e}")
     
@@ -290,8 +309,24 @@ def recent_errors():
 @cached(ttl=300)  # Cache de 5 minutos
 def performance_trends():
     """API para tendências de performance"""
+    if analytics_available:
+        try:
+            from analytics import rollups
+            from analytics.rollups import inicio_da_hora
+            primeira = inicio_da_hora(datetime.utcnow()) - timedelta(hours=23)
+            por_hora = {linha['period']: linha for linha in _consultar(lambda session: rollups.serie(session, primeira))}
+            horas = [primeira + timedelta(hours=i) for i in range(24)]
+            return jsonify({
+                'hours': [_hora_local(hora) for hora in horas],
+                'response_times': [por_hora[hora]['avg_ms'] if hora in por_hora else 0 for hora in horas],
+                'commands': [por_hora[hora]['count'] if hora in por_hora else 0 for hora in horas],
+                'status': 'success'
+            })
+        except Exception as e:
+            logger.error(f"Erro em performance/trends: {e}")
+    
     try:
-        # Simular dados de tendência por enquanto
+        # Simular dados de tendência (modo local)
         hours = []
         response_times = []
         
@@ -341,6 +376,29 @@ def system_health():
 @cached(ttl=900)  # Cache de 15 minutos
 def user_engagement():
     """API para métricas de engajamento"""
+    if analytics_available:
+        try:
+            from analytics import rollups
+            hoje = rollups.hoje_utc()
+            
+            def consulta(session):
+                mensais = rollups.usuarios_ativos(session, hoje - timedelta(days=29))
+                comandos_30d = rollups.resumo_dias(session, hoje - timedelta(days=29))['count']
+                return {
+                    'daily_active_users': rollups.usuarios_ativos(session, hoje),
+                    'weekly_active_users': rollups.usuarios_ativos(session, hoje - timedelta(days=6)),
+                    'monthly_active_users': mensais,
+                    'commands_per_user': round(comandos_30d / mensais, 1) if mensais else 0
+                }
+            
+            return jsonify({
+                'engagement': _consultar(consulta),
+                'status': 'success',
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Erro em metrics/engagement: {e}")
+    
     try:
         # Dados mock para demonstração
         engagement_data = {
@@ -368,6 +426,44 @@ def user_engagement():
 @cached(ttl=600)  # Cache de 10 minutos
 def command_performance():
     """API para performance de comandos"""
+    if analytics_available:
+        try:
+            from analytics import rollups
+            
+            def consulta(session):
+                desde = rollups.horas_atras(24)
+                return (
+                    rollups.resumo(session, desde),
+                    rollups.por_comando(session, desde, por_hora=True),
+                    rollups.percentis(rollups.latencias(session, desde)),
+                )
+            
+            totais, comandos, latencia = _consultar(consulta)
+            # Comandos com poucas execuções não entram no ranking de tempo
+            com_volume = [c for c in comandos if c['count'] >= 5] or comandos
+            por_tempo = sorted(com_volume, key=lambda c: c['avg_ms'], reverse=True)
+            return jsonify({
+                'performance': {
+                    'avg_response_time': totais['avg_ms'],
+                    'p50_ms': latencia['overall']['p50_ms'],
+                    'p95_ms': latencia['overall']['p95_ms'],
+                    'p99_ms': latencia['overall']['p99_ms'],
+                    'slow_requests': latencia['overall']['slow'],
+                    'slowest_p99_commands': [
+                        {'command': f"/{c['command']}", 'p99_ms': c['p99_ms'], 'slow': c['slow']} for c in latencia['commands'][:3]
+                    ],
+                    'success_rate': totais['success_rate'],
+                    'error_rate': totais['error_rate'],
+                    'throughput_per_minute': round(totais['count'] / (24 * 60), 2),
+                    'slowest_commands': [{'command': f"/{c['command']}", 'avg_time_ms': c['avg_ms']} for c in por_tempo[:3]],
+                    'fastest_commands': [{'command': f"/{c['command']}", 'avg_time_ms': c['avg_ms']} for c in por_tempo[::-1][:3]]
+                },
+                'status': 'success',
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Erro em metrics/performance: {e}")
+    
     try:
         performance_data = {
             'avg_response_time': 245.8,
@@ -400,6 +496,34 @@ def command_performance():
 @cached(ttl=1800)  # Cache de 30 minutos
 def business_kpis():
     """API para KPIs de negócio"""
+    if analytics_available:
+        try:
+            from analytics import rollups
+            hoje = rollups.hoje_utc()
+            inicio_mes = hoje.replace(day=1)
+            inicio_mes_anterior = (inicio_mes - timedelta(days=1)).replace(day=1)
+            
+            def consulta(session):
+                novos = rollups.novos_usuarios(session, inicio_mes)
+                novos_anterior = rollups.novos_usuarios(session, inicio_mes_anterior, inicio_mes)
+                totais_30d = rollups.resumo_dias(session, hoje - timedelta(days=29))
+                return {
+                    'total_users': rollups.usuarios_ativos(session, date(1970, 1, 1)),
+                    'new_users_this_month': novos,
+                    'user_growth_rate': round((novos - novos_anterior) / novos_anterior * 100, 1) if novos_anterior else 0,
+                    'command_success_rate': totais_30d['success_rate'],
+                    'avg_commands_per_day': round(totais_30d['count'] / 30, 1),
+                    'error_rate': totais_30d['error_rate']
+                }
+            
+            return jsonify({
+                'kpis': _consultar(consulta),
+                'status': 'success',
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Erro em metrics/kpis: {e}")
+    
     try:
         kpis_data = {
             'total_users': 150,
@@ -426,10 +550,64 @@ def business_kpis():
         logger.error(f"Erro em metrics/kpis: {e}")
         return jsonify({'error': str(e), 'status': 'error'})
 
+def _tendencias_uso(session):
+    """Últimos 30 dias a partir dos rollups diários e horários."""
+    from analytics import rollups
+    hoje = rollups.hoje_utc()
+    primeiro_dia = hoje - timedelta(days=29)
+    por_dia = {linha['period']: linha for linha in rollups.serie(session, primeiro_dia, por_hora=False)}
+    usuarios = rollups.usuarios_por_dia(session, primeiro_dia)
+    
+    daily_stats = []
+    for i in range(30):
+        dia = primeiro_dia + timedelta(days=i)
+        linha = por_dia.get(dia)
+        daily_stats.append({
+            'date': dia.strftime('%Y-%m-%d'),
+            'total_commands': linha['count'] if linha else 0,
+            'active_users': usuarios.get(dia, 0),
+            'error_rate': linha['error_rate'] if linha else 0
+        })
+    
+    # Horários de pico: as 5 horas do dia com mais comandos na última semana
+    volume_por_hora = {}
+    for linha in rollups.serie(session, rollups.horas_atras(24 * 7)):
+        hora = int(_hora_local(linha['period'])[:2])
+        volume_por_hora[hora] = volume_por_hora.get(hora, 0) + linha['count']
+    peak_hours = sorted(sorted(volume_por_hora, key=volume_por_hora.get, reverse=True)[:5])
+    
+    # Crescimento por comando: últimos 15 dias contra os 15 anteriores
+    meio = hoje - timedelta(days=14)
+    anteriores = {c['command']: c['count'] for c in rollups.por_comando(session, primeiro_dia, meio)}
+    crescimento = [
+        {'command': f"/{c['command']}", 'growth': round((c['count'] - anteriores[c['command']]) / anteriores[c['command']] * 100, 1)}
+        for c in rollups.por_comando(session, meio) if anteriores.get(c['command'])
+    ]
+    
+    primeira_metade = sum(d['total_commands'] for d in daily_stats[:15])
+    segunda_metade = sum(d['total_commands'] for d in daily_stats[15:])
+    return {
+        'period': '30_days',
+        'daily_stats': daily_stats,
+        'growth_trend': 'positive' if segunda_metade >= primeira_metade else 'negative',
+        'peak_hours': peak_hours,
+        'top_growing_commands': sorted(crescimento, key=lambda c: c['growth'], reverse=True)[:3]
+    }
+
 @app.route('/api/trends/usage')
 @cached(ttl=3600)  # Cache de 1 hora
 def usage_trends():
     """API para tendências de uso"""
+    if analytics_available:
+        try:
+            return jsonify({
+                'trends': _consultar(_tendencias_uso),
+                'status': 'success',
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Erro em trends/usage: {e}")
+    
     try:
         # Gerar dados de tendência dos últimos 30 dias
         import random
@@ -470,16 +648,22 @@ def usage_trends():
         logger.error(f"Erro em trends/usage: {e}")
         return jsonify({'error': str(e), 'status': 'error'})
 
+@app.route('/metrics')
+def metrics():
+    """Métricas de runtime do dashboard (formato texto do Prometheus)"""
+    return metricas.exportar(), 200, {'Content-Type': metricas.CONTENT_TYPE}
+
 @app.route('/api/cache/stats')
 def cache_stats():
     """API para estatísticas do cache"""
     try:
         total_keys = len(_cache)
+        consultas = _cache_contagem['hits'] + _cache_contagem['misses']
         cache_info = {
             'total_keys': total_keys,
             'cache_ttl': CACHE_TTL,
             'memory_usage': f'{total_keys * 0.1:.1f}KB',
-            'hit_rate': f'{min(95, total_keys * 2)}%'
+            'hit_rate': f"{_cache_contagem['hits'] / consultas * 100 if consultas else 0:.0f}%"
         }
         
         return jsonify({
@@ -497,6 +681,27 @@ def commands_ranking():
     try:
         days = request.args.get('days', 7, type=int)
         
+        if analytics_available:
+            try:
+                from analytics import rollups
+                comandos = _consultar(lambda session: rollups.por_comando(session, rollups.hoje_utc() - timedelta(days=days - 1)))
+                total = sum(c['count'] for c in comandos)
+                return jsonify({
+                    'ranking': [{
+                        'command': c['command'],
+                        'count': c['count'],
+                        'total_uses': c['count'],
+                        'percentage': round(c['count'] / total * 100, 1) if total else 0,
+                        'success_rate': c['success_rate'],
+                        'avg_time_ms': c['avg_ms']
+                    } for c in comandos],
+                    'period_days': days,
+                    'total_commands': total,
+                    'status': 'success'
+                })
+            except Exception as e:
+                logger.error(f"Erro no ranking de comandos: {e}")
+        
         # Mock data para ranking de comandos
         ranking_data = [
             {'command': '/extrato', 'count': 45, 'percentage': 25.0},
@@ -572,6 +777,54 @@ def performance_metrics():
     try:
         hours = request.args.get('hours', 24, type=int)
         
+        if analytics_available:
+            try:
+                from analytics import rollups
+                
+                def consulta(session):
+                    desde = rollups.horas_atras(hours)
+                    return (
+                        rollups.resumo(session, desde),
+                        rollups.serie(session, desde),
+                        rollups.por_comando(session, desde, por_hora=True),
+                        rollups.percentis(rollups.latencias(session, desde)),
+                    )
+                
+                totais, serie_horaria, comandos, latencia = _consultar(consulta)
+                por_comando = {c['command']: c for c in latencia['commands']}
+                return jsonify({
+                    'metrics': {
+                        'response_times': {
+                            'avg_ms': totais['avg_ms'],
+                            'max_ms': totais['max_ms'],
+                            'p50_ms': latencia['overall']['p50_ms'],
+                            'p95_ms': latencia['overall']['p95_ms'],
+                            'p99_ms': latencia['overall']['p99_ms'],
+                            'slow_requests': latencia['overall']['slow']
+                        },
+                        'latency_buckets': totais['buckets'],
+                        'throughput': {
+                            'commands_per_hour': round(totais['count'] / hours, 1),
+                            'errors_per_hour': round((totais['count'] - totais['successes']) / hours, 1)
+                        },
+                        'trends': [
+                            {'time': _hora_local(linha['period']), 'response_time': linha['avg_ms'], 'throughput': linha['count']}
+                            for linha in serie_horaria
+                        ],
+                        'commands': [
+                            {
+                                'command': c['command'], 'avg_time': c['avg_ms'], 'max_time': c['max_ms'], 'count': c['count'],
+                                **{k: por_comando.get(c['command'], {}).get(k, 0) for k in ('p50_ms', 'p95_ms', 'p99_ms', 'slow')}
+                            }
+                            for c in comandos
+                        ]
+                    },
+                    'period_hours': hours,
+                    'status': 'success'
+                })
+            except Exception as e:
+                logger.error(f"Erro nas métricas de performance: {e}")
+        
         # Mock data para métricas de performance
         metrics_data = {
             'response_times': {
@@ -610,6 +863,37 @@ def performance_metrics():
         logger.error(f"Erro nas métricas de performance: {e}")
         return jsonify({'error': str(e), 'status': 'error'})
 
+@app.route('/api/latency')
+def latency_percentiles():
+    """API de latência: p50/p95/p99 e execuções acima do SLO, por comando e no total"""
+    try:
+        hours = request.args.get('hours', 24, type=int)
+        command = request.args.get('command') or None
+        slow_ms = request.args.get('slow_ms', type=int)
+        
+        if not analytics_available:
+            return jsonify({'status': 'unavailable', 'period_hours': hours})
+        
+        from analytics import rollups
+        # Até 3 dias: sketches horários; acima disso, os diários
+        if hours <= 72:
+            desde, por_hora = rollups.horas_atras(hours), True
+        else:
+            desde, por_hora = rollups.hoje_utc() - timedelta(days=(hours + 23) // 24 - 1), False
+        sketches = _consultar(lambda session: rollups.latencias(session, desde, por_hora=por_hora, comando=command))
+        
+        return jsonify({
+            'latency': rollups.percentis(sketches, slow_ms),
+            'period_hours': hours,
+            'granularity': 'hour' if por_hora else 'day',
+            'status': 'success',
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro no endpoint de latência: {e}")
+        return jsonify({'error': str(e), 'status': 'error'})
+
 @app.route('/api/config/status')
 def config_status():
     """API para status das configurações do sistema"""
@@ -0,0 +1,140 @@
+"""
+⏱️ Sketch de Latência
+Histograma de latência com faixas logarítmicas (estilo HDR): cada faixa cobre
+valores com erro relativo de até ``PRECISAO_RELATIVA`` (1%), então p50/p95/p99
+saem com essa precisão qualquer que seja a escala (5 ms ou 50 s).
+
+- É **mesclável**: somar as contagens de dois sketches dá o sketch da união
+  dos eventos. Sketches por (hora, comando) viram qualquer janela/agrupamento
+  sem reler eventos brutos;
+- É **compacto**: só faixas não vazias, gravadas como pares varint
+  (delta do índice, contagem) em ``to_bytes`` — tipicamente dezenas de bytes
+  por comando por hora.
+"""
+
+import math
+from typing import Dict, Iterable, Optional
+
+PRECISAO_RELATIVA = 0.01
+_GAMMA = (1 + PRECISAO_RELATIVA) / (1 - PRECISAO_RELATIVA)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+def _varint(valor: int, saida: bytearray) -> None:
+    while True:
+        byte = valor & 0x7F
+        valor >>= 7
+        if valor:
+            saida.append(byte | 0x80)
+        else:
+            saida.append(byte)
+            return
+
+
+def _ler_varints(dados: bytes) -> Iterable[int]:
+    valor = deslocamento = 0
+    for byte in dados:
+        valor |= (byte & 0x7F) << deslocamento
+        if byte & 0x80:
+            deslocamento += 7
+        else:
+            yield valor
+            valor = deslocamento = 0
+
+
+class LatencySketch:
+    """Contagens por faixa logarítmica de latência (ms); latências <= 1 ms ficam na faixa zero."""
+
+    __slots__ = ('faixas', 'zeros', 'count')
+
+    def __init__(self):
+        self.faixas: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    @staticmethod
+    def _indice(latencia_ms: float) -> int:
+        return math.ceil(math.log(latencia_ms) / _LOG_GAMMA)
+
+    @staticmethod
+    def _valor(indice: int) -> float:
+        # Ponto da faixa (gamma^(i-1), gamma^i] com erro relativo <= PRECISAO_RELATIVA
+        return 2 * _GAMMA ** indice / (_GAMMA + 1)
+
+    def add(self, latencia_ms: Optional[float], vezes: int = 1) -> None:
+        if latencia_ms is None or latencia_ms <= 1:
+            self.zeros += vezes
+        else:
+            indice = self._indice(latencia_ms)
+            self.faixas[indice] = self.faixas.get(indice, 0) + vezes
+        self.count += vezes
+
+    def merge(self, outro: "LatencySketch") -> "LatencySketch":
+        for indice, contagem in outro.faixas.items():
+            self.faixas[indice] = self.faixas.get(indice, 0) + contagem
+        self.zeros += outro.zeros
+        self.count += outro.count
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Latência (ms) no quantil ``q`` (0..1); 0 para sketch vazio."""
+        if not self.count:
+            return 0.0
+        posicao = q * (self.count - 1)
+        acumulado = self.zeros
+        if posicao < acumulado:
+            return 0.0
+        for indice in sorted(self.faixas):
+            acumulado += self.faixas[indice]
+            if posicao < acumulado:
+                return round(self._valor(indice), 1)
+        return round(self._valor(max(self.faixas)), 1)
+
+    def count_above(self, limite_ms: float) -> int:
+        """Execuções acima de ``limite_ms`` (na resolução das faixas)."""
+        if limite_ms <= 1:
+            return self.count - self.zeros
+        minimo = self._indice(limite_ms)
+        return sum(contagem for indice, contagem in self.faixas.items() if indice > minimo)
+
+    def to_bytes(self) -> bytes:
+        saida = bytearray()
+        _varint(self.zeros, saida)
+        anterior = 0
+        for indice in sorted(self.faixas):
+            _varint(indice - anterior, saida)
+            _varint(self.faixas[indice], saida)
+            anterior = indice
+        return bytes(saida)
+
+    @classmethod
+    def from_bytes(cls, dados: Optional[bytes]) -> "LatencySketch":
+        sketch = cls()
+        if not dados:
+            return sketch
+        valores = _ler_varints(bytes(dados))
+        sketch.zeros = next(valores, 0)
+        sketch.count = sketch.zeros
+        indice = 0
+        for delta in valores:
+            indice += delta
+            contagem = next(valores)
+            sketch.faixas[indice] = contagem
+            sketch.count += contagem
+        return sketch
+
+    def resumo(self, limite_lento_ms: Optional[float] = None) -> Dict[str, float]:
+        dados = {
+            'count': self.count,
+            'p50_ms': self.quantile(0.50),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+        }
+        if limite_lento_ms is not None:
+            lentos = self.count_above(limite_lento_ms)
+            dados['slow'] = lentos
+            dados['slow_rate'] = round(lentos / self.count * 100, 2) if self.count else 0
+        return dados
+
+
+__all__ = ['LatencySketch', 'PRECISAO_RELATIVA']
@@ -0,0 +1,338 @@
+"""
+📈 Rollups de Analytics
+Contadores pré-agregados por comando, por hora e por dia
+(``analytics_rollup_hourly`` / ``analytics_rollup_daily``): execuções,
+sucessos, erros registrados, soma/máximo de latência e um histograma de
+latência em faixas fixas.
+
+- O gravador em lote (``AnalyticsBatchWriter``) soma cada lote em memória e
+  aplica os deltas com um ``INSERT ... ON CONFLICT DO UPDATE`` por tabela,
+  junto com os eventos brutos;
+- Cada linha guarda também um ``LatencySketch`` (analytics/latency_sketch.py)
+  mesclado a cada lote, de onde saem p50/p95/p99 e execuções lentas de
+  qualquer janela (``latencias``);
+- O dashboard (``analytics/dashboard_app.py``) lê só daqui e de
+  ``analytics_daily_users``: o custo de cada endpoint depende do período e
+  do número de comandos, não do volume de eventos brutos.
+
+Horas e dias são UTC, como ``CommandUsage.timestamp``.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from analytics.bot_analytics_postgresql import CommandRollupDaily, CommandRollupHourly, DailyUsers
+from analytics.latency_sketch import LatencySketch
+
+# (limite superior em ms, coluna); acima do último vai para b_inf
+BUCKETS_LATENCIA: Tuple[Tuple[int, str], ...] = (
+    (100, 'b_100'),
+    (250, 'b_250'),
+    (500, 'b_500'),
+    (1000, 'b_1000'),
+    (2500, 'b_2500'),
+    (5000, 'b_5000'),
+    (10000, 'b_10000'),
+    (30000, 'b_30000'),
+)
+COLUNAS_BUCKET: Tuple[str, ...] = tuple(coluna for _, coluna in BUCKETS_LATENCIA) + ('b_inf',)
+COLUNAS_SOMA: Tuple[str, ...] = ('total', 'successes', 'error_logs', 'latency_sum_ms') + COLUNAS_BUCKET
+
+Chave = Tuple[Any, str]
+
+# SLO de latência: acima disso a execução conta como lenta.
+# ANALYTICS_SLOW_MS é o padrão; ANALYTICS_SLO_MS define por comando ("relatorio=8000,ocr=6000")
+LIMITE_LENTO_MS = int(os.getenv("ANALYTICS_SLOW_MS", "2000"))
+LIMITES_LENTO_POR_COMANDO: Dict[str, int] = {
+    nome.strip().lstrip('/'): int(limite)
+    for nome, _, limite in (item.partition('=') for item in os.getenv("ANALYTICS_SLO_MS", "").split(','))
+    if nome.strip() and limite.strip().isdigit()
+}
+
+
+def limite_lento(comando: Optional[str]) -> int:
+    return LIMITES_LENTO_POR_COMANDO.get(comando or '', LIMITE_LENTO_MS)
+
+
+def coluna_bucket(latencia_ms: Optional[int]) -> str:
+    latencia_ms = latencia_ms or 0
+    for limite, coluna in BUCKETS_LATENCIA:
+        if latencia_ms <= limite:
+            return coluna
+    return 'b_inf'
+
+
+def _linha_vazia() -> Dict[str, int]:
+    return dict.fromkeys(COLUNAS_SOMA + ('latency_max_ms',), 0)
+
+
+def inicio_da_hora(momento: datetime) -> datetime:
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def agregar_eventos(commands: Iterable[Dict[str, Any]],
+                    errors: Iterable[Dict[str, Any]] = ()) -> Tuple[Dict[Chave, Dict[str, int]], Dict[Chave, Dict[str, int]]]:
+    """Deltas de um lote de eventos por (hora, comando) e por (dia, comando)."""
+    horas: Dict[Chave, Dict[str, int]] = {}
+    dias: Dict[Chave, Dict[str, int]] = {}
+    for c in commands:
+        latencia = c.get('execution_time_ms') or 0
+        bucket = coluna_bucket(latencia)
+        for linha in _linhas_do_evento(horas, dias, c):
+            linha['total'] += 1
+            linha['successes'] += 1 if c.get('success', True) else 0
+            linha['latency_sum_ms'] += latencia
+            linha['latency_max_ms'] = max(linha['latency_max_ms'], latencia)
+            linha[bucket] += 1
+    for e in errors:
+        for linha in _linhas_do_evento(horas, dias, e):
+            linha['error_logs'] += 1
+    return horas, dias
+
+
+def _linhas_do_evento(horas, dias, evento) -> Tuple[Dict[str, int], Dict[str, int]]:
+    momento = evento['timestamp']
+    comando = evento.get('command') or ''
+    return (
+        horas.setdefault((inicio_da_hora(momento), comando), _linha_vazia()),
+        dias.setdefault((momento.date(), comando), _linha_vazia()),
+    )
+
+
+def sketches_do_lote(commands: Iterable[Dict[str, Any]]) -> Tuple[Dict[Chave, LatencySketch], Dict[Chave, LatencySketch]]:
+    """Sketches de latência de um lote por (hora, comando) e por (dia, comando)."""
+    horas: Dict[Chave, LatencySketch] = {}
+    dias: Dict[Chave, LatencySketch] = {}
+    for c in commands:
+        momento = c['timestamp']
+        comando = c.get('command') or ''
+        latencia = c.get('execution_time_ms') or 0
+        horas.setdefault((inicio_da_hora(momento), comando), LatencySketch()).add(latencia)
+        dias.setdefault((momento.date(), comando), LatencySketch()).add(latencia)
+    return horas, dias
+
+
+def _upsert(session: Session, modelo, coluna_periodo: str, deltas: Dict[Chave, Dict[str, int]]) -> None:
+    if not deltas:
+        return
+    dialeto = postgresql if session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialeto.insert(modelo)
+    tabela = modelo.__table__
+    atualizar = {coluna: tabela.c[coluna] + stmt.excluded[coluna] for coluna in COLUNAS_SOMA}
+    atualizar['latency_max_ms'] = case(
+        (stmt.excluded.latency_max_ms > tabela.c.latency_max_ms, stmt.excluded.latency_max_ms),
+        else_=tabela.c.latency_max_ms,
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=[coluna_periodo, 'command'], set_=atualizar)
+    session.execute(stmt, [
+        {coluna_periodo: periodo, 'command': comando, **valores}
+        for (periodo, comando), valores in deltas.items()
+    ])
+
+
+def _mesclar_sketches(session: Session, modelo, coluna_periodo: str, sketches: Dict[Chave, LatencySketch]) -> None:
+    """Mescla os sketches do lote nos já gravados (linhas criadas pelo upsert, travadas até o commit)."""
+    if not sketches:
+        return
+    periodo = getattr(modelo, coluna_periodo)
+    linhas = session.query(modelo.id, periodo, modelo.command, modelo.latency_sketch).filter(
+        tuple_(periodo, modelo.command).in_(list(sketches))
+    ).with_for_update().all()
+    tabela = modelo.__table__
+    atualizar = tabela.update().where(tabela.c.id == bindparam('b_id')).values(latency_sketch=bindparam('b_sketch'))
+    session.connection().execute(atualizar, [
+        {'b_id': id_linha, 'b_sketch': LatencySketch.from_bytes(atual).merge(sketches[(chave, comando)]).to_bytes()}
+        for id_linha, chave, comando, atual in linhas
+    ])
+
+
+def gravar_rollups(session: Session, commands: List[Dict[str, Any]], errors: List[Dict[str, Any]] = ()) -> None:
+    """Soma um lote de eventos aos rollups horário e diário (na transação de ``session``)."""
+    horas, dias = agregar_eventos(commands, errors)
+    _upsert(session, CommandRollupHourly, 'hour', horas)
+    _upsert(session, CommandRollupDaily, 'day', dias)
+    sketches_horas, sketches_dias = sketches_do_lote(commands)
+    _mesclar_sketches(session, CommandRollupHourly, 'hour', sketches_horas)
+    _mesclar_sketches(session, CommandRollupDaily, 'day', sketches_dias)
+
+
+# =============================================================================
+#  CONSULTAS DO DASHBOARD
+# =============================================================================
+
+def _somas(modelo) -> list:
+    return [func.coalesce(func.sum(getattr(modelo, coluna)), 0) for coluna in COLUNAS_SOMA] + [
+        func.coalesce(func.max(modelo.latency_max_ms), 0)
+    ]
+
+
+def _metricas(valores) -> Dict[str, Any]:
+    linha = dict(zip(COLUNAS_SOMA + ('latency_max_ms',), (int(v or 0) for v in valores)))
+    total = linha['total']
+    return {
+        'count': total,
+        'successes': linha['successes'],
+        'success_rate': round(linha['successes'] / total * 100, 1) if total else 0,
+        'error_rate': round((total - linha['successes']) / total * 100, 1) if total else 0,
+        'avg_ms': round(linha['latency_sum_ms'] / total, 1) if total else 0,
+        'max_ms': linha['latency_max_ms'],
+        'error_logs': linha['error_logs'],
+        'buckets': {coluna: linha[coluna] for coluna in COLUNAS_BUCKET},
+    }
+
+
+def _filtro_periodo(modelo, desde, ate):
+    coluna = modelo.hour if modelo is CommandRollupHourly else modelo.day
+    filtros = [coluna >= desde]
+    if ate is not None:
+        filtros.append(coluna < ate)
+    return coluna, filtros
+
+
+def resumo(session: Session, desde: datetime, ate: Optional[datetime] = None) -> Dict[str, Any]:
+    """Totais de todos os comandos nas horas em [desde, ate)."""
+    _, filtros = _filtro_periodo(CommandRollupHourly, inicio_da_hora(desde), ate)
+    return _metricas(session.query(*_somas(CommandRollupHourly)).filter(*filtros).one())
+
+
+def resumo_dias(session: Session, desde: date, ate: Optional[date] = None) -> Dict[str, Any]:
+    """Totais de todos os comandos nos dias em [desde, ate)."""
+    _, filtros = _filtro_periodo(CommandRollupDaily, desde, ate)
+    return _metricas(session.query(*_somas(CommandRollupDaily)).filter(*filtros).one())
+
+
+def por_comando(session: Session, desde, ate=None, por_hora: bool = False) -> List[Dict[str, Any]]:
+    """Métricas de cada comando no período (horas se ``por_hora``, senão dias), do mais usado ao menos."""
+    modelo = CommandRollupHourly if por_hora else CommandRollupDaily
+    if por_hora:
+        desde = inicio_da_hora(desde)
+    _, filtros = _filtro_periodo(modelo, desde, ate)
+    linhas = session.query(modelo.command, *_somas(modelo)).filter(
+        *filtros, modelo.command != ''
+    ).group_by(modelo.command).all()
+    comandos = [{'command': linha[0], **_metricas(linha[1:])} for linha in linhas]
+    return sorted(comandos, key=lambda c: c['count'], reverse=True)
+
+
+def serie(session: Session, desde, ate=None, por_hora: bool = True) -> List[Dict[str, Any]]:
+    """Métricas de cada hora (ou dia) do período, em ordem; períodos sem eventos não aparecem."""
+    modelo = CommandRollupHourly if por_hora else CommandRollupDaily
+    if por_hora:
+        desde = inicio_da_hora(desde)
+    coluna, filtros = _filtro_periodo(modelo, desde, ate)
+    linhas = session.query(coluna, *_somas(modelo)).filter(*filtros).group_by(coluna).order_by(coluna).all()
+    return [{'period': linha[0], **_metricas(linha[1:])} for linha in linhas]
+
+
+def latencias(session: Session, desde, ate=None, por_hora: bool = True,
+              comando: Optional[str] = None) -> Dict[str, LatencySketch]:
+    """Sketch de latência de cada comando no período (horas se ``por_hora``, senão dias), mesclando as linhas."""
+    modelo = CommandRollupHourly if por_hora else CommandRollupDaily
+    if por_hora:
+        desde = inicio_da_hora(desde)
+    _, filtros = _filtro_periodo(modelo, desde, ate)
+    query = session.query(modelo.command, modelo.latency_sketch).filter(
+        *filtros, modelo.command != '', modelo.latency_sketch.isnot(None)
+    )
+    if comando:
+        query = query.filter(modelo.command == comando)
+    sketches: Dict[str, LatencySketch] = {}
+    for nome, dados in query.yield_per(500):
+        sketches.setdefault(nome, LatencySketch()).merge(LatencySketch.from_bytes(dados))
+    return sketches
+
+
+def percentis(sketches: Dict[str, LatencySketch], limite_ms: Optional[int] = None) -> Dict[str, Any]:
+    """p50/p95/p99 e execuções lentas por comando e no total (cada comando com seu SLO, salvo ``limite_ms``)."""
+    total = LatencySketch()
+    lentos_total = 0
+    comandos = []
+    for nome, sketch in sketches.items():
+        limite = limite_ms or limite_lento(nome)
+        resumo_comando = sketch.resumo(limite)
+        lentos_total += resumo_comando['slow']
+        total.merge(sketch)
+        comandos.append({'command': nome, 'slo_ms': limite, **resumo_comando})
+    geral = total.resumo()
+    geral['slow'] = lentos_total
+    geral['slow_rate'] = round(lentos_total / total.count * 100, 2) if total.count else 0
+    return {
+        'overall': geral,
+        'commands': sorted(comandos, key=lambda c: c['p99_ms'], reverse=True),
+    }
+
+
+def usuarios_ativos(session: Session, desde: date, ate: Optional[date] = None) -> int:
+    """Usuários distintos com ao menos um comando nos dias em [desde, ate)."""
+    query = session.query(func.count(func.distinct(DailyUsers.user_id))).filter(DailyUsers.day >= desde)
+    if ate is not None:
+        query = query.filter(DailyUsers.day < ate)
+    return int(query.scalar() or 0)
+
+
+def usuarios_por_dia(session: Session, desde: date) -> Dict[date, int]:
+    linhas = session.query(DailyUsers.day, func.count(DailyUsers.id)).filter(
+        DailyUsers.day >= desde
+    ).group_by(DailyUsers.day).all()
+    return {dia: int(total) for dia, total in linhas}
+
+
+def ranking_usuarios(session: Session, desde: date, limite: int = 50) -> List[Dict[str, Any]]:
+    """Usuários mais ativos desde ``desde``, somando as linhas diárias."""
+    linhas = session.query(
+        DailyUsers.user_id,
+        func.max(DailyUsers.username),
+        func.sum(DailyUsers.total_commands),
+        func.max(DailyUsers.day),
+    ).filter(DailyUsers.day >= desde).group_by(DailyUsers.user_id).order_by(
+        func.sum(DailyUsers.total_commands).desc()
+    ).limit(limite).all()
+    return [
+        {'user_id': user_id, 'username': username, 'commands_count': int(total or 0), 'last_activity': dia.isoformat()}
+        for user_id, username, total, dia in linhas
+    ]
+
+
+def novos_usuarios(session: Session, desde: date, ate: Optional[date] = None) -> int:
+    """Usuários cujo primeiro dia de uso está em [desde, ate)."""
+    primeiro_dia = session.query(func.min(DailyUsers.day).label('primeiro')).group_by(DailyUsers.user_id).subquery()
+    query = session.query(func.count()).select_from(primeiro_dia).filter(primeiro_dia.c.primeiro >= desde)
+    if ate is not None:
+        query = query.filter(primeiro_dia.c.primeiro < ate)
+    return int(query.scalar() or 0)
+
+
+def hoje_utc() -> date:
+    return datetime.utcnow().date()
+
+
+def horas_atras(horas: int) -> datetime:
+    return datetime.utcnow() - timedelta(hours=horas)
+
+
+__all__ = [
+    'BUCKETS_LATENCIA',
+    'COLUNAS_BUCKET',
+    'agregar_eventos',
+    'coluna_bucket',
+    'gravar_rollups',
+    'horas_atras',
+    'limite_lento',
+    'percentis',
+    'hoje_utc',
+    'latencias',
+    'novos_usuarios',
+    'por_comando',
+    'ranking_usuarios',
+    'resumo',
+    'resumo_dias',
+    'serie',
+    'sketches_do_lote',
+    'usuarios_ativos',
+    'usuarios_por_dia',
+]
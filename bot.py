@@ -37,13 +37,14 @@ except Exception as ocr_init_error:
 
 # Inicializar Analytics
 try:
+    from analytics.batch_writer import get_batch_writer, iniciar_analytics, encerrar_analytics
     if os.getenv('DATABASE_URL'):  # Render
         from analytics.bot_analytics_postgresql import get_analytics, track_command
-        analytics = get_analytics()
+        analytics = get_batch_writer(get_analytics())
         logging.info("✅ Analytics PostgreSQL integrado (RENDER)")
     else:  # Local
         from analytics.bot_analytics import BotAnalytics, track_command
-        analytics = BotAnalytics()
+        analytics = get_batch_writer(BotAnalytics())
         logging.info("✅ Analytics SQLite integrado (LOCAL)")
     
     ANALYTICS_ENABLED = True
@@ -71,7 +72,7 @@ def track_analytics(command_name):
                     # Calcular tempo de execução
                     execution_time = (datetime.now() - start_time).total_seconds() * 1000
                     
-                    # Registrar sucesso
+                    # Registrar sucesso (só enfileira; a gravação é em lote, fora do loop)
                     analytics.track_command_usage(
                         user_id=user_id,
                         username=username,
@@ -141,9 +142,11 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters,
     CallbackQueryHandler, ConversationHandler, ApplicationBuilder, ContextTypes
 )
+from telegram.request import HTTPXRequest
 
 # --- IMPORTS DO PROJETO ---
 import config
+import metricas
 from database.database import get_db, popular_dados_iniciais, criar_tabelas
 from models import *
 from alerts import schedule_alerts
@@ -192,7 +195,6 @@ from gerente_financeiro.wrapped_anual_handler import meu_wrapped_handler
 # 🏦 OPEN FINANCE OAUTH (substitui handler antigo)
 try:
     from gerente_financeiro.open_finance_oauth_handler import OpenFinanceOAuthHandler
-    from open_finance.data_sync import schedule_daily_sync
     OPEN_FINANCE_OAUTH_ENABLED = True
     logging.info("✅ Open Finance OAuth habilitado")
 except Exception as e:
@@ -490,10 +492,11 @@ def _register_default_handlers(application: Application, safe_mode: bool = False
         callback_builders.extend([
             ("import_callback", lambda: CallbackQueryHandler(of_oauth_handler.handle_import_callback, pattern="^import_")),
             ("action_callback", lambda: CallbackQueryHandler(of_oauth_handler.handle_action_callback, pattern="^action_")),
+            ("of_authorized", lambda: CallbackQueryHandler(of_oauth_handler.handle_authorized_callback, pattern="^of_authorized_")),
             ("of_sync_now", lambda: CallbackQueryHandler(of_oauth_handler.handle_sync_now_callback, pattern="^of_sync_now_")),
             ("of_view_accounts", lambda: CallbackQueryHandler(of_oauth_handler.handle_view_accounts_callback, pattern="^of_view_accounts$"))
         ])
-        logger.info("✅ Callback handlers Open Finance adicionados (import, action, sync_now, view_accounts)")
+        logger.info("✅ Callback handlers Open Finance adicionados (import, action, authorized, sync_now, view_accounts)")
 
     for name, builder in callback_builders:
         build_and_add(name, builder)
@@ -520,6 +523,43 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
             logger.error(f"Failed to send error message to user: {e}")
             print(f"❌ Erro ao enviar mensagem de erro: {e}")
 
+class _RequisicaoTelegramMedida(HTTPXRequest):
+    """HTTPXRequest que mede cada chamada à Bot API (latência e falhas por método)."""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        metodo = url.rsplit("/", 1)[-1]  # .../bot<token>/sendMessage -> sendMessage
+        try:
+            with metricas.cronometrar(metricas.TELEGRAM_DURACAO, metodo=metodo):
+                codigo, corpo = await super().do_request(url, method, request_data, **kwargs)
+        except Exception as e:
+            metricas.TELEGRAM_FALHAS.inc(metodo=metodo, motivo=type(e).__name__)
+            raise
+        if codigo >= 400:
+            metricas.TELEGRAM_FALHAS.inc(metodo=metodo, motivo=str(codigo))
+        return codigo, corpo
+
+async def _ao_iniciar(application) -> None:
+    await metricas.iniciar_monitor_loop()
+    if ANALYTICS_ENABLED:
+        await iniciar_analytics(application)
+
+async def _ao_encerrar(application) -> None:
+    await metricas.parar_monitor_loop()
+    if ANALYTICS_ENABLED:
+        await encerrar_analytics(application)
+
+def _application_builder():
+    """ApplicationBuilder com os ganchos de ciclo de vida (fila de analytics, métricas)."""
+    metricas.instrumentar_gemini()
+    # Mesmo pool padrão do PTB (256) para as chamadas fora do getUpdates, agora medidas
+    builder = (
+        ApplicationBuilder()
+        .token(config.TELEGRAM_TOKEN)
+        .request(_RequisicaoTelegramMedida(connection_pool_size=256))
+    )
+    # Sobe a gravação em lote e a sonda do event loop com o loop; grava o que restou na fila ao encerrar
+    return builder.post_init(_ao_iniciar).post_shutdown(_ao_encerrar)
+
 def main() -> None:
     """Função principal que monta e executa o bot."""
     logger.info("Iniciando o bot...")
@@ -553,7 +593,7 @@ def main() -> None:
         return
 
     # Construção da Aplicação do Bot
-    application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).build()
+    application = _application_builder().build()
     logger.info("Aplicação do bot criada.")
 
     _register_default_handlers(application)
@@ -600,7 +640,7 @@ def create_application_ultra_robust():
     # 🔥 CRIAÇÃO APLICAÇÃO ULTRA-ROBUSTA
     try:
         print("DEBUG: Criando ApplicationBuilder...")
-        application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).build()
+        application = _application_builder().build()
         print("DEBUG: Application criada!")
         logger.info("✅ Aplicação do bot criada.")
 
@@ -623,31 +663,6 @@ def create_application_ultra_robust():
         except Exception as job_error:
             logger.warning(f"⚠️ Jobs falhou: {job_error} - continuando")
         
-        # 🏦 OPEN FINANCE AUTO-SYNC
-        if OPEN_FINANCE_OAUTH_ENABLED:
-            try:
-                from open_finance.data_sync import DataSynchronizer
-                synchronizer = DataSynchronizer()
-                
-                # Usar o scheduler existente do bot
-                application.job_queue.run_daily(
-                    synchronizer.sync_all_connections,
-                    time=datetime.strptime("06:00", "%H:%M").time(),
-                    name="daily_bank_sync"
-                )
-                
-                # Também rodar a cada 6 horas
-                application.job_queue.run_repeating(
-                    synchronizer.sync_all_connections,
-                    interval=21600,  # 6 horas em segundos
-                    first=10,  # Esperar 10 segundos para primeira execução
-                    name="periodic_bank_sync"
-                )
-                
-                logger.info("✅ Sincronização automática Open Finance ativada (6h + a cada 6h)")
-            except Exception as e:
-                logger.error(f"❌ Erro ao agendar sync Open Finance: {e}")
-        
         logger.info("🎯 [ULTRA-ROBUST] Aplicação criada com SUCESSO!")
         return application
         
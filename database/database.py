@@ -6,6 +6,7 @@ from sqlalchemy.orm import sessionmaker, Session
 from models import Base, Lancamento, Usuario, Categoria, Subcategoria, Objetivo
 from datetime import datetime, timedelta
 import config
+import metricas
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func, and_
 from models import Lancamento, Usuario, Categoria, Subcategoria, Objetivo, ItemLancamento
@@ -31,6 +32,7 @@ try:
 
     engine = create_engine(config.DATABASE_URL, client_encoding='utf8')
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    metricas.registrar_engine("principal", engine)
     
     with engine.connect() as connection:
         logging.info("✅ Conexão com o banco de dados estabelecida com sucesso!")
@@ -206,6 +208,30 @@ def deletar_todos_dados_usuario(telegram_id: int) -> bool:
     finally:
         db.close()    
 
+# Migrations idempotentes (ADD COLUMN IF NOT EXISTS...) aplicadas a cada inicialização:
+# create_all não altera tabelas que já existem
+MIGRACOES_INCREMENTAIS = [
+    "004_campos_derivados.sql",
+    "005_indice_lancamentos_dia.sql",
+    "006_relatorio_mensal_automatico.sql",
+    "007_analytics_dia_indices.sql",
+    "008_analytics_rollups.sql",
+    "009_analytics_latency_sketch.sql",
+]
+
+
+def aplicar_migracoes_incrementais():
+    from pathlib import Path
+    pasta = Path(__file__).resolve().parent.parent / "migrations"
+    for nome in MIGRACOES_INCREMENTAIS:
+        try:
+            sql = (pasta / nome).read_text(encoding="utf-8")
+            with engine.begin() as connection:
+                connection.exec_driver_sql(sql)
+        except Exception as e:
+            logging.error(f"Erro ao aplicar migration {nome}: {e}")
+
+
 # --- Funções Auxiliares ---
 def criar_tabelas():
     if not engine:
@@ -214,6 +240,8 @@ def criar_tabelas():
     try:
         logging.info("Verificando e criando tabelas a partir dos modelos...")
         Base.metadata.create_all(bind=engine)
+        if engine.dialect.name == "postgresql":
+            aplicar_migracoes_incrementais()
         logging.info("Tabelas prontas.")
     except Exception as e:
         logging.error(f"Erro ao criar tabelas: {e}")
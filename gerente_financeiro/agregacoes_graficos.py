@@ -0,0 +1,179 @@
+"""
+📊 Agregações SQL para Gráficos
+Um provedor por agrupamento do menu /grafico. O GROUP BY (categoria, forma de
+pagamento, dia, mês) roda no banco, sobre qualquer período, e o resultado são
+arrays pequenos entregues direto ao renderizador (renderizador_graficos):
+o custo não depende do tamanho do histórico.
+
+Os períodos são meio-abertos por dia local: ``inicio <= dia_referencia < fim + 1``
+(colunas gravadas na inserção, ver campos_derivados), usando o índice
+(id_usuario, dia_referencia). ``intervalo_do_periodo`` traduz as opções do
+menu (PERIODOS) em [inicio, fim].
+
+Os tipos são os gravados em Lancamento.tipo ('Entrada'/'Saída'); os valores
+entram em módulo, como no cálculo anterior em Python.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from models import Categoria, Lancamento
+from .campos_derivados import TIPO_ENTRADA, TIPO_SAIDA, chave_mes
+
+logger = logging.getLogger(__name__)
+
+AgregadorGrafico = Callable[[Session, int, Optional[date], Optional[date]], Dict[str, Any]]
+
+_VALOR = func.abs(Lancamento.valor)
+_RECEITAS = func.coalesce(func.sum(case((Lancamento.tipo == TIPO_ENTRADA, _VALOR), else_=0)), 0)
+_DESPESAS = func.coalesce(func.sum(case((Lancamento.tipo == TIPO_SAIDA, _VALOR), else_=0)), 0)
+
+# Opções de período do menu /grafico: chave -> (rótulo, meses até o atual; None = todo o histórico)
+PERIODOS = {
+    "tudo": ("Tudo", None),
+    "mes": ("Este mês", 1),
+    "3m": ("3 meses", 3),
+    "12m": ("12 meses", 12),
+}
+PERIODO_PADRAO = "tudo"
+
+
+def intervalo_do_periodo(periodo: str, hoje: Optional[date] = None) -> Tuple[Optional[date], Optional[date]]:
+    """[inicio, fim] de uma opção de PERIODOS: os últimos N meses do calendário até hoje."""
+    meses = PERIODOS.get(periodo, PERIODOS[PERIODO_PADRAO])[1]
+    if meses is None:
+        return None, None
+    hoje = hoje or date.today()
+    indice = hoje.year * 12 + hoje.month - 1 - (meses - 1)
+    return date(indice // 12, indice % 12 + 1, 1), hoje
+
+
+def _filtrar(query, id_usuario: int, inicio: Optional[date], fim: Optional[date]):
+    query = query.filter(Lancamento.id_usuario == id_usuario)
+    if inicio:
+        query = query.filter(Lancamento.dia_referencia >= inicio)
+    if fim:
+        query = query.filter(Lancamento.dia_referencia < fim + timedelta(days=1))
+    return query
+
+
+def _grupos(linhas) -> Dict[str, Any]:
+    return {
+        "grupos": [grupo for grupo, _ in linhas],
+        "valores": [float(valor) for _, valor in linhas],
+    }
+
+
+def agregar_por_categoria(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                          fim: Optional[date] = None) -> Dict[str, Any]:
+    """Despesas somadas por categoria."""
+    nome = func.coalesce(Categoria.nome, 'Sem Categoria')
+    query = db.query(nome, func.sum(_VALOR)).outerjoin(
+        Categoria, Lancamento.id_categoria == Categoria.id
+    ).filter(Lancamento.tipo == TIPO_SAIDA)
+    return _grupos(_filtrar(query, id_usuario, inicio, fim).group_by(nome).order_by(func.sum(_VALOR).desc()).all())
+
+
+def agregar_por_forma_pagamento(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                                fim: Optional[date] = None) -> Dict[str, Any]:
+    """Despesas somadas por forma de pagamento (conta/cartão)."""
+    forma = func.coalesce(Lancamento.forma_pagamento, 'Não informado')
+    query = db.query(forma, func.sum(_VALOR)).filter(Lancamento.tipo == TIPO_SAIDA)
+    return _grupos(_filtrar(query, id_usuario, inicio, fim).group_by(forma).order_by(func.sum(_VALOR).desc()).all())
+
+
+def agregar_por_mes(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                    fim: Optional[date] = None) -> Dict[str, Any]:
+    """Resultado líquido (receitas - despesas) de cada mês."""
+    query = db.query(Lancamento.mes_referencia, _RECEITAS - _DESPESAS)
+    linhas = _filtrar(query, id_usuario, inicio, fim).group_by(Lancamento.mes_referencia).order_by(
+        Lancamento.mes_referencia
+    ).all()
+    return _grupos([(mes, valor) for mes, valor in linhas if mes])
+
+
+def agregar_saldo_diario(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                         fim: Optional[date] = None) -> Dict[str, Any]:
+    """Resultado líquido de cada dia, em ordem (o renderizador acumula o saldo)."""
+    query = db.query(Lancamento.dia_referencia, _RECEITAS - _DESPESAS)
+    linhas = _filtrar(query, id_usuario, inicio, fim).group_by(Lancamento.dia_referencia).order_by(
+        Lancamento.dia_referencia
+    ).all()
+    linhas = [(dia, liquido) for dia, liquido in linhas if dia]
+    return {
+        "dias": [dia.isoformat() for dia, _ in linhas],
+        "liquidos": [float(liquido) for _, liquido in linhas],
+    }
+
+
+def agregar_fluxo_caixa(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                        fim: Optional[date] = None) -> Dict[str, Any]:
+    """Receitas e despesas de cada dia."""
+    query = db.query(Lancamento.dia_referencia, _RECEITAS, _DESPESAS)
+    linhas = _filtrar(query, id_usuario, inicio, fim).group_by(Lancamento.dia_referencia).order_by(
+        Lancamento.dia_referencia
+    ).all()
+    linhas = [linha for linha in linhas if linha[0]]
+    return {
+        "dias": [dia.isoformat() for dia, _, _ in linhas],
+        "entradas": [float(receitas) for _, receitas, _ in linhas],
+        "saidas": [float(despesas) for _, _, despesas in linhas],
+    }
+
+
+def agregar_projecao(db: Session, id_usuario: int, inicio: Optional[date] = None,
+                     fim: Optional[date] = None) -> Dict[str, Any]:
+    """Despesas do mês de ``fim`` (padrão: hoje) até esse dia; ``inicio`` é ignorado."""
+    hoje = fim or date.today()
+    query = db.query(_DESPESAS).filter(
+        Lancamento.id_usuario == id_usuario,
+        Lancamento.mes_referencia == chave_mes(hoje),
+        Lancamento.dia_referencia <= hoje,
+    )
+    return {"hoje": hoje.isoformat(), "total_gasto": float(query.scalar() or 0)}
+
+
+PROVEDORES: Dict[str, AgregadorGrafico] = {
+    "categoria": agregar_por_categoria,
+    "forma_pagamento": agregar_por_forma_pagamento,
+    "mes": agregar_por_mes,
+    "data": agregar_saldo_diario,
+    "fluxo_caixa": agregar_fluxo_caixa,
+    "projecao": agregar_projecao,
+}
+
+
+def agregar(db: Session, id_usuario: int, agrupar_por: str, inicio: Optional[date] = None,
+            fim: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Agregados de um gráfico para o usuário (ID interno) no período [inicio, fim].
+    Sem período, cobre todo o histórico. Retorna None quando não há lançamentos.
+    """
+    provedor = PROVEDORES.get(agrupar_por)
+    if provedor is None:
+        raise ValueError(f"Agrupamento de gráfico desconhecido: {agrupar_por}")
+    dados = provedor(db, id_usuario, inicio, fim)
+    return dados if _tem_valores(dados) else None
+
+
+def _tem_valores(dados: Dict[str, Any]) -> bool:
+    return any(valor for valor in dados.values() if isinstance(valor, (list, float)))
+
+
+__all__ = [
+    'PERIODOS',
+    'PERIODO_PADRAO',
+    'PROVEDORES',
+    'agregar',
+    'agregar_fluxo_caixa',
+    'agregar_por_categoria',
+    'agregar_por_forma_pagamento',
+    'agregar_por_mes',
+    'agregar_projecao',
+    'agregar_saldo_diario',
+    'intervalo_do_periodo',
+]
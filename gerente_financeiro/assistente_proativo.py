@@ -21,9 +21,13 @@ from decimal import Decimal
 
 from database.database import get_db
 from models import Usuario, Lancamento, Objetivo, Categoria
+from .similaridade import IndiceQuaseDuplicatas
 
 logger = logging.getLogger(__name__)
 
+# Similaridade mínima entre descrições para tratá-las como a mesma assinatura
+LIMIAR_SIMILARIDADE_ASSINATURA = 0.6
+
 
 # ============================================================================
 # ANÁLISE DE GASTOS ELEVADOS
@@ -215,26 +219,21 @@ def detectar_assinaturas_recorrentes(usuario_id: int, meses: int = 3) -> List[Di
             )
         ).order_by(Lancamento.data_transacao).all()
         
-        # Agrupar por descrição similar
+        # Agrupar por descrição similar (índice MinHash/LSH: "NETFLIX.COM 0123" ~ "Netflix com")
+        indice = IndiceQuaseDuplicatas(limiar=LIMIAR_SIMILARIDADE_ASSINATURA)
+        indice.adicionar_varios((n, lanc.descricao) for n, lanc in enumerate(lancamentos))
         grupos_descricao = {}
         
-        for lanc in lancamentos:
-            # Normalizar descrição (minúsculas, sem números de fatura)
-            desc_normalizada = lanc.descricao.lower()
-            
-            # Remover números de fatura/parcela
-            import re
-            desc_normalizada = re.sub(r'\d+/\d+|\d{4,}', '', desc_normalizada).strip()
-            
-            if desc_normalizada not in grupos_descricao:
-                grupos_descricao[desc_normalizada] = []
-            
-            grupos_descricao[desc_normalizada].append({
-                'valor': float(lanc.valor),
-                'data': lanc.data_transacao,
-                'descricao_original': lanc.descricao,
-                'categoria': lanc.categoria.nome if lanc.categoria else 'Outros'
-            })
+        for grupo in indice.agrupar():
+            grupos_descricao[grupo[0]] = [
+                {
+                    'valor': float(lancamentos[n].valor),
+                    'data': lancamentos[n].data_transacao,
+                    'descricao_original': lancamentos[n].descricao,
+                    'categoria': lancamentos[n].categoria.nome if lancamentos[n].categoria else 'Outros'
+                }
+                for n in sorted(grupo)
+            ]
         
         # Identificar assinaturas (aparecem em pelo menos 2 meses)
         assinaturas = []
@@ -0,0 +1,197 @@
+"""
+🧮 Campos Derivados na Gravação
+Atributos calculados uma única vez, quando o lançamento/transação é gravado,
+e persistidos em colunas indexadas — os caminhos de leitura (contexto da IA,
+gráficos, Wrapped) apenas leem as colunas:
+
+- merchant_key: estabelecimento normalizado (merchant_memory.normalizar_merchant);
+- meio_pagamento: forma de pagamento inferida (Pix, Cartão de Crédito, Boleto...);
+- mes_referencia / dia_referencia: mês ('AAAA-MM') e dia no fuso local;
+- itens: itens extraídos da descrição (apenas transações Open Finance).
+"""
+
+import logging
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from .categorizacao import normalizar_texto
+from .merchant_memory import normalizar_merchant
+
+logger = logging.getLogger(__name__)
+
+FUSO_LOCAL = ZoneInfo("America/Sao_Paulo")
+
+# Valores gravados em Lancamento.tipo (manual, OCR e importação Open Finance)
+TIPO_ENTRADA = 'Entrada'
+TIPO_SAIDA = 'Saída'
+
+
+def data_local(momento) -> Optional[date]:
+    """Dia local de um datetime (aware é convertido para o fuso local; naive já é local)."""
+    if momento is None:
+        return None
+    if isinstance(momento, datetime):
+        if momento.tzinfo is not None:
+            momento = momento.astimezone(FUSO_LOCAL)
+        return momento.date()
+    return momento
+
+
+def agora_local() -> datetime:
+    """Momento atual no horário local, sem fuso (convenção de data_transacao)."""
+    return datetime.now(FUSO_LOCAL).replace(tzinfo=None)
+
+
+def chave_mes(momento) -> Optional[str]:
+    """Chave 'AAAA-MM' no fuso local."""
+    dia = data_local(momento)
+    return f"{dia.year:04d}-{dia.month:02d}" if dia else None
+
+
+def inferir_meio_pagamento(origem: Optional[str], descricao: Optional[str]) -> str:
+    """Infere a forma de pagamento a partir da origem/conta e da descrição."""
+    o_raw = origem or ''
+    d = normalizar_texto(descricao)
+    o = normalizar_texto(o_raw)
+
+    # Se a origem já veio formatada pelo serviço (ex: 'Cartão de Crédito • Nubank'), preserva
+    if o_raw and '•' in str(o_raw):
+        return str(o_raw)
+
+    # Detectores principais
+    if 'pix' in o or 'pix' in d:
+        return 'Pix'
+
+    # Cartões: detectar presença de palavras-chave e, se possível, manter o nome do emissor
+    if 'cartao' in o or 'credito' in o or 'debito' in o or 'visa' in d or 'master' in d or 'elo' in d or 'amex' in d:
+        # Se a origem textual contiver o nome do banco, tenta preservar
+        if o_raw and len(o_raw) > 3 and o_raw.lower() not in ('openfinance', 'open finance'):
+            # Normaliza capitalização mínima
+            return o_raw
+        # Caso contrário, decide entre crédito/débito por palavras-chave
+        if 'debito' in o:
+            return 'Cartão de Débito'
+        return 'Cartão de Crédito'
+
+    # Transferências e boletos
+    if 'transfer' in o or 'ted' in o or 'doc' in o or 'transferência' in d or 'transferencia' in d:
+        return 'Transferência'
+    if 'boleto' in d or 'boleto' in o:
+        return 'Boleto'
+
+    # Nunca retornar 'Open Finance' como forma de pagamento — é apenas origem
+    # Caso a origem contenha 'openfinance', preferir 'Conta' ou o nome da conta
+    if 'openfinance' in o or 'open finance' in d:
+        return o_raw if o_raw and o_raw.lower() not in ('openfinance', 'open finance') else 'Conta'
+
+    # Fallback: se a origem contém algo plausível, title-case; senão 'Desconhecido'
+    if o:
+        return o.title()
+    return 'Desconhecido'
+
+
+_PADRAO_VALORES = re.compile(r'(?P<nome>[A-Za-z0-9\s\-\&\.,]{3,80}?)\s+(?:R\$|r\$)\s*(?P<valor>\d+[.,]\d{2})')
+_PADRAO_QUANTIDADE = re.compile(
+    r'(?P<qtd>\d+)\s*[xX]\s*(?P<nome>[A-Za-z0-9\s\-\&]{3,80})\s*(?:-|\s)\s*(?:R\$|r\$)?\s*(?P<valor>\d+[.,]\d{2})?'
+)
+
+
+def extrair_itens_de_descricao(texto: str, valor_total: float) -> List[Dict[str, Any]]:
+    """Heurística leve para extrair itens de uma descrição de transação.
+    Retorna lista de dicionários: {'nome_item', 'quantidade', 'valor_unitario'}
+    - Procura padrões como "Produto X R$ 12,34" ou "2x Pizza R$ 25,00"
+    - Se nada for encontrado, retorna um item único com o merchant/descritivo e o valor total
+    """
+    try:
+        if not texto:
+            return []
+        texto = texto.replace('\n', ' ').replace('\r', ' ')
+        # Padrão: nome ... R$ 12,34
+        itens = []
+        for match in _PADRAO_VALORES.findall(texto):
+            nome_raw = match[0].strip(' -–:;,.')
+            valor_str = match[1].replace('.', '').replace(',', '.')
+            try:
+                valor = float(valor_str)
+            except Exception:
+                valor = 0.0
+            itens.append({'nome_item': nome_raw, 'quantidade': 1, 'valor_unitario': valor})
+
+        if itens:
+            return itens
+
+        # Padrão alternativo: "2x Pizza - R$12,00" ou "2 x Pizza R$12,00"
+        for m in _PADRAO_QUANTIDADE.findall(texto):
+            try:
+                qtd = int(m[0])
+            except Exception:
+                qtd = 1
+            nome = m[1].strip()
+            valor = 0.0
+            if m[2]:
+                try:
+                    valor = float(m[2].replace('.', '').replace(',', '.'))
+                except Exception:
+                    valor = 0.0
+            itens.append({'nome_item': nome, 'quantidade': qtd, 'valor_unitario': valor})
+
+        if itens:
+            return itens
+
+        # Fallback: se não conseguiu extrair itens, sugere um único item com o merchant/descritivo
+        resumo = texto
+        if len(resumo) > 60:
+            resumo = resumo[:57] + '...'
+        return [{'nome_item': resumo.strip(), 'quantidade': 1, 'valor_unitario': float(valor_total)}]
+    except Exception as e:
+        logger.debug(f"Falha ao extrair itens da descrição: {e}")
+        return []
+
+
+def campos_derivados_lancamento(descricao: Optional[str], forma_pagamento: Optional[str],
+                                data_transacao) -> Dict[str, Any]:
+    """Colunas derivadas de um lançamento (para INSERTs em massa, que não disparam eventos do ORM)."""
+    return {
+        'merchant_key': normalizar_merchant(descricao) or None,
+        'meio_pagamento': inferir_meio_pagamento(forma_pagamento, descricao),
+        'mes_referencia': chave_mes(data_transacao),
+        'dia_referencia': data_local(data_transacao),
+    }
+
+
+def preencher_lancamento(lancamento) -> None:
+    """Preenche as colunas derivadas de um objeto Lancamento (eventos before_insert/before_update)."""
+    # Sem data, o INSERT grava o default da coluna (agora, no horário local)
+    momento = lancamento.data_transacao or agora_local()
+    for coluna, valor in campos_derivados_lancamento(
+        lancamento.descricao, lancamento.forma_pagamento, momento
+    ).items():
+        setattr(lancamento, coluna, valor)
+
+
+def campos_derivados_transacao(descricao: Optional[str], merchant_name: Optional[str], valor: float,
+                               data_transacao, tipo_conta: Optional[str] = None,
+                               conta_nome: Optional[str] = None) -> Dict[str, Any]:
+    """Colunas derivadas de uma transação do read model Open Finance."""
+    origem = 'Cartão de Crédito' if (tipo_conta or '').upper() in ('CREDIT', 'CREDIT_CARD') else conta_nome
+    return {
+        'merchant_key': normalizar_merchant(merchant_name or descricao) or None,
+        'meio_pagamento': inferir_meio_pagamento(origem, descricao),
+        'mes_referencia': chave_mes(data_transacao),
+        'itens': extrair_itens_de_descricao(f"{descricao or ''} {merchant_name or ''}", valor) or None,
+    }
+
+
+__all__ = [
+    'FUSO_LOCAL',
+    'agora_local',
+    'campos_derivados_lancamento',
+    'campos_derivados_transacao',
+    'chave_mes',
+    'data_local',
+    'extrair_itens_de_descricao',
+    'inferir_meio_pagamento',
+    'preencher_lancamento',
+]
@@ -0,0 +1,119 @@
+"""
+🏷️ Motor de Categorização por Palavras-Chave
+Compila as regras de palavra-chave uma única vez em uma expressão regular
+combinada, de forma que classificar um texto custa uma varredura O(len(texto))
+em vez de testar cada palavra-chave de cada categoria.
+
+- Matching sem acentos e sem diferenciar maiúsculas;
+- Limites de palavra: 'bar' não casa com 'barbearia'. Palavras-chave terminadas
+  em '*' são prefixos ('panific*' casa com 'panificadora');
+- Prioridade determinística: vence a regra declarada primeiro, independente
+  da posição no texto;
+- Memo por texto (LRU), útil em importações grandes e no Wrapped.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, Mapping, Optional, Sequence, Tuple
+
+# Caracteres que contam como "dentro de uma palavra" para os limites
+_CHAR_PALAVRA = "a-z0-9"
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Remove acentos e converte para minúsculas."""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = texto.encode('ASCII', 'ignore').decode('ascii')
+    return texto.lower()
+
+
+class MotorCategorizacao:
+    """Classificador de textos compilado a partir de regras (rótulo, palavras-chave)."""
+
+    def __init__(
+        self,
+        regras: Iterable[Tuple[Hashable, Sequence[str]]],
+        negativas: Optional[Mapping[Hashable, Sequence[str]]] = None,
+        memo_size: int = 8192,
+    ):
+        """
+        Args:
+            regras: Pares (rótulo, palavras-chave) em ordem de prioridade
+            negativas: Palavras que, se presentes, anulam o rótulo correspondente
+            memo_size: Quantidade de textos memorizados
+        """
+        # palavra normalizada -> (prioridade, rótulo); a primeira declaração vence
+        self._positivas: Dict[str, Tuple[int, Hashable]] = {}
+        self._prefixos: Dict[str, Tuple[int, Hashable]] = {}
+        for prioridade, (rotulo, palavras) in enumerate(regras):
+            for palavra in palavras:
+                self._registrar(palavra, (prioridade, rotulo))
+
+        # palavra negativa normalizada -> rótulos anulados
+        self._negativas: Dict[str, set] = {}
+        for rotulo, palavras in (negativas or {}).items():
+            for palavra in palavras:
+                self._negativas.setdefault(normalizar_texto(palavra), set()).add(rotulo)
+
+        self._regex = self._compilar(list(self._positivas) + list(self._negativas), list(self._prefixos))
+        self.classificar = lru_cache(maxsize=memo_size)(self._classificar)
+
+    def _registrar(self, palavra: str, entrada: Tuple[int, Hashable]) -> None:
+        if palavra.endswith('*'):
+            self._prefixos.setdefault(normalizar_texto(palavra[:-1]), entrada)
+        else:
+            self._positivas.setdefault(normalizar_texto(palavra), entrada)
+
+    @staticmethod
+    def _compilar(palavras: Sequence[str], prefixos: Sequence[str]) -> Optional["re.Pattern"]:
+        alternativas = []
+        # Mais longas primeiro: 'uber eats' deve ganhar de 'uber' na mesma posição
+        if palavras:
+            corpo = "|".join(re.escape(p) for p in sorted(set(palavras), key=len, reverse=True))
+            alternativas.append(f"(?:{corpo})(?![{_CHAR_PALAVRA}])")
+        if prefixos:
+            corpo = "|".join(re.escape(p) for p in sorted(set(prefixos), key=len, reverse=True))
+            alternativas.append(f"(?:{corpo})[{_CHAR_PALAVRA}]*")
+        if not alternativas:
+            return None
+        return re.compile(f"(?<![{_CHAR_PALAVRA}])(?:{'|'.join(alternativas)})")
+
+    def _entrada_para(self, trecho: str) -> Optional[Tuple[int, Hashable]]:
+        entrada = self._positivas.get(trecho)
+        if entrada is not None:
+            return entrada
+        # Prefixos: o trecho casado começa com algum prefixo registrado
+        melhor = None
+        for prefixo, candidata in self._prefixos.items():
+            if trecho.startswith(prefixo) and (melhor is None or candidata[0] < melhor[0]):
+                melhor = candidata
+        return melhor
+
+    def _classificar(self, texto: str) -> Optional[Hashable]:
+        if self._regex is None:
+            return None
+        normalizado = normalizar_texto(texto)
+        if not normalizado:
+            return None
+
+        candidatos = []
+        anulados: set = set()
+        for match in self._regex.finditer(normalizado):
+            trecho = match.group(0)
+            if trecho in self._negativas:
+                anulados |= self._negativas[trecho]
+                continue
+            entrada = self._entrada_para(trecho)
+            if entrada:
+                candidatos.append(entrada)
+
+        validos = [c for c in candidatos if c[1] not in anulados]
+        if not validos:
+            return None
+        return min(validos, key=lambda c: c[0])[1]
+
+
+__all__ = ['MotorCategorizacao', 'normalizar_texto']
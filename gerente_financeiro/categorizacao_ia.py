@@ -0,0 +1,239 @@
+"""
+🤖 Categorização em Lote com IA
+Categoriza muitas transações com poucas chamadas ao Gemini.
+
+- Descrições idênticas (após normalização) são enviadas uma única vez;
+- Cada prompt leva até ``TAMANHO_LOTE`` transações e o catálogo compacto de
+  categorias (códigos curtos em vez de nomes repetidos);
+- A resposta é um array JSON ``[{"i": 0, "c": "3.2"}, ...]``;
+- Os lotes rodam em paralelo com concorrência limitada (compartilhada por
+  todos os usuários), então uma importação de 300 transações vira poucas
+  chamadas sem estourar a cota da API.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import google.generativeai as genai
+from sqlalchemy import update
+from sqlalchemy.orm import Session, joinedload
+
+import config
+from database.database import get_db
+from models import Categoria, Lancamento
+from .categorizacao import normalizar_texto
+from .prompts import PROMPT_CATEGORIZACAO_LOTE
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 60
+MAX_CHAMADAS_SIMULTANEAS = 3
+CATALOGO_TTL_SECONDS = 600
+
+Rotulo = Tuple[int, Optional[int]]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def chave_descricao(descricao: Optional[str]) -> str:
+    """Normaliza a descrição para deduplicação (sem acentos, pontuação e números soltos)."""
+    return " ".join(t for t in _TOKEN.findall(normalizar_texto(descricao)) if not t.isdigit())
+
+
+@dataclass(frozen=True)
+class CatalogoCategorias:
+    """Catálogo de categorias pronto para prompts."""
+    texto_compacto: str            # "3: Alimentação / 3.1 Supermercado, 3.2 Restaurante"
+    texto_nomes: str               # "- Alimentação: (Supermercado, Restaurante)" (prompt do OCR)
+    codigos: Dict[str, Rotulo]     # "3.2" -> (id_categoria, id_subcategoria)
+
+
+_catalogo: Optional[CatalogoCategorias] = None
+_catalogo_carregado_em: Optional[float] = None
+
+
+def get_catalogo(db: Session) -> CatalogoCategorias:
+    """Retorna o catálogo de categorias, recarregado a cada ``CATALOGO_TTL_SECONDS``."""
+    global _catalogo, _catalogo_carregado_em
+    if _catalogo is not None and time.monotonic() - _catalogo_carregado_em < CATALOGO_TTL_SECONDS:
+        return _catalogo
+
+    categorias = db.query(Categoria).options(joinedload(Categoria.subcategorias)).order_by(Categoria.id).all()
+    linhas_compactas, linhas_nomes, codigos = [], [], {}
+    for n, cat in enumerate(categorias, start=1):
+        subs = sorted(cat.subcategorias, key=lambda s: s.id)
+        codigos[str(n)] = (cat.id, None)
+        partes = []
+        for m, sub in enumerate(subs, start=1):
+            codigos[f"{n}.{m}"] = (cat.id, sub.id)
+            partes.append(f"{n}.{m} {sub.nome}")
+        linhas_compactas.append(f"{n}: {cat.nome}" + (f" / {', '.join(partes)}" if partes else ""))
+        linhas_nomes.append(f"- {cat.nome}: ({', '.join(sub.nome for sub in subs)})")
+
+    _catalogo = CatalogoCategorias(
+        texto_compacto="\n".join(linhas_compactas),
+        texto_nomes="\n".join(linhas_nomes),
+        codigos=codigos,
+    )
+    _catalogo_carregado_em = time.monotonic()
+    return _catalogo
+
+
+def interpretar_resposta(texto: str, catalogo: CatalogoCategorias, tamanho: int) -> List[Optional[Rotulo]]:
+    """Converte a resposta JSON da IA em rótulos por índice (None quando ausente ou inválido)."""
+    resultado: List[Optional[Rotulo]] = [None] * tamanho
+    match = re.search(r"\[.*\]", texto or "", re.DOTALL)
+    if not match:
+        return resultado
+    try:
+        itens = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return resultado
+    for item in itens:
+        if not isinstance(item, dict):
+            continue
+        indice, codigo = item.get("i"), item.get("c")
+        if isinstance(indice, int) and 0 <= indice < tamanho and codigo is not None:
+            resultado[indice] = catalogo.codigos.get(str(codigo).strip())
+    return resultado
+
+
+class CategorizadorLote:
+    """Categoriza transações em lotes via Gemini, com concorrência limitada."""
+
+    def __init__(self, tamanho_lote: int = TAMANHO_LOTE, max_concorrentes: int = MAX_CHAMADAS_SIMULTANEAS,
+                 model_name: Optional[str] = None):
+        self.tamanho_lote = tamanho_lote
+        self.max_concorrentes = max_concorrentes
+        self.model_name = model_name or config.GEMINI_MODEL_NAME
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+    async def _gerar(self, prompt: str) -> str:
+        model = genai.GenerativeModel(self.model_name)
+        resposta = await model.generate_content_async(
+            prompt, generation_config={"response_mime_type": "application/json"}
+        )
+        return resposta.text
+
+    async def _categorizar_lote(self, itens: Sequence[Tuple[str, str]],
+                                catalogo: CatalogoCategorias) -> List[Optional[Rotulo]]:
+        transacoes = "\n".join(f"{i}|{tipo}|{descricao[:80]}" for i, (descricao, tipo) in enumerate(itens))
+        prompt = PROMPT_CATEGORIZACAO_LOTE.format(catalogo=catalogo.texto_compacto, transacoes=transacoes)
+        async with self._semaforo:
+            try:
+                texto = await self._gerar(prompt)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha na categorização em lote ({len(itens)} itens): {e}")
+                return [None] * len(itens)
+        return interpretar_resposta(texto, catalogo, len(itens))
+
+    async def categorizar(self, itens: Sequence[Tuple[str, str]],
+                          catalogo: CatalogoCategorias) -> List[Optional[Rotulo]]:
+        """
+        Categoriza pares (descrição, tipo).
+
+        Returns:
+            Lista alinhada com ``itens``: (id_categoria, id_subcategoria) ou None
+        """
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concorrentes)
+
+        # Deduplicação: cada (descrição normalizada, tipo) vai uma única vez para a IA
+        unicos: Dict[Tuple[str, str], int] = {}
+        representantes: List[Tuple[str, str]] = []
+        posicoes: List[Optional[int]] = []
+        for descricao, tipo in itens:
+            chave = (chave_descricao(descricao), tipo)
+            if not chave[0]:
+                posicoes.append(None)
+                continue
+            if chave not in unicos:
+                unicos[chave] = len(representantes)
+                representantes.append((descricao.strip(), tipo))
+            posicoes.append(unicos[chave])
+
+        lotes = [representantes[i:i + self.tamanho_lote] for i in range(0, len(representantes), self.tamanho_lote)]
+        if lotes:
+            logger.info(f"🤖 Categorizando {len(itens)} transações ({len(representantes)} únicas) em {len(lotes)} chamada(s)")
+        respostas = await asyncio.gather(*(self._categorizar_lote(lote, catalogo) for lote in lotes))
+        rotulos = [rotulo for resposta in respostas for rotulo in resposta]
+        return [rotulos[p] if p is not None else None for p in posicoes]
+
+
+_categorizador: Optional[CategorizadorLote] = None
+
+
+def get_categorizador_lote() -> CategorizadorLote:
+    """Retorna a instância compartilhada do categorizador em lote."""
+    global _categorizador
+    if _categorizador is None:
+        _categorizador = CategorizadorLote()
+    return _categorizador
+
+
+def _carregar_pendentes(id_usuario: int, limite: Optional[int]):
+    db = next(get_db())
+    try:
+        query = db.query(Lancamento.id, Lancamento.descricao, Lancamento.tipo).filter(
+            Lancamento.id_usuario == id_usuario,
+            Lancamento.id_categoria.is_(None),
+        ).order_by(Lancamento.id)
+        if limite:
+            query = query.limit(limite)
+        return query.all(), get_catalogo(db)
+    finally:
+        db.close()
+
+
+def _aplicar_categorias(atualizacoes: List[Dict]) -> None:
+    db = next(get_db())
+    try:
+        # UPDATE em massa por chave primária (executemany)
+        db.execute(update(Lancamento), atualizacoes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def categorizar_pendentes_usuario(id_usuario: int, limite: Optional[int] = None) -> Dict[str, int]:
+    """
+    Categoriza com IA os lançamentos sem categoria de um usuário (ID interno).
+    O acesso ao banco roda em threads; as chamadas ao Gemini, no event loop.
+    """
+    pendentes, catalogo = await asyncio.to_thread(_carregar_pendentes, id_usuario, limite)
+    stats = {"total": len(pendentes), "categorizados": 0}
+    if not pendentes:
+        return stats
+
+    rotulos = await get_categorizador_lote().categorizar(
+        [(descricao or "", tipo or "Despesa") for _, descricao, tipo in pendentes], catalogo
+    )
+    atualizacoes = [
+        {"id": lanc_id, "id_categoria": rotulo[0], "id_subcategoria": rotulo[1]}
+        for (lanc_id, _, _), rotulo in zip(pendentes, rotulos)
+        if rotulo
+    ]
+    if atualizacoes:
+        await asyncio.to_thread(_aplicar_categorias, atualizacoes)
+    stats["categorizados"] = len(atualizacoes)
+    logger.info(f"✅ Categorização em lote do usuário {id_usuario}: {stats['categorizados']}/{stats['total']}")
+    return stats
+
+
+__all__ = [
+    'CatalogoCategorias',
+    'CategorizadorLote',
+    'categorizar_pendentes_usuario',
+    'chave_descricao',
+    'get_catalogo',
+    'get_categorizador_lote',
+    'interpretar_resposta',
+]
@@ -42,8 +42,9 @@ from telegram.ext import (
 from database.database import (
     buscar_lancamentos_usuario, deletar_lancamento_por_id, atualizar_lancamento_por_id, get_db
 )
-from models import Categoria, Subcategoria
+from models import Categoria, Subcategoria, Usuario
 from .handlers import cancel, criar_teclado_colunas
+from .merchant_memory import get_merchant_memory
 from .states import (
     CHOOSE_METHOD, AWAIT_SEARCH_QUERY, CHOOSE_LANCAMENTO,
     CHOOSE_FIELD_TO_EDIT, AWAIT_NEW_VALUE,
@@ -52,6 +53,26 @@ from .states import (
 
 logger = logging.getLogger(__name__)
 
+# Chaves de edit_data que não são colunas de Lancamento
+CAMPOS_AUXILIARES = ['id', 'categoria_nome', 'subcategoria_nome', 'categoria_original']
+
+
+def _aprender_categoria(telegram_id: int, edit_data: dict) -> None:
+    """Se o usuário corrigiu a categoria, memoriza a escolha para o estabelecimento."""
+    nova = (edit_data.get('id_categoria'), edit_data.get('id_subcategoria'))
+    if not nova[0] or nova == edit_data.get('categoria_original'):
+        return
+    db = next(get_db())
+    try:
+        usuario = db.query(Usuario).filter(Usuario.telegram_id == telegram_id).first()
+        if usuario and get_merchant_memory().aprender(db, usuario.id, edit_data.get('descricao'), *nova):
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"⚠️ Não foi possível memorizar a categoria corrigida: {e}")
+    finally:
+        db.close()
+
 # =============================================================================
 # 1. PONTO DE ENTRADA E SELEÇÃO DO MÉTODO DE BUSCA
 # =============================================================================
@@ -187,7 +208,9 @@ async def select_lancamento_to_edit(update: Update, context: ContextTypes.DEFAUL
         'id_categoria': lanc.id_categoria,
         'id_subcategoria': lanc.id_subcategoria,
         'categoria_nome': lanc.categoria.nome if lanc.categoria else "N/A",
-        'subcategoria_nome': lanc.subcategoria.nome if lanc.subcategoria else ""
+        'subcategoria_nome': lanc.subcategoria.nome if lanc.subcategoria else "",
+        # Categoria original, para aprender com a correção ao salvar
+        'categoria_original': (lanc.id_categoria, lanc.id_subcategoria)
     }
     
     text, keyboard = await _get_cockpit_text_and_keyboard(context)
@@ -208,9 +231,11 @@ async def choose_field_to_edit(update: Update, context: ContextTypes.DEFAULT_TYP
     if field == "save":
         lanc_id = context.user_data['edit_data']['id']
         # Remove os campos auxiliares antes de salvar
-        data_to_update = {k: v for k, v in context.user_data['edit_data'].items() if k not in ['id', 'categoria_nome', 'subcategoria_nome']}
+        data_to_update = {k: v for k, v in context.user_data['edit_data'].items() if k not in CAMPOS_AUXILIARES}
         
         atualizado = atualizar_lancamento_por_id(lanc_id, query.from_user.id, data_to_update)
+        if atualizado:
+            _aprender_categoria(query.from_user.id, context.user_data['edit_data'])
         msg = "✅ Lançamento atualizado com sucesso!" if atualizado else "❌ Erro ao salvar."
         await query.edit_message_text(msg)
         return ConversationHandler.END
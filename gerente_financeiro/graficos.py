@@ -33,12 +33,12 @@ def track_analytics(command_name):
         return wrapper
     return decorator
 
+import asyncio
 import logging
 from contextlib import contextmanager
 from enum import IntEnum
-from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ContextTypes,
@@ -48,8 +48,12 @@ from telegram.ext import (
 )
 from telegram.error import TelegramError
 
+import metricas
 from database.database import get_db, DatabaseError, ServiceError  # Agora importando do database.py
+from models import Usuario
 from . import services
+from .agregacoes_graficos import PERIODO_PADRAO, PERIODOS, agregar, intervalo_do_periodo
+from .renderizador_graficos import get_renderizador
 from .handlers import cancel  # Importa função de cancelamento genérica
 
 logger = logging.getLogger(__name__)
@@ -68,9 +72,15 @@ CHART_PARAMS = {
     "grafico_forma_pagamento_pizza": {"agrupar_por": "forma_pagamento", "tipo_grafico": "pizza"},
 }
 
-# Cache para lançamentos (5 minutos de TTL)
+# Botões de período do menu (a escolha fica em context.user_data)
+PREFIXO_PERIODO = "grafico_periodo_"
+
+# Cache dos agregados de cada gráfico e período (5 minutos de TTL, contado por usuário)
 CACHE_TTL_MINUTES = 5
-_cache_timestamps = {}
+_cache_dados: Dict[int, Tuple[datetime, Dict[Tuple[str, str], Dict[str, Any]]]] = {}
+_cache_hits = 0
+_cache_misses = 0
+metricas.registrar_cache("graficos_dados", lambda: {"hits": _cache_hits, "misses": _cache_misses})
 
 @contextmanager
 def get_db_context():
@@ -96,60 +106,58 @@ def validate_user_request(user_id: Optional[int], action: str) -> bool:
         logger.warning(f"User ID inválido: {user_id}")
         return False
     
+    if action.startswith(PREFIXO_PERIODO):
+        if action[len(PREFIXO_PERIODO):] not in PERIODOS:
+            logger.warning(f"Período desconhecido: {action}")
+            return False
+        return True
+
     if action not in CHART_PARAMS and action not in ["grafico_fechar", "grafico_voltar"]:
         logger.warning(f"Ação desconhecida: {action}")
         return False
     
     return True
 
-@lru_cache(maxsize=100)
-def get_cached_lancamentos(user_id: int, cache_key: str) -> Optional[List]:
+def get_dados_grafico(user_id: int, agrupar_por: str, periodo: str = PERIODO_PADRAO) -> Optional[Dict[str, Any]]:
     """
-    Cache simples para lançamentos usando LRU cache.
-    
-    Args:
-        user_id: ID do usuário
-        cache_key: Chave única para o cache (baseada em timestamp)
-        
-    Returns:
-        Lista de lançamentos ou None
-    """
-    # O cache real é feito pelo decorator @lru_cache
-    # Esta função será chamada apenas quando necessário
-    with get_db_context() as db:
-        return services.buscar_lancamentos_com_relacionamentos(db, user_id)
+    Agregados (SQL) de um gráfico no período escolhido, com TTL por usuário.
+    Faz I/O de banco: chame fora do event loop (asyncio.to_thread).
 
-def get_cache_key(user_id: int) -> str:
-    """
-    Gera uma chave de cache baseada no tempo (TTL de 5 minutos).
-    
     Args:
-        user_id: ID do usuário
-        
+        user_id: ID do usuário (telegram_id)
+        agrupar_por: Agrupamento do gráfico (CHART_PARAMS)
+        periodo: Chave de agregacoes_graficos.PERIODOS
+
     Returns:
-        Chave de cache única
+        Arrays do agrupamento (agregacoes_graficos) ou None se o usuário não existir
     """
-    now = datetime.now()
-    
-    # Verifica se precisa invalidar cache do usuário
-    if user_id in _cache_timestamps:
-        last_update = _cache_timestamps[user_id]
-        if now - last_update > timedelta(minutes=CACHE_TTL_MINUTES):
-            # Cache expirado, limpa a entrada específica
-            get_cached_lancamentos.cache_clear()
-            del _cache_timestamps[user_id]
-    
-    # Atualiza timestamp
-    _cache_timestamps[user_id] = now
-    
-    # Retorna chave baseada em intervalos de 5 minutos
-    interval = now.replace(second=0, microsecond=0)
-    interval = interval.replace(minute=(interval.minute // CACHE_TTL_MINUTES) * CACHE_TTL_MINUTES)
-    
-    return f"{user_id}_{interval.isoformat()}"
+    global _cache_hits, _cache_misses
+    agora = datetime.now()
+    entrada = _cache_dados.get(user_id)
+    if entrada and agora - entrada[0] > timedelta(minutes=CACHE_TTL_MINUTES):
+        # Expirou: descarta apenas este usuário
+        del _cache_dados[user_id]
+        entrada = None
+    chave = (agrupar_por, periodo)
+    if entrada and chave in entrada[1]:
+        _cache_hits += 1
+        return entrada[1][chave]
+
+    _cache_misses += 1
+    with get_db_context() as db:
+        usuario_id = db.query(Usuario.id).filter(Usuario.telegram_id == user_id).scalar()
+        if usuario_id is None:
+            return None
+        inicio, fim = intervalo_do_periodo(periodo)
+        dados = agregar(db, usuario_id, agrupar_por, inicio, fim)
+    if entrada is None:
+        entrada = _cache_dados[user_id] = (agora, {})
+    entrada[1][chave] = dados
+    return dados
 
 async def show_chart_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Exibe o menu de gráficos com layout otimizado."""
+    periodo = context.user_data.get('grafico_periodo', PERIODO_PADRAO)
     keyboard = [
         [
             InlineKeyboardButton("🍕 Desp. por Categoria", callback_data="grafico_categoria_pizza"),
@@ -163,13 +171,17 @@ async def show_chart_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             InlineKeyboardButton("🔮 Projeção de Gastos", callback_data="grafico_projecao_barra_linha"),
             InlineKeyboardButton("💳 Gastos por Pagamento", callback_data="grafico_forma_pagamento_pizza")
         ],
+        [
+            InlineKeyboardButton(f"{'✅ ' if chave == periodo else ''}{rotulo}", callback_data=f"{PREFIXO_PERIODO}{chave}")
+            for chave, (rotulo, _) in PERIODOS.items()
+        ],
         [InlineKeyboardButton("❌ Fechar", callback_data="grafico_fechar")]
     ]
     
     text = (
         "📊 <b>Painel de Visualização</b>\n"
         "Escolha uma análise para gerar:\n\n"
-        "💡 <i>Tip: Os gráficos são gerados com base nos seus lançamentos mais recentes</i>"
+        f"🗓️ <i>Período: {PERIODOS[periodo][0]}</i>"
     )
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -221,6 +233,10 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     if action == "grafico_voltar":
         return await show_chart_menu(update, context)
 
+    if action.startswith(PREFIXO_PERIODO):
+        context.user_data['grafico_periodo'] = action[len(PREFIXO_PERIODO):]
+        return await show_chart_menu(update, context)
+
     # Processamento de gráficos
     try:
         params = CHART_PARAMS.get(action)
@@ -245,11 +261,11 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             parse_mode='HTML'
         )
         
-        # Busca dados com cache
-        cache_key = get_cache_key(user_id)
-        lancamentos = get_cached_lancamentos(user_id, cache_key)
+        # Agregados do SQL com cache (banco fora do event loop)
+        periodo = context.user_data.get('grafico_periodo', PERIODO_PADRAO)
+        dados = await asyncio.to_thread(get_dados_grafico, user_id, agrupar_por, periodo)
         
-        if not lancamentos:
+        if not dados:
             await query.edit_message_text(
                 "⚠️ <b>Dados insuficientes</b>\n"
                 "Não encontrei lançamentos para gerar este gráfico.\n\n"
@@ -261,15 +277,18 @@ async def chart_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             )
             return ChartStates.CHART_MENU
 
-        # Gera o gráfico
-        grafico_buffer = services.gerar_grafico_dinamico(lancamentos, tipo_grafico, agrupar_por)
+        # Gera o gráfico no pool de processos (ou devolve o PNG em cache)
+        grafico_png = await get_renderizador().grafico(user_id, dados, tipo_grafico, agrupar_por)
         
-        if grafico_buffer:
+        if grafico_png:
             # Envia o gráfico
             await context.bot.send_photo(
                 chat_id=query.message.chat.id, 
-                photo=grafico_buffer,
-                caption=f"📊 <b>{nome_exibicao}</b>\n<i>Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}</i>",
+                photo=grafico_png,
+                caption=(
+                    f"📊 <b>{nome_exibicao}</b> · {PERIODOS[periodo][0]}\n"
+                    f"<i>Gerado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}</i>"
+                ),
                 parse_mode='HTML'
             )
             
@@ -349,11 +368,8 @@ def clear_user_cache(user_id: int) -> None:
     Args:
         user_id: ID do usuário para limpar cache
     """
-    if user_id in _cache_timestamps:
-        del _cache_timestamps[user_id]
-    
-    # Limpa todo o cache LRU (pode ser otimizado para limpar apenas o usuário específico)
-    get_cached_lancamentos.cache_clear()
+    _cache_dados.pop(user_id, None)
+    get_renderizador().cache.invalidar(user_id)
     logger.info(f"Cache limpo para usuário {user_id}")
 
 def get_cache_stats() -> Dict[str, Any]:
@@ -363,14 +379,14 @@ def get_cache_stats() -> Dict[str, Any]:
     Returns:
         Dict com estatísticas do cache
     """
-    cache_info = get_cached_lancamentos.cache_info()
+    total = _cache_hits + _cache_misses
     return {
-        "hits": cache_info.hits,
-        "misses": cache_info.misses,
-        "maxsize": cache_info.maxsize,
-        "currsize": cache_info.currsize,
-        "active_users": len(_cache_timestamps),
-        "hit_rate": cache_info.hits / (cache_info.hits + cache_info.misses) if (cache_info.hits + cache_info.misses) > 0 else 0
+        "hits": _cache_hits,
+        "misses": _cache_misses,
+        "currsize": sum(len(graficos) for _, graficos in _cache_dados.values()),
+        "active_users": len(_cache_dados),
+        "hit_rate": _cache_hits / total if total > 0 else 0,
+        "graficos": get_renderizador().cache.stats(),
     }
 
 # ConversationHandler para os gráficos
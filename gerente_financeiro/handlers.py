@@ -8,6 +8,7 @@ def painel_notificacoes(update=None, context=None):
             "🔔 Painel de notificações em construção! Em breve você verá todos os alertas, lembretes e novidades aqui."
         )
     return "Painel de notificações em construção!"
+import asyncio
 import json
 import logging
 import random
@@ -1398,17 +1399,20 @@ async def importar_of(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = next(get_db())
     from open_finance.service import OpenFinanceService
     service = OpenFinanceService(db)
-    pending_txns = service.get_pending_transactions(user_id)
-    db.close()
-    pending_imports_cache[user_id] = pending_txns
+    try:
+        # Só o total e uma amostra: o lote completo é lido em partes na confirmação
+        total, amostra = service.get_pending_summary(user_id, limit=10)
+    finally:
+        db.close()
+    pending_imports_cache[user_id] = total
     # Resumo interativo
     resumo = f"<b>Resumo da Importação:</b>\n"
-    resumo += f"Total: {len(pending_txns)} novas transações\n"
+    resumo += f"Total: {total} novas transações\n"
     resumo += "\n".join([
-        f"• {getattr(tx, 'description', 'Sem descrição')} - R$ {abs(getattr(tx, 'amount', 0)):.2f}" for tx in pending_txns[:10]
+        f"• {tx['description'] or 'Sem descrição'} - R$ {abs(tx['amount']):.2f}" for tx in amostra
     ])
-    if len(pending_txns) > 10:
-        resumo += f"\n...e mais {len(pending_txns)-10} lançamentos."
+    if total > 10:
+        resumo += f"\n...e mais {total-10} lançamentos."
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("✅ Confirmar Importação", callback_data="confirmar_importacao")],
         [InlineKeyboardButton("❌ Cancelar", callback_data="cancelar_importacao")]
@@ -1421,39 +1425,75 @@ from telegram.ext import ContextTypes
 
 pending_imports_cache = {}
 
+# A partir deste tamanho o usuário recebe mensagens de progresso
+IMPORTACAO_PROGRESSO_MINIMO = 1000
+
 async def confirmar_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer("Importando...")
     user_id = update.effective_user.id
-    pending_txns = pending_imports_cache.get(user_id, [])
-    def salvar_thread():
+    chat_id = update.effective_chat.id
+    total_previsto = pending_imports_cache.pop(user_id, 0)
+    loop = asyncio.get_running_loop()
+
+    progress_msg = None
+    if total_previsto >= IMPORTACAO_PROGRESSO_MINIMO:
+        progress_msg = await context.bot.send_message(chat_id=chat_id, text=f"⏳ Importando {total_previsto} transações...")
+
+    def reportar_progresso(processadas: int, total: int):
+        # Chamado na thread de importação: agenda a edição da mensagem no event loop
+        if progress_msg:
+            asyncio.run_coroutine_threadsafe(
+                progress_msg.edit_text(f"⏳ Importando... {processadas}/{total} ({processadas * 100 // total}%)"),
+                loop,
+            )
+
+    def salvar_em_lote():
         db2 = next(get_db())
-        from models import Lancamento
-        imported_count = 0
-        for tx in pending_txns:
-            existing = db2.query(Lancamento).filter(
-                Lancamento.descricao == getattr(tx, 'description', ''),
-                Lancamento.valor == abs(getattr(tx, 'amount', 0)),
-                Lancamento.data_transacao == getattr(tx, 'date', None),
-                Lancamento.id_usuario == getattr(getattr(tx, 'account', type('A', (), {})).item, 'id_usuario', user_id)
-            ).first()
-            if not existing:
-                new_lancamento = Lancamento(
-                    id_usuario=getattr(getattr(tx, 'account', type('A', (), {})).item, 'id_usuario', user_id),
-                    descricao=getattr(tx, 'description', ''),
-                    valor=abs(getattr(tx, 'amount', 0)),
-                    tipo='Saída' if getattr(tx, 'amount', 0) < 0 else 'Entrada',
-                    data_transacao=getattr(tx, 'date', None),
-                    forma_pagamento=getattr(getattr(tx, 'account', type('A', (), {})).item, 'connector_name', 'Desconhecido'),
-                )
-                db2.add(new_lancamento)
-                imported_count += 1
-        db2.commit()
-        db2.close()
-        context.bot.send_message(chat_id=update.effective_chat.id,
-            text=f"✅ Importação concluída! {imported_count} lançamentos salvos.\n💡 Use /categorizar para organizar tudo com IA.",
-            parse_mode="HTML")
-    from threading import Thread
-    Thread(target=salvar_thread).start()
+        try:
+            from open_finance.service import OpenFinanceService
+            return OpenFinanceService(db2).import_pending_transactions(user_id, progress=reportar_progresso)
+        finally:
+            db2.close()
+
+    try:
+        stats = await asyncio.to_thread(salvar_em_lote)
+    except Exception as e:
+        logger.error(f"Erro ao importar transações Open Finance do usuário {user_id}: {e}", exc_info=True)
+        await context.bot.send_message(chat_id=chat_id, text="❌ Não foi possível concluir a importação. Tente novamente.")
+        return
+
+    texto = f"✅ Importação concluída! {stats['imported']} lançamentos salvos."
+    if stats['duplicates']:
+        texto += f"\n🔄 {stats['duplicates']} já existiam e foram apenas vinculadas."
+    if stats['imported']:
+        texto += "\n🤖 Categorizando com IA o que as regras não reconheceram..."
+        context.application.create_task(_categorizar_importados(user_id, chat_id, context))
+    await context.bot.send_message(chat_id=chat_id, text=texto, parse_mode="HTML")
+
+async def _categorizar_importados(user_id: int, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Categoriza em lote (background) os lançamentos importados que ficaram sem categoria."""
+    from gerente_financeiro.categorizacao_ia import categorizar_pendentes_usuario
+
+    def buscar_id_usuario():
+        db2 = next(get_db())
+        try:
+            usuario = db2.query(Usuario).filter(Usuario.telegram_id == user_id).first()
+            return usuario.id if usuario else None
+        finally:
+            db2.close()
+
+    try:
+        id_usuario = await asyncio.to_thread(buscar_id_usuario)
+        if id_usuario is None:
+            return
+        stats = await categorizar_pendentes_usuario(id_usuario)
+        if stats['categorizados']:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"✨ {stats['categorizados']} lançamentos importados foram categorizados com IA."
+            )
+    except Exception as e:
+        logger.error(f"Erro ao categorizar importação do usuário {user_id}: {e}", exc_info=True)
 
 async def cancelar_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer("Importação cancelada.")
@@ -0,0 +1,222 @@
+"""
+🧠 Memória de Categorias por Estabelecimento
+Aprende (estabelecimento normalizado) -> (categoria, subcategoria) a partir das
+confirmações e correções dos usuários e responde em O(1) antes das regras de
+palavra-chave.
+
+- Mapa por usuário: carregado do banco no primeiro acesso (uma consulta) e
+  mantido em memória (LRU por usuário);
+- Mapa global: estabelecimentos em que pelo menos ``MIN_USUARIOS_GLOBAL``
+  usuários concordam, recalculado a cada ``GLOBAL_TTL_SECONDS``;
+- O aprendizado grava no banco (upsert) e só atualiza o cache depois que a
+  transação do chamador é confirmada (commit).
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import MerchantCategoria
+from .categorizacao import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+MIN_USUARIOS_GLOBAL = 3
+GLOBAL_TTL_SECONDS = 3600
+MAX_USUARIOS_EM_CACHE = 2048
+MAX_TOKENS_MERCHANT = 3
+
+# Ruído comum em descrições bancárias/notas que não identifica o estabelecimento
+_STOPWORDS = {
+    'compra', 'compras', 'pagamento', 'pagto', 'pgto', 'pag', 'pix', 'ted', 'doc',
+    'cartao', 'credito', 'debito', 'deb', 'cred', 'elo', 'visa', 'master', 'mastercard',
+    'transf', 'transferencia', 'enviada', 'recebida', 'parcela', 'parc', 'no', 'na',
+    'de', 'da', 'do', 'em', 'com', 'ltda', 'me', 'epp', 'eireli', 'sa', 'cia',
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+Rotulo = Tuple[int, Optional[int]]
+
+# Chave em Session.info com os aprendizados aguardando o commit do chamador
+_PENDENTES = 'merchant_memory_pendentes'
+
+
+def normalizar_merchant(texto: Optional[str]) -> str:
+    """
+    Reduz uma descrição ao nome do estabelecimento.
+
+    'COMPRA CARTAO - PADARIA SAO JOSE LTDA 12/03' -> 'padaria sao jose'
+    """
+    tokens = [
+        t for t in _TOKEN.findall(normalizar_texto(texto))
+        if t not in _STOPWORDS and not t.isdigit() and len(t) > 1
+    ]
+    return " ".join(tokens[:MAX_TOKENS_MERCHANT])[:120]
+
+
+class MerchantMemory:
+    """Cache em memória das categorias aprendidas, com persistência em ``merchant_categorias``."""
+
+    def __init__(self, max_usuarios: int = MAX_USUARIOS_EM_CACHE, global_ttl: int = GLOBAL_TTL_SECONDS):
+        self.max_usuarios = max_usuarios
+        self.global_ttl = global_ttl
+        self._por_usuario: "OrderedDict[int, Dict[str, Rotulo]]" = OrderedDict()
+        self._global: Dict[str, Rotulo] = {}
+        self._global_carregado_em: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # ==================== CARGA ====================
+
+    def _mapa_usuario(self, db: Session, id_usuario: int) -> Dict[str, Rotulo]:
+        with self._lock:
+            mapa = self._por_usuario.get(id_usuario)
+            if mapa is not None:
+                self._por_usuario.move_to_end(id_usuario)
+                return mapa
+
+        rows = db.query(
+            MerchantCategoria.merchant_key,
+            MerchantCategoria.id_categoria,
+            MerchantCategoria.id_subcategoria,
+        ).filter(MerchantCategoria.id_usuario == id_usuario).all()
+        mapa = {key: (cat, sub) for key, cat, sub in rows}
+
+        with self._lock:
+            self._por_usuario[id_usuario] = mapa
+            self._por_usuario.move_to_end(id_usuario)
+            while len(self._por_usuario) > self.max_usuarios:
+                self._por_usuario.popitem(last=False)
+        return mapa
+
+    def _mapa_global(self, db: Session) -> Dict[str, Rotulo]:
+        if self._global_carregado_em is not None and time.monotonic() - self._global_carregado_em < self.global_ttl:
+            return self._global
+
+        usuarios = func.count(func.distinct(MerchantCategoria.id_usuario))
+        rows = (
+            db.query(
+                MerchantCategoria.merchant_key,
+                MerchantCategoria.id_categoria,
+                MerchantCategoria.id_subcategoria,
+                usuarios,
+            )
+            .group_by(MerchantCategoria.merchant_key, MerchantCategoria.id_categoria, MerchantCategoria.id_subcategoria)
+            .having(usuarios >= MIN_USUARIOS_GLOBAL)
+            .all()
+        )
+        # Se houver mais de um rótulo para o mesmo estabelecimento, vence o mais votado
+        melhores: Dict[str, Tuple[int, Rotulo]] = {}
+        for key, cat, sub, votos in rows:
+            if key not in melhores or votos > melhores[key][0]:
+                melhores[key] = (votos, (cat, sub))
+
+        self._global = {key: rotulo for key, (_, rotulo) in melhores.items()}
+        self._global_carregado_em = time.monotonic()
+        logger.info(f"🧠 Memória global de estabelecimentos carregada: {len(self._global)} entradas")
+        return self._global
+
+    # ==================== API ====================
+
+    def consultar(self, db: Session, id_usuario: int, texto: Optional[str]) -> Optional[Rotulo]:
+        """Retorna (id_categoria, id_subcategoria) aprendido para o texto, ou None."""
+        key = normalizar_merchant(texto)
+        if not key:
+            return None
+        try:
+            rotulo = self._mapa_usuario(db, id_usuario).get(key)
+            if rotulo is None:
+                rotulo = self._mapa_global(db).get(key)
+            return rotulo
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao consultar memória de estabelecimentos: {e}")
+            return None
+
+    def aprender(
+        self,
+        db: Session,
+        id_usuario: int,
+        texto: Optional[str],
+        id_categoria: Optional[int],
+        id_subcategoria: Optional[int] = None,
+    ) -> bool:
+        """
+        Registra a categoria escolhida pelo usuário para o estabelecimento.
+        A transação é do chamador (não faz commit); o cache só muda depois dele.
+        """
+        key = normalizar_merchant(texto)
+        if not key or not id_categoria:
+            return False
+
+        stmt = pg_insert(MerchantCategoria.__table__).values(
+            id_usuario=id_usuario,
+            merchant_key=key,
+            id_categoria=id_categoria,
+            id_subcategoria=id_subcategoria,
+            confirmacoes=1,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=['id_usuario', 'merchant_key'],
+            set_={
+                'id_categoria': stmt.excluded.id_categoria,
+                'id_subcategoria': stmt.excluded.id_subcategoria,
+                'confirmacoes': MerchantCategoria.__table__.c.confirmacoes + 1,
+                'atualizado_em': func.now(),
+            },
+        ))
+
+        self._memorizar_apos_commit(db, id_usuario, key, (id_categoria, id_subcategoria))
+        logger.debug(f"🧠 Aprendido '{key}' -> {id_categoria}/{id_subcategoria} (usuário {id_usuario})")
+        return True
+
+    def _memorizar_apos_commit(self, db: Session, id_usuario: int, key: str, rotulo: Rotulo) -> None:
+        """Agenda a atualização do cache para depois do commit; um rollback a descarta."""
+        db.info.setdefault(_PENDENTES, []).append((self, id_usuario, key, rotulo))
+        if not event.contains(db, 'after_commit', _aplicar_pendentes):
+            event.listen(db, 'after_commit', _aplicar_pendentes)
+            event.listen(db, 'after_rollback', _descartar_pendentes)
+
+    def _memorizar(self, id_usuario: int, key: str, rotulo: Rotulo) -> None:
+        with self._lock:
+            mapa = self._por_usuario.get(id_usuario)
+            if mapa is not None:
+                mapa[key] = rotulo
+
+    def invalidar(self, id_usuario: Optional[int] = None) -> None:
+        """Descarta o cache de um usuário (ou de todos, incluindo o global)."""
+        with self._lock:
+            if id_usuario is None:
+                self._por_usuario.clear()
+                self._global = {}
+                self._global_carregado_em = None
+            else:
+                self._por_usuario.pop(id_usuario, None)
+
+
+def _aplicar_pendentes(session: Session) -> None:
+    for memoria, id_usuario, key, rotulo in session.info.pop(_PENDENTES, ()):
+        memoria._memorizar(id_usuario, key, rotulo)
+
+
+def _descartar_pendentes(session: Session) -> None:
+    session.info.pop(_PENDENTES, None)
+
+
+_memory: Optional[MerchantMemory] = None
+
+
+def get_merchant_memory() -> MerchantMemory:
+    """Retorna a instância compartilhada da memória de estabelecimentos."""
+    global _memory
+    if _memory is None:
+        _memory = MerchantMemory()
+    return _memory
+
+
+__all__ = ['MerchantMemory', 'get_merchant_memory', 'normalizar_merchant']
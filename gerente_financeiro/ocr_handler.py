@@ -20,6 +20,8 @@ import config
 from database.database import get_or_create_user, get_db
 from models import Lancamento, ItemLancamento, Categoria, Subcategoria, Usuario
 from .states import OCR_CONFIRMATION_STATE
+from .merchant_memory import get_merchant_memory
+from .categorizacao_ia import get_catalogo
 
 # Configurar logging específico para OCR com arquivo dedicado
 def setup_ocr_logging():
@@ -610,14 +612,10 @@ async def ocr_iniciar_como_subprocesso(update: Update, context: ContextTypes.DEF
         logger.info("🧠 FASE 4: Analisando com IA")
         await message.edit_text(f"🧠 Texto extraído! Analisando com IA...\n<i>Método: {ocr_method_used}</i>", parse_mode='HTML')
         
-        # Buscar categorias
+        # Catálogo de categorias (cacheado, compartilhado com a categorização em lote)
         db: Session = next(get_db())
         try:
-            categorias_db = db.query(Categoria).options(joinedload(Categoria.subcategorias)).all()
-            categorias_formatadas = [
-                f"- {cat.nome}: ({', '.join(sub.nome for sub in cat.subcategorias)})" for cat in categorias_db
-            ]
-            categorias_contexto = "\n".join(categorias_formatadas)
+            categorias_contexto = get_catalogo(db).texto_nomes
         finally:
             db.close()
         
@@ -810,6 +808,17 @@ async def ocr_action_processor(update: Update, context: ContextTypes.DEFAULT_TYP
             db.add(novo_lancamento)
             db.commit()
 
+            # Confirmação do usuário: memoriza a categoria para o estabelecimento.
+            # Falhar aqui não pode desfazer o lançamento já salvo.
+            try:
+                if get_merchant_memory().aprender(
+                    db, usuario_db.id, dados.get('nome_estabelecimento'), id_categoria, id_subcategoria
+                ):
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"⚠️ Não foi possível memorizar a categoria do estabelecimento: {e}")
+
             # Mensagem de sucesso será enviada pelo handler principal
         except Exception as e:
             db.rollback()
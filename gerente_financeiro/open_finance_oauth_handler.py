@@ -21,13 +21,15 @@ from telegram.ext import (
 
 from database.database import get_db
 from open_finance.service import OpenFinanceService
-from open_finance.pluggy_client import PluggyClient, PluggyClientError
+from open_finance.pluggy_client import PluggyClientError
+from open_finance.connector_catalog import get_connector_catalog
+from open_finance.item_watcher import EVENT_ERROR, EVENT_READY, EVENT_USER_INPUT, get_item_watcher
 from config import PLUGGY_WHITELIST_IDS
 
 logger = logging.getLogger(__name__)
 
 # Estados da conversa
-SELECTING_BANK, AWAITING_CPF, WAITING_AUTH = range(3)
+SELECTING_BANK, AWAITING_CPF = range(2)
 
 
 # --- Funções Auxiliares de UI ---
@@ -65,6 +67,16 @@ def _build_banks_keyboard(connectors: list) -> InlineKeyboardMarkup:
     keyboard.append([InlineKeyboardButton("❌ Cancelar", callback_data="of_cancel")])
     return InlineKeyboardMarkup(keyboard)
 
+# Teclado pré-montado, reconstruído apenas quando a versão do catálogo muda
+_banks_keyboard_cache: dict = {"version": None, "keyboard": None}
+
+def _get_banks_keyboard(catalog) -> InlineKeyboardMarkup:
+    """Retorna o teclado de bancos memoizado pela versão do catálogo de conectores."""
+    if _banks_keyboard_cache["version"] != catalog.version or _banks_keyboard_cache["keyboard"] is None:
+        _banks_keyboard_cache["keyboard"] = _build_banks_keyboard(catalog.get_connectors(oauth_only=True))
+        _banks_keyboard_cache["version"] = catalog.version
+    return _banks_keyboard_cache["keyboard"]
+
 def _find_oauth_url(item_data: dict) -> Optional[str]:
     """Inspeciona a resposta da API da Pluggy para encontrar a URL de autorização."""
     if not item_data:
@@ -100,14 +112,16 @@ async def start_flow(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Buscando bancos disponíveis com Open Finance...")
     
     try:
-        client = PluggyClient()
-        connectors = client.get_connectors()
-        oauth_connectors = [c for c in connectors if c.get("oauth")]
-        oauth_connectors.sort(key=lambda x: x['name'])
+        catalog = get_connector_catalog()
+        # Só chega à API se o catálogo estiver vazio; dados vencidos são servidos
+        # enquanto o job de background atualiza
+        oauth_connectors = await asyncio.to_thread(catalog.get_connectors, True)
+        if catalog.is_stale():
+            context.application.create_task(catalog.refresh_if_stale())
         
         context.user_data['of_connectors'] = {c['id']: c for c in oauth_connectors}
         
-        keyboard = _build_banks_keyboard(oauth_connectors)
+        keyboard = _get_banks_keyboard(catalog)
         await update.message.reply_text("Selecione seu banco:", reply_markup=keyboard)
         return SELECTING_BANK
     except PluggyClientError as e:
@@ -167,7 +181,7 @@ async def handle_cpf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         if not oauth_url:
             # Fallback: aguarda um pouco e tenta novamente
             await asyncio.sleep(4)
-            item_status = service.get_item_status(item_id)
+            item_status = await asyncio.to_thread(service.get_item_status, item_id)
             oauth_url = _find_oauth_url(item_status)
             if not oauth_url:
                  raise PluggyClientError("Não foi possível obter o link de autorização do banco após a criação.")
@@ -181,7 +195,9 @@ async def handle_cpf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             "Depois, volte aqui e clique em 'Já autorizei'.",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
-        return WAITING_AUTH
+        # "Já autorizei" é tratado fora da conversa (authorized_handler): o mesmo botão
+        # volta nas mensagens do observador, depois que a conversa já terminou
+        return ConversationHandler.END
         
     except PluggyClientError as e:
         logger.error(f"Erro de cliente Pluggy ao criar conexão: {e}")
@@ -195,36 +211,87 @@ async def handle_cpf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         db.close()
 
 async def authorized_flow(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Verifica o status da conexão após o usuário autorizar."""
+    """Botão "Já autorizei" (of_authorized_<item>): agenda a verificação da conexão em background."""
     query = update.callback_query
     await query.answer("Verificando...")
     
     item_id = query.data.split("_")[-1]
+    telegram_id = query.from_user.id
+    chat_id = query.message.chat_id
     
-    await query.edit_message_text("🔄 Sincronizando dados da sua conta. Isso pode levar um minuto...")
+    await query.edit_message_text(
+        "🔄 Sincronizando dados da sua conta. Vou te avisar aqui assim que o banco responder..."
+    )
+
+    async def notificar(evento: str, item: dict) -> None:
+        await _notificar_status_conexao(context, chat_id, telegram_id, evento, item)
+
+    # Observação em background: o handler retorna imediatamente. O item ainda fica em
+    # WAITING_USER_INPUT por um tempo; só um novo pedido do banco volta ao usuário
+    get_item_watcher().watch(item_id, notificar, autorizacao_enviada=True)
+    return ConversationHandler.END
+
 
+def authorized_handler() -> CallbackQueryHandler:
+    """Handler avulso do botão "Já autorizei", válido a qualquer momento após o /conectar_banco."""
+    return CallbackQueryHandler(authorized_flow, pattern="^of_authorized_")
+
+
+def _finalizar_conexao(telegram_id: int, item_status: dict) -> int:
+    """Persiste o item e sincroniza as contas (bloqueante, executado em thread)."""
     db = next(get_db())
-    service = OpenFinanceService(db)
     try:
-        # Loop de verificação
-        for _ in range(10): # Tenta por até 50 segundos
-            item_status = service.get_item_status(item_id)
-            if item_status.get("status") in ("UPDATED", "PARTIAL_SUCCESS"):
-                saved_item = service.save_connection_details(query.from_user.id, item_status)
-                new_acc, _ = service.sync_accounts_for_item(saved_item)
-                await query.edit_message_text(f"✅ Conexão bem-sucedida! {new_acc} conta(s) encontrada(s). Use /minhas_contas para ver os detalhes.")
-                return ConversationHandler.END
-            await asyncio.sleep(5)
-            
-        await query.edit_message_text("A conexão está demorando mais que o esperado. Vou continuar tentando em background e te aviso quando terminar.")
-        return ConversationHandler.END
-    except (PluggyClientError, ValueError) as e:
-        await query.edit_message_text(f"❌ Erro na finalização da conexão: {e}")
-        return ConversationHandler.END
+        service = OpenFinanceService(db)
+        saved_item = service.save_connection_details(telegram_id, item_status)
+        new_acc, _ = service.sync_accounts_for_item(saved_item)
+        return new_acc
     finally:
         db.close()
 
 
+async def _notificar_status_conexao(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    telegram_id: int,
+    evento: str,
+    item: dict,
+) -> None:
+    """Envia ao chat do usuário o resultado da observação de um item."""
+    if evento == EVENT_READY:
+        try:
+            new_acc = await asyncio.to_thread(_finalizar_conexao, telegram_id, item)
+            texto = f"✅ Conexão bem-sucedida! {new_acc} conta(s) encontrada(s). Use /minhas_contas para ver os detalhes."
+        except (PluggyClientError, ValueError) as e:
+            texto = f"❌ Erro na finalização da conexão: {e}"
+        await context.bot.send_message(chat_id, texto)
+        return
+
+    if evento == EVENT_USER_INPUT:
+        oauth_url = _find_oauth_url(item)
+        reply_markup = None
+        if oauth_url:
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔐 Autorizar no Banco", url=oauth_url)],
+                [InlineKeyboardButton("✅ Já autorizei", callback_data=f"of_authorized_{item.get('id')}")]
+            ])
+        await context.bot.send_message(
+            chat_id,
+            "🔐 O banco solicitou uma confirmação adicional. Conclua a autorização e toque em 'Já autorizei'.",
+            reply_markup=reply_markup
+        )
+        return
+
+    if evento == EVENT_ERROR:
+        detalhe = item.get('statusDetail') or "O banco rejeitou a conexão."
+        await context.bot.send_message(chat_id, f"❌ Não foi possível concluir a conexão: {detalhe}")
+        return
+
+    await context.bot.send_message(
+        chat_id,
+        "⏱️ O banco ainda está processando sua autorização. Tente novamente com /conectar_banco em alguns minutos."
+    )
+
+
 async def cancel_flow(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancela o fluxo de conversa."""
     message = update.message or update.callback_query.message
@@ -322,7 +389,6 @@ def get_open_finance_handlers():
         states={
             SELECTING_BANK: [CallbackQueryHandler(bank_selected, pattern="^of_bank_")],
             AWAITING_CPF: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cpf)],
-            WAITING_AUTH: [CallbackQueryHandler(authorized_flow, pattern="^of_authorized_")]
         },
         fallbacks=[
             CommandHandler("cancelar", cancel_flow),
@@ -333,6 +399,7 @@ def get_open_finance_handlers():
 
     return [
         conv_handler,
+        authorized_handler(),
         CommandHandler("minhas_contas", list_accounts),
         CommandHandler("sincronizar", sync_transactions),
         # O handler para /categorizar será adicionado aqui depois
@@ -352,7 +419,6 @@ class OpenFinanceOAuthHandler:
             states={
                 SELECTING_BANK: [CallbackQueryHandler(bank_selected, pattern="^of_bank_")],
                 AWAITING_CPF: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cpf)],
-                WAITING_AUTH: [CallbackQueryHandler(authorized_flow, pattern="^of_authorized_")]
             },
             fallbacks=[
                 CommandHandler("cancelar", cancel_flow),
@@ -376,16 +442,20 @@ class OpenFinanceOAuthHandler:
     
     async def categorizar_lancamentos(self, update, context):
         """Handler interativo para /categorizar: mostra quantos lançamentos há, pede confirmação, executa categorização."""
-        user_id = update.effective_user.id
+        from models import Lancamento, Usuario
+        from gerente_financeiro.services import _categorizar_com_mapa_inteligente, _get_all_categories_and_subcategories
+        from gerente_financeiro.categorizacao_ia import categorizar_pendentes_usuario
+
         db = next(get_db())
-        from models import Lancamento
-        from gerente_financeiro.services import _categorizar_com_mapa_inteligente
-        lancamentos = db.query(Lancamento).filter(
-            Lancamento.id_usuario == user_id,
-            Lancamento.id_categoria == None
-        ).all()
-        total = len(lancamentos)
-        db.close()
+        try:
+            usuario = db.query(Usuario).filter(Usuario.telegram_id == update.effective_user.id).first()
+            id_usuario = usuario.id if usuario else None
+            total = db.query(Lancamento).filter(
+                Lancamento.id_usuario == id_usuario,
+                Lancamento.id_categoria == None
+            ).count() if usuario else 0
+        finally:
+            db.close()
         if total == 0:
             await update.message.reply_text("✅ Todas as transações já estão categorizadas!")
             return
@@ -398,24 +468,42 @@ class OpenFinanceOAuthHandler:
         ])
         await update.message.reply_text(resumo, reply_markup=keyboard, parse_mode="HTML")
 
+        def categorizar_por_regras() -> int:
+            # Regras de palavra-chave primeiro: resolvem a maior parte sem chamar a IA
+            db2 = next(get_db())
+            try:
+                mapas = _get_all_categories_and_subcategories(db2)
+                lancamentos2 = db2.query(Lancamento).filter(
+                    Lancamento.id_usuario == id_usuario,
+                    Lancamento.id_categoria == None
+                ).all()
+                categorizados = 0
+                for l in lancamentos2:
+                    cat_id, subcat_id = _categorizar_com_mapa_inteligente(l.descricao or "", l.tipo, db2, mapas)
+                    if cat_id:
+                        l.id_categoria = cat_id
+                        l.id_subcategoria = subcat_id
+                        categorizados += 1
+                db2.commit()
+                return categorizados
+            finally:
+                db2.close()
+
+        async def categorizar_em_background(query):
+            try:
+                por_regras = await asyncio.to_thread(categorizar_por_regras)
+                stats = await categorizar_pendentes_usuario(id_usuario)
+                await query.edit_message_text(
+                    f"✨ {por_regras + stats['categorizados']} lançamentos categorizados automaticamente! 🚀"
+                )
+            except Exception as e:
+                logger.error(f"❌ Erro na categorização do usuário {id_usuario}: {e}", exc_info=True)
+                await query.edit_message_text("❌ Não foi possível concluir a categorização. Tente novamente.")
+
         async def confirmar_callback(update, context):
             await update.callback_query.answer("Categorizando...")
-            db2 = next(get_db())
-            lancamentos2 = db2.query(Lancamento).filter(
-                Lancamento.id_usuario == user_id,
-                Lancamento.id_categoria == None
-            ).all()
-            categorizados = 0
-            for l in lancamentos2:
-                texto_busca = (l.descricao or "")
-                cat_id, subcat_id = _categorizar_com_mapa_inteligente(texto_busca, l.tipo, db2)
-                if cat_id:
-                    l.id_categoria = cat_id
-                    l.id_subcategoria = subcat_id
-                    categorizados += 1
-            db2.commit()
-            db2.close()
-            await update.callback_query.edit_message_text(f"✨ {categorizados} lançamentos categorizados automaticamente! 🚀")
+            await update.callback_query.edit_message_text("🤖 Categorizando seus lançamentos em segundo plano...")
+            context.application.create_task(categorizar_em_background(update.callback_query))
 
         async def cancelar_callback(update, context):
             await update.callback_query.answer("Cancelado.")
@@ -442,6 +530,10 @@ class OpenFinanceOAuthHandler:
         # Placeholder
         pass
     
+    async def handle_authorized_callback(self, update, context):
+        """Handler para o botão "Já autorizei" (fora da conversa)"""
+        await authorized_flow(update, context)
+    
     async def handle_sync_now_callback(self, update, context):
         """Handler para callback de sync now"""
         # Placeholder
@@ -2,6 +2,8 @@
 
 import io
 import os
+import tempfile
+import threading
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
@@ -39,6 +41,109 @@ def register_fonts():
 
 FONT_REG, FONT_BOLD = register_fonts()
 
+# --- ESTILOS (imutáveis: criados uma vez por processo e compartilhados) ---
+_STYLES = getSampleStyleSheet()
+
+STYLE_H2 = ParagraphStyle(
+    'H2', parent=_STYLES['Heading2'], 
+    fontName=FONT_BOLD, fontSize=16, 
+    textColor=COLOR_PRIMARY, 
+    spaceAfter=10, spaceBefore=20
+)
+STYLE_NORMAL = ParagraphStyle(
+    'Normal', parent=_STYLES['Normal'], 
+    fontName=FONT_REG, fontSize=10, 
+    textColor=COLOR_TEXT_MAIN, leading=14
+)
+STYLE_INSIGHT = ParagraphStyle(
+    'Insight', parent=_STYLES['Normal'], 
+    fontName=FONT_REG, fontSize=10, 
+    textColor=HexColor('#065F46'), 
+    backColor=HexColor('#ECFDF5'), 
+    padding=10, 
+    borderColor=HexColor('#10B981'), 
+    borderWidth=0.5, 
+    borderRadius=5, 
+    spaceAfter=5
+)
+
+# Tabelas com cabeçalho escuro e linhas zebradas (categorias, projeções, resumo mensal)
+TABLE_STYLE_DADOS = TableStyle([
+    ('FONTNAME', (0,0), (-1,0), FONT_BOLD),
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRIMARY),
+    ('TEXTCOLOR', (0,0), (-1,0), COLOR_WHITE),
+    ('ALIGN', (1,0), (-1,-1), 'RIGHT'),
+    ('FONTNAME', (0,1), (-1,-1), FONT_REG),
+    ('ROWBACKGROUNDS', (0,1), (-1,-1), [COLOR_BG_LIGHT, COLOR_WHITE]),
+    ('GRID', (0,0), (-1,-1), 0.5, HexColor('#E2E8F0')),
+    ('BOTTOMPADDING', (0,0), (-1,-1), 6),
+    ('TOPPADDING', (0,0), (-1,-1), 6),
+])
+TABLE_STYLE_MAIORES = TableStyle([
+    ('FONTNAME', (0,0), (-1,0), FONT_BOLD),
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRIMARY),
+    ('TEXTCOLOR', (0,0), (-1,0), COLOR_WHITE),
+    ('ALIGN', (3,0), (3,-1), 'RIGHT'),
+    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ('FONTNAME', (0,1), (-1,-1), FONT_REG),
+    ('ROWBACKGROUNDS', (0,1), (-1,-1), [COLOR_BG_LIGHT, COLOR_WHITE]),
+    ('GRID', (0,0), (-1,-1), 0.5, HexColor('#E2E8F0')),
+    ('BOTTOMPADDING', (0,0), (-1,-1), 6),
+    ('TOPPADDING', (0,0), (-1,-1), 6),
+])
+TABLE_STYLE_KPI = TableStyle([
+    ('VALIGN', (0,0), (-1,-1), 'TOP'),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+])
+# Extratos longos: fonte menor e padding curto
+TABLE_STYLE_EXTRATO = TableStyle([
+    ('FONTNAME', (0,0), (-1,0), FONT_BOLD),
+    ('FONTSIZE', (0,0), (-1,-1), 8),
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRIMARY),
+    ('TEXTCOLOR', (0,0), (-1,0), COLOR_WHITE),
+    ('ALIGN', (4,0), (4,-1), 'RIGHT'),
+    ('FONTNAME', (0,1), (-1,-1), FONT_REG),
+    ('ROWBACKGROUNDS', (0,1), (-1,-1), [COLOR_BG_LIGHT, COLOR_WHITE]),
+    ('LINEBELOW', (0,0), (-1,-1), 0.25, HexColor('#E2E8F0')),
+    ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+    ('TOPPADDING', (0,0), (-1,-1), 2),
+])
+
+# Frames e PageTemplates guardam a posição corrente durante o build, então não
+# podem ser compartilhados entre builds simultâneos: cada thread reaproveita os seus.
+_templates_por_thread = threading.local()
+
+
+def _page_templates():
+    """(template da capa, template de conteúdo, frame de conteúdo) da thread atual."""
+    templates = getattr(_templates_por_thread, 'templates', None)
+    if templates is None:
+        # Frame da Capa: Margem Zero, ocupa a folha toda
+        frame_cover = Frame(
+            0, 0, A4[0], A4[1], 
+            id='cover', 
+            leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0
+        )
+        # Frame do Conteúdo: Margens de 20mm
+        frame_content = Frame(
+            20*mm, 20*mm, A4[0]-40*mm, A4[1]-40*mm, 
+            id='content'
+        )
+        templates = (
+            PageTemplate(id='Cover', frames=[frame_cover]),
+            PageTemplate(id='Normal', frames=[frame_content], onPage=footer_canvas),
+            frame_content,
+        )
+        _templates_por_thread.templates = templates
+    return templates
+
+
+def _novo_documento(destino, **kwargs):
+    template_cover, template_content, frame_content = _page_templates()
+    doc = BaseDocTemplate(destino, pagesize=A4, **kwargs)
+    doc.addPageTemplates([template_cover, template_content])
+    return doc, frame_content
+
 class GradientCover(Flowable):
     """
     Desenha a capa ocupando 100% da página (sem margens).
@@ -177,59 +282,39 @@ def validate_flowable_size(flowable, max_width, max_height):
             flowable.x *= scale_factor
             flowable.y *= scale_factor
 
+def _grade_kpis(rec, desp, saldo, poup):
+    """Grade 2x2 de cards (receitas, despesas, saldo, taxa de poupança)."""
+    card_w = 82*mm
+    card_h = 35*mm
+    
+    kpi_data = [
+        [
+            KPICard("Receitas", f"R$ {rec:,.2f}", "Entradas", "up", card_w, card_h),
+            KPICard("Despesas", f"R$ {desp:,.2f}", "Saídas", "down", card_w, card_h)
+        ],
+        [
+            KPICard("Saldo Líquido", f"R$ {saldo:,.2f}", "Caixa", "neutral", card_w, card_h),
+            KPICard("Taxa Poupança", f"{poup:.1f}%", "Meta: 20%", "up" if poup > 20 else "down", card_w, card_h)
+        ]
+    ]
+    
+    t_kpi = Table(kpi_data, colWidths=[85*mm, 85*mm], rowHeights=[40*mm, 40*mm])
+    t_kpi.setStyle(TABLE_STYLE_KPI)
+    return t_kpi
+
 def generate_financial_pdf(context):
     """
     Gera o PDF usando BaseDocTemplate para permitir layouts diferentes (Capa vs Conteúdo).
     """
     buffer = io.BytesIO()
     
-    # 1. DEFINIÇÃO DOS FRAMES E TEMPLATES
-    
-    # Frame da Capa: Margem Zero, ocupa a folha toda
-    frame_cover = Frame(
-        0, 0, A4[0], A4[1], 
-        id='cover', 
-        leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0
-    )
-    template_cover = PageTemplate(id='Cover', frames=[frame_cover])
-    
-    # Frame do Conteúdo: Margens de 20mm
-    frame_content = Frame(
-        20*mm, 20*mm, A4[0]-40*mm, A4[1]-40*mm, 
-        id='content'
-    )
-    template_content = PageTemplate(id='Normal', frames=[frame_content], onPage=footer_canvas)
-    
-    # Inicializa o Documento Base
-    doc = BaseDocTemplate(buffer, pagesize=A4)
-    doc.addPageTemplates([template_cover, template_content])
+    # 1. Documento com os templates (Capa vs Conteúdo) e estilos já prontos
+    doc, frame_content = _novo_documento(buffer)
     
     elements = []
-    styles = getSampleStyleSheet()
-    
-    # Estilos Personalizados
-    style_h2 = ParagraphStyle(
-        'H2', parent=styles['Heading2'], 
-        fontName=FONT_BOLD, fontSize=16, 
-        textColor=COLOR_PRIMARY, 
-        spaceAfter=10, spaceBefore=20
-    )
-    style_normal = ParagraphStyle(
-        'Normal', parent=styles['Normal'], 
-        fontName=FONT_REG, fontSize=10, 
-        textColor=COLOR_TEXT_MAIN, leading=14
-    )
-    style_insight = ParagraphStyle(
-        'Insight', parent=styles['Normal'], 
-        fontName=FONT_REG, fontSize=10, 
-        textColor=HexColor('#065F46'), 
-        backColor=HexColor('#ECFDF5'), 
-        padding=10, 
-        borderColor=HexColor('#10B981'), 
-        borderWidth=0.5, 
-        borderRadius=5, 
-        spaceAfter=5
-    )
+    style_h2 = STYLE_H2
+    style_normal = STYLE_NORMAL
+    style_insight = STYLE_INSIGHT
 
     # --- CONSTRUÇÃO DO CONTEÚDO ---
 
@@ -255,25 +340,7 @@ def generate_financial_pdf(context):
     poup = context.get('taxa_poupanca', 0)
     
     # Grid de Cards
-    card_w = 82*mm
-    card_h = 35*mm
-    
-    kpi_data = [
-        [
-            KPICard("Receitas", f"R$ {rec:,.2f}", "Entradas", "up", card_w, card_h),
-            KPICard("Despesas", f"R$ {desp:,.2f}", "Saídas", "down", card_w, card_h)
-        ],
-        [
-            KPICard("Saldo Líquido", f"R$ {saldo:,.2f}", "Caixa", "neutral", card_w, card_h),
-            KPICard("Taxa Poupança", f"{poup:.1f}%", "Meta: 20%", "up" if poup > 20 else "down", card_w, card_h)
-        ]
-    ]
-    
-    t_kpi = Table(kpi_data, colWidths=[85*mm, 85*mm], rowHeights=[40*mm, 40*mm])
-    t_kpi.setStyle(TableStyle([
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-    ]))
+    t_kpi = _grade_kpis(rec, desp, saldo, poup)
     elements.append(t_kpi)
     
     # 3. GRÁFICO E TABELA
@@ -328,21 +395,29 @@ def generate_financial_pdf(context):
             table_data.append([cat, f"R$ {val_float:,.2f}", f"{perc:.1f}%"])
             
         t_cat = Table(table_data, colWidths=[90*mm, 40*mm, 30*mm])
-        t_cat.setStyle(TableStyle([
-            ('FONTNAME', (0,0), (-1,0), FONT_BOLD),
-            ('BACKGROUND', (0,0), (-1,0), COLOR_PRIMARY),
-            ('TEXTCOLOR', (0,0), (-1,0), COLOR_WHITE),
-            ('ALIGN', (1,0), (-1,-1), 'RIGHT'),
-            ('FONTNAME', (0,1), (-1,-1), FONT_REG),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [COLOR_BG_LIGHT, COLOR_WHITE]),
-            ('GRID', (0,0), (-1,-1), 0.5, HexColor('#E2E8F0')),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 6),
-            ('TOPPADDING', (0,0), (-1,-1), 6),
-        ]))
+        t_cat.setStyle(TABLE_STYLE_DADOS)
         elements.append(t_cat)
     else:
         elements.append(Paragraph("Nenhum gasto registrado neste período.", style_normal))
 
+    # Maiores despesas do período
+    top_gastos = context.get('top_gastos', [])
+    if top_gastos:
+        elements.append(Spacer(1, 5*mm))
+        elements.append(Paragraph("Maiores Despesas", style_h2))
+        table_top = [['Data', 'Descrição', 'Categoria', 'Valor']]
+        for gasto in top_gastos:
+            data_gasto = gasto.get('data')
+            table_top.append([
+                data_gasto.strftime('%d/%m') if data_gasto else '',
+                Paragraph(str(gasto.get('descricao') or '')[:60], style_normal),
+                gasto.get('categoria', ''),
+                f"R$ {float(gasto.get('valor', 0)):,.2f}",
+            ])
+        t_top = Table(table_top, colWidths=[18*mm, 80*mm, 42*mm, 30*mm], repeatRows=1)
+        t_top.setStyle(TABLE_STYLE_MAIORES)
+        elements.append(t_top)
+
     # 4. INSIGHTS
     elements.append(Spacer(1, 10*mm))
     elements.append(Paragraph("Insights Inteligentes", style_h2))
@@ -390,17 +465,7 @@ def generate_financial_pdf(context):
         table_proj_data.append([f"Mês {i}", f"R$ {rec*i:,.2f}", f"R$ {desp*i:,.2f}"])
         
     t_proj = Table(table_proj_data, colWidths=[60*mm, 60*mm, 60*mm])
-    t_proj.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,0), FONT_BOLD),
-        ('BACKGROUND', (0,0), (-1,0), COLOR_PRIMARY),
-        ('TEXTCOLOR', (0,0), (-1,0), COLOR_WHITE),
-        ('ALIGN', (1,0), (-1,-1), 'RIGHT'),
-        ('FONTNAME', (0,1), (-1,-1), FONT_REG),
-        ('ROWBACKGROUNDS', (0,1), (-1,-1), [COLOR_BG_LIGHT, COLOR_WHITE]),
-        ('GRID', (0,0), (-1,-1), 0.5, HexColor('#E2E8F0')),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 6),
-        ('TOPPADDING', (0,0), (-1,-1), 6),
-    ]))
+    t_proj.setStyle(TABLE_STYLE_DADOS)
     elements.append(t_proj)
 
     # 6. GERAR PDF
@@ -421,4 +486,148 @@ def generate_financial_pdf(context):
         raise e
     
     buffer.seek(0)
-    return buffer.getvalue()
\ No newline at end of file
+    return buffer.getvalue()
+
+# --- RELATÓRIO DE VÁRIOS MESES (ANUAL OU INTERVALO) ---
+
+SPOOL_MAX_BYTES = 8 * 1024 * 1024  # acima disso o PDF vai para um arquivo temporário em disco
+LINHAS_POR_TABELA = 40
+
+
+class _FlowablesSobDemanda(list):
+    """
+    Lista de flowables alimentada por um iterável de blocos.
+
+    Depende de um detalhe interno de ``BaseDocTemplate.build`` (ReportLab
+    4.4, fixado em requirements.txt): o laço chama ``len()`` a cada passo,
+    consome a lista pelo início (``del flowables[0]``) e reinsere no início
+    as partes de um flowable dividido. O próximo bloco (um mês, uma tabela de
+    extrato) só é montado quando a lista está quase vazia, então as tabelas de
+    um ano inteiro não ficam montadas ao mesmo tempo.
+
+    As páginas já desenhadas continuam no canvas até o ``save()`` do fim do
+    build: a memória ainda cresce com o número de páginas, só sem o pico de
+    todos os flowables do período.
+    """
+
+    def __init__(self, blocos):
+        super().__init__()
+        self._blocos = iter(blocos)
+
+    def __len__(self):
+        while self._blocos is not None and super().__len__() < 2:
+            try:
+                self.extend(next(self._blocos))
+            except StopIteration:
+                self._blocos = None
+        return super().__len__()
+
+
+def _tabelas_extrato(lancamentos):
+    """Tabelas de LINHAS_POR_TABELA lançamentos, montadas uma de cada vez."""
+    cabecalho = ['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor']
+    linhas = []
+    for data, descricao, categoria, tipo, valor in lancamentos:
+        linhas.append([
+            data.strftime('%d/%m') if data else '',
+            str(descricao or '')[:55],
+            str(categoria or '')[:25],
+            tipo or '',
+            f"R$ {float(valor or 0):,.2f}",
+        ])
+        if len(linhas) == LINHAS_POR_TABELA:
+            yield [_tabela_extrato(cabecalho, linhas)]
+            linhas = []
+    if linhas:
+        yield [_tabela_extrato(cabecalho, linhas)]
+
+
+def _tabela_extrato(cabecalho, linhas):
+    tabela = Table([cabecalho] + linhas, colWidths=[14*mm, 72*mm, 40*mm, 18*mm, 26*mm], repeatRows=1)
+    tabela.setStyle(TABLE_STYLE_EXTRATO)
+    return tabela
+
+
+def _blocos_periodo(context, meses):
+    """Capa e resumo do período, depois um bloco por mês (cabeçalho + extrato)."""
+    rec = context.get('receita_total', 0)
+    desp = context.get('despesa_total', 0)
+    saldo = context.get('saldo_mes', 0)
+    poup = context.get('taxa_poupanca', 0)
+
+    yield [
+        GradientCover(
+            A4[0], A4[1],
+            context.get('usuario_nome', 'Investidor'),
+            context.get('periodo_extenso', 'Período')
+        ),
+        NextPageTemplate('Normal'),
+        PageBreak(),
+        Paragraph("Resumo do Período", STYLE_H2),
+        Spacer(1, 5*mm),
+        _grade_kpis(rec, desp, saldo, poup),
+    ]
+
+    resumo_mensal = context.get('resumo_mensal', [])
+    if resumo_mensal:
+        dados = [['Mês', 'Receitas', 'Despesas', 'Saldo']]
+        dados += [
+            [rotulo, f"R$ {r:,.2f}", f"R$ {d:,.2f}", f"R$ {r - d:,.2f}"]
+            for rotulo, r, d in resumo_mensal
+        ]
+        t_meses = Table(dados, colWidths=[50*mm, 40*mm, 40*mm, 40*mm], repeatRows=1)
+        t_meses.setStyle(TABLE_STYLE_DADOS)
+        yield [Spacer(1, 5*mm), Paragraph("Mês a Mês", STYLE_H2), t_meses]
+
+    cats = context.get('gastos_agrupados', [])[:10]
+    if cats:
+        dados = [['Categoria', 'Valor', '%']]
+        dados += [
+            [cat, f"R$ {float(val):,.2f}", f"{(float(val) / float(desp) * 100) if desp > 0 else 0:.1f}%"]
+            for cat, val in cats
+        ]
+        t_cat = Table(dados, colWidths=[90*mm, 40*mm, 30*mm], repeatRows=1)
+        t_cat.setStyle(TABLE_STYLE_DADOS)
+        yield [Spacer(1, 5*mm), Paragraph("Gastos por Categoria no Período", STYLE_H2), t_cat]
+
+    for mes in meses:
+        yield [
+            PageBreak(),
+            Paragraph(f"Extrato de {mes['rotulo']}", STYLE_H2),
+            Paragraph(
+                f"Receitas: R$ {mes.get('receitas', 0):,.2f} • Despesas: R$ {mes.get('despesas', 0):,.2f}",
+                STYLE_NORMAL
+            ),
+            Spacer(1, 3*mm),
+        ]
+        vazio = True
+        for bloco in _tabelas_extrato(mes.get('lancamentos', [])):
+            vazio = False
+            yield bloco
+        if vazio:
+            yield [Paragraph("Nenhum lançamento neste mês.", STYLE_NORMAL)]
+
+
+def generate_period_pdf(context, meses, destino=None):
+    """
+    Relatório de vários meses (anual ou intervalo arbitrário) com o extrato
+    completo de cada mês.
+
+    ``context`` traz os totais do período (mesmas chaves do mensal, mais
+    ``resumo_mensal``: lista de (rótulo, receitas, despesas)). ``meses`` é um
+    iterável de dicts ``{'rotulo', 'receitas', 'despesas', 'lancamentos'}``
+    consumido sob demanda: ``lancamentos`` pode ser um cursor do banco com
+    tuplas (data, descrição, categoria, tipo, valor).
+
+    As páginas são gravadas em ``destino`` (padrão: SpooledTemporaryFile, que
+    passa para o disco acima de SPOOL_MAX_BYTES). Retorna o arquivo
+    posicionado no início.
+    """
+    if destino is None:
+        destino = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+b')
+
+    doc, _ = _novo_documento(destino, pageCompression=1)
+    doc.build(_FlowablesSobDemanda(_blocos_periodo(context, meses)))
+
+    destino.seek(0)
+    return destino
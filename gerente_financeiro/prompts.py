@@ -270,4 +270,16 @@ Formato sugerido para respostas de análise:
 
 <b>🎯 Próximos Passos</b>
 [Recomendação clara e específica]
-"""
\ No newline at end of file
+"""
+
+PROMPT_CATEGORIZACAO_LOTE = """
+Você classifica transações financeiras brasileiras em categorias.
+**CATÁLOGO** (código: categoria / subcategorias):
+{catalogo}
+**TRANSAÇÕES** (índice|tipo|descrição):
+{transacoes}
+**REGRAS:**
+- Use apenas códigos do catálogo; prefira o código da subcategoria (ex: "3.2").
+- Se não tiver segurança, use null.
+- Responda SOMENTE com um array JSON, um objeto por transação: [{{"i": 0, "c": "3.2"}}, ...]
+"""
@@ -0,0 +1,223 @@
+"""
+🗂️ Registro de Assets do Relatório
+Tudo o que o /relatorio usa e não depende do usuário é preparado uma única vez
+por processo, na inicialização, em vez de a cada pedido:
+
+- Imagens de ``img-pdf-exemplo/``: lidas, codificadas em data URI e com
+  fingerprint (sha256) calculado uma vez;
+- Build stamp (``git rev-parse --short HEAD`` ou ``BUILD_STAMP``) resolvido
+  uma vez, sem subprocesso por relatório;
+- Ambiente Jinja2 com filtros registrados, cache de bytecode em disco e sem
+  auto-reload: o template é compilado uma vez e reaproveitado.
+
+O HTML só é renderizado quando um backend HTML→PDF está selecionado
+(``RELATORIO_PDF_BACKEND=weasyprint``). O backend padrão, ReportLab, monta o
+PDF direto a partir dos dados e não usa o HTML.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+logger = logging.getLogger(__name__)
+
+RAIZ_PROJETO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TEMPLATES_PATH = os.path.join(RAIZ_PROJETO, 'templates')
+IMAGENS_PATH = os.path.join(RAIZ_PROJETO, 'img-pdf-exemplo')
+JINJA_CACHE_DIR = os.getenv("RELATORIO_JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "maestrofin_jinja"))
+
+TEMPLATE_RELATORIO = 'relatorio_inspiracao.html'
+PDF_BACKEND = os.getenv("RELATORIO_PDF_BACKEND", "reportlab").lower()
+BACKENDS_HTML = ('weasyprint',)
+
+_EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg', '.svg')
+
+
+# =============================================================================
+#  FILTROS CUSTOMIZADOS DO JINJA2
+# =============================================================================
+
+def nl2br_filter(s):
+    """Filtro Jinja2 para converter quebras de linha em tags <br>."""
+    if s is None:
+        return ""
+    return re.sub(r'\r\n|\r|\n', '<br>\n', str(s))
+
+def color_palette_filter(index):
+    """Filtro Jinja2 que retorna uma cor de uma paleta predefinida baseado no índice."""
+    colors = ["#3498db", "#e74c3c", "#2ecc71", "#f1c40f", "#9b59b6", "#1abc9c", "#e67e22"]
+    return colors[int(index) % len(colors)]
+
+def safe_float_filter(value, default=0.0):
+    """Filtro Jinja2 para converter valores para float de forma segura."""
+    try:
+        return float(value) if value is not None else default
+    except (ValueError, TypeError):
+        return default
+
+def safe_format_currency(value):
+    """Filtro Jinja2 para formatar valores monetários de forma segura."""
+    try:
+        return "%.2f" % float(value) if value is not None else "0.00"
+    except (ValueError, TypeError):
+        return "0.00"
+
+
+def criar_ambiente_jinja(cache_dir: Optional[str] = JINJA_CACHE_DIR) -> Environment:
+    """Ambiente Jinja2 dos relatórios, com cache de bytecode quando o diretório é gravável."""
+    bytecode_cache = None
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError as e:
+            logger.warning(f"⚠️ Cache de bytecode do Jinja indisponível ({cache_dir}): {e}")
+
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_PATH),
+        autoescape=True,  # Ativa o autoescaping para segurança
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,  # templates só mudam em deploy
+    )
+    env.filters['nl2br'] = nl2br_filter
+    env.filters['color_palette'] = color_palette_filter
+    env.filters['safe_float'] = safe_float_filter
+    env.filters['safe_currency'] = safe_format_currency
+    return env
+
+
+# =============================================================================
+#  REGISTRO
+# =============================================================================
+
+@dataclass(frozen=True)
+class ImagemRelatorio:
+    nome: str
+    mime: str
+    fingerprint: str
+    data_uri: str
+
+
+def _carregar_imagens(diretorio: str = IMAGENS_PATH) -> List[ImagemRelatorio]:
+    imagens = []
+    if not os.path.isdir(diretorio):
+        return imagens
+    for nome in sorted(os.listdir(diretorio)):
+        caminho = os.path.join(diretorio, nome)
+        if not (os.path.isfile(caminho) and nome.lower().endswith(_EXTENSOES_IMAGEM)):
+            continue
+        try:
+            with open(caminho, 'rb') as fimg:
+                conteudo = fimg.read()
+        except OSError as e:
+            logger.debug(f"Falha ao carregar imagem de inspiração {nome}: {e}")
+            continue
+        mime = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        imagens.append(ImagemRelatorio(
+            nome=nome,
+            mime=mime,
+            fingerprint=hashlib.sha256(conteudo).hexdigest()[:12],
+            data_uri=f"data:{mime};base64,{base64.b64encode(conteudo).decode('ascii')}",
+        ))
+    return imagens
+
+
+def _resolver_build_stamp() -> Optional[str]:
+    stamp = os.getenv("BUILD_STAMP") or os.getenv("RAILWAY_GIT_COMMIT_SHA")
+    if stamp:
+        return stamp[:7]
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ_PROJETO, stderr=subprocess.DEVNULL, timeout=5
+        ).decode().strip() or None
+    except Exception:
+        return None
+
+
+class RegistroAssetsRelatorio:
+    """Imagens, build stamp e templates compilados, carregados uma vez por processo."""
+
+    def __init__(self, pdf_backend: str = PDF_BACKEND):
+        self.pdf_backend = pdf_backend
+        self.env = criar_ambiente_jinja()
+        self.imagens: List[ImagemRelatorio] = []
+        self.build_stamp: Optional[str] = None
+        self._contexto_fixo: Dict[str, Any] = {}
+        self._carregado = False
+        self._lock = threading.Lock()
+
+    @property
+    def usa_html(self) -> bool:
+        """True quando o backend de PDF selecionado converte o HTML do template."""
+        return self.pdf_backend in BACKENDS_HTML
+
+    def carregar(self) -> "RegistroAssetsRelatorio":
+        with self._lock:
+            if self._carregado:
+                return self
+            self.imagens = _carregar_imagens()
+            self.build_stamp = _resolver_build_stamp()
+            self._contexto_fixo = {
+                'inspiracao_images': [imagem.data_uri for imagem in self.imagens],
+                'build_stamp': self.build_stamp,
+                'now': datetime.now,
+            }
+            if self.usa_html:
+                self.env.get_template(TEMPLATE_RELATORIO)  # compila (ou lê o bytecode) já na inicialização
+            self._carregado = True
+        logger.info(
+            f"🗂️ Assets do relatório prontos: {len(self.imagens)} imagem(ns), "
+            f"build {self.build_stamp or 'desconhecido'}, backend {self.pdf_backend}"
+        )
+        return self
+
+    def contexto_template(self) -> Dict[str, Any]:
+        """Variáveis fixas do template (imagens, build stamp e now())."""
+        self.carregar()
+        return dict(self._contexto_fixo)
+
+    def renderizar_html(self, contexto: Dict[str, Any], template: str = TEMPLATE_RELATORIO) -> str:
+        return self.env.get_template(template).render({**self.contexto_template(), **contexto})
+
+
+_registro: Optional[RegistroAssetsRelatorio] = None
+
+
+def get_registro_assets() -> RegistroAssetsRelatorio:
+    """Retorna o registro de assets compartilhado (carregado no primeiro uso)."""
+    global _registro
+    if _registro is None:
+        _registro = RegistroAssetsRelatorio()
+    return _registro.carregar()
+
+
+async def job_carregar_assets_relatorio(context) -> None:
+    """Job de inicialização: prepara os assets antes do primeiro /relatorio."""
+    try:
+        await asyncio.to_thread(get_registro_assets)
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível carregar os assets do relatório: {e}")
+
+
+__all__ = [
+    'BACKENDS_HTML',
+    'ImagemRelatorio',
+    'PDF_BACKEND',
+    'RegistroAssetsRelatorio',
+    'TEMPLATE_RELATORIO',
+    'criar_ambiente_jinja',
+    'get_registro_assets',
+    'job_carregar_assets_relatorio',
+]
@@ -0,0 +1,314 @@
+"""
+📑 Dados do Relatório Mensal
+Provedor dos números do /relatorio. Uma única consulta agrupada cobre o mês
+do relatório e os cinco anteriores (intervalo meio-aberto por dia local,
+``inicio <= dia_referencia < fim``, índice (id_usuario, dia_referencia)):
+dela saem os totais mensais de receitas/despesas, os totais por categoria do
+mês e as médias/tendências. Transferências ficam fora dos cálculos; os tipos
+gravados ('Entrada'/'Saída') viram receitas/despesas e os valores entram em módulo.
+
+Objetos ORM só são carregados para as maiores despesas que o PDF lista. As
+variantes ``*_usuarios`` fazem o mesmo para um lote de usuários de uma vez
+(relatório mensal automático, ver relatorios_lote), e ``dados_relatorio_periodo``
+alimenta o relatório de vários meses com o extrato lido sob demanda.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, joinedload
+
+from models import Categoria, Lancamento, Usuario
+from .campos_derivados import TIPO_ENTRADA, TIPO_SAIDA
+
+logger = logging.getLogger(__name__)
+
+MESES_HISTORICO = 6
+LIMITE_MAIORES_DESPESAS = 10
+CATEGORIA_TRANSFERENCIA = 'transferência'
+
+Linha = Tuple[str, str, str, float]
+
+# Lancamento.tipo gravado -> chave dos totais do relatório
+_TOTAL_DO_TIPO = {TIPO_ENTRADA: 'Receita', TIPO_SAIDA: 'Despesa'}
+_VALOR = func.abs(Lancamento.valor)
+
+
+def periodo_historico(mes: int, ano: int, meses: int = MESES_HISTORICO) -> Tuple[date, date]:
+    """[inicio, fim) que vai do 1º dia de ``meses - 1`` meses atrás até o fim do mês alvo."""
+    primeiro_dia = date(ano, mes, 1)
+    return primeiro_dia - relativedelta(months=meses - 1), primeiro_dia + relativedelta(months=1)
+
+
+def agregar_periodo_usuarios(db: Session, ids_usuarios: Iterable[int], inicio: date,
+                             fim: date) -> Dict[int, List[Linha]]:
+    """
+    Linhas (mês, tipo, categoria, total) de ``inicio <= dia < fim`` para
+    vários usuários de uma vez, numa só consulta agrupada.
+    """
+    ids_usuarios = list(ids_usuarios)
+    nome = func.coalesce(Categoria.nome, 'Sem Categoria')
+    linhas = db.query(
+        Lancamento.id_usuario, Lancamento.mes_referencia, Lancamento.tipo, nome, func.sum(_VALOR)
+    ).outerjoin(
+        Categoria, Lancamento.id_categoria == Categoria.id
+    ).filter(
+        Lancamento.id_usuario.in_(ids_usuarios),
+        Lancamento.dia_referencia >= inicio,
+        Lancamento.dia_referencia < fim,
+    ).group_by(Lancamento.id_usuario, Lancamento.mes_referencia, Lancamento.tipo, nome).all()
+
+    por_usuario: Dict[int, List[Linha]] = {id_usuario: [] for id_usuario in ids_usuarios}
+    for id_usuario, mes_ref, tipo, categoria, total in linhas:
+        por_usuario[id_usuario].append((mes_ref, tipo, categoria, float(total or 0)))
+    return por_usuario
+
+
+def agregar_historico_usuarios(db: Session, ids_usuarios: Iterable[int], mes: int, ano: int,
+                               meses: int = MESES_HISTORICO) -> Dict[int, List[Linha]]:
+    """Linhas (mês, tipo, categoria, total) dos ``meses`` meses até o alvo para vários usuários."""
+    inicio, fim = periodo_historico(mes, ano, meses)
+    return agregar_periodo_usuarios(db, ids_usuarios, inicio, fim)
+
+
+def agregar_historico(db: Session, id_usuario: int, mes: int, ano: int,
+                      meses: int = MESES_HISTORICO) -> List[Linha]:
+    """Linhas (mês, tipo, categoria, total) dos ``meses`` meses até o alvo, numa só consulta."""
+    return agregar_historico_usuarios(db, [id_usuario], mes, ano, meses)[id_usuario]
+
+
+def buscar_maiores_despesas_usuarios(db: Session, ids_usuarios: Iterable[int], mes: int, ano: int,
+                                     limite: int = LIMITE_MAIORES_DESPESAS) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    As ``limite`` maiores despesas do mês (sem transferências) de cada usuário,
+    prontas para o PDF. O ranking por usuário é feito no banco (row_number).
+    """
+    ids_usuarios = list(ids_usuarios)
+    inicio = date(ano, mes, 1)
+    posicao = func.row_number().over(
+        partition_by=Lancamento.id_usuario, order_by=_VALOR.desc()
+    ).label('posicao')
+    ranking = db.query(Lancamento.id.label('id'), posicao).outerjoin(
+        Categoria, Lancamento.id_categoria == Categoria.id
+    ).filter(
+        Lancamento.id_usuario.in_(ids_usuarios),
+        Lancamento.tipo == TIPO_SAIDA,
+        Lancamento.dia_referencia >= inicio,
+        Lancamento.dia_referencia < inicio + relativedelta(months=1),
+        or_(Categoria.id.is_(None), func.lower(Categoria.nome) != CATEGORIA_TRANSFERENCIA),
+    ).subquery()
+    lancamentos = db.query(Lancamento).join(ranking, ranking.c.id == Lancamento.id).filter(
+        ranking.c.posicao <= limite
+    ).options(joinedload(Lancamento.categoria)).order_by(
+        Lancamento.id_usuario, ranking.c.posicao
+    ).all()
+
+    por_usuario: Dict[int, List[Dict[str, Any]]] = {id_usuario: [] for id_usuario in ids_usuarios}
+    for l in lancamentos:
+        por_usuario[l.id_usuario].append({
+            'data': l.data_transacao,
+            'descricao': l.descricao,
+            'categoria': l.categoria.nome if l.categoria else 'Sem Categoria',
+            'valor': abs(float(l.valor)),
+        })
+    return por_usuario
+
+
+def buscar_maiores_despesas(db: Session, id_usuario: int, mes: int, ano: int,
+                            limite: int = LIMITE_MAIORES_DESPESAS) -> List[Dict[str, Any]]:
+    """As ``limite`` maiores despesas do mês (sem transferências), prontas para o PDF."""
+    return buscar_maiores_despesas_usuarios(db, [id_usuario], mes, ano, limite)[id_usuario]
+
+
+def _eh_transferencia(categoria: str) -> bool:
+    return (categoria or '').lower() == CATEGORIA_TRANSFERENCIA
+
+
+def montar_contexto_relatorio(db: Session, usuario: Usuario, mes: int, ano: int) -> Dict[str, Any]:
+    """Contexto do relatório mensal de ``usuario`` a partir dos agregados."""
+    linhas = agregar_historico(db, usuario.id, mes, ano)
+    maiores = buscar_maiores_despesas(db, usuario.id, mes, ano) if _tem_dados_no_mes(linhas, mes, ano) else []
+    return contexto_de_agregados(usuario, mes, ano, linhas, maiores)
+
+
+def _tem_dados_no_mes(linhas: List[Linha], mes: int, ano: int) -> bool:
+    mes_alvo = f"{ano:04d}-{mes:02d}"
+    return any(mes_ref == mes_alvo for mes_ref, _, _, _ in linhas)
+
+
+def contexto_de_agregados(usuario: Usuario, mes: int, ano: int, linhas: List[Linha],
+                          maiores_despesas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Contexto do relatório a partir das linhas agregadas e das maiores despesas já buscadas."""
+    mes_alvo = f"{ano:04d}-{mes:02d}"
+    mes_nome_str = datetime(ano, mes, 1).strftime("%B").capitalize()
+
+    if not _tem_dados_no_mes(linhas, mes, ano):
+        return {"has_data": False, "usuario": usuario, "mes_nome": mes_nome_str, "ano": ano, "now": datetime.now}
+
+    totais_mensais: Dict[str, Dict[str, float]] = defaultdict(lambda: {'Receita': 0.0, 'Despesa': 0.0})
+    gastos_por_categoria_atual: Dict[str, float] = {}
+    for mes_ref, tipo, categoria, total in linhas:
+        chave_total = _TOTAL_DO_TIPO.get(tipo)
+        if _eh_transferencia(categoria) or chave_total is None:
+            continue
+        totais_mensais[mes_ref][chave_total] += total
+        if mes_ref == mes_alvo and tipo == TIPO_SAIDA and total > 0:
+            gastos_por_categoria_atual[categoria] = gastos_por_categoria_atual.get(categoria, 0) + total
+
+    receitas_atual = totais_mensais[mes_alvo]['Receita']
+    despesas_atual = totais_mensais[mes_alvo]['Despesa']
+    saldo_atual = receitas_atual - despesas_atual
+    taxa_poupanca_atual = (saldo_atual / receitas_atual) * 100 if receitas_atual > 0 else 0
+
+    gastos_agrupados_final = sorted(gastos_por_categoria_atual.items(), key=lambda i: i[1], reverse=True)
+
+    # Médias dos três meses com movimento anteriores ao alvo
+    meses_anteriores = sorted(m for m in totais_mensais if m < mes_alvo)
+    ultimos_3m = meses_anteriores[-3:]
+    media_receitas_3m = sum(totais_mensais[m]['Receita'] for m in ultimos_3m) / len(ultimos_3m) if ultimos_3m else 0.0
+    media_despesas_3m = sum(totais_mensais[m]['Despesa'] for m in ultimos_3m) / len(ultimos_3m) if ultimos_3m else 0.0
+
+    mes_anterior = (date(ano, mes, 1) - relativedelta(months=1)).strftime('%Y-%m')
+    if mes_anterior in totais_mensais:
+        receitas_anterior = totais_mensais[mes_anterior]['Receita']
+        despesas_anterior = totais_mensais[mes_anterior]['Despesa']
+        tendencia_receita_percent = ((receitas_atual - receitas_anterior) / receitas_anterior * 100) if receitas_anterior > 0 else 0
+        tendencia_despesa_percent = ((despesas_atual - despesas_anterior) / despesas_anterior * 100) if despesas_anterior > 0 else 0
+    else:
+        tendencia_receita_percent = 0
+        tendencia_despesa_percent = 0
+
+    return {
+        "has_data": True, "now": datetime.now, "usuario": usuario,
+        "mes_nome": mes_nome_str, "ano": ano,
+        "receita_total": receitas_atual,
+        "despesa_total": despesas_atual,
+        "saldo_mes": saldo_atual,
+        "taxa_poupanca": taxa_poupanca_atual,
+        "gastos_agrupados": gastos_agrupados_final,
+        "gastos_por_categoria_dict": gastos_por_categoria_atual,
+        "historico_mensal": [
+            (m, totais_mensais[m]['Receita'], totais_mensais[m]['Despesa']) for m in sorted(totais_mensais)
+        ],
+        "lista_despesas": maiores_despesas,
+        "tendencia_receita_percent": tendencia_receita_percent,
+        "tendencia_despesa_percent": tendencia_despesa_percent,
+        "media_receitas_3m": media_receitas_3m,
+        "media_despesas_3m": media_despesas_3m,
+        "media_saldo_3m": media_receitas_3m - media_despesas_3m,
+        # Placeholders para futuras implementações
+        "analise_ia": "Análise inteligente do Maestro aparecerá aqui.",
+        "metas": [],
+    }
+
+
+def _iterar_lancamentos_mes(db: Session, id_usuario: int, mes_referencia: str, lote: int = 500):
+    """Lançamentos do mês como tuplas, lidos do banco em lotes (sem objetos ORM)."""
+    return db.query(
+        Lancamento.data_transacao, Lancamento.descricao, func.coalesce(Categoria.nome, 'Sem Categoria'),
+        Lancamento.tipo, Lancamento.valor,
+    ).outerjoin(
+        Categoria, Lancamento.id_categoria == Categoria.id
+    ).filter(
+        Lancamento.id_usuario == id_usuario,
+        Lancamento.mes_referencia == mes_referencia,
+    ).order_by(Lancamento.data_transacao, Lancamento.id).yield_per(lote)
+
+
+def dados_relatorio_periodo(db: Session, usuario: Usuario, inicio: date,
+                            fim: date) -> Tuple[Optional[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+    """
+    Totais do período ``[inicio, fim)`` (uma consulta agregada) e um iterador
+    preguiçoso com o extrato de cada mês, para pdf_generator.generate_period_pdf.
+    O contexto é None quando não há lançamentos no período. A sessão ``db``
+    precisa continuar aberta enquanto o iterador é consumido.
+    """
+    linhas = agregar_periodo_usuarios(db, [usuario.id], inicio, fim)[usuario.id]
+    if not linhas:
+        return None, iter(())
+
+    totais_mensais: Dict[str, Dict[str, float]] = defaultdict(lambda: {'Receita': 0.0, 'Despesa': 0.0})
+    gastos_por_categoria: Dict[str, float] = {}
+    for mes_ref, tipo, categoria, total in linhas:
+        chave_total = _TOTAL_DO_TIPO.get(tipo)
+        if _eh_transferencia(categoria) or chave_total is None or not mes_ref:
+            continue
+        totais_mensais[mes_ref][chave_total] += total
+        if tipo == TIPO_SAIDA and total > 0:
+            gastos_por_categoria[categoria] = gastos_por_categoria.get(categoria, 0) + total
+
+    receitas = sum(t['Receita'] for t in totais_mensais.values())
+    despesas = sum(t['Despesa'] for t in totais_mensais.values())
+    meses_periodo = []
+    mes = inicio.replace(day=1)
+    while mes < fim:
+        meses_periodo.append(mes)
+        mes += relativedelta(months=1)
+
+    def rotulo(mes_inicio: date) -> str:
+        return mes_inicio.strftime('%B de %Y').capitalize()
+
+    contexto = {
+        'usuario_nome': usuario.nome_completo or 'Investidor',
+        'periodo_extenso': f"{rotulo(meses_periodo[0])} a {rotulo(meses_periodo[-1])}",
+        'receita_total': receitas,
+        'despesa_total': despesas,
+        'saldo_mes': receitas - despesas,
+        'taxa_poupanca': ((receitas - despesas) / receitas) * 100 if receitas > 0 else 0,
+        'gastos_agrupados': sorted(gastos_por_categoria.items(), key=lambda i: i[1], reverse=True),
+        'resumo_mensal': [
+            (rotulo(m), totais_mensais[m.strftime('%Y-%m')]['Receita'], totais_mensais[m.strftime('%Y-%m')]['Despesa'])
+            for m in meses_periodo
+        ],
+    }
+
+    def meses() -> Iterator[Dict[str, Any]]:
+        for m in meses_periodo:
+            chave = m.strftime('%Y-%m')
+            yield {
+                'rotulo': rotulo(m),
+                'receitas': totais_mensais[chave]['Receita'],
+                'despesas': totais_mensais[chave]['Despesa'],
+                'lancamentos': _iterar_lancamentos_mes(db, usuario.id, chave),
+            }
+
+    return contexto, meses()
+
+
+def contexto_pdf(contexto_dados: Dict[str, Any], data_alvo) -> Dict[str, Any]:
+    """Campos que o pdf_generator lê, extraídos do contexto (sem objetos ORM, serializável)."""
+    usuario = contexto_dados.get('usuario')
+    return {
+        'usuario_nome': getattr(usuario, 'nome_completo', None) or 'Investidor',
+        'periodo_extenso': f"{contexto_dados.get('mes_nome')} de {contexto_dados.get('ano')}",
+        'periodo_inicio': data_alvo.strftime('%d/%m/%Y'),
+        'periodo_fim': (data_alvo + relativedelta(day=31)).strftime('%d/%m/%Y'),
+        'receita_total': contexto_dados.get('receita_total', 0),
+        'despesa_total': contexto_dados.get('despesa_total', 0),
+        'saldo_mes': contexto_dados.get('saldo_mes', 0),
+        'taxa_poupanca': contexto_dados.get('taxa_poupanca', 0),
+        # O gráfico de pizza do PDF é desenhado pelo próprio ReportLab a partir destes totais
+        'gastos_agrupados': contexto_dados.get('gastos_agrupados', []),
+        'top_gastos': contexto_dados.get('lista_despesas', [])[:LIMITE_MAIORES_DESPESAS],
+        'insights': contexto_dados.get('insights', [])
+    }
+
+
+__all__ = [
+    'LIMITE_MAIORES_DESPESAS',
+    'MESES_HISTORICO',
+    'agregar_historico',
+    'agregar_historico_usuarios',
+    'agregar_periodo_usuarios',
+    'buscar_maiores_despesas',
+    'buscar_maiores_despesas_usuarios',
+    'contexto_de_agregados',
+    'contexto_pdf',
+    'dados_relatorio_periodo',
+    'montar_contexto_relatorio',
+    'periodo_historico',
+]
@@ -34,22 +34,21 @@ def track_analytics(command_name):
         return wrapper
     return decorator
 
+import asyncio
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from io import BytesIO
 import os
 import io
 from dateutil.relativedelta import relativedelta
-import re
 import base64
 
 from telegram import Update, InputFile
 from telegram.ext import ContextTypes, CommandHandler
-from jinja2 import Environment, FileSystemLoader
 
-# Import ReportLab para geração de PDFs (WeasyPrint removido - incompatível com Railway)
+# Import ReportLab para geração de PDFs (backend padrão; WeasyPrint é opcional, ver relatorio_assets)
 try:
-    from .pdf_generator import generate_financial_pdf
+    from .pdf_generator import generate_financial_pdf, generate_period_pdf
     REPORTLAB_AVAILABLE = True
     print("✅ ReportLab disponível para geração de PDFs")
 except ImportError as e:
@@ -57,60 +56,26 @@ except ImportError as e:
     print("⚠️ Relatórios PDF não poderão ser gerados!")
     REPORTLAB_AVAILABLE = False
     generate_financial_pdf = None
+    generate_period_pdf = None
 
 from database.database import get_db
-from .services import gerar_contexto_relatorio, gerar_grafico_para_relatorio, limpar_cache_usuario
-from . import services as services_module
+from models import Usuario
+from .services import gerar_contexto_relatorio
+from .campos_derivados import chave_mes
+from .renderizador_graficos import get_renderizador
+from .relatorio_dados import contexto_pdf, dados_relatorio_periodo
+from .relatorio_assets import TEMPLATES_PATH, get_registro_assets
+from .relatorios_worker import ProgressoRelatorio, RelatorioPronto, get_trabalhador_relatorios, versao_dados_mes
 
 logger = logging.getLogger(__name__)
 
-
-# =============================================================================
-#  CONFIGURAÇÃO DO AMBIENTE JINJA2 E FILTROS CUSTOMIZADOS
-#  (Esta seção deve ser executada apenas uma vez, quando o módulo é importado)
-# =============================================================================
-
-def nl2br_filter(s):
-    """Filtro Jinja2 para converter quebras de linha em tags <br>."""
-    if s is None:
-        return ""
-    return re.sub(r'\r\n|\r|\n', '<br>\n', str(s))
-
-def color_palette_filter(index):
-    """Filtro Jinja2 que retorna uma cor de uma paleta predefinida baseado no índice."""
-    colors = ["#3498db", "#e74c3c", "#2ecc71", "#f1c40f", "#9b59b6", "#1abc9c", "#e67e22"]
-    return colors[int(index) % len(colors)]
-
-def safe_float_filter(value, default=0.0):
-    """Filtro Jinja2 para converter valores para float de forma segura."""
-    try:
-        return float(value) if value is not None else default
-    except (ValueError, TypeError):
-        return default
-
-def safe_format_currency(value):
-    """Filtro Jinja2 para formatar valores monetários de forma segura."""
-    try:
-        return "%.2f" % float(value) if value is not None else "0.00"
-    except (ValueError, TypeError):
-        return "0.00"
-
-# Define os caminhos para as pastas de templates e arquivos estáticos
-templates_path = os.path.join(os.path.dirname(__file__), '..', 'templates')
-static_path = os.path.join(os.path.dirname(__file__), '..', 'static')
-
-# Cria e configura o ambiente do Jinja2
-env = Environment(
-    loader=FileSystemLoader(templates_path),
-    autoescape=True  # Ativa o autoescaping para segurança
+MAX_MESES_PERIODO = 24
+ANO_MINIMO_PERIODO = 2000
+USO_PERIODO = (
+    "Uso: /relatorio ano [AAAA] ou /relatorio AAAA-MM AAAA-MM "
+    f"(anos de {ANO_MINIMO_PERIODO} até o atual)."
 )
 
-# Adiciona os filtros customizados ao ambiente
-env.filters['nl2br'] = nl2br_filter
-env.filters['color_palette'] = color_palette_filter
-env.filters['safe_float'] = safe_float_filter
-env.filters['safe_currency'] = safe_format_currency
-
 
 # =============================================================================
 #  FUNÇÕES AUXILIARES PARA PROCESSAMENTO DE DADOS
@@ -207,222 +172,358 @@ def debug_contexto(contexto_dados):
 
 
 # =============================================================================
-#  HANDLER DO COMANDO /relatorio
+#  PRODUÇÃO DO RELATÓRIO (roda em segundo plano, ver relatorios_worker)
 # =============================================================================
 
-async def gerar_relatorio_comando(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Gera e envia um relatório financeiro detalhado em PDF."""
-    
-    hoje = datetime.now()
-    
-    # Determina o período do relatório (mês atual ou passado)
-    if context.args and context.args[0].lower() in ['passado', 'anterior']:
-        data_alvo = hoje - relativedelta(months=1)
-        periodo_str = f"do mês passado ({data_alvo.strftime('%B de %Y')})"
-    else:
-        data_alvo = hoje
-        periodo_str = "deste mês"
-        
-    mes_alvo = data_alvo.month
-    ano_alvo = data_alvo.year
+def _coletar_contexto(user_id, mes_alvo, ano_alvo):
+    """Etapa bloqueante: consulta e agrega os dados do mês (thread do pool de relatórios)."""
+    db = next(get_db())
+    try:
+        contexto_dados = gerar_contexto_relatorio(db, user_id, mes_alvo, ano_alvo)
+        if contexto_dados:
+            contexto_dados = validar_e_completar_contexto(contexto_dados)
+            debug_contexto(contexto_dados)
+        return contexto_dados
+    finally:
+        db.close()
 
-    await update.message.reply_text(f"Gerando seu relatório {periodo_str}... 🎥\nIsso pode levar alguns segundos.")
-    
+
+def _versao_relatorio(user_id, mes_referencia):
     db = next(get_db())
-    user_id = update.effective_user.id
-    
     try:
-        # 1. Desativar temporariamente o sistema de cache para garantir dados sempre frescos
-        old_cache_ttl = getattr(services_module, 'CACHE_TTL', None)
-        old_cache_max = getattr(services_module, 'CACHE_MAX_SIZE', None)
-        try:
-            services_module.CACHE_TTL = 0
-            services_module.CACHE_MAX_SIZE = 0
-            logger.debug("CACHE DESATIVADO temporariamente para geração do /relatorio")
-        except Exception:
-            logger.debug("Não foi possível desativar o cache (ignorando)")
+        return versao_dados_mes(db, user_id, mes_referencia)
+    finally:
+        db.close()
 
-        # Limpa qualquer cache residual do usuário (defensivo)
+
+def _gerar_pdf(contexto_dados, data_alvo, ano_alvo):
+    """Etapa bloqueante: monta o PDF no backend selecionado (thread do pool de relatórios)."""
+    # Garantir que mes_nome e ano estejam corretos para o período solicitado
+    contexto_dados['mes_nome'] = contexto_dados.get('mes_nome') or data_alvo.strftime('%B')
+    contexto_dados['ano'] = contexto_dados.get('ano') or ano_alvo
+
+    registro = get_registro_assets()
+    if registro.usa_html:
+        # O template só é renderizado quando o backend converte HTML em PDF
+        logger.info(f"Renderizando template HTML para o backend {registro.pdf_backend}...")
+        html_renderizado = registro.renderizar_html(contexto_dados)
+        logger.info(f"Template renderizado. Tamanho: {len(html_renderizado)} caracteres")
+        pdf_bytes = _html_para_pdf(html_renderizado)
+    else:
+        pdf_bytes = _gerar_pdf_reportlab(contexto_dados, data_alvo)
+
+    if not pdf_bytes or len(pdf_bytes) == 0:
+        raise Exception("PDF gerado está vazio")
+
+    logger.info(f"✅ PDF gerado com sucesso. Tamanho: {len(pdf_bytes)} bytes")
+    return pdf_bytes
+
+
+def _html_para_pdf(html_renderizado):
+    try:
+        from weasyprint import HTML
+    except ImportError as e:
+        raise Exception(f"Backend HTML→PDF selecionado, mas WeasyPrint não está disponível: {e}")
+    return HTML(string=html_renderizado, base_url=TEMPLATES_PATH).write_pdf()
+
+
+def _gerar_pdf_reportlab(contexto_dados, data_alvo):
+    logger.info("Usando ReportLab para gerar PDF...")
+    if not REPORTLAB_AVAILABLE:
+        raise Exception("ReportLab não está disponível")
+
+    # Ajustar nomes de campos do contexto para o PDF generator
+    pdf_context = contexto_pdf(contexto_dados, data_alvo)
+
+    logger.info(f"Gerando PDF com ReportLab - dados: {len(pdf_context.get('gastos_agrupados', []))} categorias, {len(pdf_context.get('top_gastos', []))} gastos")
+
+    return generate_financial_pdf(pdf_context)
+
+
+async def _enviar_relatorio(bot, chat_id, pronto: RelatorioPronto):
+    """Envia o PDF; reaproveita o file_id do Telegram quando o relatório veio do cache."""
+    if pronto.file_id:
         try:
-            limpar_cache_usuario(user_id)
-            logger.debug(f"Cache do usuário {user_id} limpo antes de gerar o relatório")
-        except Exception:
-            logger.debug("Falha ao limpar cache do usuário (não crítico)")
+            await bot.send_document(chat_id=chat_id, document=pronto.file_id, caption=pronto.legenda)
+            return
+        except Exception as e:
+            logger.warning(f"file_id do relatório recusado, reenviando os bytes: {e}")
+            pronto.file_id = None
+
+    mensagem = await bot.send_document(
+        chat_id=chat_id,
+        document=InputFile(io.BytesIO(pronto.pdf_bytes), filename=pronto.nome_arquivo),
+        caption=pronto.legenda,
+        read_timeout=120,
+        write_timeout=120
+    )
+    if mensagem and mensagem.document:
+        pronto.file_id = mensagem.document.file_id
+
+
+async def produzir_relatorio(bot, chat_id, user_id, data_alvo, periodo_str, progresso: ProgressoRelatorio):
+    """Monta e envia o relatório de ``data_alvo`` (agendado pelo /relatorio)."""
+    trabalhador = get_trabalhador_relatorios()
+    mes_alvo = data_alvo.month
+    ano_alvo = data_alvo.year
+    mes_referencia = chave_mes(data_alvo)
+    # Só meses fechados vão para o cache: o relatório do mês corrente muda a cada dia
+    mes_fechado = mes_referencia < chave_mes(datetime.now())
+    chave_cache = None
+
+    try:
+        await progresso.etapa(f"📥 Relatório {periodo_str}: coletando seus lançamentos...")
+
+        if mes_fechado:
+            versao = await trabalhador.executar(_versao_relatorio, user_id, mes_referencia)
+            if versao:
+                chave_cache = (user_id, mes_referencia, versao)
+                pronto = trabalhador.cache.get(chave_cache)
+                if pronto:
+                    logger.info(f"⚡ Relatório {mes_referencia} do usuário {user_id} servido do cache")
+                    await _enviar_relatorio(bot, chat_id, pronto)
+                    await progresso.concluir()
+                    return
 
-        
         logger.info(f"Iniciando geração de relatório para usuário {user_id}, mês {mes_alvo}, ano {ano_alvo}")
-        contexto_dados = gerar_contexto_relatorio(db, user_id, mes_alvo, ano_alvo)
-        
+        contexto_dados = await trabalhador.executar(_coletar_contexto, user_id, mes_alvo, ano_alvo)
+
         if not contexto_dados:
-            await update.message.reply_text("Não foi possível encontrar seu usuário. Tente usar o bot uma vez para se registrar.")
+            await progresso.etapa("Não foi possível encontrar seu usuário. Tente usar o bot uma vez para se registrar.")
             return
-        
-        # 2. Validar e completar contexto
-        contexto_dados = validar_e_completar_contexto(contexto_dados)
-        
-        # 3. Debug do contexto (pode ser removido em produção)
-        debug_contexto(contexto_dados)
-        
+
         if not contexto_dados.get("has_data"):
-            await update.message.reply_text(f"Não encontrei dados suficientes para {periodo_str} para gerar um relatório.")
+            await progresso.etapa(f"Não encontrei dados suficientes para {periodo_str} para gerar um relatório.")
             return
 
-        # 4. Gerar o gráfico de pizza dinamicamente
-        logger.info("Gerando gráfico de pizza...")
-        try:
-            grafico_buffer = gerar_grafico_para_relatorio(contexto_dados.get("gastos_por_categoria_dict", {}))
-            
-            if grafico_buffer:
-                grafico_bytes = grafico_buffer.getvalue()
-                grafico_base64 = base64.b64encode(grafico_bytes).decode('utf-8')
-                contexto_dados["grafico_pizza_base64"] = grafico_base64
-                # Também disponibiliza os bytes do PNG diretamente para o gerador de PDF
-                contexto_dados["grafico_pizza_png_bytes"] = grafico_bytes
-                logger.info("Gráfico gerado com sucesso")
-            else:
-                contexto_dados["grafico_pizza_base64"] = None
-                logger.warning("Falha ao gerar gráfico")
-        except Exception as e:
-            logger.error(f"Erro ao gerar gráfico: {e}")
-            contexto_dados["grafico_pizza_base64"] = None
-        
-        # 5. Renderizar o template HTML com os dados
-        logger.info("Renderizando template HTML...")
-        try:
-            # Adicionar utilitários ao contexto (ex.: now()) para uso no template
-            contexto_dados['now'] = datetime.now
-            # Garantir que mes_nome e ano estejam corretos para o período solicitado
-            contexto_dados['mes_nome'] = contexto_dados.get('mes_nome') or data_alvo.strftime('%B')
-            contexto_dados['ano'] = contexto_dados.get('ano') or ano_alvo
-
-            # Injetar imagens de inspiração (img-pdf-exemplo) como data URIs para uso no template
+        # 4. Gráfico de pizza em PNG: só o template HTML usa (o PDF do ReportLab desenha a pizza sozinho)
+        contexto_dados["grafico_pizza_base64"] = None
+        if get_registro_assets().usa_html:
+            await progresso.etapa(f"🎨 Relatório {periodo_str}: desenhando os gráficos...")
             try:
-                import glob
-                imagens_dir = os.path.join(os.path.dirname(__file__), '..', 'img-pdf-exemplo')
-                imagens = []
-                if os.path.isdir(imagens_dir):
-                    for nome in sorted(os.listdir(imagens_dir)):
-                        caminho = os.path.join(imagens_dir, nome)
-                        if os.path.isfile(caminho) and nome.lower().endswith(('.png', '.jpg', '.jpeg', '.svg')):
-                            with open(caminho, 'rb') as fimg:
-                                b = fimg.read()
-                            mime = 'image/png' if nome.lower().endswith('.png') else 'image/jpeg'
-                            datauri = f"data:{mime};base64,{base64.b64encode(b).decode('ascii')}"
-                            imagens.append(datauri)
-                contexto_dados['inspiracao_images'] = imagens
+                # Desenhado no pool de processos (não bloqueia o event loop) e reaproveitado do cache
+                grafico_bytes = await get_renderizador().grafico_relatorio(
+                    user_id, contexto_dados.get("gastos_por_categoria_dict", {})
+                )
+                if grafico_bytes:
+                    contexto_dados["grafico_pizza_base64"] = base64.b64encode(grafico_bytes).decode('utf-8')
+                else:
+                    logger.warning("Falha ao gerar gráfico")
             except Exception as e:
-                logger.debug(f"Falha ao carregar imagens de inspiração: {e}")
+                logger.error(f"Erro ao gerar gráfico: {e}")
 
-            # opcional: adicionar build_stamp se houver (para o rodapé do template)
-            try:
-                import subprocess
-                commit = None
-                try:
-                    commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.join(os.path.dirname(__file__), '..')).decode().strip()
-                except Exception:
-                    commit = None
-                contexto_dados['build_stamp'] = commit
-            except Exception:
-                contexto_dados['build_stamp'] = None
-
-            # Usar o template de inspiração (contendo galerias/imagens)
-            # Se quiser reverter para o template antigo, troque o nome abaixo
-            template = env.get_template('relatorio_inspiracao.html')
-            html_renderizado = template.render(contexto_dados)
-            logger.info(f"Template renderizado. Tamanho: {len(html_renderizado)} caracteres")
-            
-            # Debug: salva HTML temporariamente para verificação (apenas em desenvolvimento)
-            # Descomente as linhas abaixo se precisar verificar o HTML gerado
-            # with open(f"debug_relatorio_{user_id}.html", "w", encoding="utf-8") as f:
-            #     f.write(html_renderizado)
-            # logger.info("HTML de debug salvo")
-            
-        except Exception as e:
-            logger.error(f"Erro ao renderizar template: {e}", exc_info=True)
-            raise
-        
-        # 6. Gerar o PDF
-        logger.info("Gerando PDF...")
-        
-        # SEMPRE usar ReportLab (WeasyPrint removido - não funciona no Railway)
-        logger.info("Usando ReportLab para gerar PDF...")
+        await progresso.etapa(f"📄 Relatório {periodo_str}: montando o PDF...")
         try:
-            if not REPORTLAB_AVAILABLE:
-                raise Exception("ReportLab não está disponível")
-            
-            # Ajustar nomes de campos do contexto para o PDF generator
-            pdf_context = {
-                'periodo_inicio': data_alvo.strftime('%d/%m/%Y'),
-                'periodo_fim': (data_alvo + relativedelta(day=31)).strftime('%d/%m/%Y'),
-                'total_receitas': contexto_dados.get('receita_total', 0),
-                'total_gastos': contexto_dados.get('despesa_total', 0),
-                'saldo_periodo': contexto_dados.get('saldo_mes', 0),
-                'gastos_por_categoria': contexto_dados.get('gastos_por_categoria', []),
-                'grafico_pizza_png': contexto_dados.get('grafico_pizza_png_bytes'),
-                # Inclui o HTML renderizado opcionalmente para permitir HTML->PDF se disponível
-                'html_renderizado': html_renderizado,
-                'top_gastos': contexto_dados.get('lista_despesas', [])[:10],
-                'insights': contexto_dados.get('insights', [])
-            }
-            
-            logger.info(f"Gerando PDF com ReportLab - dados: {len(pdf_context.get('gastos_por_categoria', []))} categorias, {len(pdf_context.get('top_gastos', []))} gastos")
-            
-            pdf_bytes = generate_financial_pdf(pdf_context)
-            
-            if not pdf_bytes or len(pdf_bytes) == 0:
-                raise Exception("PDF gerado está vazio")
-            
-            logger.info(f"✅ PDF gerado com sucesso. Tamanho: {len(pdf_bytes)} bytes")
-            
-            # Enviar PDF
-            pdf_filename = f"relatorio_{data_alvo.strftime('%Y-%m')}_{user_id}.pdf"
-            
-            await update.message.reply_document(
-                document=InputFile(io.BytesIO(pdf_bytes), filename=pdf_filename),
-                caption=f"📊 Relatório de {periodo_str}\n\n"
-                       f"📈 Total de receitas: R$ {contexto_dados.get('receita_total', 0):.2f}\n"
-                       f"📉 Total de despesas: R$ {contexto_dados.get('despesa_total', 0):.2f}\n"
-                       f"💰 Saldo: R$ {contexto_dados.get('saldo_mes', 0):.2f}",
-                read_timeout=120,
-                write_timeout=120
+            pdf_bytes = await trabalhador.executar(_gerar_pdf, contexto_dados, data_alvo, ano_alvo)
+
+            pronto = RelatorioPronto(
+                pdf_bytes=pdf_bytes,
+                nome_arquivo=f"relatorio_{mes_referencia}_{user_id}.pdf",
+                legenda=f"📊 Relatório de {periodo_str}\n\n"
+                        f"📈 Total de receitas: R$ {contexto_dados.get('receita_total', 0):.2f}\n"
+                        f"📉 Total de despesas: R$ {contexto_dados.get('despesa_total', 0):.2f}\n"
+                        f"💰 Saldo: R$ {contexto_dados.get('saldo_mes', 0):.2f}",
             )
-            
+
+            await progresso.etapa(f"📤 Relatório {periodo_str}: enviando...")
+            await _enviar_relatorio(bot, chat_id, pronto)
+            if chave_cache:
+                trabalhador.cache.set(chave_cache, pronto)
+            await progresso.concluir()
+
             logger.info("✅ Relatório PDF enviado com sucesso!")
-            return
-            
+
         except Exception as e:
             logger.error(f"❌ Erro ao gerar/enviar PDF: {e}", exc_info=True)
-            await update.message.reply_text(
+            await progresso.etapa(
                 f"❌ Erro ao gerar relatório PDF:\n{str(e)}\n\n"
                 f"Resumo do período:\n"
                 f"📈 Receitas: R$ {contexto_dados.get('receita_total', 0):.2f}\n"
                 f"📉 Despesas: R$ {contexto_dados.get('despesa_total', 0):.2f}\n"
                 f"💰 Saldo: R$ {contexto_dados.get('saldo_mes', 0):.2f}"
             )
-            return
-
-        
-    # Não há arquivo HTML temporário criado aqui, então nada a limpar.
 
     except Exception as e:
         logger.error(f"Erro crítico na geração do relatório: {e}", exc_info=True)
-        await update.message.reply_text(
-            "❌ Ocorreu um erro ao gerar o relatório. Tente novamente em alguns minutos.",
-            parse_mode='HTML'
-        )
+        await progresso.etapa("❌ Ocorreu um erro ao gerar o relatório. Tente novamente em alguns minutos.")
 
+
+def _gerar_pdf_periodo(user_id, inicio, fim):
+    """Etapa bloqueante: relatório de vários meses gravado num arquivo temporário (ou None sem dados)."""
+    if not REPORTLAB_AVAILABLE:
+        raise Exception("ReportLab não está disponível")
+    db = next(get_db())
+    try:
+        usuario = db.query(Usuario).filter(Usuario.telegram_id == user_id).first()
+        if not usuario:
+            return None
+        contexto, meses = dados_relatorio_periodo(db, usuario, inicio, fim)
+        if contexto is None:
+            return None
+        # O extrato de cada mês é lido do banco enquanto as páginas são montadas
+        return generate_period_pdf(contexto, meses)
     finally:
         db.close()
-        # Restaura os valores de cache originais (se existiam)
+
+
+async def produzir_relatorio_periodo(bot, chat_id, user_id, inicio, fim, periodo_str, progresso: ProgressoRelatorio):
+    """Monta e envia o relatório de vários meses ``[inicio, fim)`` (agendado pelo /relatorio)."""
+    trabalhador = get_trabalhador_relatorios()
+    arquivo = None
+    try:
+        await progresso.etapa(f"📄 Relatório {periodo_str}: montando o PDF com o extrato completo...")
+        arquivo = await trabalhador.executar(_gerar_pdf_periodo, user_id, inicio, fim)
+        if arquivo is None:
+            await progresso.etapa(f"Não encontrei dados suficientes para {periodo_str} para gerar um relatório.")
+            return
+
+        await progresso.etapa(f"📤 Relatório {periodo_str}: enviando...")
+        fim_inclusivo = fim - relativedelta(months=1)
+        await bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(arquivo, filename=f"relatorio_{chave_mes(inicio)}_a_{chave_mes(fim_inclusivo)}_{user_id}.pdf"),
+            caption=f"📊 Relatório {periodo_str}",
+            read_timeout=300,
+            write_timeout=300
+        )
+        await progresso.concluir()
+        logger.info(f"✅ Relatório de período {inicio} a {fim} enviado para {user_id}")
+    except Exception as e:
+        logger.error(f"Erro crítico na geração do relatório de período: {e}", exc_info=True)
+        await progresso.etapa("❌ Ocorreu um erro ao gerar o relatório. Tente novamente em alguns minutos.")
+    finally:
+        if arquivo is not None:
+            arquivo.close()
+
+
+def _validar_ano(ano, hoje):
+    if not ANO_MINIMO_PERIODO <= ano <= hoje.year:
+        raise ValueError(f"Ano fora do intervalo: {ano}")
+
+
+def periodo_dos_argumentos(args, hoje):
+    """
+    ``ano [AAAA]`` ou ``AAAA-MM AAAA-MM`` -> (inicio, fim exclusivo, descrição);
+    None quando os argumentos não pedem um relatório de vários meses.
+    Levanta ValueError para anos fora de ANO_MINIMO_PERIODO..ano atual.
+    """
+    if not args:
+        return None
+    if args[0].lower() == 'ano':
+        ano = int(args[1]) if len(args) > 1 and args[1].isdigit() else hoje.year
+        _validar_ano(ano, hoje)
+        inicio = date(ano, 1, 1)
+        # O ano corrente vai só até o mês atual
+        fim = date(hoje.year, hoje.month, 1) + relativedelta(months=1) if ano == hoje.year else date(ano + 1, 1, 1)
+        return inicio, fim, f"de {ano}"
+    if len(args) >= 2:
         try:
-            if old_cache_ttl is not None:
-                services_module.CACHE_TTL = old_cache_ttl
-            if old_cache_max is not None:
-                services_module.CACHE_MAX_SIZE = old_cache_max
-            logger.debug("CACHE restaurado aos valores anteriores após geração do relatório")
-        except Exception:
-            logger.debug("Falha ao restaurar configuração de cache (não crítico)")
+            inicio = datetime.strptime(args[0], '%Y-%m').date()
+            ultimo = datetime.strptime(args[1], '%Y-%m').date()
+        except ValueError:
+            return None
+        if ultimo < inicio:
+            inicio, ultimo = ultimo, inicio
+        _validar_ano(inicio.year, hoje)
+        _validar_ano(ultimo.year, hoje)
+        ultimo = min(ultimo, inicio + relativedelta(months=MAX_MESES_PERIODO - 1))
+        return inicio, ultimo + relativedelta(months=1), f"de {inicio.strftime('%m/%Y')} a {ultimo.strftime('%m/%Y')}"
+    return None
+
+
+# =============================================================================
+#  HANDLER DO COMANDO /relatorio
+# =============================================================================
+
+def _definir_relatorio_automatico(user_id, ativo):
+    db = next(get_db())
+    try:
+        usuario = db.query(Usuario).filter(Usuario.telegram_id == user_id).first()
+        if not usuario:
+            return False
+        usuario.relatorio_mensal_ativo = ativo
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+async def configurar_relatorio_automatico(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/relatorio automatico [off]: ativa ou desativa o relatório mensal automático."""
+    ativo = not (len(context.args) > 1 and context.args[1].lower() in ['off', 'desativar', 'nao', 'não'])
+    encontrado = await asyncio.to_thread(_definir_relatorio_automatico, update.effective_user.id, ativo)
+    if not encontrado:
+        await update.message.reply_text("Não foi possível encontrar seu usuário. Tente usar o bot uma vez para se registrar.")
+    elif ativo:
+        await update.message.reply_text(
+            "✅ Relatório mensal automático ativado!\n"
+            "Todo início de mês você recebe o relatório do mês anterior no seu horário de notificação "
+            "(por e-mail, se tiver um cadastrado).\n\nPara desativar: /relatorio automatico off"
+        )
+    else:
+        await update.message.reply_text("🔕 Relatório mensal automático desativado.")
+
+
+async def gerar_relatorio_comando(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Agenda a geração do relatório financeiro em PDF e responde na hora."""
+
+    if context.args and context.args[0].lower() in ['automatico', 'automático', 'auto']:
+        await configurar_relatorio_automatico(update, context)
+        return
+    
+    hoje = datetime.now()
+    user_id = update.effective_user.id
+    trabalhador = get_trabalhador_relatorios()
+
+    # Relatório de vários meses: /relatorio ano [AAAA] ou /relatorio AAAA-MM AAAA-MM
+    try:
+        periodo = periodo_dos_argumentos(context.args, hoje)
+    except ValueError:
+        await update.message.reply_text(USO_PERIODO)
+        return
+    if periodo:
+        inicio, fim, periodo_str = periodo
+        chave_trabalho = (user_id, chave_mes(inicio), chave_mes(fim))
+        if trabalhador.em_andamento(chave_trabalho):
+            await update.message.reply_text(f"⏳ Seu relatório {periodo_str} já está sendo gerado. Ele chega em instantes!")
+            return
+        status = await update.message.reply_text(
+            f"Gerando seu relatório {periodo_str}... 🎥\nVocê pode continuar usando o bot enquanto isso."
+        )
+        progresso = ProgressoRelatorio(status)
+        trabalhador.agendar(
+            context.application,
+            chave_trabalho,
+            produzir_relatorio_periodo(context.bot, update.effective_chat.id, user_id, inicio, fim, periodo_str, progresso),
+            progresso,
+        )
+        return
+    
+    # Determina o período do relatório (mês atual ou passado)
+    if context.args and context.args[0].lower() in ['passado', 'anterior']:
+        data_alvo = hoje - relativedelta(months=1)
+        periodo_str = f"do mês passado ({data_alvo.strftime('%B de %Y')})"
+    else:
+        data_alvo = hoje
+        periodo_str = "deste mês"
+
+    chave_trabalho = (user_id, chave_mes(data_alvo))
+
+    if trabalhador.em_andamento(chave_trabalho):
+        await update.message.reply_text(f"⏳ Seu relatório {periodo_str} já está sendo gerado. Ele chega em instantes!")
+        return
+
+    status = await update.message.reply_text(
+        f"Gerando seu relatório {periodo_str}... 🎥\nVocê pode continuar usando o bot enquanto isso."
+    )
+    progresso = ProgressoRelatorio(status)
+    trabalhador.agendar(
+        context.application,
+        chave_trabalho,
+        produzir_relatorio(context.bot, update.effective_chat.id, user_id, data_alvo, periodo_str, progresso),
+        progresso,
+    )
         
 
 # Cria o handler para ser importado no bot.py
-relatorio_handler = CommandHandler('relatorio', gerar_relatorio_comando)
\ No newline at end of file
+relatorio_handler = CommandHandler('relatorio', gerar_relatorio_comando)
@@ -0,0 +1,371 @@
+"""
+🗓️ Relatório Mensal Automático (lote)
+Depois que o mês fecha, gera e entrega o relatório do mês anterior a todos os
+usuários que ativaram ``/relatorio automatico``, em vez de concentrar a carga
+nos pedidos sob demanda dos primeiros dias do mês.
+
+Etapas, cada uma retomável e idempotente (estado em ``relatorios_mensais``):
+
+1. **Planejar** (``planejar_mes``): uma linha 'pendente' por usuário ativo com
+   lançamentos no mês, agendada para o horário de notificação do usuário.
+   Usuários já planejados são ignorados (índice único usuário+mês);
+2. **Gerar** (``gerar_pendentes``): lotes de ``RELATORIOS_LOTE_TAMANHO``
+   usuários têm os agregados calculados de uma vez (relatorio_dados, variantes
+   ``*_usuarios``); os PDFs são montados num pool de processos com fila
+   limitada e gravados como 'gerado';
+3. **Entregar** (``entregar_devidos``): a cada poucos minutos, os relatórios
+   cujo horário chegou são enviados por e-mail (se o usuário cadastrou um e o
+   SMTP está configurado) ou pelo Telegram, e marcados como 'enviado'.
+
+Falhas contam tentativas; após ``MAX_TENTATIVAS`` a linha vira 'falhou'.
+A vazão (relatórios por minuto) de cada etapa fica em ``stats()`` e no log.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time as time_module
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import exists, insert, select, update
+from telegram import InputFile
+
+from database.database import get_db
+from models import Lancamento, RelatorioMensalEnvio, Usuario
+from .campos_derivados import FUSO_LOCAL
+from .pdf_generator import generate_financial_pdf
+from .relatorio_dados import (
+    agregar_historico_usuarios,
+    buscar_maiores_despesas_usuarios,
+    contexto_de_agregados,
+    contexto_pdf,
+)
+from .utils_email import email_configurado, enviar_email_com_anexo
+
+logger = logging.getLogger(__name__)
+
+MAX_PROCESSOS = int(os.getenv("RELATORIOS_LOTE_PROCESSOS", "2"))
+TAMANHO_LOTE = int(os.getenv("RELATORIOS_LOTE_TAMANHO", "100"))
+MAX_NA_FILA = MAX_PROCESSOS * 2
+MAX_TENTATIVAS = 3
+DIAS_PLANEJAMENTO = 5  # o mês fechado é planejado nos primeiros dias do mês seguinte
+HORARIO_PADRAO = time(hour=9, minute=0)
+INTERVALO_ENVIO_SEGUNDOS = 0.1  # folga para os limites da API do Telegram
+
+
+def _agora_utc() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def mes_fechado(hoje: date) -> Tuple[int, int]:
+    """(mês, ano) do último mês encerrado antes de ``hoje``."""
+    anterior = hoje - relativedelta(months=1)
+    return anterior.month, anterior.year
+
+
+def horario_entrega(horario: Optional[time], dia: date, agora_utc: datetime) -> datetime:
+    """Horário de notificação do usuário em ``dia`` (UTC, sem fuso), nunca antes de agora."""
+    local = datetime.combine(dia, horario or HORARIO_PADRAO, tzinfo=FUSO_LOCAL)
+    return max(local.astimezone(timezone.utc).replace(tzinfo=None), agora_utc)
+
+
+def planejar_mes(db, mes: int, ano: int, hoje: Optional[date] = None) -> int:
+    """Cria as linhas 'pendente' do mês para os usuários ativos ainda não planejados."""
+    mes_referencia = f"{ano:04d}-{mes:02d}"
+    hoje = hoje or datetime.now(FUSO_LOCAL).date()
+    agora = _agora_utc()
+
+    ja_planejados = select(RelatorioMensalEnvio.id_usuario).where(
+        RelatorioMensalEnvio.mes_referencia == mes_referencia
+    )
+    com_lancamentos = exists().where(
+        Lancamento.id_usuario == Usuario.id, Lancamento.mes_referencia == mes_referencia
+    )
+    usuarios = db.query(Usuario.id, Usuario.horario_notificacao, Usuario.email_notificacao).filter(
+        Usuario.relatorio_mensal_ativo.is_(True),
+        com_lancamentos,
+        Usuario.id.not_in(ja_planejados),
+    ).all()
+    if not usuarios:
+        return 0
+
+    canal_email = email_configurado()
+    db.execute(insert(RelatorioMensalEnvio), [
+        {
+            "id_usuario": id_usuario,
+            "mes_referencia": mes_referencia,
+            "status": "pendente",
+            "canal": "email" if canal_email and email else "telegram",
+            "agendado_para": horario_entrega(horario, hoje, agora),
+            "tentativas": 0,
+            "criado_em": agora,
+        }
+        for id_usuario, horario, email in usuarios
+    ])
+    db.commit()
+    return len(usuarios)
+
+
+def _carregar_lote(mes: int, ano: int, ultimo_id: int) -> List[Tuple[int, int, Optional[Dict[str, Any]]]]:
+    """Próximo lote 'pendente': (id do envio, tentativas, contexto do PDF ou None sem dados)."""
+    mes_referencia = f"{ano:04d}-{mes:02d}"
+    db = next(get_db())
+    try:
+        envios = db.query(
+            RelatorioMensalEnvio.id, RelatorioMensalEnvio.id_usuario, RelatorioMensalEnvio.tentativas
+        ).filter(
+            RelatorioMensalEnvio.mes_referencia == mes_referencia,
+            RelatorioMensalEnvio.status == 'pendente',
+            RelatorioMensalEnvio.id > ultimo_id,
+        ).order_by(RelatorioMensalEnvio.id).limit(TAMANHO_LOTE).all()
+        if not envios:
+            return []
+
+        ids_usuarios = [id_usuario for _, id_usuario, _ in envios]
+        usuarios = {u.id: u for u in db.query(Usuario).filter(Usuario.id.in_(ids_usuarios)).all()}
+        linhas = agregar_historico_usuarios(db, ids_usuarios, mes, ano)
+        maiores = buscar_maiores_despesas_usuarios(db, ids_usuarios, mes, ano)
+
+        lote = []
+        for envio_id, id_usuario, tentativas in envios:
+            contexto = contexto_de_agregados(usuarios[id_usuario], mes, ano, linhas[id_usuario], maiores[id_usuario])
+            pdf_context = contexto_pdf(contexto, date(ano, mes, 1)) if contexto.get("has_data") else None
+            lote.append((envio_id, tentativas, pdf_context))
+        return lote
+    finally:
+        db.close()
+
+
+def _resultado_falha(envio_id: int, tentativas: int, erro: str, status_retentativa: str) -> Dict[str, Any]:
+    tentativas += 1
+    return {
+        "id": envio_id,
+        "tentativas": tentativas,
+        "erro": erro[:1000],
+        "status": "falhou" if tentativas >= MAX_TENTATIVAS else status_retentativa,
+    }
+
+
+def _gravar(resultados: List[Dict[str, Any]]) -> None:
+    if not resultados:
+        return
+    db = next(get_db())
+    try:
+        db.execute(update(RelatorioMensalEnvio), resultados)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _carregar_entregas(agora: datetime) -> List[Tuple]:
+    db = next(get_db())
+    try:
+        return db.query(
+            RelatorioMensalEnvio.id, RelatorioMensalEnvio.mes_referencia, RelatorioMensalEnvio.canal,
+            RelatorioMensalEnvio.tentativas, RelatorioMensalEnvio.pdf,
+            Usuario.telegram_id, Usuario.email_notificacao,
+        ).join(Usuario, RelatorioMensalEnvio.id_usuario == Usuario.id).filter(
+            RelatorioMensalEnvio.status == 'gerado',
+            RelatorioMensalEnvio.agendado_para <= agora,
+        ).order_by(RelatorioMensalEnvio.agendado_para).limit(TAMANHO_LOTE).all()
+    finally:
+        db.close()
+
+
+class EstatisticasLote:
+    """Contadores e vazão (relatórios por minuto) de uma etapa do lote."""
+
+    def __init__(self):
+        self.processados = 0
+        self.falhas = 0
+        self.segundos = 0.0
+
+    def registrar(self, processados: int, falhas: int, segundos: float) -> None:
+        self.processados += processados
+        self.falhas += falhas
+        self.segundos += segundos
+
+    @property
+    def por_minuto(self) -> float:
+        return self.processados / self.segundos * 60 if self.segundos else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processados": self.processados,
+            "falhas": self.falhas,
+            "segundos": round(self.segundos, 1),
+            "relatorios_por_minuto": round(self.por_minuto, 1),
+        }
+
+
+class PipelineRelatoriosMensais:
+    """Geração em lote (pool de processos, fila limitada) e entrega dos relatórios mensais."""
+
+    def __init__(self, max_processos: int = MAX_PROCESSOS, max_na_fila: int = MAX_NA_FILA):
+        self.max_processos = max_processos
+        self.max_na_fila = max_na_fila
+        self.geracao = EstatisticasLote()
+        self.entrega = EstatisticasLote()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._em_execucao = asyncio.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Sem fork: o bot tem várias threads e um filho de fork herdaria locks presos.
+                # Os processos importam só o pdf_generator (ReportLab) para montar os PDFs
+                metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_processos, mp_context=multiprocessing.get_context(metodo)
+                )
+            return self._pool
+
+    def encerrar(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    async def _renderizar(self, lote) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        fila = asyncio.Semaphore(self.max_na_fila)  # no máximo max_na_fila PDFs submetidos ao pool
+
+        async def renderizar_um(envio_id, tentativas, pdf_context):
+            if pdf_context is None:
+                return {"id": envio_id, "status": "falhou", "erro": "Sem lançamentos no mês", "tentativas": tentativas}
+            async with fila:
+                try:
+                    pdf = await loop.run_in_executor(pool, generate_financial_pdf, pdf_context)
+                except Exception as e:
+                    return _resultado_falha(envio_id, tentativas, str(e), 'pendente')
+            return {"id": envio_id, "status": "gerado", "pdf": pdf, "erro": None, "gerado_em": _agora_utc()}
+
+        return await asyncio.gather(*(renderizar_um(*item) for item in lote))
+
+    async def gerar_pendentes(self, mes: int, ano: int) -> int:
+        """Gera os PDFs 'pendente' do mês, lote a lote; retoma de onde parou se interrompido."""
+        async with self._em_execucao:
+            gerados, ultimo_id = 0, 0
+            try:
+                while True:
+                    inicio = time_module.monotonic()
+                    lote = await asyncio.to_thread(_carregar_lote, mes, ano, ultimo_id)
+                    if not lote:
+                        break
+                    ultimo_id = lote[-1][0]
+                    resultados = await self._renderizar(lote)
+                    await asyncio.to_thread(_gravar, resultados)
+                    ok = sum(1 for r in resultados if r["status"] == "gerado")
+                    gerados += ok
+                    self.geracao.registrar(ok, len(resultados) - ok, time_module.monotonic() - inicio)
+            finally:
+                self.encerrar()
+            if gerados:
+                logger.info(
+                    f"📈 Relatórios mensais {ano:04d}-{mes:02d}: {gerados} gerados "
+                    f"({self.geracao.por_minuto:.1f} relatórios/min)"
+                )
+            return gerados
+
+    async def _entregar_um(self, bot, mes_referencia, canal, pdf, telegram_id, email) -> None:
+        nome_arquivo = f"relatorio_{mes_referencia}.pdf"
+        if canal == 'email' and email:
+            await asyncio.to_thread(
+                enviar_email_com_anexo, email, f"Seu relatório financeiro de {mes_referencia}",
+                "<p>Olá! Segue em anexo o seu relatório financeiro do mês.</p><p>— Maestro Financeiro</p>",
+                pdf, nome_arquivo,
+            )
+            return
+        await bot.send_document(
+            chat_id=telegram_id,
+            document=InputFile(io.BytesIO(pdf), filename=nome_arquivo),
+            caption=f"📊 Seu relatório de {mes_referencia} chegou! Bom planejamento para o novo mês.",
+            read_timeout=120,
+            write_timeout=120,
+        )
+
+    async def entregar_devidos(self, bot) -> int:
+        """Envia os relatórios 'gerado' cujo horário de entrega já chegou."""
+        inicio = time_module.monotonic()
+        entregas = await asyncio.to_thread(_carregar_entregas, _agora_utc())
+        enviados, falhas = 0, 0
+        for envio_id, mes_referencia, canal, tentativas, pdf, telegram_id, email in entregas:
+            try:
+                await self._entregar_um(bot, mes_referencia, canal, pdf, telegram_id, email)
+                resultado = {"id": envio_id, "status": "enviado", "pdf": None, "erro": None, "enviado_em": _agora_utc()}
+                enviados += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao entregar relatório mensal {envio_id} ({canal}): {e}")
+                resultado = _resultado_falha(envio_id, tentativas, str(e), 'gerado')
+                falhas += 1
+            # Gravado a cada envio: um reinício não reenvia o que já foi entregue
+            await asyncio.to_thread(_gravar, [resultado])
+            await asyncio.sleep(INTERVALO_ENVIO_SEGUNDOS)
+        if entregas:
+            self.entrega.registrar(enviados, falhas, time_module.monotonic() - inicio)
+            logger.info(f"📬 Relatórios mensais entregues: {enviados} ({falhas} falha(s))")
+        return enviados
+
+    def stats(self) -> Dict[str, Any]:
+        return {"geracao": self.geracao.stats(), "entrega": self.entrega.stats()}
+
+
+_pipeline: Optional[PipelineRelatoriosMensais] = None
+
+
+def get_pipeline_relatorios() -> PipelineRelatoriosMensais:
+    """Retorna o pipeline de relatórios mensais compartilhado."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = PipelineRelatoriosMensais()
+    return _pipeline
+
+
+def _planejar(mes: int, ano: int, hoje: date) -> int:
+    db = next(get_db())
+    try:
+        return planejar_mes(db, mes, ano, hoje)
+    finally:
+        db.close()
+
+
+async def job_lote_relatorios_mensais(context) -> None:
+    """Job diário: planeja (nos primeiros dias do mês) e gera os relatórios do mês fechado."""
+    try:
+        hoje = datetime.now(FUSO_LOCAL).date()
+        mes, ano = mes_fechado(hoje)
+        if hoje.day <= DIAS_PLANEJAMENTO:
+            planejados = await asyncio.to_thread(_planejar, mes, ano, hoje)
+            if planejados:
+                logger.info(f"🗓️ {planejados} relatório(s) mensal(is) de {ano:04d}-{mes:02d} planejado(s)")
+        await get_pipeline_relatorios().gerar_pendentes(mes, ano)
+    except Exception as e:
+        logger.error(f"❌ Erro no lote de relatórios mensais: {e}", exc_info=True)
+
+
+async def job_entregar_relatorios_mensais(context) -> None:
+    """Job periódico: entrega os relatórios mensais cujo horário chegou."""
+    try:
+        await get_pipeline_relatorios().entregar_devidos(context.bot)
+    except Exception as e:
+        logger.error(f"❌ Erro ao entregar relatórios mensais: {e}", exc_info=True)
+
+
+__all__ = [
+    'EstatisticasLote',
+    'PipelineRelatoriosMensais',
+    'get_pipeline_relatorios',
+    'horario_entrega',
+    'job_entregar_relatorios_mensais',
+    'job_lote_relatorios_mensais',
+    'mes_fechado',
+    'planejar_mes',
+]
@@ -0,0 +1,215 @@
+"""
+📄 Geração de Relatórios em Segundo Plano
+Tira a produção do /relatorio (consulta, agregação, gráfico, template e
+ReportLab) de dentro do handler:
+
+- O handler só responde "gerando..." e agenda o trabalho com
+  ``get_trabalhador_relatorios().agendar(...)``; o bot continua atendendo
+  os demais usuários enquanto o relatório é montado;
+- As etapas bloqueantes rodam num pool de threads dedicado
+  (``RELATORIOS_WORKERS``) e no máximo esse número de relatórios é produzido
+  ao mesmo tempo; os excedentes esperam na fila;
+- O progresso é mostrado editando a mensagem de status no chat
+  (``ProgressoRelatorio``);
+- PDFs prontos de meses fechados ficam em cache com chave
+  (usuário, mês, versão dos dados): pedir de novo um mês que não mudou
+  reenvia o ``file_id`` do Telegram (ou os bytes) na hora. Qualquer
+  lançamento novo, editado ou apagado no mês gera outra versão.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Dict, Hashable, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+import metricas
+from models import Lancamento, Usuario
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.getenv("RELATORIOS_WORKERS", "2"))
+MAX_RELATORIOS_EM_CACHE = int(os.getenv("RELATORIOS_CACHE_MAX", "256"))
+
+ChaveRelatorio = Tuple[int, str, str]
+
+
+@dataclass
+class RelatorioPronto:
+    """PDF gerado e o que é preciso para reenviá-lo sem refazer nada."""
+    pdf_bytes: bytes
+    nome_arquivo: str
+    legenda: str
+    file_id: Optional[str] = None
+
+
+def versao_dados_mes(db: Session, telegram_id: int, mes_referencia: str) -> Optional[str]:
+    """
+    Versão dos lançamentos de um mês (``YYYY-MM``) do usuário: hash das linhas
+    (id, valor, tipo, categoria, data e descrição) em ordem de id, pelo índice
+    (id_usuario, mes_referencia). Qualquer inclusão, remoção ou edição muda a versão.
+    """
+    linhas = db.query(
+        Lancamento.id,
+        Lancamento.valor,
+        Lancamento.tipo,
+        Lancamento.id_categoria,
+        Lancamento.data_transacao,
+        Lancamento.descricao,
+    ).join(Usuario, Lancamento.id_usuario == Usuario.id).filter(
+        Usuario.telegram_id == telegram_id,
+        Lancamento.mes_referencia == mes_referencia,
+    ).order_by(Lancamento.id)
+    resumo = hashlib.sha1()
+    vazio = True
+    for linha in linhas.yield_per(1000):
+        resumo.update("|".join(str(valor) for valor in linha).encode())
+        resumo.update(b"\n")
+        vazio = False
+    return None if vazio else resumo.hexdigest()[:16]
+
+
+class CacheRelatorios:
+    """PDFs prontos por (usuário, mês, versão dos dados), com descarte LRU."""
+
+    def __init__(self, max_entradas: int = MAX_RELATORIOS_EM_CACHE):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[ChaveRelatorio, RelatorioPronto]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave: ChaveRelatorio) -> Optional[RelatorioPronto]:
+        with self._lock:
+            pronto = self._entradas.get(chave)
+            if pronto is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return pronto
+
+    def set(self, chave: ChaveRelatorio, pronto: RelatorioPronto) -> None:
+        with self._lock:
+            # Versões antigas do mesmo mês nunca mais serão pedidas
+            for antiga in [c for c in self._entradas if c[:2] == chave[:2] and c != chave]:
+                del self._entradas[antiga]
+            self._entradas[chave] = pronto
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, telegram_id: int) -> None:
+        with self._lock:
+            for chave in [c for c in self._entradas if c[0] == telegram_id]:
+                del self._entradas[chave]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "relatorios": len(self._entradas),
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+
+class ProgressoRelatorio:
+    """Mostra as etapas do relatório editando a mensagem de status no chat."""
+
+    def __init__(self, mensagem):
+        self.mensagem = mensagem
+        self._ultimo_texto: Optional[str] = None
+
+    async def etapa(self, texto: str) -> None:
+        if texto == self._ultimo_texto:
+            return
+        self._ultimo_texto = texto
+        try:
+            await self.mensagem.edit_text(texto)
+        except Exception as e:
+            # Mensagem apagada ou limite de edição: o progresso é só informativo
+            logger.debug(f"Não foi possível atualizar o progresso do relatório: {e}")
+
+    async def concluir(self) -> None:
+        try:
+            await self.mensagem.delete()
+        except Exception as e:
+            logger.debug(f"Não foi possível remover a mensagem de progresso: {e}")
+
+
+class TrabalhadorRelatorios:
+    """Pool de threads e fila de relatórios, com cache dos PDFs prontos."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS, cache: Optional[CacheRelatorios] = None):
+        self.max_workers = max_workers
+        self.cache = cache or CacheRelatorios()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="relatorio")
+        self._vagas: Optional[asyncio.Semaphore] = None
+        self._em_andamento: Set[Hashable] = set()
+
+    async def executar(self, funcao: Callable, *args) -> Any:
+        """Roda uma etapa bloqueante no pool de threads dos relatórios."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, funcao, *args)
+
+    def em_andamento(self, chave: Hashable) -> bool:
+        return chave in self._em_andamento
+
+    def agendar(self, application, chave: Hashable, trabalho: Coroutine,
+                progresso: Optional[ProgressoRelatorio] = None) -> bool:
+        """
+        Agenda ``trabalho`` em segundo plano. Retorna False (e descarta o
+        trabalho) se já há um relatório com a mesma chave em produção.
+        """
+        if chave in self._em_andamento:
+            trabalho.close()
+            return False
+        self._em_andamento.add(chave)
+        application.create_task(self._rodar(chave, trabalho, progresso))
+        return True
+
+    async def _rodar(self, chave: Hashable, trabalho: Coroutine,
+                     progresso: Optional[ProgressoRelatorio]) -> None:
+        if self._vagas is None:
+            self._vagas = asyncio.Semaphore(self.max_workers)
+        try:
+            if self._vagas.locked() and progresso:
+                await progresso.etapa("🕒 Seu relatório está na fila e começa em instantes...")
+            async with self._vagas:
+                await trabalho
+        except Exception as e:
+            logger.error(f"❌ Erro no trabalho de relatório {chave}: {e}", exc_info=True)
+        finally:
+            self._em_andamento.discard(chave)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"em_andamento": len(self._em_andamento), "cache": self.cache.stats()}
+
+
+_trabalhador: Optional[TrabalhadorRelatorios] = None
+
+
+def get_trabalhador_relatorios() -> TrabalhadorRelatorios:
+    """Retorna o trabalhador de relatórios compartilhado."""
+    global _trabalhador
+    if _trabalhador is None:
+        _trabalhador = TrabalhadorRelatorios()
+        metricas.registrar_cache("relatorios", _trabalhador.cache.stats)
+    return _trabalhador
+
+
+__all__ = [
+    'CacheRelatorios',
+    'ProgressoRelatorio',
+    'RelatorioPronto',
+    'TrabalhadorRelatorios',
+    'get_trabalhador_relatorios',
+    'versao_dados_mes',
+]
@@ -0,0 +1,611 @@
+"""
+🎨 Renderização de Gráficos fora do Event Loop
+Desenha os gráficos (matplotlib/scipy) num pool de processos dedicado e
+guarda os PNGs gerados em cache.
+
+- Os handlers agregam os dados no SQL (``agregacoes_graficos``) e aguardam
+  ``get_renderizador().grafico(...)`` com os arrays pequenos resultantes: o
+  desenho roda num processo do pool e o event loop nunca fica bloqueado;
+- Cada processo é pré-aquecido (backend Agg, estilos já mesclados, cache de
+  fontes e um desenho de teste) na inicialização;
+- Resultados ficam em cache por usuário, com chave (tipo de gráfico,
+  agrupamento, hash dos dados) e TTL próprio de cada usuário: cliques
+  repetidos no menu respondem na hora, e dados novos geram outro hash.
+
+Os processos do pool nascem via forkserver/spawn, nunca por fork do
+processo do bot (que tem várias threads). Além das bibliotecas de desenho,
+este módulo importa apenas ``metricas`` (só biblioteca padrão): nem o
+banco de dados nem o bot.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import metricas
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib import font_manager
+from scipy.interpolate import make_interp_spline
+
+logger = logging.getLogger(__name__)
+
+MAX_PROCESSOS = int(os.getenv("GRAFICOS_PROCESSOS", "2"))
+CACHE_TTL_SECONDS = int(os.getenv("GRAFICOS_CACHE_TTL_SECONDS", "300"))
+MAX_USUARIOS_EM_CACHE = 256
+MAX_GRAFICOS_POR_USUARIO = 16
+
+_FONTES = ['Arial', 'Helvetica', 'DejaVu Sans']
+
+# Estilos mesclados uma única vez por processo (antes: plt.style.use + rcParams a cada desenho)
+_ESTILO_DINAMICO: Dict[str, Any] = {}
+_ESTILO_RELATORIO: Dict[str, Any] = {}
+
+
+def _carregar_estilos() -> None:
+    _ESTILO_DINAMICO.clear()
+    _ESTILO_DINAMICO.update(plt.style.library['seaborn-v0_8-darkgrid'])
+    _ESTILO_DINAMICO.update({
+        'font.family': 'sans-serif',
+        'font.sans-serif': _FONTES, # Fallback de fontes
+        'axes.labelcolor': '#333333',
+        'xtick.color': '#333333',
+        'ytick.color': '#333333',
+        'axes.titlecolor': '#1a2b4c',
+        'axes.edgecolor': '#cccccc',
+        'axes.titleweight': 'bold',
+        'axes.titlesize': 18,
+        'figure.dpi': 120
+    })
+    _ESTILO_RELATORIO.clear()
+    _ESTILO_RELATORIO.update(plt.style.library['seaborn-v0_8-whitegrid'])
+
+
+def _aplicar_estilo(estilo: Dict[str, Any]) -> None:
+    if not estilo:
+        _carregar_estilos()
+    plt.rcParams.update(estilo)
+
+
+def aquecer_processo() -> None:
+    """Inicializador dos processos do pool: estilos, fontes e um desenho de teste."""
+    _carregar_estilos()
+    for fonte in _FONTES:
+        font_manager.findfont(fonte, fallback_to_default=True)
+    _aplicar_estilo(_ESTILO_DINAMICO)
+    fig, ax = plt.subplots(figsize=(1, 1))
+    ax.pie([1, 1], autopct='%1.1f%%')
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def _pronto() -> int:
+    return os.getpid()
+
+
+def preparar_dados_para_grafico(dados: Dict[str, Any], agrupar_por: str):
+    """
+    Converte os agregados vindos do SQL (gerente_financeiro.agregacoes_graficos)
+    no DataFrame pequeno usado pelo desenho.
+
+    Returns:
+        tuple: (DataFrame preparado, bool se tem dados suficientes)
+    """
+    if not dados:
+        return pd.DataFrame(), False
+
+    if agrupar_por in ('categoria', 'forma_pagamento', 'mes'):
+        df = pd.DataFrame({'grupo': dados['grupos'], 'valor': dados['valores']}, columns=['grupo', 'valor'])
+        df = df[df['valor'] > 0]
+        tem_dados_suficientes = len(df) >= 1 and df['valor'].sum() > 0
+
+    elif agrupar_por == 'data':
+        # Saldo acumulado a partir do resultado líquido de cada dia
+        df = pd.DataFrame({
+            'data': pd.to_datetime(dados['dias']),
+            'Saldo Acumulado': np.cumsum(dados['liquidos']),
+        })
+        tem_dados_suficientes = len(df) >= 1
+
+    elif agrupar_por == 'fluxo_caixa':
+        df = pd.DataFrame({
+            'data': pd.to_datetime(dados['dias']),
+            'entrada': dados['entradas'],
+            'saida': dados['saidas'],
+        })
+        tem_dados_suficientes = len(df) >= 1 and (df['entrada'].sum() > 0 or df['saida'].sum() > 0)
+
+    elif agrupar_por == 'projecao':
+        df = pd.DataFrame({'total_gasto': [dados['total_gasto']]})
+        tem_dados_suficientes = dados['total_gasto'] > 0
+
+    else:
+        return pd.DataFrame(), False
+
+    return df, tem_dados_suficientes
+
+
+def desenhar_grafico_relatorio(gastos_por_categoria: dict) -> Optional[bytes]:
+    """Gera um gráfico de pizza (PNG em bytes) a partir de um dicionário de gastos por categoria."""
+    if not gastos_por_categoria:
+        return None
+    try:
+        _aplicar_estilo(_ESTILO_RELATORIO)
+
+        df = pd.DataFrame(list(gastos_por_categoria.items()), columns=['Categoria', 'Valor']).sort_values('Valor', ascending=False)
+
+        if len(df) > 6:
+            top_5 = df.iloc[:5].copy()
+            outros_valor = df.iloc[5:]['Valor'].sum()
+            outros_df = pd.DataFrame([{'Categoria': 'Outros', 'Valor': outros_valor}])
+            df = pd.concat([top_5, outros_df], ignore_index=True)
+
+        # aumentar dpi para melhorar qualidade ao inserir no PDF
+        fig, ax = plt.subplots(figsize=(8, 5), dpi=200)
+
+        colors = sns.color_palette("viridis_r", len(df))
+
+        wedges, _, autotexts = ax.pie(
+            df['Valor'], 
+            autopct='%1.1f%%', 
+            startangle=140, 
+            pctdistance=0.85, 
+            colors=colors, 
+            wedgeprops={'edgecolor': 'white', 'linewidth': 1.5}
+        )
+        plt.setp(autotexts, size=10, weight="bold", color="white")
+
+        centre_circle = plt.Circle((0,0),0.70,fc='white')
+        fig.gca().add_artist(centre_circle)
+
+        ax.set_title('Distribuição de Despesas', fontsize=16, pad=15, weight='bold')
+        ax.axis('equal')
+
+        plt.tight_layout()
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=200)
+        return buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Erro CRÍTICO ao gerar gráfico para relatório: {e}", exc_info=True)
+        return None
+    finally:
+        plt.close('all')
+
+
+def desenhar_grafico(dados: Dict[str, Any], tipo_grafico: str, agrupar_por: str) -> Optional[bytes]:
+    """
+    Gera gráficos financeiros dinâmicos com um design aprimorado e profissional.
+    Recebe os agregados do SQL e retorna o PNG em bytes (ou None sem dados suficientes).
+    """
+    try:
+        _aplicar_estilo(_ESTILO_DINAMICO)
+
+        df, tem_dados_suficientes = preparar_dados_para_grafico(dados, agrupar_por)
+        if not tem_dados_suficientes:
+            return None
+
+        # DPI alto para imagens mais nítidas no PDF
+        fig, ax = plt.subplots(figsize=(12, 7), dpi=200)
+
+        # --- GRÁFICOS DE CATEGORIA E FORMA DE PAGAMENTO ---
+        if agrupar_por in ['categoria', 'forma_pagamento']:
+            
+            # GRÁFICO DE PIZZA (AGORA DONUT CHART)
+            if tipo_grafico == 'pizza':
+                nome_agrupamento = 'Categoria' if agrupar_por == 'categoria' else 'Forma de Pagamento'
+                ax.set_title(f'Distribuição de Valores por {nome_agrupamento}', pad=20, fontsize=16, weight='bold')
+                
+                # Paleta de cores vibrante e profissional
+                colors = plt.cm.Set3(np.linspace(0, 1, len(df['grupo'])))
+                
+                # Explode as fatias para melhor visualização (maior fatia com destaque)
+                valores_norm = df['valor'] / df['valor'].sum()
+                explode = [0.08 if v == valores_norm.max() else 0.03 for v in valores_norm]
+                
+                wedges, texts, autotexts = ax.pie(
+                    df['valor'], 
+                    autopct='%1.1f%%', 
+                    startangle=90, 
+                    colors=colors, 
+                    pctdistance=0.82,
+                    explode=explode,
+                    wedgeprops={'edgecolor': 'white', 'linewidth': 3, 'antialiased': True},
+                    textprops={'fontsize': 11, 'weight': 'bold'}
+                )
+                
+                # Melhora visibilidade dos percentuais
+                for autotext in autotexts:
+                    autotext.set_color('white')
+                    autotext.set_fontsize(12)
+                    autotext.set_weight('bold')
+                    autotext.set_bbox(dict(boxstyle='round,pad=0.3', facecolor='black', alpha=0.3))
+                
+                # Desenha o círculo no centro para criar o efeito DONUT
+                centre_circle = plt.Circle((0,0), 0.68, fc='white', linewidth=0)
+                fig.gca().add_artist(centre_circle)
+                
+                # Total no centro do donut
+                total = df['valor'].sum()
+                ax.text(0, 0, f'Total\nR$ {total:,.2f}'.replace(',', '.'), 
+                       ha='center', va='center', fontsize=14, weight='bold', color='#2c3e50')
+                
+                # Legenda limpa e organizada com valores
+                legend_labels = [f"{label}: R$ {valor:,.2f}".replace(',', '.') for label, valor in zip(df['grupo'], df['valor'])]
+                ax.legend(wedges, legend_labels, title=nome_agrupamento, title_fontsize=12,
+                         loc="center left", bbox_to_anchor=(1, 0, 0.5, 1), fontsize=10,
+                         frameon=True, fancybox=True, shadow=True)
+                ax.axis('equal')
+
+            # GRÁFICO DE BARRAS HORIZONTAIS
+            elif tipo_grafico == 'barra_h':
+                nome_agrupamento = 'Categoria' if agrupar_por == 'categoria' else 'Forma de Pagamento'
+                ax.set_title(f'Gastos por {nome_agrupamento}', pad=20, fontsize=16, weight='bold')
+                df = df.sort_values('valor', ascending=True) # Ordena do menor para o maior
+                
+                # Paleta de cores gradiente moderna
+                colors = plt.cm.viridis(np.linspace(0.2, 0.9, len(df)))
+                bars = ax.barh(df['grupo'], df['valor'], color=colors, edgecolor='white', linewidth=1.5, height=0.7)
+                
+                ax.set_xlabel('Valor Gasto (R$)', fontsize=13, weight='bold')
+                ax.set_ylabel('')
+                ax.grid(axis='x', linestyle='--', alpha=0.3) # Grade vertical sutil
+                ax.set_axisbelow(True)
+                
+                # Rótulos de valor formatados
+                max_valor = df['valor'].max()
+                for i, (bar, valor) in enumerate(zip(bars, df['valor'])):
+                    width = bar.get_width()
+                    # Posiciona rótulo dentro da barra se for grande, fora se for pequena
+                    if valor > max_valor * 0.15:
+                        ax.text(width * 0.95, bar.get_y() + bar.get_height()/2,
+                               f'R$ {width:,.2f}'.replace(',', '.'),
+                               va='center', ha='right', fontsize=11, weight='bold', color='white')
+                    else:
+                        ax.text(width + (max_valor * 0.02), bar.get_y() + bar.get_height()/2,
+                               f'R$ {width:,.2f}'.replace(',', '.'),
+                               va='center', ha='left', fontsize=11, weight='bold', color='#2c3e50')
+
+        # --- GRÁFICOS BASEADOS EM DATA ---
+        elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
+            
+            # GRÁFICO DE EVOLUÇÃO DO SALDO (LINHA)
+            if agrupar_por == 'data':
+                if len(df) < 2: return None # Precisa de pelo menos 2 pontos
+                ax.set_title('Evolução do Saldo Financeiro', pad=20)
+                
+                df = df.sort_values('data')
+                
+                # Decidir se suaviza ou não baseado no número de pontos
+                if len(df) >= 5:
+                    # Suavização da linha (apenas se tiver dados suficientes)
+                    try:
+                        x_smooth = np.linspace(df['data'].astype(np.int64).min(), df['data'].astype(np.int64).max(), 300)
+                        x_smooth_dt = pd.to_datetime(x_smooth)
+                        spl = make_interp_spline(df['data'].astype(np.int64), df['Saldo Acumulado'], k=min(2, len(df)-1))
+                        y_smooth = spl(x_smooth)
+                        
+                        ax.plot(x_smooth_dt, y_smooth, label='Saldo Acumulado', color='#3498db', linewidth=3)
+                        ax.fill_between(x_smooth_dt, y_smooth, alpha=0.15, color='#3498db')
+                    except Exception as e:
+                        logger.warning(f"Erro na suavização, usando linha simples: {e}")
+                        ax.plot(df['data'], df['Saldo Acumulado'], label='Saldo Acumulado', color='#3498db', linewidth=3, marker='o')
+                        ax.fill_between(df['data'], df['Saldo Acumulado'], alpha=0.15, color='#3498db')
+                else:
+                    # Linha simples para poucos pontos
+                    ax.plot(df['data'], df['Saldo Acumulado'], label='Saldo Acumulado', color='#3498db', linewidth=3, marker='o', markersize=8)
+                    ax.fill_between(df['data'], df['Saldo Acumulado'], alpha=0.15, color='#3498db')
+                
+                # Destaque do pico máximo e mínimo
+                pico_max = df.loc[df['Saldo Acumulado'].idxmax()]
+                pico_min = df.loc[df['Saldo Acumulado'].idxmin()]
+                
+                ax.scatter(pico_max['data'], pico_max['Saldo Acumulado'], color='#2ecc71', s=180, zorder=5, label='Maior Saldo', edgecolor='white', linewidth=2)
+                ax.scatter(pico_min['data'], pico_min['Saldo Acumulado'], color='#e74c3c', s=180, zorder=5, label='Menor Saldo', edgecolor='white', linewidth=2)
+                
+                # Anotações nos picos (com posicionamento dinâmico)
+                offset_max = abs(pico_max['Saldo Acumulado']) * 0.05
+                offset_min = abs(pico_min['Saldo Acumulado']) * 0.05
+                ax.text(pico_max['data'], pico_max['Saldo Acumulado'] + offset_max, 
+                       f'R$ {pico_max["Saldo Acumulado"]:.2f}', 
+                       ha='center', fontsize=11, weight='bold', color='#2ecc71', 
+                       bbox=dict(boxstyle='round,pad=0.4', fc='white', alpha=0.8, edgecolor='#2ecc71'))
+                ax.text(pico_min['data'], pico_min['Saldo Acumulado'] - offset_min, 
+                       f'R$ {pico_min["Saldo Acumulado"]:.2f}', 
+                       ha='center', fontsize=11, weight='bold', color='#e74c3c',
+                       bbox=dict(boxstyle='round,pad=0.4', fc='white', alpha=0.8, edgecolor='#e74c3c'))
+
+                ax.legend(fontsize=11, loc='best')
+                ax.axhline(0, color='gray', linewidth=0.8, linestyle='--', alpha=0.5)
+
+            # GRÁFICO DE PROJEÇÃO (BARRAS HORIZONTAIS)
+            elif agrupar_por == 'projecao':
+                today = datetime.fromisoformat(dados['hoje'])
+                
+                # Total de despesas do mês até hoje (somado no SQL)
+                total_gasto = dados['total_gasto']
+                
+                # Calcular projeção
+                dias_no_mes = (today.replace(month=today.month % 12 + 1 if today.month != 12 else 1, day=1, year=today.year if today.month != 12 else today.year + 1) - timedelta(days=1)).day
+                dias_passados = today.day
+                gasto_medio_diario = total_gasto / dias_passados
+                gasto_projetado = gasto_medio_diario * dias_no_mes
+                
+                # Nome do mês em português
+                meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
+                           'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+                mes_nome = meses_pt[today.month - 1]
+                
+                ax.set_title(f'Projeção de Gastos para {mes_nome}/{today.year}', pad=20, fontsize=16)
+                
+                # Dados para o gráfico
+                labels = ['💰 Gasto até Hoje', '📊 Projeção Mensal']
+                valores = [total_gasto, gasto_projetado]
+                cores = ['#3498db', '#e74c3c']
+
+                bars = ax.barh(labels, valores, color=cores, edgecolor='white', linewidth=2, height=0.6)
+                ax.invert_yaxis() # Gasto atual em cima
+                
+                ax.set_xlabel('Valor (R$)', fontsize=13, weight='bold')
+                ax.grid(axis='x', alpha=0.3, linestyle='--')
+                
+                # Rótulos de valor
+                for i, (bar, valor) in enumerate(zip(bars, valores)):
+                    width = bar.get_width()
+                    ax.text(width + (gasto_projetado * 0.02), bar.get_y() + bar.get_height()/2,
+                           f'R$ {valor:,.2f}'.replace(',', '.'),
+                           va='center', ha='left', fontsize=12, weight='bold', color=cores[i])
+                
+                # Informações adicionais
+                dias_restantes = dias_no_mes - dias_passados
+                gasto_restante = gasto_projetado - total_gasto
+                
+                info_text = (
+                    f"📅 Dia {dias_passados}/{dias_no_mes} ({dias_restantes} dias restantes)\n"
+                    f"📈 Média diária: R$ {gasto_medio_diario:.2f}\n"
+                    f"💸 Estimativa restante: R$ {gasto_restante:.2f}"
+                )
+                
+                ax.text(0.02, 0.98, info_text,
+                       transform=ax.transAxes, fontsize=10,
+                       verticalalignment='top',
+                       bbox=dict(boxstyle='round,pad=0.6', fc='lightyellow', alpha=0.8, edgecolor='gray'))
+
+            # GRÁFICO DE FLUXO DE CAIXA
+            elif agrupar_por == 'fluxo_caixa':
+                # Entradas e saídas por dia (somadas no SQL)
+                df_agrupado = df.sort_values('data')
+                
+                if df_agrupado['entrada'].sum() == 0 and df_agrupado['saida'].sum() == 0:
+                    logger.info("Sem dados de fluxo de caixa para exibir")
+                    return None
+                
+                ax.set_title('Fluxo de Caixa (Receitas vs. Despesas)', pad=20, fontsize=16, weight='bold')
+                
+                # Barras com cores modernas e bordas
+                width_days = (df_agrupado['data'].max() - df_agrupado['data'].min()).days
+                bar_width = max(0.8, min(3, width_days / len(df_agrupado) * 0.7))
+                
+                ax.bar(df_agrupado['data'], df_agrupado['entrada'], 
+                      color='#27ae60', label='💰 Receitas', 
+                      width=bar_width, edgecolor='white', linewidth=1.5, alpha=0.9)
+                ax.bar(df_agrupado['data'], -df_agrupado['saida'], 
+                      color='#e74c3c', label='💸 Despesas', 
+                      width=bar_width, edgecolor='white', linewidth=1.5, alpha=0.9)
+                
+                # Linha zero de referência
+                ax.axhline(0, color='#2c3e50', linewidth=1.5, linestyle='-', alpha=0.7, zorder=0)
+                
+                # Estatísticas no gráfico
+                total_receitas = df_agrupado['entrada'].sum()
+                total_despesas = df_agrupado['saida'].sum()
+                saldo_liquido = total_receitas - total_despesas
+                
+                stats_text = (
+                    f"💰 Total Receitas: R$ {total_receitas:,.2f}\n"
+                    f"💸 Total Despesas: R$ {total_despesas:,.2f}\n"
+                    f"{'📈' if saldo_liquido >= 0 else '📉'} Saldo Líquido: R$ {saldo_liquido:,.2f}"
+                ).replace(',', '.')
+                
+                ax.text(0.02, 0.98, stats_text,
+                       transform=ax.transAxes, fontsize=10,
+                       verticalalignment='top',
+                       bbox=dict(boxstyle='round,pad=0.6', fc='lightyellow', alpha=0.85, edgecolor='gray'))
+                
+                ax.legend(fontsize=11, loc='lower right', frameon=True, fancybox=True, shadow=True)
+                ax.grid(axis='y', linestyle='--', alpha=0.3)
+            
+            ax.set_ylabel('Valor (R$)', fontsize=12)
+            fig.autofmt_xdate(rotation=30)
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+
+        else:
+            return None
+        
+        plt.tight_layout(pad=1.5)
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=200)
+        plt.close(fig) # Garante que a figura seja fechada para liberar memória
+        return buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Erro CRÍTICO ao gerar gráfico: {e}", exc_info=True)
+        plt.close('all') # Fecha todas as figuras em caso de erro
+        return None
+
+def _hash_dados(dados: Any) -> str:
+    return hashlib.sha1(json.dumps(dados, default=str, sort_keys=True).encode()).hexdigest()
+
+
+class CacheGraficos:
+    """PNGs por usuário; cada usuário tem o próprio TTL e é invalidado sem afetar os demais."""
+
+    def __init__(self, ttl_segundos: int = CACHE_TTL_SECONDS, max_usuarios: int = MAX_USUARIOS_EM_CACHE):
+        self.ttl_segundos = ttl_segundos
+        self.max_usuarios = max_usuarios
+        self._por_usuario: "OrderedDict[Any, Tuple[float, OrderedDict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id_usuario, chave: Tuple) -> Optional[bytes]:
+        with self._lock:
+            entrada = self._por_usuario.get(id_usuario)
+            if entrada and time.monotonic() < entrada[0] and chave in entrada[1]:
+                self._por_usuario.move_to_end(id_usuario)
+                self.hits += 1
+                return entrada[1][chave]
+            if entrada and time.monotonic() >= entrada[0]:
+                del self._por_usuario[id_usuario]
+            self.misses += 1
+            return None
+
+    def set(self, id_usuario, chave: Tuple, png: bytes) -> None:
+        with self._lock:
+            entrada = self._por_usuario.get(id_usuario)
+            if entrada is None:
+                entrada = (time.monotonic() + self.ttl_segundos, OrderedDict())
+                self._por_usuario[id_usuario] = entrada
+            graficos = entrada[1]
+            graficos[chave] = png
+            while len(graficos) > MAX_GRAFICOS_POR_USUARIO:
+                graficos.popitem(last=False)
+            self._por_usuario.move_to_end(id_usuario)
+            while len(self._por_usuario) > self.max_usuarios:
+                self._por_usuario.popitem(last=False)
+
+    def invalidar(self, id_usuario) -> None:
+        with self._lock:
+            self._por_usuario.pop(id_usuario, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "usuarios": len(self._por_usuario),
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+
+class RenderizadorGraficos:
+    """Pool de processos pré-aquecidos para desenhar gráficos, com cache de resultados."""
+
+    def __init__(self, max_processos: int = MAX_PROCESSOS, cache: Optional[CacheGraficos] = None):
+        self.max_processos = max_processos
+        self.cache = cache or CacheGraficos()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Sem fork: o bot tem várias threads (Flask, bot, relatórios) e um filho de fork
+                # herdaria locks presos (logging, metricas, matplotlib). aquecer_processo prepara o resto
+                metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_processos,
+                    mp_context=multiprocessing.get_context(metodo),
+                    initializer=aquecer_processo,
+                )
+            return self._pool
+
+    async def iniciar(self) -> None:
+        """Sobe e aquece todos os processos do pool (chamado na inicialização do bot)."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _pronto) for _ in range(self.max_processos)))
+        logger.info(f"🎨 Pool de gráficos pronto: {len(set(pids))} processo(s)")
+
+    def encerrar(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _descartar_quebrado(self, pool: ProcessPoolExecutor) -> None:
+        """Descarta um pool quebrado (processo morto); a próxima chamada cria outro."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    async def _renderizar(self, id_usuario, chave: Tuple, funcao, *args) -> Optional[bytes]:
+        png = self.cache.get(id_usuario, chave)
+        if png is not None:
+            return png
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            png = await loop.run_in_executor(pool, funcao, *args)
+        except BrokenProcessPool as e:
+            logger.error(f"❌ Pool de gráficos quebrado, será recriado: {e}")
+            self._descartar_quebrado(pool)
+            return None
+        except Exception as e:
+            # Falha só deste desenho: os pedidos dos outros usuários seguem no mesmo pool
+            logger.error(f"❌ Falha ao renderizar gráfico: {e}", exc_info=True)
+            return None
+        if png is not None:
+            self.cache.set(id_usuario, chave, png)
+        return png
+
+    async def grafico(self, id_usuario, dados: Dict[str, Any], tipo_grafico: str,
+                      agrupar_por: str) -> Optional[bytes]:
+        """PNG do gráfico do menu /grafico a partir dos agregados (ou None sem dados suficientes)."""
+        chave = (tipo_grafico, agrupar_por, _hash_dados(dados))
+        return await self._renderizar(id_usuario, chave, desenhar_grafico, dados, tipo_grafico, agrupar_por)
+
+    async def grafico_relatorio(self, id_usuario, gastos_por_categoria: dict) -> Optional[bytes]:
+        """PNG do gráfico de pizza do relatório mensal."""
+        if not gastos_por_categoria:
+            return None
+        chave = ('pizza', 'relatorio', _hash_dados(gastos_por_categoria))
+        return await self._renderizar(id_usuario, chave, desenhar_grafico_relatorio, gastos_por_categoria)
+
+
+_renderizador: Optional[RenderizadorGraficos] = None
+
+
+def get_renderizador() -> RenderizadorGraficos:
+    """Retorna o renderizador compartilhado."""
+    global _renderizador
+    if _renderizador is None:
+        _renderizador = RenderizadorGraficos()
+        metricas.registrar_cache("graficos_imagens", _renderizador.cache.stats)
+    return _renderizador
+
+
+async def job_aquecer_pool_graficos(context) -> None:
+    """Job de inicialização: sobe os processos antes do primeiro /grafico."""
+    try:
+        await get_renderizador().iniciar()
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível aquecer o pool de gráficos: {e}")
+
+
+__all__ = [
+    'CacheGraficos',
+    'RenderizadorGraficos',
+    'aquecer_processo',
+    'desenhar_grafico',
+    'desenhar_grafico_relatorio',
+    'get_renderizador',
+    'job_aquecer_pool_graficos',
+    'preparar_dados_para_grafico',
+]
@@ -7,12 +7,10 @@ import io
 import pandas as pd
 from models import Conta, Objetivo, Agendamento
 import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import seaborn as sns
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, extract, text
+from sqlalchemy import func, and_, extract, text, insert
 import asyncio
 import difflib
 import hashlib  # <-- Para gerar chaves de cache
@@ -20,14 +18,19 @@ import json  # <-- Para serialização de dados
 from functools import lru_cache  # <-- Cache em memória
 import time  # <-- Para timestamps do cache
 import google.generativeai as genai
+import metricas
 
 from database.database import listar_objetivos_usuario
 from models import Categoria, Lancamento, Usuario, Subcategoria, ItemLancamento
 import config
 from . import external_data
+from .categorizacao import MotorCategorizacao
+from .campos_derivados import agora_local, campos_derivados_lancamento, chave_mes, extrair_itens_de_descricao
+from .merchant_memory import get_merchant_memory
+from .relatorio_dados import montar_contexto_relatorio
+from .renderizador_graficos import desenhar_grafico_relatorio
 from dateutil.relativedelta import relativedelta
 import numpy as np 
-from scipy.interpolate import make_interp_spline
 
 # --- SISTEMA DE CACHE INTELIGENTE V2 (OTIMIZADO) ---
 _cache_financeiro = {}
@@ -36,6 +39,10 @@ _cache_memoria = {}  # <-- Cache principal em memória
 _cache_hash_transacoes = {}  # <-- Hash das transações para invalidação automática
 CACHE_TTL = 30  # ⚡ 30 segundos (rápido para evitar dados desatualizados)
 CACHE_MAX_SIZE = 100  # Limite de itens no cache
+_cache_contagem = {"hits": 0, "misses": 0}
+_cache_ia_contagem = {"hits": 0, "misses": 0}
+metricas.registrar_cache("financeiro", lambda: _cache_contagem)
+metricas.registrar_cache("respostas_ia", lambda: _cache_ia_contagem)
 
 logger = logging.getLogger(__name__)
 
@@ -113,9 +120,11 @@ def _obter_do_cache(chave: str, db: Session = None, user_id: int = None) -> Any:
     """
     if _cache_valido(chave, db, user_id):
         logger.debug(f"✅ Cache hit: {chave}")
+        _cache_contagem["hits"] += 1
         return _cache_financeiro.get(chave)
     
     logger.debug(f"❌ Cache miss: {chave}")
+    _cache_contagem["misses"] += 1
     return None
 
 def _salvar_no_cache(chave: str, dados: Any, db: Session = None, user_id: int = None) -> None:
@@ -200,56 +209,18 @@ def preparar_contexto_json(lancamentos: List[Lancamento]) -> str:
 
 
 def gerar_grafico_para_relatorio(gastos_por_categoria: dict) -> io.BytesIO | None:
-    """Gera um gráfico de pizza a partir de um dicionário de gastos por categoria."""
-    if not gastos_por_categoria:
-        return None
-    try:
-        plt.style.use('seaborn-v0_8-whitegrid')
-
-        df = pd.DataFrame(list(gastos_por_categoria.items()), columns=['Categoria', 'Valor']).sort_values('Valor', ascending=False)
-
-        if len(df) > 6:
-            top_5 = df.iloc[:5].copy()
-            outros_valor = df.iloc[5:]['Valor'].sum()
-            outros_df = pd.DataFrame([{'Categoria': 'Outros', 'Valor': outros_valor}])
-            df = pd.concat([top_5, outros_df], ignore_index=True)
-
-        # aumentar dpi para melhorar qualidade ao inserir no PDF
-        fig, ax = plt.subplots(figsize=(8, 5), dpi=200)
-
-        colors = sns.color_palette("viridis_r", len(df))
-
-        wedges, _, autotexts = ax.pie(
-            df['Valor'], 
-            autopct='%1.1f%%', 
-            startangle=140, 
-            pctdistance=0.85, 
-            colors=colors, 
-            wedgeprops={'edgecolor': 'white', 'linewidth': 1.5}
-        )
-        plt.setp(autotexts, size=10, weight="bold", color="white")
-
-        centre_circle = plt.Circle((0,0),0.70,fc='white')
-        fig.gca().add_artist(centre_circle)
-
-        ax.set_title('Distribuição de Despesas', fontsize=16, pad=15, weight='bold')
-        ax.axis('equal')
-
-        plt.tight_layout()
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=200)
-        buffer.seek(0)
-        return buffer
-    except Exception as e:
-        logger.error(f"Erro CRÍTICO ao gerar gráfico para relatório: {e}", exc_info=True)
-        return None
-    finally:
-        plt.close('all')
+    """
+    Gera o gráfico de pizza do relatório no processo atual.
+    Handlers assíncronos usam ``get_renderizador().grafico_relatorio`` (pool + cache).
+    """
+    png = desenhar_grafico_relatorio(gastos_por_categoria)
+    return io.BytesIO(png) if png else None
 
 def gerar_contexto_relatorio(db: Session, telegram_id: int, mes: int, ano: int):
     """
     Coleta e processa dados detalhados para o relatório avançado, ignorando
     transações da categoria 'Transferência' para os cálculos financeiros.
+    Os números vêm de uma consulta agregada (ver relatorio_dados).
     """
     
     usuario_q = db.query(Usuario).filter(Usuario.telegram_id == telegram_id).first()
@@ -257,120 +228,7 @@ def gerar_contexto_relatorio(db: Session, telegram_id: int, mes: int, ano: int):
         logging.warning(f"Usuário com telegram_id {telegram_id} não encontrado para gerar relatório.")
         return None
 
-    data_alvo = datetime(ano, mes, 1)
-    periodo_alvo = pd.Period(data_alvo, freq='M')
-
-    # Busca todos os lançamentos do período, incluindo transferências
-    lancamentos_mes_atual = db.query(Lancamento).filter(
-        and_(
-            Lancamento.id_usuario == usuario_q.id,
-            extract('year', Lancamento.data_transacao) == ano,
-            extract('month', Lancamento.data_transacao) == mes
-        )
-    ).options(joinedload(Lancamento.categoria)).all()
-
-    # Busca histórico de 6 meses usando extract para evitar problemas de timezone
-    from sqlalchemy import or_
-    historico_conditions = []
-    temp_date = data_alvo
-    for _ in range(6):
-        historico_conditions.append(
-            and_(
-                extract('year', Lancamento.data_transacao) == temp_date.year,
-                extract('month', Lancamento.data_transacao) == temp_date.month
-            )
-        )
-        temp_date -= relativedelta(months=1)
-
-    lancamentos_historico_6m = db.query(Lancamento).filter(
-        and_(
-            Lancamento.id_usuario == usuario_q.id,
-            or_(*historico_conditions)
-        )
-    ).options(joinedload(Lancamento.categoria)).all()
-
-    mes_nome_str = data_alvo.strftime("%B").capitalize()
-
-    if not lancamentos_mes_atual:
-        return {"has_data": False, "usuario": usuario_q, "mes_nome": mes_nome_str, "ano": ano, "now": datetime.now}
-    
-    # --- CORREÇÃO APLICADA: FILTRAGEM DE TRANSFERÊNCIAS ---
-    # Cria uma nova lista contendo apenas lançamentos que NÃO são transferências
-    lancamentos_financeiros = [
-        l for l in lancamentos_mes_atual 
-        if not (l.categoria and l.categoria.nome.lower() == 'transferência')
-    ]
-
-    # Todos os cálculos de receita, despesa e saldo agora usam a lista filtrada
-    receitas_atual = sum(float(l.valor) for l in lancamentos_financeiros if l.tipo == 'Receita')
-    despesas_atual = sum(float(l.valor) for l in lancamentos_financeiros if l.tipo == 'Despesa')
-    saldo_atual = receitas_atual - despesas_atual
-    taxa_poupanca_atual = (saldo_atual / receitas_atual) * 100 if receitas_atual > 0 else 0
-
-    # O agrupamento de gastos também usa a lista filtrada
-    gastos_por_categoria_atual = {}
-    for l in lancamentos_financeiros:
-        if l.tipo == 'Despesa' and l.valor > 0:
-            cat_nome = l.categoria.nome if l.categoria else "Sem Categoria"
-            gastos_por_categoria_atual[cat_nome] = gastos_por_categoria_atual.get(cat_nome, 0) + float(l.valor)
-    
-    gastos_agrupados_final = sorted([(cat, val) for cat, val in gastos_por_categoria_atual.items()], key=lambda i: i[1], reverse=True)
-
-    # A análise histórica pode continuar usando todos os dados, se desejado, ou também pode ser filtrada
-    df_historico = pd.DataFrame([
-        {'data': l.data_transacao, 'valor': float(l.valor), 'tipo': l.tipo} 
-        for l in lancamentos_historico_6m 
-        if not (l.categoria and l.categoria.nome.lower() == 'transferência') # Filtrando aqui também
-    ])
-    
-    if not df_historico.empty:
-        df_historico['mes_ano'] = df_historico['data'].dt.to_period('M')
-        dados_mensais = df_historico.groupby(['mes_ano', 'tipo'])['valor'].sum().unstack(fill_value=0)
-    else:
-        dados_mensais = pd.DataFrame()
-        
-    if 'Receita' not in dados_mensais.columns: dados_mensais['Receita'] = 0
-    if 'Despesa' not in dados_mensais.columns: dados_mensais['Despesa'] = 0
-
-    periodo_3m = dados_mensais.index[dados_mensais.index < periodo_alvo][-3:]
-    media_3m = dados_mensais.loc[periodo_3m].mean() if not periodo_3m.empty else pd.Series(dtype=float)
-    media_receitas_3m = media_3m.get('Receita', 0.0)
-    media_despesas_3m = media_3m.get('Despesa', 0.0)
-
-    periodo_anterior = periodo_alvo - 1
-    if periodo_anterior in dados_mensais.index:
-        receitas_anterior = dados_mensais.loc[periodo_anterior, 'Receita']
-        despesas_anterior = dados_mensais.loc[periodo_anterior, 'Despesa']
-        tendencia_receita_percent = ((receitas_atual - receitas_anterior) / receitas_anterior * 100) if receitas_anterior > 0 else 0
-        tendencia_despesa_percent = ((despesas_atual - despesas_anterior) / despesas_anterior * 100) if despesas_anterior > 0 else 0
-    else:
-        tendencia_receita_percent = 0
-        tendencia_despesa_percent = 0
-
-    # Placeholders para futuras implementações
-    analise_ia = "Análise inteligente do Maestro aparecerá aqui."
-    metas_com_progresso = []
-
-    contexto = {
-        "has_data": True, "now": datetime.now, "usuario": usuario_q,
-        "mes_nome": mes_nome_str, "ano": ano,
-        "receita_total": receitas_atual,
-        "despesa_total": despesas_atual,
-        "saldo_mes": saldo_atual,
-        "taxa_poupanca": taxa_poupanca_atual,
-        "gastos_agrupados": gastos_agrupados_final,
-        "gastos_por_categoria_dict": gastos_por_categoria_atual,
-        "lancamentos_historico": lancamentos_historico_6m, # Mantém o histórico completo para referência
-        "tendencia_receita_percent": tendencia_receita_percent,
-        "tendencia_despesa_percent": tendencia_despesa_percent,
-        "media_receitas_3m": media_receitas_3m,
-        "media_despesas_3m": media_despesas_3m,
-        "media_saldo_3m": media_receitas_3m - media_despesas_3m,
-        "analise_ia": analise_ia,
-        "metas": metas_com_progresso,
-    }
-    
-    return contexto
+    return montar_contexto_relatorio(db, usuario_q, mes, ano)
 
 def gerar_grafico_evolucao_mensal(lancamentos_historico: list) -> io.BytesIO | None:
     if not lancamentos_historico:
@@ -669,11 +527,64 @@ def analisar_comportamento_financeiro(lancamentos: List[Lancamento]) -> Dict[str
 
 # --- FUNÇÕES GENÉRICAS PARA ELIMINAÇÃO DE DUPLICAÇÃO ---
 
+# Colunas aceitas por Lancamento (calculadas uma vez; filtram chaves auxiliares como 'origem')
+_COLUNAS_LANCAMENTO = frozenset(c.name for c in Lancamento.__table__.columns)
+
+# Janela (em dias) e similaridade mínima de descrição para considerar duplicata
+JANELA_DUPLICIDADE_DIAS = 3
+SIMILARIDADE_DUPLICIDADE = 0.8
+
+
+def _converter_data_transacao(data_transacao):
+    """Aceita datetime, date ou string 'DD/MM/AAAA' / 'AAAA-MM-DD' (date vira datetime à meia-noite)."""
+    if isinstance(data_transacao, str):
+        try:
+            return datetime.strptime(data_transacao, '%d/%m/%Y')
+        except ValueError:
+            return datetime.strptime(data_transacao, '%Y-%m-%d')
+    if isinstance(data_transacao, date) and not isinstance(data_transacao, datetime):
+        return datetime.combine(data_transacao, datetime.min.time())
+    return data_transacao
+
+
+def _centavos(valor) -> int:
+    return int(round(abs(float(valor or 0)) * 100))
+
+
+class _IndiceDuplicidade:
+    """
+    Índice em memória de lançamentos por (valor em centavos, dia), com as palavras
+    da descrição pré-processadas. Responde "já existe algo parecido?" olhando só
+    as chaves dentro da janela de dias, sem consultar o banco.
+    """
+
+    def __init__(self, janela_dias: int = JANELA_DUPLICIDADE_DIAS, limiar: float = SIMILARIDADE_DUPLICIDADE):
+        self.janela_dias = janela_dias
+        self.limiar = limiar
+        self._por_chave: Dict[Tuple[int, Any], List[frozenset]] = {}
+
+    def adicionar(self, centavos: int, dia, descricao: str) -> None:
+        self._por_chave.setdefault((centavos, dia), []).append(_palavras_descricao(descricao))
+
+    def contem(self, centavos: int, dia, descricao: str) -> bool:
+        palavras = _palavras_descricao(descricao)
+        for delta in range(-self.janela_dias, self.janela_dias + 1):
+            for existentes in self._por_chave.get((centavos, dia + timedelta(days=delta)), ()):
+                if _jaccard(palavras, existentes) > self.limiar:
+                    return True
+        return False
+
+
 async def salvar_transacoes_generica(db: Session, usuario_db, transacoes: list, 
                                    conta_id: int, tipo_origem: str = "manual") -> tuple[bool, str, dict]:
     """
     Função genérica para salvar transações em lote.
     Elimina duplicação entre extrato_handler e fatura_handler.
+
+    O lote inteiro usa um número constante de consultas: uma para os candidatos
+    a duplicata (faixa de datas do lote), uma para as categorias, um INSERT em
+    massa dos lançamentos (RETURNING id) e outro para os itens. Duplicatas
+    dentro do próprio lote também são descartadas.
     
     Args:
         db: Sessão do banco de dados
@@ -703,64 +614,77 @@ async def salvar_transacoes_generica(db: Session, usuario_db, transacoes: list,
             'erro': 0,
             'valor_total': 0.0
         }
-        
-        transacoes_salvas = []
-        
+
+        # 1) Normaliza datas/valores; transações malformadas contam como erro
+        entradas = []
         for transacao_data in transacoes:
             try:
-                # Verifica duplicidade primeiro
-                if verificar_duplicidade_transacoes(db, usuario_db.id, conta_id, transacao_data):
+                data_transacao = _converter_data_transacao(transacao_data.get('data_transacao'))
+                if data_transacao is None:
+                    # Como antes: sem data, vale o padrão da coluna (agora, horário local);
+                    # o dedupe segue por valor + descrição na janela de hoje
+                    data_transacao = agora_local()
+                entradas.append((transacao_data, data_transacao, _centavos(transacao_data.get('valor'))))
+            except Exception as e:
+                logging.error(f"Erro ao processar transação individual: {e}")
+                stats['erro'] += 1
+
+        # 2) Uma consulta para todos os candidatos a duplicata do lote
+        indice = _IndiceDuplicidade()
+        if entradas:
+            datas = [data for _, data, _ in entradas]
+            inicio = min(datas) - timedelta(days=JANELA_DUPLICIDADE_DIAS)
+            fim = max(datas) + timedelta(days=JANELA_DUPLICIDADE_DIAS + 1)
+            candidatos = db.query(Lancamento.descricao, Lancamento.valor, Lancamento.data_transacao).filter(
+                Lancamento.id_usuario == usuario_db.id,
+                Lancamento.id_conta == conta_id,
+                Lancamento.data_transacao >= inicio,
+                Lancamento.data_transacao < fim,
+            )
+            for descricao, valor, data in candidatos:
+                if data is not None:
+                    indice.adicionar(_centavos(valor), data.date(), descricao or '')
+
+        # 3) Dedupe (banco + lote) e preparação com as categorias carregadas uma única vez
+        mapas = _get_all_categories_and_subcategories(db)
+        novos, itens_por_novo = [], []
+        for transacao_data, data_transacao, centavos in entradas:
+            try:
+                descricao = (transacao_data.get('descricao') or '').strip()
+                if indice.contem(centavos, data_transacao.date(), descricao):
                     stats['duplicadas'] += 1
                     continue
-                
-                # Prepara os dados da transação
-                lancamento_data = _preparar_dados_lancamento(transacao_data, usuario_db.id, conta_id, db)
-                
+                indice.adicionar(centavos, data_transacao.date(), descricao)
 
-                # Filtra apenas campos válidos do modelo Lancamento antes de criar
-                try:
-                    valid_cols = {c.name for c in Lancamento.__table__.columns}
-                except Exception:
-                    # Fallback conservador: campos esperados
-                    valid_cols = {'descricao', 'valor', 'tipo', 'data_transacao', 'forma_pagamento', 'documento_fiscal', 'id_usuario', 'id_conta', 'id_categoria', 'id_subcategoria'}
-
-                lanc_kwargs = {k: v for k, v in lancamento_data.items() if k in valid_cols}
-
-                # Cria o lançamento usando apenas campos válidos
-                novo_lancamento = Lancamento(**lanc_kwargs)
-
-                # Se a preparação trouxe itens, anexa objetos ItemLancamento ao lançamento antes do commit
-                itens_payload = lancamento_data.get('itens') or []
-                for item in itens_payload:
-                    try:
-                        nome_item = item.get('nome_item') or item.get('descricao') or 'Item'
-                        qtd = float(str(item.get('quantidade', 1)).replace(',', '.')) if item.get('quantidade') is not None else 1.0
-                        valor_unit = float(str(item.get('valor_unitario', 0)).replace(',', '.')) if item.get('valor_unitario') is not None else 0.0
-                        novo_item = ItemLancamento(nome_item=nome_item, quantidade=qtd, valor_unitario=valor_unit)
-                        novo_lancamento.itens.append(novo_item)
-                    except Exception:
-                        # não deixamos falhar o processamento por um item mal formatado
-                        logger.debug(f"Item inválido ignorado ao salvar transação: {item}")
-
-                db.add(novo_lancamento)
-                
-                transacoes_salvas.append(novo_lancamento)
-                stats['salvas'] += 1
+                lancamento_data = _preparar_dados_lancamento(
+                    {**transacao_data, 'data_transacao': data_transacao}, usuario_db.id, conta_id, db, mapas
+                )
+                novos.append({k: v for k, v in lancamento_data.items() if k in _COLUNAS_LANCAMENTO})
+                itens_por_novo.append(lancamento_data.get('itens') or [])
                 stats['valor_total'] += float(lancamento_data.get('valor', 0))
-                
             except Exception as e:
                 logging.error(f"Erro ao processar transação individual: {e}")
                 stats['erro'] += 1
-                continue
-        
+
+        # 4) INSERT em massa com os IDs na ordem dos parâmetros
+        created_ids: List[int] = []
+        if novos:
+            created_ids = list(db.scalars(
+                insert(Lancamento).returning(Lancamento.id, sort_by_parameter_order=True),
+                novos,
+            ))
+            itens_rows = [
+                item_row
+                for lanc_id, itens_payload in zip(created_ids, itens_por_novo)
+                for item_row in _linhas_itens_lancamento(lanc_id, itens_payload)
+            ]
+            if itens_rows:
+                db.execute(insert(ItemLancamento), itens_rows)
+
         # Commit das transações
         db.commit()
-
-        # IDs criados (após commit os objetos terão id)
-        try:
-            stats['created_ids'] = [int(getattr(t, 'id')) for t in transacoes_salvas]
-        except Exception:
-            stats['created_ids'] = []
+        stats['salvas'] = len(created_ids)
+        stats['created_ids'] = created_ids
 
         # Gera mensagem de resultado
         mensagem_resultado = _gerar_mensagem_resultado_salvamento(stats, tipo_origem)
@@ -773,10 +697,31 @@ async def salvar_transacoes_generica(db: Session, usuario_db, transacoes: list,
         return False, f"Erro ao salvar transações: {str(e)}", {}
 
 
+def _linhas_itens_lancamento(lancamento_id: int, itens_payload: list) -> List[Dict[str, Any]]:
+    """Converte os itens extraídos de uma transação em linhas de itens_lancamento."""
+    linhas = []
+    for item in itens_payload:
+        try:
+            nome_item = item.get('nome_item') or item.get('descricao') or 'Item'
+            qtd = float(str(item.get('quantidade', 1)).replace(',', '.')) if item.get('quantidade') is not None else 1.0
+            valor_unit = float(str(item.get('valor_unitario', 0)).replace(',', '.')) if item.get('valor_unitario') is not None else 0.0
+            linhas.append({
+                'id_lancamento': lancamento_id,
+                'nome_item': nome_item,
+                'quantidade': qtd,
+                'valor_unitario': valor_unit,
+            })
+        except Exception:
+            # não deixamos falhar o processamento por um item mal formatado
+            logger.debug(f"Item inválido ignorado ao salvar transação: {item}")
+    return linhas
+
+
 def verificar_duplicidade_transacoes(db: Session, user_id: int, conta_id: int, 
-                                   transacao_data: dict, janela_dias: int = 3) -> bool:
+                                   transacao_data: dict, janela_dias: int = JANELA_DUPLICIDADE_DIAS) -> bool:
     """
     Verifica se uma transação já existe para evitar duplicatas.
+    Para lotes, prefira salvar_transacoes_generica (uma consulta por lote).
     
     Args:
         db: Sessão do banco
@@ -790,50 +735,43 @@ def verificar_duplicidade_transacoes(db: Session, user_id: int, conta_id: int,
     """
     try:
         # Extrai dados necessários
-        valor = float(transacao_data.get('valor', 0))
+        valor = abs(float(transacao_data.get('valor', 0)))  # Lançamentos guardam o valor absoluto
         descricao = transacao_data.get('descricao', '').strip()
-        data_transacao = transacao_data.get('data_transacao')
-        
-        # Converte data se necessário
-        if isinstance(data_transacao, str):
-            try:
-                data_transacao = datetime.strptime(data_transacao, '%d/%m/%Y')
-            except:
-                data_transacao = datetime.strptime(data_transacao, '%Y-%m-%d')
+        data_transacao = _converter_data_transacao(transacao_data.get('data_transacao'))
         
         # Define janela de busca
         data_inicio = data_transacao - timedelta(days=janela_dias)
         data_fim = data_transacao + timedelta(days=janela_dias)
         
         # Busca por duplicatas
-        duplicata = db.query(Lancamento).filter(
+        candidatos = db.query(Lancamento.descricao).filter(
             Lancamento.id_usuario == user_id,
             Lancamento.id_conta == conta_id,
             Lancamento.valor == valor,
             Lancamento.data_transacao.between(data_inicio, data_fim)
-        ).first()
+        ).all()
         
         # Se encontrou duplicata com valor e data similar, verifica descrição
-        if duplicata:
-            # Compara descrições (similaridade básica)
-            desc_existente = duplicata.descricao.lower().strip()
-            desc_nova = descricao.lower().strip()
-            
-            # Se descrições são muito similares, considera duplicata
-            if _calcular_similaridade_descricao(desc_existente, desc_nova) > 0.8:
-                return True
-        
-        return False
+        return any(
+            _calcular_similaridade_descricao(desc_existente or '', descricao) > SIMILARIDADE_DUPLICIDADE
+            for (desc_existente,) in candidatos
+        )
         
     except Exception as e:
         logging.error(f"Erro ao verificar duplicidade: {e}")
         return False
 
 
-def _preparar_dados_lancamento(transacao_data: dict, user_id: int, conta_id: int, db: Session = None) -> dict:
+def _mes_lancamento(lancamento: Lancamento) -> str:
+    """Mês 'AAAA-MM' gravado na inserção (calculado só para linhas ainda sem backfill)."""
+    return lancamento.mes_referencia or chave_mes(lancamento.data_transacao)
+
+
+def _preparar_dados_lancamento(transacao_data: dict, user_id: int, conta_id: int, db: Session = None,
+                               mapas: Optional[Tuple[Dict[str, int], Dict[str, int]]] = None) -> dict:
     """
     Prepara dados da transação para criação do Lancamento com categorização inteligente.
-    VERSÃO 2.0
+    VERSÃO 2.0 (``mapas`` reaproveita as categorias já carregadas em lotes)
     """
     # --- REGRA DE OURO: O sinal do valor define o tipo ---
     valor = float(transacao_data.get('valor', 0))
@@ -851,22 +789,29 @@ def _preparar_dados_lancamento(transacao_data: dict, user_id: int, conta_id: int
     }
     
     # Converte data se necessário
-    if isinstance(dados['data_transacao'], str):
-        try:
-            dados['data_transacao'] = datetime.strptime(dados['data_transacao'], '%d/%m/%Y')
-        except:
-            dados['data_transacao'] = datetime.strptime(dados['data_transacao'], '%Y-%m-%d')
+    dados['data_transacao'] = _converter_data_transacao(dados['data_transacao'])
 
     # --- LÓGICA DE CATEGORIZAÇÃO INTELIGENTE (NOVO) ---
     texto_busca = (dados['descricao'] + ' ' + (transacao_data.get('merchant_name') or '')).lower()
     
-    # 1. Tenta categorizar usando o novo mapa inteligente
-    categoria_id, subcategoria_id = _categorizar_com_mapa_inteligente(texto_busca, tipo_transacao, db)
+    # 1. Memória do usuário/global por estabelecimento (O(1), cacheada em memória)
+    aprendido = None
+    if db is not None:
+        aprendido = get_merchant_memory().consultar(
+            db, user_id, transacao_data.get('merchant_name') or dados['descricao']
+        )
+
+    # 2. Senão, tenta categorizar usando o novo mapa inteligente
+    if aprendido:
+        categoria_id, subcategoria_id = aprendido
+    else:
+        categoria_id, subcategoria_id = _categorizar_com_mapa_inteligente(texto_busca, tipo_transacao, db, mapas)
     
     dados['id_categoria'] = categoria_id
     dados['id_subcategoria'] = subcategoria_id
 
-    # ... (o resto da função, como extração de itens e forma de pagamento, pode permanecer) ...
+    # Campos derivados gravados junto (o INSERT em massa não dispara os eventos do ORM)
+    dados.update(campos_derivados_lancamento(dados['descricao'], dados['forma_pagamento'], dados['data_transacao']))
     
     return dados
 
@@ -883,75 +828,88 @@ def _get_all_categories_and_subcategories(db: Session) -> Tuple[Dict[str, int],
             
     return cat_map, subcat_map
 
-def _categorizar_com_mapa_inteligente(texto: str, tipo_transacao: str, db: Session) -> Tuple[Optional[int], Optional[int]]:
-    """
-    Usa um mapa de regras para encontrar a melhor categoria e subcategoria.
-    """
-    # Este mapa é o "cérebro" da categorização. Pode ser expandido e até movido para um arquivo de configuração.
-    MAPA_CATEGORIZACAO = {
-        # Categoria: { Subcategoria: [palavras-chave], 'negativas': [palavras_a_evitar] }
-        'Alimentação': {
-            'Supermercado': ['supermercado', 'mercado', 'hortifruti', 'sams club', 'carrefour', 'pao de acucar'],
-            'Restaurante': ['restaurante', 'churrascaria', 'pizzaria', 'jantar'],
-            'Delivery': ['ifood', 'rappi', 'uber eats', 'delivery'],
-            'Padaria': ['padaria', 'panificadora'],
-            'Bares e Lanches': ['bar', 'lanche', 'cafe', 'starbucks'],
-        },
-        'Transporte': {
-            'Combustível': ['posto', 'gasolina', 'etanol', 'combustivel', 'shell', 'ipiranga'],
-            'App de Transporte': ['uber', '99app'],
-            'Estacionamento': ['estacionamento', 'estapar', 'zona azul'],
-            'Transporte Público': ['metro', 'cptm', 'onibus', 'bilhete unico'],
-        },
-        'Moradia': {
-            'Aluguel': ['aluguel', 'condominio'],
-            'Contas de Consumo': ['energia', 'eletropaulo', 'enel', 'sabesp', 'agua', 'luz', 'comgas', 'internet', 'net virtua', 'claro'],
-        },
-        'Saúde': {
-            'Farmácia': ['farmacia', 'drogaria', 'drogasil', 'droga raia'],
-            'Consultas e Exames': ['medico', 'consulta', 'exame', 'laboratorio', 'hospital'],
-        },
-        'Lazer': {
-            'Streaming': ['netflix', 'spotify', 'disney+', 'hbo max', 'globoplay'],
-            'Cinema e Eventos': ['cinema', 'ingresso', 'show', 'teatro', 'sympla'],
-            'Jogos': ['steam', 'playstation', 'xbox', 'nuuvem'],
-        },
-        'Compras': {
-            'Vestuário': ['loja de roupa', 'renner', 'cea', 'zara'],
-            'Eletrônicos': ['fast shop', 'ponto frio', 'magazine luiza', 'apple'],
-            'Geral': ['amazon', 'mercado livre', 'shopee', 'aliexpress'],
-        },
-        'Receitas': {
-            'Salário': ['salario', 'pagamento', 'vencimento'],
-            'Reembolso': ['reembolso'],
-            'Rendimentos': ['rendimento', 'juros', 'dividendos'],
-        }
+# Este mapa é o "cérebro" da categorização. Pode ser expandido e até movido para um arquivo de configuração.
+# A ordem de declaração define a prioridade quando mais de uma regra casa.
+MAPA_CATEGORIZACAO = {
+    # Categoria: { Subcategoria: [palavras-chave], 'negativas': [palavras_a_evitar] }
+    'Alimentação': {
+        'Supermercado': ['supermercado', 'mercado', 'hortifruti', 'sams club', 'carrefour', 'pao de acucar'],
+        'Restaurante': ['restaurante', 'churrascaria', 'pizzaria', 'jantar'],
+        'Delivery': ['ifood', 'rappi', 'uber eats', 'delivery'],
+        'Padaria': ['padaria', 'panificadora'],
+        'Bares e Lanches': ['bar', 'lanche', 'cafe', 'starbucks'],
+    },
+    'Transporte': {
+        'Combustível': ['posto', 'gasolina', 'etanol', 'combustivel', 'shell', 'ipiranga'],
+        'App de Transporte': ['uber', '99app'],
+        'Estacionamento': ['estacionamento', 'estapar', 'zona azul'],
+        'Transporte Público': ['metro', 'cptm', 'onibus', 'bilhete unico'],
+    },
+    'Moradia': {
+        'Aluguel': ['aluguel', 'condominio'],
+        'Contas de Consumo': ['energia', 'eletropaulo', 'enel', 'sabesp', 'agua', 'luz', 'comgas', 'internet', 'net virtua', 'claro'],
+    },
+    'Saúde': {
+        'Farmácia': ['farmacia', 'drogaria', 'drogasil', 'droga raia'],
+        'Consultas e Exames': ['medico', 'consulta', 'exame', 'laboratorio', 'hospital'],
+    },
+    'Lazer': {
+        'Streaming': ['netflix', 'spotify', 'disney+', 'hbo max', 'globoplay'],
+        'Cinema e Eventos': ['cinema', 'ingresso', 'show', 'teatro', 'sympla'],
+        'Jogos': ['steam', 'playstation', 'xbox', 'nuuvem'],
+    },
+    'Compras': {
+        'Vestuário': ['loja de roupa', 'renner', 'cea', 'zara'],
+        'Eletrônicos': ['fast shop', 'ponto frio', 'magazine luiza', 'apple'],
+        'Geral': ['amazon', 'mercado livre', 'shopee', 'aliexpress'],
+    },
+    'Receitas': {
+        'Salário': ['salario', 'pagamento', 'vencimento'],
+        'Reembolso': ['reembolso'],
+        'Rendimentos': ['rendimento', 'juros', 'dividendos'],
     }
-    
-    # Regra importante: se for Receita, só procurar em categorias de Receita
-    categorias_a_procurar = {'Receitas'} if tipo_transacao == 'Receita' else set(MAPA_CATEGORIZACAO.keys()) - {'Receitas'}
+}
 
-    cat_map, subcat_map = _get_all_categories_and_subcategories(db)
 
+def _construir_motor_categorizacao(receitas: bool) -> MotorCategorizacao:
+    """Compila o MAPA_CATEGORIZACAO em um motor (Receitas ou demais categorias)."""
+    regras, negativas = [], {}
     for categoria_nome, subcategorias in MAPA_CATEGORIZACAO.items():
-        if categoria_nome not in categorias_a_procurar:
-            continue
-
-        palavras_negativas = subcategorias.get('negativas', [])
-        if any(palavra_neg in texto for palavra_neg in palavras_negativas):
+        if (categoria_nome == 'Receitas') != receitas:
             continue
-
         for subcategoria_nome, palavras_chave in subcategorias.items():
             if subcategoria_nome == 'negativas':
                 continue
-            
-            if any(palavra in texto for palavra in palavras_chave):
-                # Encontrou! Retorna os IDs do banco de dados.
-                cat_id = cat_map.get(categoria_nome.lower())
-                subcat_id = subcat_map.get(subcategoria_nome.lower())
-                return cat_id, subcat_id
-    
-    return None, None
+            rotulo = (categoria_nome, subcategoria_nome)
+            regras.append((rotulo, palavras_chave))
+            if subcategorias.get('negativas'):
+                negativas[rotulo] = subcategorias['negativas']
+    return MotorCategorizacao(regras, negativas)
+
+
+# Compilados uma única vez no import do módulo
+_MOTOR_RECEITAS = _construir_motor_categorizacao(receitas=True)
+_MOTOR_DESPESAS = _construir_motor_categorizacao(receitas=False)
+
+
+def _categorizar_com_mapa_inteligente(texto: str, tipo_transacao: str, db: Session,
+                                      mapas: Optional[Tuple[Dict[str, int], Dict[str, int]]] = None) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Usa um mapa de regras para encontrar a melhor categoria e subcategoria.
+
+    ``mapas`` permite reaproveitar (cat_map, subcat_map) já carregados ao
+    categorizar lotes, evitando uma consulta de categorias por transação.
+    """
+    # Regra importante: se for Receita, só procurar em categorias de Receita
+    motor = _MOTOR_RECEITAS if tipo_transacao == 'Receita' else _MOTOR_DESPESAS
+    rotulo = motor.classificar(texto)
+    if not rotulo:
+        return None, None
+
+    # Encontrou! Retorna os IDs do banco de dados.
+    categoria_nome, subcategoria_nome = rotulo
+    cat_map, subcat_map = mapas or _get_all_categories_and_subcategories(db)
+    return cat_map.get(categoria_nome.lower()), subcat_map.get(subcategoria_nome.lower())
 
 
 
@@ -995,474 +953,24 @@ def _calcular_similaridade_descricao(desc1: str, desc2: str) -> float:
     if not desc1 or not desc2:
         return 0.0
     
-    # Normaliza textos
-    desc1 = re.sub(r'[^a-zA-Z0-9\s]', '', desc1.lower())
-    desc2 = re.sub(r'[^a-zA-Z0-9\s]', '', desc2.lower())
-    
-    # Divide em palavras
-    palavras1 = set(desc1.split())
-    palavras2 = set(desc2.split())
-    
-    if not palavras1 or not palavras2:
-        return 0.0
-    
-    # Calcula Jaccard similarity
-    intersecao = len(palavras1.intersection(palavras2))
-    uniao = len(palavras1.union(palavras2))
-    
-    return intersecao / uniao if uniao > 0 else 0.0
+    return _jaccard(_palavras_descricao(desc1), _palavras_descricao(desc2))
 
 
-def _extrair_itens_de_descricao(texto: str, valor_total: float) -> List[Dict[str, Any]]:
-    """Heurística leve para extrair itens de uma descrição de transação.
-    Retorna lista de dicionários: {'nome_item', 'quantidade', 'valor_unitario'}
-    - Procura padrões como "Produto X R$ 12,34" ou "2x Pizza R$ 25,00"
-    - Se nada for encontrado, retorna um item único com o merchant/descritivo e o valor total
-    """
-    try:
-        if not texto:
-            return []
-        texto = texto.replace('\n', ' ').replace('\r', ' ')
-        # Padrão: nome ... R$ 12,34
-        pattern_valores = re.compile(r'(?P<nome>[A-Za-z0-9\s\-\&\.,]{3,80}?)\s+(?:R\$|r\$)\s*(?P<valor>\d+[.,]\d{2})')
-        encontrados = pattern_valores.findall(texto)
-        itens = []
-        for match in encontrados:
-            nome_raw = match[0].strip(' -–:;,.')
-            valor_str = match[1].replace('.', '').replace(',', '.')
-            try:
-                valor = float(valor_str)
-            except Exception:
-                valor = 0.0
-            itens.append({'nome_item': nome_raw, 'quantidade': 1, 'valor_unitario': valor})
-
-        if itens:
-            return itens
-
-        # Padrão alternativo: "2x Pizza - R$12,00" ou "2 x Pizza R$12,00"
-        pattern_qtd = re.compile(r'(?P<qtd>\d+)\s*[xX]\s*(?P<nome>[A-Za-z0-9\s\-\&]{3,80})\s*(?:-|\s)\s*(?:R\$|r\$)?\s*(?P<valor>\d+[.,]\d{2})?')
-        encontrados2 = pattern_qtd.findall(texto)
-        for m in encontrados2:
-            try:
-                qtd = int(m[0])
-            except Exception:
-                qtd = 1
-            nome = m[1].strip()
-            valor = 0.0
-            if m[2]:
-                try:
-                    valor = float(m[2].replace('.', '').replace(',', '.'))
-                except Exception:
-                    valor = 0.0
-            itens.append({'nome_item': nome, 'quantidade': qtd, 'valor_unitario': valor})
-
-        if itens:
-            return itens
-
-        # Fallback: se não conseguiu extrair itens, sugere um único item com o merchant/descritivo
-        resumo = texto
-        if len(resumo) > 60:
-            resumo = resumo[:57] + '...'
-        return [{'nome_item': resumo.strip(), 'quantidade': 1, 'valor_unitario': float(valor_total)}]
-    except Exception as e:
-        logger.debug(f"Falha ao extrair itens da descrição: {e}")
-        return []
+_NAO_ALFANUMERICO = re.compile(r'[^a-zA-Z0-9\s]')
 
 
+def _palavras_descricao(descricao: str) -> frozenset:
+    """Conjunto de palavras normalizadas da descrição (pré-computável por lançamento)."""
+    return frozenset(_NAO_ALFANUMERICO.sub('', (descricao or '').lower()).split())
 
 
-def preparar_dados_para_grafico(lancamentos: List[Lancamento], agrupar_por: str):
-    """
-    Prepara dados dos lançamentos para geração de gráficos.
-    
-    Returns:
-        tuple: (DataFrame preparado, bool se tem dados suficientes)
-    """
-    from datetime import datetime
-    
-    if not lancamentos:
-        return pd.DataFrame(), False
-    
-    # Converter lançamentos para DataFrame
-    dados = []
-    for lancamento in lancamentos:
-        # CORREÇÃO: Extrair nome da categoria corretamente
-        if hasattr(lancamento, 'categoria') and lancamento.categoria:
-            categoria_str = lancamento.categoria.nome
-        else:
-            categoria_str = 'Sem Categoria'
-        
-        # forma_pagamento já é string no modelo Lancamento
-        forma_pagamento_str = lancamento.forma_pagamento or 'Não informado'
-        
-        dados.append({
-            'data': lancamento.data_transacao,
-            'valor': float(lancamento.valor),
-            'descricao': lancamento.descricao or 'Sem descrição',
-            'tipo': 'Receita' if lancamento.valor > 0 else 'Despesa',
-            'mes': lancamento.data_transacao.strftime('%Y-%m'),
-            'ano': lancamento.data_transacao.year,
-            'categoria': categoria_str,
-            'forma_pagamento': forma_pagamento_str
-        })
-    
-    df = pd.DataFrame(dados)
-    
-    if len(df) == 0:
-        return df, False
-    
-    # Processar dados baseado no tipo de agrupamento
-    if agrupar_por == 'categoria':
-        # Agrupar por categoria e somar valores absolutos (receitas + despesas)
-        df_agrupado = df.groupby('categoria')['valor'].apply(lambda x: x.abs().sum()).reset_index()
-        df_agrupado = df_agrupado[df_agrupado['valor'] > 0]  # Qualquer valor > 0
-        df_agrupado['grupo'] = df_agrupado['categoria']
-        
-    elif agrupar_por == 'forma_pagamento':
-        # Agrupar por forma de pagamento (receitas + despesas)
-        df_agrupado = df.groupby('forma_pagamento')['valor'].apply(lambda x: x.abs().sum()).reset_index()
-        df_agrupado = df_agrupado[df_agrupado['valor'] > 0]  # Qualquer valor > 0
-        df_agrupado['grupo'] = df_agrupado['forma_pagamento']
-        
-    elif agrupar_por == 'data':
-        # Agrupar por data para evolução temporal
-        df['Saldo Acumulado'] = df['valor'].cumsum()
-        df_agrupado = df.copy()
-        df_agrupado['grupo'] = df_agrupado['data'].dt.strftime('%Y-%m-%d')
-        
-    elif agrupar_por == 'mes':
-        # Agrupar por mês
-        df_agrupado = df.groupby('mes')['valor'].sum().reset_index()
-        df_agrupado['grupo'] = df_agrupado['mes']
-        
-    else:
-        # Fallback - agrupar por tipo
-        df_agrupado = df.groupby('tipo')['valor'].apply(lambda x: x.abs().sum()).reset_index()
-        df_agrupado['grupo'] = df_agrupado['tipo']
-    
-    # Verificar se temos dados suficientes
-    tem_dados_suficientes = len(df_agrupado) >= 1 and df_agrupado['valor'].sum() > 0
-    
-    return df_agrupado, tem_dados_suficientes
-
-def gerar_grafico_dinamico(lancamentos: List[Lancamento], tipo_grafico: str, agrupar_por: str) -> Optional[io.BytesIO]:
-    """
-    Gera gráficos financeiros dinâmicos com um design aprimorado e profissional.
-    """
-    try:
-        # --- ESTILO GLOBAL PARA TODOS OS GRÁFICOS ---
-        plt.style.use('seaborn-v0_8-darkgrid')
-        plt.rcParams.update({
-            'font.family': 'sans-serif',
-            'font.sans-serif': ['Arial', 'Helvetica', 'DejaVu Sans'], # Fallback de fontes
-            'axes.labelcolor': '#333333',
-            'xtick.color': '#333333',
-            'ytick.color': '#333333',
-            'axes.titlecolor': '#1a2b4c',
-            'axes.edgecolor': '#cccccc',
-            'axes.titleweight': 'bold',
-            'axes.titlesize': 18,
-            'figure.dpi': 120
-        })
-
-        df, tem_dados_suficientes = preparar_dados_para_grafico(lancamentos, agrupar_por)
-        if not tem_dados_suficientes:
-            return None
-
-        # DPI alto para imagens mais nítidas no PDF
-        fig, ax = plt.subplots(figsize=(12, 7), dpi=200)
-
-        # --- GRÁFICOS DE CATEGORIA E FORMA DE PAGAMENTO ---
-        if agrupar_por in ['categoria', 'forma_pagamento']:
-            
-            # GRÁFICO DE PIZZA (AGORA DONUT CHART)
-            if tipo_grafico == 'pizza':
-                nome_agrupamento = 'Categoria' if agrupar_por == 'categoria' else 'Forma de Pagamento'
-                ax.set_title(f'Distribuição de Valores por {nome_agrupamento}', pad=20, fontsize=16, weight='bold')
-                
-                # Paleta de cores vibrante e profissional
-                colors = plt.cm.Set3(np.linspace(0, 1, len(df['grupo'])))
-                
-                # Explode as fatias para melhor visualização (maior fatia com destaque)
-                valores_norm = df['valor'] / df['valor'].sum()
-                explode = [0.08 if v == valores_norm.max() else 0.03 for v in valores_norm]
-                
-                wedges, texts, autotexts = ax.pie(
-                    df['valor'], 
-                    autopct='%1.1f%%', 
-                    startangle=90, 
-                    colors=colors, 
-                    pctdistance=0.82,
-                    explode=explode,
-                    wedgeprops={'edgecolor': 'white', 'linewidth': 3, 'antialiased': True},
-                    textprops={'fontsize': 11, 'weight': 'bold'}
-                )
-                
-                # Melhora visibilidade dos percentuais
-                for autotext in autotexts:
-                    autotext.set_color('white')
-                    autotext.set_fontsize(12)
-                    autotext.set_weight('bold')
-                    autotext.set_bbox(dict(boxstyle='round,pad=0.3', facecolor='black', alpha=0.3))
-                
-                # Desenha o círculo no centro para criar o efeito DONUT
-                centre_circle = plt.Circle((0,0), 0.68, fc='white', linewidth=0)
-                fig.gca().add_artist(centre_circle)
-                
-                # Total no centro do donut
-                total = df['valor'].sum()
-                ax.text(0, 0, f'Total\nR$ {total:,.2f}'.replace(',', '.'), 
-                       ha='center', va='center', fontsize=14, weight='bold', color='#2c3e50')
-                
-                # Legenda limpa e organizada com valores
-                legend_labels = [f"{label}: R$ {valor:,.2f}".replace(',', '.') for label, valor in zip(df['grupo'], df['valor'])]
-                ax.legend(wedges, legend_labels, title=nome_agrupamento, title_fontsize=12,
-                         loc="center left", bbox_to_anchor=(1, 0, 0.5, 1), fontsize=10,
-                         frameon=True, fancybox=True, shadow=True)
-                ax.axis('equal')
-
-            # GRÁFICO DE BARRAS HORIZONTAIS
-            elif tipo_grafico == 'barra_h':
-                nome_agrupamento = 'Categoria' if agrupar_por == 'categoria' else 'Forma de Pagamento'
-                ax.set_title(f'Gastos por {nome_agrupamento}', pad=20, fontsize=16, weight='bold')
-                df = df.sort_values('valor', ascending=True) # Ordena do menor para o maior
-                
-                # Paleta de cores gradiente moderna
-                colors = plt.cm.viridis(np.linspace(0.2, 0.9, len(df)))
-                bars = ax.barh(df['grupo'], df['valor'], color=colors, edgecolor='white', linewidth=1.5, height=0.7)
-                
-                ax.set_xlabel('Valor Gasto (R$)', fontsize=13, weight='bold')
-                ax.set_ylabel('')
-                ax.grid(axis='x', linestyle='--', alpha=0.3) # Grade vertical sutil
-                ax.set_axisbelow(True)
-                
-                # Rótulos de valor formatados
-                max_valor = df['valor'].max()
-                for i, (bar, valor) in enumerate(zip(bars, df['valor'])):
-                    width = bar.get_width()
-                    # Posiciona rótulo dentro da barra se for grande, fora se for pequena
-                    if valor > max_valor * 0.15:
-                        ax.text(width * 0.95, bar.get_y() + bar.get_height()/2,
-                               f'R$ {width:,.2f}'.replace(',', '.'),
-                               va='center', ha='right', fontsize=11, weight='bold', color='white')
-                    else:
-                        ax.text(width + (max_valor * 0.02), bar.get_y() + bar.get_height()/2,
-                               f'R$ {width:,.2f}'.replace(',', '.'),
-                               va='center', ha='left', fontsize=11, weight='bold', color='#2c3e50')
-
-        # --- GRÁFICOS BASEADOS EM DATA ---
-        elif agrupar_por in ['data', 'fluxo_caixa', 'projecao']:
-            
-            # GRÁFICO DE EVOLUÇÃO DO SALDO (LINHA)
-            if agrupar_por == 'data':
-                if len(df) < 2: return None # Precisa de pelo menos 2 pontos
-                ax.set_title('Evolução do Saldo Financeiro', pad=20)
-                
-                # Verificar se temos a coluna 'Saldo Acumulado' (preparada em preparar_dados_para_grafico)
-                if 'Saldo Acumulado' not in df.columns:
-                    logger.error("Coluna 'Saldo Acumulado' não encontrada no DataFrame")
-                    return None
-                
-                # Converter data para datetime se necessário
-                if not pd.api.types.is_datetime64_any_dtype(df['data']):
-                    df['data'] = pd.to_datetime(df['data'])
-                
-                df = df.sort_values('data')
-                
-                # Decidir se suaviza ou não baseado no número de pontos
-                if len(df) >= 5:
-                    # Suavização da linha (apenas se tiver dados suficientes)
-                    try:
-                        x_smooth = np.linspace(df['data'].astype(np.int64).min(), df['data'].astype(np.int64).max(), 300)
-                        x_smooth_dt = pd.to_datetime(x_smooth)
-                        spl = make_interp_spline(df['data'].astype(np.int64), df['Saldo Acumulado'], k=min(2, len(df)-1))
-                        y_smooth = spl(x_smooth)
-                        
-                        ax.plot(x_smooth_dt, y_smooth, label='Saldo Acumulado', color='#3498db', linewidth=3)
-                        ax.fill_between(x_smooth_dt, y_smooth, alpha=0.15, color='#3498db')
-                    except Exception as e:
-                        logger.warning(f"Erro na suavização, usando linha simples: {e}")
-                        ax.plot(df['data'], df['Saldo Acumulado'], label='Saldo Acumulado', color='#3498db', linewidth=3, marker='o')
-                        ax.fill_between(df['data'], df['Saldo Acumulado'], alpha=0.15, color='#3498db')
-                else:
-                    # Linha simples para poucos pontos
-                    ax.plot(df['data'], df['Saldo Acumulado'], label='Saldo Acumulado', color='#3498db', linewidth=3, marker='o', markersize=8)
-                    ax.fill_between(df['data'], df['Saldo Acumulado'], alpha=0.15, color='#3498db')
-                
-                # Destaque do pico máximo e mínimo
-                pico_max = df.loc[df['Saldo Acumulado'].idxmax()]
-                pico_min = df.loc[df['Saldo Acumulado'].idxmin()]
-                
-                ax.scatter(pico_max['data'], pico_max['Saldo Acumulado'], color='#2ecc71', s=180, zorder=5, label='Maior Saldo', edgecolor='white', linewidth=2)
-                ax.scatter(pico_min['data'], pico_min['Saldo Acumulado'], color='#e74c3c', s=180, zorder=5, label='Menor Saldo', edgecolor='white', linewidth=2)
-                
-                # Anotações nos picos (com posicionamento dinâmico)
-                offset_max = abs(pico_max['Saldo Acumulado']) * 0.05
-                offset_min = abs(pico_min['Saldo Acumulado']) * 0.05
-                ax.text(pico_max['data'], pico_max['Saldo Acumulado'] + offset_max, 
-                       f'R$ {pico_max["Saldo Acumulado"]:.2f}', 
-                       ha='center', fontsize=11, weight='bold', color='#2ecc71', 
-                       bbox=dict(boxstyle='round,pad=0.4', fc='white', alpha=0.8, edgecolor='#2ecc71'))
-                ax.text(pico_min['data'], pico_min['Saldo Acumulado'] - offset_min, 
-                       f'R$ {pico_min["Saldo Acumulado"]:.2f}', 
-                       ha='center', fontsize=11, weight='bold', color='#e74c3c',
-                       bbox=dict(boxstyle='round,pad=0.4', fc='white', alpha=0.8, edgecolor='#e74c3c'))
-
-                ax.legend(fontsize=11, loc='best')
-                ax.axhline(0, color='gray', linewidth=0.8, linestyle='--', alpha=0.5)
-
-            # GRÁFICO DE PROJEÇÃO (BARRAS HORIZONTAIS)
-            elif agrupar_por == 'projecao':
-                today = datetime.now()
-                start_of_month = today.replace(day=1, hour=0, minute=0, second=0)
-                
-                # Filtrar apenas despesas do mês atual
-                despesas_mes_atual = [
-                    l for l in lancamentos 
-                    if l.data_transacao >= start_of_month 
-                    and l.data_transacao <= today
-                    and l.tipo == 'Despesa'
-                ]
-                
-                if not despesas_mes_atual:
-                    logger.info("Nenhuma despesa encontrada no mês atual para projeção")
-                    return None
-                
-                # Calcular total de gastos até hoje
-                total_gasto = sum(abs(float(l.valor)) for l in despesas_mes_atual)
-                
-                if total_gasto == 0:
-                    logger.info("Total de gastos é zero, sem projeção possível")
-                    return None
-                
-                # Calcular projeção
-                dias_no_mes = (today.replace(month=today.month % 12 + 1 if today.month != 12 else 1, day=1, year=today.year if today.month != 12 else today.year + 1) - timedelta(days=1)).day
-                dias_passados = today.day
-                gasto_medio_diario = total_gasto / dias_passados
-                gasto_projetado = gasto_medio_diario * dias_no_mes
-                
-                # Nome do mês em português
-                meses_pt = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                           'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-                mes_nome = meses_pt[today.month - 1]
-                
-                ax.set_title(f'Projeção de Gastos para {mes_nome}/{today.year}', pad=20, fontsize=16)
-                
-                # Dados para o gráfico
-                labels = ['💰 Gasto até Hoje', '📊 Projeção Mensal']
-                valores = [total_gasto, gasto_projetado]
-                cores = ['#3498db', '#e74c3c']
+def _jaccard(palavras1: frozenset, palavras2: frozenset) -> float:
+    """Similaridade de Jaccard entre dois conjuntos de palavras."""
+    if not palavras1 or not palavras2:
+        return 0.0
+    return len(palavras1 & palavras2) / len(palavras1 | palavras2)
 
-                bars = ax.barh(labels, valores, color=cores, edgecolor='white', linewidth=2, height=0.6)
-                ax.invert_yaxis() # Gasto atual em cima
-                
-                ax.set_xlabel('Valor (R$)', fontsize=13, weight='bold')
-                ax.grid(axis='x', alpha=0.3, linestyle='--')
-                
-                # Rótulos de valor
-                for i, (bar, valor) in enumerate(zip(bars, valores)):
-                    width = bar.get_width()
-                    ax.text(width + (gasto_projetado * 0.02), bar.get_y() + bar.get_height()/2,
-                           f'R$ {valor:,.2f}'.replace(',', '.'),
-                           va='center', ha='left', fontsize=12, weight='bold', color=cores[i])
-                
-                # Informações adicionais
-                dias_restantes = dias_no_mes - dias_passados
-                gasto_restante = gasto_projetado - total_gasto
-                
-                info_text = (
-                    f"📅 Dia {dias_passados}/{dias_no_mes} ({dias_restantes} dias restantes)\n"
-                    f"📈 Média diária: R$ {gasto_medio_diario:.2f}\n"
-                    f"💸 Estimativa restante: R$ {gasto_restante:.2f}"
-                )
-                
-                ax.text(0.02, 0.98, info_text,
-                       transform=ax.transAxes, fontsize=10,
-                       verticalalignment='top',
-                       bbox=dict(boxstyle='round,pad=0.6', fc='lightyellow', alpha=0.8, edgecolor='gray'))
-
-            # GRÁFICO DE FLUXO DE CAIXA
-            elif agrupar_por == 'fluxo_caixa':
-                # Preparar dados para fluxo de caixa
-                dados_fluxo = []
-                for l in lancamentos:
-                    # CORREÇÃO: Tipos corretos são 'Receita' e 'Despesa' (não 'Entrada'/'Saída')
-                    entrada = float(l.valor) if l.tipo == 'Receita' else 0
-                    saida = abs(float(l.valor)) if l.tipo == 'Despesa' else 0
-                    dados_fluxo.append({
-                        'data': l.data_transacao,
-                        'entrada': entrada,
-                        'saida': saida
-                    })
-                
-                df_fluxo = pd.DataFrame(dados_fluxo)
-                df_fluxo['data'] = pd.to_datetime(df_fluxo['data'])
-                
-                # Agrupar por data
-                df_agrupado = df_fluxo.groupby(df_fluxo['data'].dt.date).agg({
-                    'entrada': 'sum',
-                    'saida': 'sum'
-                }).reset_index()
-                df_agrupado['data'] = pd.to_datetime(df_agrupado['data'])
-                df_agrupado = df_agrupado.sort_values('data')
-                
-                if df_agrupado['entrada'].sum() == 0 and df_agrupado['saida'].sum() == 0:
-                    logger.info("Sem dados de fluxo de caixa para exibir")
-                    return None
-                
-                ax.set_title('Fluxo de Caixa (Receitas vs. Despesas)', pad=20, fontsize=16, weight='bold')
-                
-                # Barras com cores modernas e bordas
-                width_days = (df_agrupado['data'].max() - df_agrupado['data'].min()).days
-                bar_width = max(0.8, min(3, width_days / len(df_agrupado) * 0.7))
-                
-                ax.bar(df_agrupado['data'], df_agrupado['entrada'], 
-                      color='#27ae60', label='💰 Receitas', 
-                      width=bar_width, edgecolor='white', linewidth=1.5, alpha=0.9)
-                ax.bar(df_agrupado['data'], -df_agrupado['saida'], 
-                      color='#e74c3c', label='💸 Despesas', 
-                      width=bar_width, edgecolor='white', linewidth=1.5, alpha=0.9)
-                
-                # Linha zero de referência
-                ax.axhline(0, color='#2c3e50', linewidth=1.5, linestyle='-', alpha=0.7, zorder=0)
-                
-                # Estatísticas no gráfico
-                total_receitas = df_agrupado['entrada'].sum()
-                total_despesas = df_agrupado['saida'].sum()
-                saldo_liquido = total_receitas - total_despesas
-                
-                stats_text = (
-                    f"💰 Total Receitas: R$ {total_receitas:,.2f}\n"
-                    f"💸 Total Despesas: R$ {total_despesas:,.2f}\n"
-                    f"{'📈' if saldo_liquido >= 0 else '📉'} Saldo Líquido: R$ {saldo_liquido:,.2f}"
-                ).replace(',', '.')
-                
-                ax.text(0.02, 0.98, stats_text,
-                       transform=ax.transAxes, fontsize=10,
-                       verticalalignment='top',
-                       bbox=dict(boxstyle='round,pad=0.6', fc='lightyellow', alpha=0.85, edgecolor='gray'))
-                
-                ax.legend(fontsize=11, loc='lower right', frameon=True, fancybox=True, shadow=True)
-                ax.grid(axis='y', linestyle='--', alpha=0.3)
-            
-            ax.set_ylabel('Valor (R$)', fontsize=12)
-            fig.autofmt_xdate(rotation=30)
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
 
-        else:
-            return None
-        
-        plt.tight_layout(pad=1.5)
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=200)
-        buffer.seek(0)
-        plt.close(fig) # Garante que a figura seja fechada para liberar memória
-        return buffer
-    except Exception as e:
-        logger.error(f"Erro CRÍTICO ao gerar gráfico: {e}", exc_info=True)
-        plt.close('all') # Fecha todas as figuras em caso de erro
-        return None
-    
 # --- SISTEMA DE INSIGHTS PROATIVOS ---
 def _gerar_insights_automaticos(lancamentos: List[Lancamento]) -> List[Dict[str, Any]]:
     """Gera insights automáticos baseados nos padrões dos lançamentos"""
@@ -1531,7 +1039,7 @@ def _detectar_padroes_comportamentais(lancamentos: List[Lancamento]) -> List[Dic
     gastos_mensais = {}
     for l in lancamentos:
         if l.tipo == 'Despesa':
-            mes_ano = l.data_transacao.strftime('%Y-%m')
+            mes_ano = _mes_lancamento(l)
             gastos_mensais[mes_ano] = gastos_mensais.get(mes_ano, 0) + float(l.valor)
     
     if len(gastos_mensais) >= 2:
@@ -1614,13 +1122,12 @@ async def _classificar_situacao_comparativa(economia_mensal: float, gastos_mensa
 
 def _obter_estatisticas_cache():
     """
-    Obtém estatísticas básicas do cache.
-    Implementação simplificada para evitar erros.
+    Obtém estatísticas básicas do cache financeiro.
     """
     return {
-        'cache_size': 0,
-        'cache_hits': 0,
-        'cache_misses': 0,
+        'cache_size': len(_cache_financeiro),
+        'cache_hits': _cache_contagem['hits'],
+        'cache_misses': _cache_contagem['misses'],
         'last_cleanup': datetime.now().isoformat(),
         'status': 'active'
     }
@@ -1632,7 +1139,8 @@ async def preparar_contexto_financeiro_completo(db: Session, usuario: Usuario) -
     
     Agora busca dados de:
     1. Lançamentos manuais (tabela lancamentos)
-    2. 🏦 Transações bancárias reais (tabela bank_transactions via Open Finance)
+    2. 🏦 Transações bancárias reais (read model Open Finance), exceto as já
+       conciliadas com um lançamento (open_finance.conciliacao)
     """
     # Limpeza automática de cache
     _limpar_cache_expirado()
@@ -1684,7 +1192,7 @@ async def preparar_contexto_financeiro_completo(db: Session, usuario: Usuario) -
     data_maxima = lancamentos[-1].data_transacao.strftime('%d/%m/%Y')
     resumo_mensal = {}
     for l in lancamentos:
-        mes_ano = l.data_transacao.strftime('%Y-%m')
+        mes_ano = _mes_lancamento(l)
         if mes_ano not in resumo_mensal:
             resumo_mensal[mes_ano] = {'receitas': 0.0, 'despesas': 0.0}
         if l.tipo == 'Receita':
@@ -1830,9 +1338,11 @@ def _obter_resposta_ia_cache(chave: str) -> Optional[str]:
         tempo_atual = time.time()
         if (tempo_atual - tempo_cache) < CACHE_TTL:
             logger.info(f"✨ Cache HIT: {chave[:16]}...")
+            _cache_ia_contagem["hits"] += 1
             return _cache_respostas_ia.get(chave)
         else:
             logger.info(f"⏰ Cache EXPIRED: {chave[:16]}...")
+    _cache_ia_contagem["misses"] += 1
     return None
 
 def _salvar_resposta_ia_cache(chave: str, resposta: str) -> None:
@@ -1887,59 +1397,39 @@ def _buscar_transacoes_open_finance(db: Session, user_id: int) -> List[Dict]:
     
     Args:
         db: Sessão do banco de dados
-        user_id: ID do usuário (Telegram ID)
+        user_id: ID interno do usuário (usuarios.id)
     
     Returns:
         Lista de transações bancárias formatadas
     """
     try:
-        # Query com JOIN triplo: transactions -> accounts -> connections
-        query = text("""
-            SELECT 
-                bt.transaction_id,
-                bt.description,
-                bt.amount,
-                bt.date,
-                bt.type,
-                bt.category,
-                bt.merchant_name,
-                ba.account_name,
-                ba.account_type,
-                bc.connector_id
-            FROM bank_transactions bt
-            INNER JOIN bank_accounts ba ON bt.account_id = ba.id
-            INNER JOIN bank_connections bc ON ba.connection_id = bc.id
-            WHERE bc.user_id = :user_id
-                AND bc.status = 'UPDATED'
-                AND bt.date >= CURRENT_DATE - INTERVAL '90 days'
-            ORDER BY bt.date DESC
-        """)
-        
-        resultado = db.execute(query, {"user_id": user_id})
+        from open_finance.read_model import buscar_transacoes
+
+        # Read model desnormalizado: uma varredura no índice (id_usuario, data)
         transacoes = []
-        
-        for row in resultado:
+        # Transações já conciliadas com um lançamento ficam de fora (contadas uma vez só)
+        for row in buscar_transacoes(db, user_id, dias=90, apenas_nao_conciliadas=True):
+            valor = float(row.valor) if row.valor is not None else 0.0
             # Formata no mesmo padrão dos lançamentos manuais
             transacao = {
-                "id": row[0],  # transaction_id
-                "data": row[3].strftime('%Y-%m-%d') if row[3] else None,
-                "descricao": row[1] or row[6] or "Transação bancária",  # description ou merchant_name
-                "valor": float(row[2]) if row[2] else 0.0,
-                "tipo": "Receita" if row[2] > 0 else "Despesa",
-                "categoria": row[5] or "Open Finance",
-                "conta": row[7] or "Banco conectado",  # account_name
-                "tipo_conta": row[8],  # CREDIT_CARD, CHECKING, SAVINGS
+                "id": row.transaction_id,
+                "data": row.data.strftime('%Y-%m-%d') if row.data else None,
+                "descricao": row.descricao or row.merchant_name or "Transação bancária",
+                "valor": valor,
+                "tipo": "Receita" if row.tipo == 'Entrada' else "Despesa",
+                "categoria": row.categoria or "Open Finance",
+                "conta": row.conta_nome or "Banco conectado",
+                "tipo_conta": row.tipo_conta,  # CREDIT, BANK, CHECKING_ACCOUNT...
                 "fonte": "open_finance",  # 🏦 Identificador de origem
-                "banco": _mapear_banco_por_connector(row[9])  # Nome do banco
+                "banco": row.banco or "Banco"  # Nome do banco
             }
-            # Tenta extrair itens a partir da descrição/merchant_name (heurística local)
-            try:
-                descricao_full = (row[1] or '') + ' ' + (row[6] or '')
-                itens_extraidos = _extrair_itens_de_descricao(descricao_full, float(row[2]) if row[2] else 0.0)
-                if itens_extraidos:
-                    transacao['itens'] = itens_extraidos
-            except Exception:
-                pass
+            # Itens extraídos na ingestão; linhas antigas (sem backfill) extraem aqui
+            itens_extraidos = row.itens
+            if itens_extraidos is None:
+                descricao_full = (row.descricao or '') + ' ' + (row.merchant_name or '')
+                itens_extraidos = extrair_itens_de_descricao(descricao_full, valor)
+            if itens_extraidos:
+                transacao['itens'] = itens_extraidos
             transacoes.append(transacao)
         
         logger.info(f"✅ {len(transacoes)} transações bancárias encontradas para user {user_id}")
@@ -0,0 +1,184 @@
+"""
+🔎 Índice de Quase-Duplicatas de Descrições (MinHash + LSH)
+Substitui comparações de Jaccard par-a-par por consultas sublineares.
+
+- Cada descrição normalizada vira um conjunto de palavras e uma assinatura
+  MinHash de ``num_perm`` inteiros de 32 bits (a probabilidade de duas
+  assinaturas coincidirem numa posição é a similaridade de Jaccard);
+- A assinatura é dividida em bandas (LSH): descrições que coincidem em
+  alguma banda inteira viram candidatas, as demais nem são comparadas;
+- O número de bandas é escolhido a partir do limiar de similaridade;
+- Armazenamento compacto: descrições idênticas (após normalização) são
+  guardadas uma vez e as assinaturas ficam numa única matriz uint32.
+
+Usado pela detecção de assinaturas recorrentes.
+"""
+
+import os
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .categorizacao import normalizar_texto
+
+# Similaridade de Jaccard mínima (configurável por ambiente ou por índice/consulta)
+LIMIAR_PADRAO = float(os.getenv("SIMILARIDADE_DESCRICAO_LIMIAR", "0.8"))
+NUM_PERMUTACOES = int(os.getenv("SIMILARIDADE_NUM_PERMUTACOES", "64"))
+
+_PRIMO = np.uint64(4294967311)  # Primeiro primo acima de 2**32: (a*h + b) cabe em uint64
+_MASCARA = np.uint64(0xFFFFFFFF)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokens_descricao(descricao: Optional[str]) -> frozenset:
+    """Palavras da descrição sem acentos, pontuação e números soltos."""
+    return frozenset(t for t in _TOKEN.findall(normalizar_texto(descricao)) if not t.isdigit())
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """Similaridade de Jaccard exata entre dois conjuntos."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def escolher_bandas(num_perm: int, limiar: float) -> Tuple[int, int]:
+    """
+    Escolhe (bandas, linhas por banda) cujo ponto de inflexão (1/b)^(1/r)
+    fica mais próximo do limiar de similaridade.
+    """
+    melhor = (num_perm, 1)
+    melhor_erro = float("inf")
+    for linhas in range(1, num_perm + 1):
+        bandas = num_perm // linhas
+        erro = abs((1 / bandas) ** (1 / linhas) - limiar)
+        if erro < melhor_erro:
+            melhor, melhor_erro = (bandas, linhas), erro
+    return melhor
+
+
+class MinHasher:
+    """Gera assinaturas MinHash de conjuntos de palavras."""
+
+    def __init__(self, num_perm: int = NUM_PERMUTACOES, seed: int = 1):
+        gerador = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = gerador.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = gerador.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def assinatura(self, tokens: Iterable[str]) -> Optional[np.ndarray]:
+        hashes = np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint64)
+        if not hashes.size:
+            return None
+        permutados = (np.outer(hashes, self._a) + self._b) % _PRIMO & _MASCARA
+        return permutados.min(axis=0).astype(np.uint32)
+
+
+class IndiceQuaseDuplicatas:
+    """Índice LSH de descrições; cada descrição normalizada aponta para as chaves que a usam."""
+
+    def __init__(self, limiar: float = LIMIAR_PADRAO, num_perm: int = NUM_PERMUTACOES,
+                 hasher: Optional[MinHasher] = None):
+        self.limiar = limiar
+        self.hasher = hasher or MinHasher(num_perm)
+        self.bandas, self.linhas = escolher_bandas(self.hasher.num_perm, limiar)
+        self._assinaturas = np.zeros((0, self.hasher.num_perm), dtype=np.uint32)
+        self._tokens: List[frozenset] = []
+        self._chaves: List[List[Hashable]] = []
+        self._posicao: Dict[frozenset, int] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bandas)]
+
+    def __len__(self) -> int:
+        return sum(len(chaves) for chaves in self._chaves)
+
+    def _faixas(self, assinatura: np.ndarray):
+        for banda in range(self.bandas):
+            yield banda, assinatura[banda * self.linhas:(banda + 1) * self.linhas].tobytes()
+
+    def adicionar(self, chave: Hashable, descricao: Optional[str]) -> None:
+        self.adicionar_varios([(chave, descricao)])
+
+    def adicionar_varios(self, itens: Iterable[Tuple[Hashable, Optional[str]]]) -> None:
+        """Carga em massa (assinaturas empilhadas de uma vez)."""
+        novas = []
+        for chave, descricao in itens:
+            tokens = tokens_descricao(descricao)
+            if not tokens:
+                continue
+            posicao = self._posicao.get(tokens)
+            if posicao is not None:
+                self._chaves[posicao].append(chave)
+                continue
+            assinatura = self.hasher.assinatura(tokens)
+            posicao = len(self._tokens)
+            self._posicao[tokens] = posicao
+            self._tokens.append(tokens)
+            self._chaves.append([chave])
+            novas.append(assinatura)
+            for banda, faixa in self._faixas(assinatura):
+                self._buckets[banda].setdefault(faixa, []).append(posicao)
+        if novas:
+            self._assinaturas = np.vstack([self._assinaturas, np.stack(novas)])
+
+    def _posicoes_candidatas(self, tokens: frozenset) -> Set[int]:
+        posicao = self._posicao.get(tokens)
+        assinatura = self._assinaturas[posicao] if posicao is not None else self.hasher.assinatura(tokens)
+        if assinatura is None:
+            return set()
+        candidatas: Set[int] = set()
+        for banda, faixa in self._faixas(assinatura):
+            candidatas.update(self._buckets[banda].get(faixa, ()))
+        return candidatas
+
+    def similares(self, descricao: Optional[str], limiar: Optional[float] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Chaves com descrição similar, verificadas com Jaccard exato.
+
+        ``limiar`` pode ser mais exigente que o do índice; abaixo dele a
+        revocação cai, porque os candidatos vêm das bandas do índice.
+        """
+        tokens = tokens_descricao(descricao)
+        if not tokens:
+            return []
+        minimo = self.limiar if limiar is None else limiar
+        resultado = []
+        for posicao in self._posicoes_candidatas(tokens):
+            similaridade = jaccard(tokens, self._tokens[posicao])
+            if similaridade >= minimo:
+                resultado.extend((chave, similaridade) for chave in self._chaves[posicao])
+        resultado.sort(key=lambda par: par[1], reverse=True)
+        return resultado
+
+    def agrupar(self, limiar: Optional[float] = None) -> List[List[Hashable]]:
+        """Agrupa as chaves em componentes de descrições similares (union-find)."""
+        minimo = self.limiar if limiar is None else limiar
+        pai = list(range(len(self._tokens)))
+
+        def raiz(i: int) -> int:
+            while pai[i] != i:
+                pai[i] = pai[pai[i]]
+                i = pai[i]
+            return i
+
+        for buckets in self._buckets:
+            for posicoes in buckets.values():
+                for n, primeira in enumerate(posicoes):
+                    for outra in posicoes[n + 1:]:
+                        if raiz(primeira) != raiz(outra) and jaccard(self._tokens[primeira], self._tokens[outra]) >= minimo:
+                            pai[raiz(outra)] = raiz(primeira)
+
+        grupos: Dict[int, List[Hashable]] = {}
+        for posicao, chaves in enumerate(self._chaves):
+            grupos.setdefault(raiz(posicao), []).extend(chaves)
+        return list(grupos.values())
+
+
+__all__ = [
+    'IndiceQuaseDuplicatas',
+    'MinHasher',
+    'escolher_bandas',
+    'jaccard',
+    'tokens_descricao',
+]
@@ -26,3 +26,34 @@ def enviar_email(destinatario, assunto, corpo):
     except Exception as e:
         print(f'Erro ao enviar email: {e}')
         return False
+
+
+# Envio com anexo (PDF) pelo relay SMTP da Brevo, com as credenciais do config
+
+def email_configurado():
+    import config
+    return all([config.EMAIL_HOST_USER, config.EMAIL_HOST_PASSWORD, config.SENDER_EMAIL])
+
+
+def enviar_email_com_anexo(destinatario, assunto, corpo_html, anexo, nome_anexo):
+    import config
+    from email.mime.application import MIMEApplication
+    from email.utils import formataddr
+
+    if not email_configurado():
+        raise RuntimeError("Variáveis de e-mail não configuradas (EMAIL_HOST_USER/EMAIL_HOST_PASSWORD/SENDER_EMAIL)")
+
+    msg = MIMEMultipart()
+    msg['From'] = formataddr(('Maestro Financeiro Bot', config.SENDER_EMAIL))
+    msg['To'] = destinatario
+    msg['Subject'] = assunto
+    msg.attach(MIMEText(corpo_html, 'html', 'utf-8'))
+    parte = MIMEApplication(anexo, _subtype='pdf')
+    parte.add_header('Content-Disposition', 'attachment', filename=nome_anexo)
+    msg.attach(parte)
+
+    with smtplib.SMTP('smtp-relay.brevo.com', 587, timeout=30) as server:
+        server.starttls()
+        server.login(config.EMAIL_HOST_USER, config.EMAIL_HOST_PASSWORD)
+        server.sendmail(config.SENDER_EMAIL, destinatario, msg.as_string())
+    return True
@@ -23,6 +23,8 @@ import calendar
 
 from database.database import get_db
 from models import Usuario, Lancamento, Objetivo, Categoria, ConquistaUsuario
+from .campos_derivados import inferir_meio_pagamento as infer_payment_method
+from .categorizacao import MotorCategorizacao
 
 logger = logging.getLogger(__name__)
 
@@ -44,69 +46,24 @@ def _normalize_text(s: Optional[str]) -> str:
 
 
 _KEYWORD_CATEGORY_MAP = {
-    'mercado': 'Alimentação', 'supermercado': 'Alimentação', 'panific': 'Alimentação',
+    'mercado': 'Alimentação', 'supermercado': 'Alimentação', 'panific*': 'Alimentação',
     'padaria': 'Alimentação', 'ifood': 'Alimentação', 'rappi': 'Alimentação', 'ubereats': 'Alimentação',
     'restaurante': 'Alimentação', 'uber': 'Transporte', '99': 'Transporte', 'posto': 'Transporte',
     'gasolina': 'Transporte', 'farmacia': 'Saúde', 'cinema': 'Lazer', 'netflix': 'Assinaturas',
     'spotify': 'Assinaturas', 'renner': 'Vestuário', 'rendimento': 'Investimentos', 'investimento': 'Investimentos',
-    'boleto': 'Pagamentos', 'pix': 'Pix', 'transferencia': 'Transferência'
+    'boleto': 'Pagamentos', 'pix': 'Pix', 'transferencia': 'Transferência',
+    # heurísticas adicionais (menor prioridade)
+    'mercad*': 'Alimentação', 'mercato': 'Alimentação', 'formiguinha': 'Alimentação',
 }
 
+# Compilado uma vez: uma varredura por descrição, com memo por texto
+_CATEGORY_ENGINE = MotorCategorizacao([(cat, [kw]) for kw, cat in _KEYWORD_CATEGORY_MAP.items()])
+
 
 def infer_category_from_description(description: Optional[str]) -> Optional[str]:
-    desc = _normalize_text(description)
-    if not desc:
+    if not description:
         return None
-    for kw, cat in _KEYWORD_CATEGORY_MAP.items():
-        if kw in desc:
-            return cat
-    # heurísticas adicionais
-    if 'mercad' in desc or 'mercato' in desc:
-        return 'Alimentação'
-    if 'formiguinha' in desc:
-        return 'Alimentação'
-    return None
-
-
-def infer_payment_method(origem: Optional[str], descricao: Optional[str]) -> str:
-    o_raw = origem or ''
-    d = _normalize_text(descricao)
-    o = _normalize_text(o_raw)
-
-    # Se a origem já veio formatada pelo serviço (ex: 'Cartão de Crédito • Nubank'), preserva
-    if o_raw and '•' in str(o_raw):
-        return str(o_raw)
-
-    # Detectores principais
-    if 'pix' in o or 'pix' in d:
-        return 'Pix'
-
-    # Cartões: detectar presença de palavras-chave e, se possível, manter o nome do emissor
-    if 'cartao' in o or 'credito' in o or 'debito' in o or 'visa' in d or 'master' in d or 'elo' in d or 'amex' in d:
-        # Se a origem textual contiver o nome do banco, tenta preservar
-        if o_raw and len(o_raw) > 3 and o_raw.lower() not in ('openfinance', 'open finance'):
-            # Normaliza capitalização mínima
-            return o_raw
-        # Caso contrário, decide entre crédito/débito por palavras-chave
-        if 'debito' in o:
-            return 'Cartão de Débito'
-        return 'Cartão de Crédito'
-
-    # Transferências e boletos
-    if 'transfer' in o or 'ted' in o or 'doc' in o or 'transferência' in d or 'transferencia' in d:
-        return 'Transferência'
-    if 'boleto' in d or 'boleto' in o:
-        return 'Boleto'
-
-    # Nunca retornar 'Open Finance' como forma de pagamento — é apenas origem
-    # Caso a origem contenha 'openfinance', preferir 'Conta' ou o nome da conta
-    if 'openfinance' in o or 'open finance' in d:
-        return o_raw if o_raw and o_raw.lower() not in ('openfinance', 'open finance') else 'Conta'
-
-    # Fallback: se a origem contém algo plausível, title-case; senão 'Desconhecido'
-    if o:
-        return o.title()
-    return 'Desconhecido'
+    return _CATEGORY_ENGINE.classificar(description)
 
 
 def derive_lancamento_meta(lanc: Any) -> Tuple[str, str, str]:
@@ -120,7 +77,10 @@ def derive_lancamento_meta(lanc: Any) -> Tuple[str, str, str]:
         cat_reg = None
 
     cat_inferida = infer_category_from_description(getattr(lanc, 'descricao', None))
-    pay_method = infer_payment_method(getattr(lanc, 'meio_pagamento', None) or getattr(lanc, 'origem', None), getattr(lanc, 'descricao', None))
+    # Gravado na inserção (campos_derivados); inferido só para registros ainda sem backfill
+    pay_method = getattr(lanc, 'meio_pagamento', None) or infer_payment_method(
+        getattr(lanc, 'forma_pagamento', None) or getattr(lanc, 'origem', None), getattr(lanc, 'descricao', None)
+    )
 
     if cat_reg:
         cat_reg_norm = _normalize_text(cat_reg)
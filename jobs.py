@@ -4,111 +4,74 @@ Sistema de Jobs e Tarefas Agendadas - MaestroFin
 import logging
 from datetime import datetime, time
 from telegram.ext import ContextTypes
+from metricas import medir_job
 from alerts import agendar_notificacoes_diarias, checar_objetivos_semanal
 from gerente_financeiro.assistente_proativo import job_assistente_proativo
+from gerente_financeiro.campos_derivados import FUSO_LOCAL
+from gerente_financeiro.relatorio_assets import job_carregar_assets_relatorio
+from gerente_financeiro.relatorios_lote import job_entregar_relatorios_mensais, job_lote_relatorios_mensais
+from gerente_financeiro.renderizador_graficos import job_aquecer_pool_graficos
 from gerente_financeiro.wrapped_anual import job_wrapped_anual
+from open_finance.connector_catalog import job_atualizar_catalogo_conectores
+from open_finance.data_sync import get_data_synchronizer
 
 logger = logging.getLogger(__name__)
 
-async def sync_all_users_transactions(context: ContextTypes.DEFAULT_TYPE):
-    """Job que sincroniza transações de todos os usuários ativos"""
-    db = None
-    try:
-        logger.info("🔄 Iniciando sincronização automática de transações...")
-        
-        from database.database import get_db
-        from models import Usuario, PluggyItem
-        from open_finance.service import OpenFinanceService
-        
-        db = next(get_db())
-        service = OpenFinanceService(db)
-        
-        # Buscar todos usuários com items ativos
-        usuarios_com_items = (
-            db.query(Usuario)
-            .join(PluggyItem, Usuario.id == PluggyItem.id_usuario)
-            .filter(PluggyItem.status.in_(["UPDATED", "PARTIAL_SUCCESS"]))
-            .distinct()
-            .all()
-        )
-        
-        if not usuarios_com_items:
-            logger.info("ℹ️  Nenhum usuário com Open Finance ativo para sincronizar")
-            return
-        
-        total_synced = 0
-        total_new = 0
-        
-        for usuario in usuarios_com_items:
-            try:
-                stats = service.sync_transactions_for_user(usuario.telegram_id, days=7)
-                
-                new_txns = stats.get("new_transactions", 0)
-                if new_txns > 0:
-                    total_new += new_txns
-                    total_synced += 1
-                    
-                    # Notificar usuário se houver transações novas
-                    try:
-                        await context.bot.send_message(
-                            chat_id=usuario.telegram_id,
-                            text=(
-                                f"🔔 *Nova\\(s\\) transação\\(ões\\)\\!*\n\n"
-                                f"Encontrei *{new_txns} nova\\(s\\) transação\\(ões\\)* nas suas contas\\.\n\n"
-                                f"Use /importar\\_transacoes para revisar e importar\\."
-                            ),
-                            parse_mode="MarkdownV2"
-                        )
-                    except Exception as e:
-                        logger.error(f"❌ Erro ao notificar usuário {usuario.telegram_id}: {e}")
-                
-            except Exception as e:
-                logger.error(f"❌ Erro ao sincronizar usuário {usuario.telegram_id}: {e}")
-                continue
-        
-        logger.info(
-            f"✅ Sincronização automática concluída: "
-            f"{total_synced} usuários, {total_new} transações novas"
-        )
-        
-    except Exception as e:
-        logger.error(f"❌ Erro no job de sincronização: {e}", exc_info=True)
-    finally:
-        if db:
-            db.close()
-
-
 def configurar_jobs(job_queue):
-    """Configura todos os jobs agendados do sistema"""
+    """Configura todos os jobs agendados do sistema (cada callback medido em ``metricas``)"""
     try:
         logger.info("⚙️ Configurando jobs agendados...")
         
         # Job diário às 01:00 - Agendamento de notificações
         job_queue.run_daily(
-            agendar_notificacoes_diarias,
+            medir_job(agendar_notificacoes_diarias),
             time=time(hour=1, minute=0),
             name="agendador_mestre_diario"
         )
         
         # Job semanal aos sábados às 10:00 - Verificar objetivos
         job_queue.run_daily(
-            checar_objetivos_semanal,
+            medir_job(checar_objetivos_semanal),
             time=time(hour=10, minute=0),
             days=(6,),  # Sábado
             name="checar_metas_semanalmente"
         )
         
-        # Job a cada 1 hora - Sincronizar transações Open Finance
+        # Agendador Open Finance - fila de prioridade com tick de 1 minuto
+        get_data_synchronizer().start(job_queue)
+        
+        # Job a cada 1 hora - Manter catálogo de bancos Pluggy aquecido (só busca se vencido)
+        job_queue.run_repeating(
+            medir_job(job_atualizar_catalogo_conectores),
+            interval=3600,
+            first=5,
+            name="atualizar_catalogo_conectores"
+        )
+        
+        # Na inicialização - Processos de renderização de gráficos pré-aquecidos
+        job_queue.run_once(medir_job(job_aquecer_pool_graficos), when=2, name="aquecer_pool_graficos")
+        
+        # Na inicialização - Imagens, build stamp e templates do /relatorio
+        job_queue.run_once(medir_job(job_carregar_assets_relatorio), when=2, name="carregar_assets_relatorio")
+        
+        # Job diário às 02:30 (horário local) - Relatórios do mês fechado (planejamento e geração em lote)
+        job_queue.run_daily(
+            medir_job(job_lote_relatorios_mensais),
+            time=time(hour=2, minute=30, tzinfo=FUSO_LOCAL),
+            name="lote_relatorios_mensais"
+        )
+        
+        # Job a cada 15 minutos - Entrega dos relatórios mensais no horário de cada usuário
         job_queue.run_repeating(
-            sync_all_users_transactions,
-            interval=3600,  # 1 hora em segundos
-            first=60,  # Primeira execução após 1 minuto do startup
-            name="sync_open_finance_transactions"
+            medir_job(job_entregar_relatorios_mensais),
+            interval=900,
+            first=60,
+            name="entregar_relatorios_mensais"
         )
         
         # Job diário às 20:00 - Assistente Proativo (alertas inteligentes)
         job_queue.run_daily(
-            job_assistente_proativo,
+            medir_job(job_assistente_proativo),
             time=time(hour=20, minute=0),
             name="assistente_proativo_diario"
         )
@@ -116,7 +79,7 @@ def configurar_jobs(job_queue):
         # Job anual 31/dez às 13:00 - Wrapped Financeiro do Ano
         from apscheduler.triggers.cron import CronTrigger
         job_queue.run_daily(
-            job_wrapped_anual,
+            medir_job(job_wrapped_anual),
             time=time(hour=13, minute=0),
             days=(30,),  # Dia 31 (0-indexed, então 30 = 31)
             name="wrapped_anual_31_dezembro"
@@ -125,7 +88,10 @@ def configurar_jobs(job_queue):
         logger.info("✅ Jobs agendados configurados com sucesso:")
         logger.info("   📅 Notificações diárias: 01:00")
         logger.info("   🎯 Verificação de metas: Sábado 10:00")
-        logger.info("   🔄 Sincronização Open Finance: A cada 1 hora")
+        logger.info("   🔄 Sincronização Open Finance: contínua (prioridade por defasagem/atividade)")
+        logger.info("   📚 Catálogo de bancos Pluggy: A cada 1 hora (TTL 24h)")
+        logger.info("   🎨 Pool de gráficos: aquecido na inicialização")
+        logger.info("   🗓️ Relatórios mensais: lote às 02:30, entrega no horário de cada usuário")
         logger.info("   🤖 Assistente Proativo: 20:00 (alertas inteligentes)")
         logger.info("   🎊 Wrapped Anual: 31/dez 13:00 (retrospectiva do ano)")
         
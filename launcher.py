@@ -106,6 +106,12 @@ def start_health_check_server():
     def health():
         return {'status': 'healthy', 'service': 'ContaComigo Bot'}, 200
     
+    @health_app.route('/metrics')
+    def metrics():
+        # Mesmo processo do bot: expõe o registro de métricas de runtime
+        import metricas
+        return metricas.exportar(), 200, {'Content-Type': metricas.CONTENT_TYPE}
+    
     port = int(os.getenv('PORT', 8000))
     logger.info(f"🏥 Health check server iniciado na porta {port}")
     
@@ -0,0 +1,408 @@
+"""
+📈 Métricas de Runtime - MaestroFin
+Registro de métricas do processo (bot ou dashboard) exposto em ``/metrics`` no
+formato texto do Prometheus (0.0.4), sem dependência externa:
+
+- ``Contador``, ``Medidor`` e ``Histograma`` com rótulos; cada observação é um
+  lookup em dicionário + ``bisect`` sob um lock, barato o bastante para ficar
+  ligado em produção;
+- Coletores (``registrar_coletor``) são lidos só na hora do scrape: pools de
+  conexão (``registrar_engine``) e caches que já contam hits/misses
+  (``registrar_cache``) não custam nada no caminho quente;
+- Instrumentação pronta: handlers (via gravador de analytics), chamadas
+  externas (Gemini/Pluggy, ``cronometrar``), jobs (``medir_job``) e atraso do
+  event loop (``iniciar_monitor_loop``).
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "maestrofin"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_LOOP = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LOOP_PROBE_MS = int(os.getenv("METRICS_LOOP_PROBE_MS", "500"))
+
+# (rótulos, valor) de uma amostra; família = (nome, tipo, ajuda, amostras)
+Amostra = Tuple[Dict[str, str], float]
+Familia = Tuple[str, str, str, List[Amostra]]
+# (sufixo do nome, rótulos, valor): histogramas geram _bucket/_sum/_count
+Serie = Tuple[str, Dict[str, str], float]
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos: Dict[str, str]) -> str:
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+def _formatar_valor(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica(ABC):
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+
+    @abstractmethod
+    def amostras(self) -> List[Serie]:
+        """Séries da métrica como (sufixo do nome, rótulos, valor)."""
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (total de eventos)."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos) -> float:
+        return self._valores.get(self._chave(rotulos), 0)
+
+    def amostras(self) -> List[Serie]:
+        with self._lock:
+            itens = list(self._valores.items())
+        return [("", dict(zip(self.rotulos, chave)), valor) for chave, valor in itens]
+
+
+class Medidor(Contador):
+    """Valor instantâneo (sobe e desce)."""
+
+    tipo = "gauge"
+
+    def set(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+
+class Histograma(_Metrica):
+    """Distribuição em buckets cumulativos (``le``), com soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets: Sequence[float] = BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # chave -> [contagens por bucket (não cumulativas) + estouro, soma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+
+    def contagem(self, **rotulos) -> int:
+        serie = self._series.get(self._chave(rotulos))
+        return sum(serie[0]) if serie else 0
+
+    def amostras(self) -> List[Serie]:
+        with self._lock:
+            itens = [(chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items()]
+        saida: List[Serie] = []
+        for chave, contagens, soma in itens:
+            base = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                saida.append(("_bucket", {**base, "le": _formatar_valor(limite)}, acumulado))
+            saida.append(("_sum", base, soma))
+            saida.append(("_count", base, acumulado))
+        return saida
+
+
+class RegistroMetricas:
+    """Métricas e coletores do processo; ``exportar()`` gera o texto do scrape."""
+
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._coletores: List[Callable[[], Iterable[Familia]]] = []
+        self._lock = threading.Lock()
+
+    def _obter(self, classe, nome: str, ajuda: str, rotulos: Sequence[str], **extras) -> _Metrica:
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = self._metricas[nome] = classe(nome, ajuda, rotulos, **extras)
+            elif type(metrica) is not classe:
+                raise ValueError(f"Métrica {nome} já registrada como {metrica.tipo}")
+            return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._obter(Contador, nome, ajuda, rotulos)
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Medidor:
+        return self._obter(Medidor, nome, ajuda, rotulos)
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                   buckets: Sequence[float] = BUCKETS_PADRAO) -> Histograma:
+        return self._obter(Histograma, nome, ajuda, rotulos, buckets=buckets)
+
+    def registrar_coletor(self, coletor: Callable[[], Iterable[Familia]]) -> None:
+        """``coletor()`` devolve famílias ``(nome, tipo, ajuda, [(rótulos, valor)])`` na hora do scrape."""
+        with self._lock:
+            if coletor not in self._coletores:
+                self._coletores.append(coletor)
+
+    def exportar(self) -> str:
+        linhas: List[str] = []
+        with self._lock:
+            metricas = list(self._metricas.values())
+            coletores = list(self._coletores)
+
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for sufixo, rotulos, valor in metrica.amostras():
+                linhas.append(f"{metrica.nome}{sufixo}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}")
+
+        # Coletores diferentes podem contribuir para a mesma família
+        familias: Dict[str, Familia] = {}
+        for coletor in coletores:
+            try:
+                for nome, tipo, ajuda, amostras in coletor():
+                    familias.setdefault(nome, (nome, tipo, ajuda, []))[3].extend(amostras)
+            except Exception as e:
+                logger.warning(f"⚠️ Coletor de métricas {getattr(coletor, '__name__', coletor)} falhou: {e}")
+        for nome, tipo, ajuda, amostras in familias.values():
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in amostras:
+                linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+_registro = RegistroMetricas()
+
+
+def get_registro() -> RegistroMetricas:
+    """Retorna o registro de métricas do processo."""
+    return _registro
+
+
+# --- Métricas compartilhadas ---
+
+HANDLER_DURACAO = _registro.histograma(
+    f"{PREFIXO}_handler_duration_seconds", "Duração dos handlers de comando do bot.", ("comando",))
+HANDLER_ERROS = _registro.contador(
+    f"{PREFIXO}_handler_errors_total", "Handlers de comando que terminaram com erro.", ("comando",))
+EXTERNO_DURACAO = _registro.histograma(
+    f"{PREFIXO}_external_request_duration_seconds",
+    "Duração das chamadas a serviços externos (Gemini, Pluggy).", ("servico", "operacao"))
+EXTERNO_ERROS = _registro.contador(
+    f"{PREFIXO}_external_request_errors_total",
+    "Chamadas a serviços externos que falharam.", ("servico", "operacao"))
+JOB_DURACAO = _registro.histograma(
+    f"{PREFIXO}_job_duration_seconds", "Duração das execuções dos jobs agendados.", ("job",))
+JOB_FALHAS = _registro.contador(
+    f"{PREFIXO}_job_failures_total", "Execuções de jobs agendados que levantaram exceção.", ("job",))
+TELEGRAM_DURACAO = _registro.histograma(
+    f"{PREFIXO}_telegram_request_duration_seconds", "Duração das chamadas à Bot API do Telegram.", ("metodo",))
+TELEGRAM_FALHAS = _registro.contador(
+    f"{PREFIXO}_telegram_request_failures_total",
+    "Chamadas à Bot API do Telegram que falharam (exceção de rede ou status >= 400).", ("metodo", "motivo"))
+LOOP_ATRASO = _registro.medidor(
+    f"{PREFIXO}_event_loop_lag_seconds", "Atraso da última sonda do event loop.")
+LOOP_ATRASO_HIST = _registro.histograma(
+    f"{PREFIXO}_event_loop_lag_distribution_seconds", "Distribuição do atraso do event loop.",
+    buckets=BUCKETS_LOOP)
+INICIO_PROCESSO = _registro.medidor(
+    f"{PREFIXO}_process_start_time_seconds", "Início do processo (epoch).")
+INICIO_PROCESSO.set(time.time())
+
+
+@contextmanager
+def cronometrar(histograma: Histograma, erros: Optional[Contador] = None, **rotulos):
+    """Observa a duração do bloco em ``histograma``; exceções contam em ``erros`` e seguem."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if erros is not None:
+            erros.inc(**rotulos)
+        raise
+    finally:
+        histograma.observe(time.perf_counter() - inicio, **rotulos)
+
+
+def registrar_comando(comando: str, duracao_ms: Optional[float], sucesso: bool) -> None:
+    """Registra uma execução de handler (chamado pelo gravador de analytics)."""
+    HANDLER_DURACAO.observe((duracao_ms or 0) / 1000, comando=comando)
+    if not sucesso:
+        HANDLER_ERROS.inc(comando=comando)
+
+
+def medir_job(callback):
+    """Decora um callback do JobQueue com duração e falhas por nome do job."""
+    @functools.wraps(callback)
+    async def medido(context):
+        job = getattr(context, "job", None)
+        nome = getattr(job, "name", None) or getattr(callback, "__name__", "job")
+        with cronometrar(JOB_DURACAO, JOB_FALHAS, job=nome):
+            return await callback(context)
+    return medido
+
+
+# --- Coletores lidos no scrape ---
+
+_engines: Dict[str, object] = {}
+_caches: Dict[str, Callable[[], Dict]] = {}
+
+
+def registrar_engine(nome: str, engine) -> None:
+    """Expõe o uso do pool de conexões de ``engine`` (SQLAlchemy) como ``pool=nome``."""
+    if engine is not None:
+        _engines[nome] = engine
+        _registro.registrar_coletor(_coletar_pools)
+
+
+def registrar_cache(nome: str, stats: Callable[[], Dict]) -> None:
+    """Expõe hits/misses de um cache; ``stats()`` devolve um dict com ``hits`` e ``misses``."""
+    _caches[nome] = stats
+    _registro.registrar_coletor(_coletar_caches)
+
+
+def _coletar_pools() -> Iterable[Familia]:
+    medidas = {
+        "checked_out": ("checkedout", "Conexões em uso."),
+        "checked_in": ("checkedin", "Conexões ociosas no pool."),
+        "size": ("size", "Tamanho configurado do pool."),
+        "overflow": ("overflow", "Conexões além do tamanho do pool (negativo = folga)."),
+    }
+    for sufixo, (metodo, ajuda) in medidas.items():
+        amostras = []
+        for nome, engine in list(_engines.items()):
+            leitura = getattr(engine.pool, metodo, None)  # NullPool/StaticPool não têm contadores
+            if leitura is not None:
+                amostras.append(({"pool": nome}, leitura()))
+        yield f"{PREFIXO}_db_pool_{sufixo}", "gauge", ajuda, amostras
+
+
+def _coletar_caches() -> Iterable[Familia]:
+    hits, misses, taxas = [], [], []
+    for nome, stats in list(_caches.items()):
+        dados = stats()
+        total = dados["hits"] + dados["misses"]
+        hits.append(({"cache": nome}, dados["hits"]))
+        misses.append(({"cache": nome}, dados["misses"]))
+        taxas.append(({"cache": nome}, dados["hits"] / total if total else 0))
+    yield f"{PREFIXO}_cache_hits_total", "counter", "Acertos de cache.", hits
+    yield f"{PREFIXO}_cache_misses_total", "counter", "Faltas de cache.", misses
+    yield f"{PREFIXO}_cache_hit_ratio", "gauge", "Acertos / consultas desde o início do processo.", taxas
+
+
+# --- Instrumentação de dependências ---
+
+def instrumentar_gemini() -> bool:
+    """Mede todas as chamadas ``generate_content_async`` do SDK do Gemini (uma vez por processo)."""
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        return False
+    classe = genai.GenerativeModel
+    original = classe.generate_content_async
+    if getattr(original, "_medido", False):
+        return True
+
+    @functools.wraps(original)
+    async def medido(self, *args, **kwargs):
+        modelo = getattr(self, "model_name", "") or "gemini"
+        with cronometrar(EXTERNO_DURACAO, EXTERNO_ERROS, servico="gemini", operacao=modelo):
+            return await original(self, *args, **kwargs)
+
+    medido._medido = True
+    classe.generate_content_async = medido
+    return True
+
+
+_monitor_loop: Optional[asyncio.Task] = None
+
+
+async def _sondar_loop(intervalo: float) -> None:
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        atraso = max(time.perf_counter() - inicio - intervalo, 0.0)
+        LOOP_ATRASO.set(atraso)
+        LOOP_ATRASO_HIST.observe(atraso)
+
+
+async def iniciar_monitor_loop(application=None) -> None:
+    """post_init: sobe a sonda de atraso do event loop (a cada ``METRICS_LOOP_PROBE_MS`` ms)."""
+    global _monitor_loop
+    if _monitor_loop is None or _monitor_loop.done():
+        _monitor_loop = asyncio.get_running_loop().create_task(_sondar_loop(LOOP_PROBE_MS / 1000))
+
+
+async def parar_monitor_loop(application=None) -> None:
+    """post_shutdown: encerra a sonda de atraso do event loop."""
+    global _monitor_loop
+    if _monitor_loop is not None:
+        _monitor_loop.cancel()
+        try:
+            await _monitor_loop
+        except asyncio.CancelledError:
+            pass
+        _monitor_loop = None
+
+
+def exportar() -> str:
+    """Texto do scrape (formato Prometheus) do registro do processo."""
+    return _registro.exportar()
+
+
+__all__ = [
+    'CONTENT_TYPE',
+    'Contador',
+    'Histograma',
+    'Medidor',
+    'RegistroMetricas',
+    'cronometrar',
+    'exportar',
+    'get_registro',
+    'iniciar_monitor_loop',
+    'instrumentar_gemini',
+    'medir_job',
+    'parar_monitor_loop',
+    'registrar_cache',
+    'registrar_comando',
+    'registrar_engine',
+]
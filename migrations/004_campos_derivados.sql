@@ -0,0 +1,35 @@
+-- Migration: Campos derivados gravados na inserção
+-- Data: 2026-10-19
+-- Descrição: Estabelecimento normalizado, meio de pagamento inferido, itens extraídos
+--            e chaves de mês/dia locais em colunas indexadas (gerente_financeiro/campos_derivados.py).
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+--            merchant_key/meio_pagamento/itens de linhas antigas: scripts/backfill_campos_derivados.py
+
+-- ==================== LANCAMENTOS ====================
+ALTER TABLE IF EXISTS lancamentos ADD COLUMN IF NOT EXISTS merchant_key VARCHAR(120);
+ALTER TABLE IF EXISTS lancamentos ADD COLUMN IF NOT EXISTS meio_pagamento VARCHAR(60);
+ALTER TABLE IF EXISTS lancamentos ADD COLUMN IF NOT EXISTS mes_referencia VARCHAR(7);
+ALTER TABLE IF EXISTS lancamentos ADD COLUMN IF NOT EXISTS dia_referencia DATE;
+
+CREATE INDEX IF NOT EXISTS ix_lancamentos_merchant_key ON lancamentos(merchant_key);
+CREATE INDEX IF NOT EXISTS ix_lancamentos_usuario_mes ON lancamentos(id_usuario, mes_referencia);
+
+-- data_transacao é gravada no horário local (sem fuso): mesma regra de campos_derivados.data_local,
+-- que só converte valores com fuso — o dia/mês local é o próprio valor gravado
+UPDATE lancamentos
+SET mes_referencia = to_char(data_transacao, 'YYYY-MM'),
+    dia_referencia = data_transacao::date
+WHERE mes_referencia IS NULL AND data_transacao IS NOT NULL;
+
+-- ==================== OPEN_FINANCE_TRANSACOES (read model) ====================
+ALTER TABLE IF EXISTS open_finance_transacoes ADD COLUMN IF NOT EXISTS merchant_key VARCHAR(120);
+ALTER TABLE IF EXISTS open_finance_transacoes ADD COLUMN IF NOT EXISTS meio_pagamento VARCHAR(60);
+ALTER TABLE IF EXISTS open_finance_transacoes ADD COLUMN IF NOT EXISTS mes_referencia VARCHAR(7);
+ALTER TABLE IF EXISTS open_finance_transacoes ADD COLUMN IF NOT EXISTS itens JSON;
+
+CREATE INDEX IF NOT EXISTS ix_open_finance_transacoes_merchant_key ON open_finance_transacoes(merchant_key);
+CREATE INDEX IF NOT EXISTS ix_of_transacoes_usuario_mes ON open_finance_transacoes(id_usuario, mes_referencia);
+
+UPDATE open_finance_transacoes
+SET mes_referencia = to_char(data, 'YYYY-MM')
+WHERE mes_referencia IS NULL;
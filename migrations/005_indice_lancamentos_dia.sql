@@ -0,0 +1,7 @@
+-- Migration: Índice para agregações de gráficos por período
+-- Data: 2026-10-19
+-- Descrição: GROUP BY por dia/categoria/forma de pagamento sobre qualquer período
+--            (gerente_financeiro/agregacoes_graficos.py) varre apenas o intervalo pedido.
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+
+CREATE INDEX IF NOT EXISTS ix_lancamentos_usuario_dia ON lancamentos(id_usuario, dia_referencia);
@@ -0,0 +1,8 @@
+-- Migration: Relatório mensal automático
+-- Data: 2026-10-19
+-- Descrição: Opt-in do usuário para receber o relatório do mês fechado
+--            (gerente_financeiro/relatorios_lote.py). A tabela relatorios_mensais
+--            é nova e criada por create_all.
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+
+ALTER TABLE IF EXISTS usuarios ADD COLUMN IF NOT EXISTS relatorio_mensal_ativo BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,50 @@
+-- Migration: Chave diária e índices das tabelas de analytics
+-- Data: 2026-10-19
+-- Descrição: analytics_daily_users ganha a coluna day (DATE) com UNIQUE (user_id, day),
+--            para o contador diário ser um único INSERT ... ON CONFLICT DO UPDATE
+--            (analytics/bot_analytics_postgresql.py). Linhas repetidas do mesmo
+--            usuário no mesmo dia são somadas na mais antiga antes da constraint.
+--            Índices por timestamp/comando/usuário para as consultas por faixa.
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+
+DO $$
+BEGIN
+    IF to_regclass('analytics_daily_users') IS NOT NULL THEN
+        ALTER TABLE analytics_daily_users ADD COLUMN IF NOT EXISTS day DATE;
+        UPDATE analytics_daily_users SET day = date::date WHERE day IS NULL;
+
+        UPDATE analytics_daily_users AS manter
+        SET total_commands = somas.total
+        FROM (
+            SELECT MIN(id) AS id, SUM(COALESCE(total_commands, 1)) AS total
+            FROM analytics_daily_users
+            GROUP BY user_id, day
+            HAVING COUNT(*) > 1
+        ) AS somas
+        WHERE manter.id = somas.id;
+
+        DELETE FROM analytics_daily_users AS repetida
+        USING analytics_daily_users AS manter
+        WHERE repetida.user_id = manter.user_id
+          AND repetida.day = manter.day
+          AND repetida.id > manter.id;
+
+        ALTER TABLE analytics_daily_users ALTER COLUMN day SET NOT NULL;
+
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_analytics_daily_users_user_day') THEN
+            ALTER TABLE analytics_daily_users
+                ADD CONSTRAINT uq_analytics_daily_users_user_day UNIQUE (user_id, day);
+        END IF;
+        CREATE INDEX IF NOT EXISTS ix_analytics_daily_users_day ON analytics_daily_users(day);
+    END IF;
+
+    IF to_regclass('analytics_command_usage') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS ix_analytics_command_usage_timestamp ON analytics_command_usage(timestamp);
+        CREATE INDEX IF NOT EXISTS ix_analytics_command_usage_command_timestamp ON analytics_command_usage(command, timestamp);
+        CREATE INDEX IF NOT EXISTS ix_analytics_command_usage_user_id ON analytics_command_usage(user_id);
+    END IF;
+
+    IF to_regclass('analytics_error_logs') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS ix_analytics_error_logs_timestamp ON analytics_error_logs(timestamp);
+    END IF;
+END $$;
@@ -0,0 +1,79 @@
+-- Migration: Rollups de analytics para o dashboard
+-- Data: 2026-10-19
+-- Descrição: analytics_rollup_hourly / analytics_rollup_daily (criadas por create_all
+--            em analytics/bot_analytics_postgresql.py) passam a ser mantidas pelo
+--            gravador em lote (analytics/rollups.py). Aqui só o preenchimento inicial
+--            a partir dos eventos brutos, feito uma vez: enquanto a tabela estiver vazia.
+--            Faixas de latência iguais a analytics.rollups.BUCKETS_LATENCIA.
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+
+DO $$
+BEGIN
+    IF to_regclass('analytics_rollup_hourly') IS NOT NULL
+       AND to_regclass('analytics_command_usage') IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM analytics_rollup_hourly) THEN
+        INSERT INTO analytics_rollup_hourly (hour, command, total, successes, error_logs, latency_sum_ms, latency_max_ms, b_100, b_250, b_500, b_1000, b_2500, b_5000, b_10000, b_30000, b_inf)
+            SELECT date_trunc('hour', timestamp), command,
+                   COUNT(*),
+                   SUM(CASE WHEN success IS NOT FALSE THEN 1 ELSE 0 END),
+                   0,
+                   SUM(COALESCE(execution_time_ms, 0)),
+                   MAX(COALESCE(execution_time_ms, 0)),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) <= 100 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 100 AND COALESCE(execution_time_ms, 0) <= 250 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 250 AND COALESCE(execution_time_ms, 0) <= 500 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 500 AND COALESCE(execution_time_ms, 0) <= 1000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 1000 AND COALESCE(execution_time_ms, 0) <= 2500 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 2500 AND COALESCE(execution_time_ms, 0) <= 5000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 5000 AND COALESCE(execution_time_ms, 0) <= 10000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 10000 AND COALESCE(execution_time_ms, 0) <= 30000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 30000 THEN 1 ELSE 0 END)
+            FROM analytics_command_usage
+            WHERE timestamp IS NOT NULL
+            GROUP BY 1, 2
+        ON CONFLICT (hour, command) DO NOTHING;
+
+        IF to_regclass('analytics_error_logs') IS NOT NULL THEN
+            INSERT INTO analytics_rollup_hourly (hour, command, error_logs)
+                SELECT date_trunc('hour', timestamp), COALESCE(command, ''), COUNT(*)
+                FROM analytics_error_logs
+                WHERE timestamp IS NOT NULL
+                GROUP BY 1, 2
+            ON CONFLICT (hour, command) DO UPDATE SET error_logs = analytics_rollup_hourly.error_logs + EXCLUDED.error_logs;
+        END IF;
+    END IF;
+
+    IF to_regclass('analytics_rollup_daily') IS NOT NULL
+       AND to_regclass('analytics_command_usage') IS NOT NULL
+       AND NOT EXISTS (SELECT 1 FROM analytics_rollup_daily) THEN
+        INSERT INTO analytics_rollup_daily (day, command, total, successes, error_logs, latency_sum_ms, latency_max_ms, b_100, b_250, b_500, b_1000, b_2500, b_5000, b_10000, b_30000, b_inf)
+            SELECT timestamp::date, command,
+                   COUNT(*),
+                   SUM(CASE WHEN success IS NOT FALSE THEN 1 ELSE 0 END),
+                   0,
+                   SUM(COALESCE(execution_time_ms, 0)),
+                   MAX(COALESCE(execution_time_ms, 0)),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) <= 100 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 100 AND COALESCE(execution_time_ms, 0) <= 250 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 250 AND COALESCE(execution_time_ms, 0) <= 500 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 500 AND COALESCE(execution_time_ms, 0) <= 1000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 1000 AND COALESCE(execution_time_ms, 0) <= 2500 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 2500 AND COALESCE(execution_time_ms, 0) <= 5000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 5000 AND COALESCE(execution_time_ms, 0) <= 10000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 10000 AND COALESCE(execution_time_ms, 0) <= 30000 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN COALESCE(execution_time_ms, 0) > 30000 THEN 1 ELSE 0 END)
+            FROM analytics_command_usage
+            WHERE timestamp IS NOT NULL
+            GROUP BY 1, 2
+        ON CONFLICT (day, command) DO NOTHING;
+
+        IF to_regclass('analytics_error_logs') IS NOT NULL THEN
+            INSERT INTO analytics_rollup_daily (day, command, error_logs)
+                SELECT timestamp::date, COALESCE(command, ''), COUNT(*)
+                FROM analytics_error_logs
+                WHERE timestamp IS NOT NULL
+                GROUP BY 1, 2
+            ON CONFLICT (day, command) DO UPDATE SET error_logs = analytics_rollup_daily.error_logs + EXCLUDED.error_logs;
+        END IF;
+    END IF;
+END $$;
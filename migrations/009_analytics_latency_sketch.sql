@@ -0,0 +1,10 @@
+-- Migration: Sketch de latência nos rollups de analytics
+-- Data: 2026-10-19
+-- Descrição: Cada linha de analytics_rollup_hourly / analytics_rollup_daily guarda um
+--            histograma logarítmico mesclável (analytics/latency_sketch.py) para
+--            p50/p95/p99 e contagem de execuções lentas por comando. Linhas
+--            anteriores ficam sem sketch (NULL) e não entram nos percentis.
+--            Idempotente: aplicada a cada inicialização por database.criar_tabelas().
+
+ALTER TABLE IF EXISTS analytics_rollup_hourly ADD COLUMN IF NOT EXISTS latency_sketch BYTEA;
+ALTER TABLE IF EXISTS analytics_rollup_daily ADD COLUMN IF NOT EXISTS latency_sketch BYTEA;
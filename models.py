@@ -2,8 +2,10 @@
 # models.py
 from datetime import datetime, timezone, time
 from sqlalchemy import (
-    Column, Integer, String, Numeric, DateTime, ForeignKey, BigInteger, Boolean, Date, Time, JSON, Float, Text, func
+    Column, Integer, String, Numeric, DateTime, ForeignKey, BigInteger, Boolean, Date, Time, JSON, Float, Text, func, Index,
+    LargeBinary
 )
+from sqlalchemy import event
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -17,6 +19,7 @@ class Usuario(Base):
     horario_notificacao = Column(Time, default=time(hour=9, minute=0))
     email_notificacao = Column(String, nullable=True)
     alerta_gastos_ativo = Column(Boolean, default=True)
+    relatorio_mensal_ativo = Column(Boolean, default=False, nullable=False, server_default='false')
     criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     # --- CAMPOS DE GAMIFICAÇÃO ---
@@ -98,15 +101,29 @@ class Subcategoria(Base):
     categoria = relationship("Categoria", back_populates="subcategorias")
     lancamentos = relationship("Lancamento", back_populates="subcategoria")
 
+def _agora_local():
+    from gerente_financeiro.campos_derivados import agora_local
+    return agora_local()
+
 class Lancamento(Base):
     __tablename__ = 'lancamentos'
+    __table_args__ = (
+        Index('ix_lancamentos_usuario_mes', 'id_usuario', 'mes_referencia'),
+        Index('ix_lancamentos_usuario_dia', 'id_usuario', 'dia_referencia'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     descricao = Column(String)
     valor = Column(Numeric(10, 2), nullable=False)
     tipo = Column(String, nullable=False)
-    data_transacao = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    data_transacao = Column(DateTime, default=_agora_local)  # Horário local, sem fuso
     forma_pagamento = Column(String) # Será preenchido com o nome da conta/cartão
     documento_fiscal = Column(String, nullable=True)
+
+    # Derivados na gravação (gerente_financeiro.campos_derivados) — leituras não recalculam
+    merchant_key = Column(String(120), nullable=True, index=True)
+    meio_pagamento = Column(String(60), nullable=True)
+    mes_referencia = Column(String(7), nullable=True)  # 'AAAA-MM' no fuso local
+    dia_referencia = Column(Date, nullable=True)
     
     id_usuario = Column(Integer, ForeignKey('usuarios.id'), nullable=False)
     id_conta = Column(Integer, ForeignKey('contas.id'), nullable=True) # Link para a conta/cartão usado
@@ -119,6 +136,15 @@ class Lancamento(Base):
     subcategoria = relationship("Subcategoria", back_populates="lancamentos")
     itens = relationship("ItemLancamento", back_populates="lancamento", cascade="all, delete-orphan")
 
+
+@event.listens_for(Lancamento, 'before_insert')
+@event.listens_for(Lancamento, 'before_update')
+def _preencher_campos_derivados(mapper, connection, target):
+    # INSERTs em massa (Core) não passam por aqui: preenchem os campos explicitamente
+    from gerente_financeiro.campos_derivados import preencher_lancamento
+    preencher_lancamento(target)
+
+
 class ItemLancamento(Base):
     __tablename__ = 'itens_lancamento'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -385,6 +411,137 @@ class PluggyTransaction(Base):
         return f"<PluggyTransaction(id={self.pluggy_transaction_id}, amount=R${self.amount}, date={self.date})>"
 
 
+class OpenFinanceTransacao(Base):
+    """
+    Read model desnormalizado das transações Open Finance de um usuário.
+
+    Consolida as duas origens (pluggy_transactions e bank_transactions) em uma
+    única tabela já com banco, tipo de conta e categoria normalizada, mantida
+    pela ingestão. Leituras (contexto da IA, listagens) viram uma varredura
+    no índice (id_usuario, data) sem joins.
+    """
+    __tablename__ = 'open_finance_transacoes'
+    __table_args__ = (
+        Index('ix_of_transacoes_usuario_data', 'id_usuario', 'data'),
+        Index('ix_of_transacoes_usuario_mes', 'id_usuario', 'mes_referencia'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id', ondelete='CASCADE'), nullable=False)
+
+    # Origem: 'pluggy' (OpenFinanceService) ou 'bank_connector' (BankConnector)
+    fonte = Column(String(20), nullable=False)
+    transaction_id = Column(String, unique=True, nullable=False)  # ID da transação na Pluggy
+    item_id = Column(String, nullable=True, index=True)  # ID do item (conexão) na Pluggy
+
+    data = Column(Date, nullable=False)
+    descricao = Column(String, nullable=False)
+    merchant_name = Column(String, nullable=True)
+    valor = Column(Numeric(15, 2), nullable=False)  # Com sinal: positivo=entrada, negativo=saída
+    tipo = Column(String(10), nullable=False)  # Entrada / Saída
+
+    categoria_origem = Column(String, nullable=True)  # Categoria como veio da Pluggy
+    categoria = Column(String, nullable=False)  # Categoria normalizada (português)
+
+    banco = Column(String, nullable=True)
+    conta_nome = Column(String, nullable=True)
+    tipo_conta = Column(String, nullable=True)  # CREDIT, BANK, CHECKING_ACCOUNT...
+
+    # Derivados na ingestão (gerente_financeiro.campos_derivados)
+    merchant_key = Column(String(120), nullable=True, index=True)
+    meio_pagamento = Column(String(60), nullable=True)
+    mes_referencia = Column(String(7), nullable=True)
+    itens = Column(JSON, nullable=True)  # [{'nome_item', 'quantidade', 'valor_unitario'}]
+
+    atualizado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<OpenFinanceTransacao(id={self.transaction_id}, valor=R${self.valor}, data={self.data})>"
+
+
+class Conciliacao(Base):
+    """
+    Vínculo entre um lançamento e a transação bancária (read model) que o representa.
+
+    Uma compra digitada pelo usuário e depois sincronizada do banco gera dois
+    registros; o vínculo permite que agregados e o contexto da IA contem apenas
+    um deles. Mantido por open_finance.conciliacao.
+    """
+    __tablename__ = 'conciliacoes'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id', ondelete='CASCADE'), nullable=False, index=True)
+    id_lancamento = Column(Integer, ForeignKey('lancamentos.id', ondelete='CASCADE'), nullable=False, unique=True)
+    transaction_id = Column(
+        String, ForeignKey('open_finance_transacoes.transaction_id', ondelete='CASCADE'), nullable=False, unique=True
+    )
+    # 'importacao' (lançamento criado a partir da transação) ou 'automatica' (pareamento)
+    metodo = Column(String(20), nullable=False)
+    similaridade = Column(Float, nullable=True)
+    criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<Conciliacao(lancamento={self.id_lancamento}, transacao={self.transaction_id}, metodo={self.metodo})>"
+
+
+class MerchantCategoria(Base):
+    """
+    Categoria aprendida por estabelecimento (merchant normalizado) para um usuário.
+
+    Alimentada pelas confirmações (OCR) e correções (/editar) do usuário e
+    consultada antes das regras de palavra-chave. Quando vários usuários
+    concordam sobre um mesmo estabelecimento, a associação também vale
+    como sugestão global (gerente_financeiro.merchant_memory).
+    """
+    __tablename__ = 'merchant_categorias'
+    __table_args__ = (
+        Index('ux_merchant_categorias_usuario_merchant', 'id_usuario', 'merchant_key', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id', ondelete='CASCADE'), nullable=False)
+    merchant_key = Column(String(120), nullable=False, index=True)
+    id_categoria = Column(Integer, ForeignKey('categorias.id', ondelete='CASCADE'), nullable=False)
+    id_subcategoria = Column(Integer, ForeignKey('subcategorias.id', ondelete='SET NULL'), nullable=True)
+    confirmacoes = Column(Integer, nullable=False, default=1)
+    atualizado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<MerchantCategoria(usuario={self.id_usuario}, merchant='{self.merchant_key}', categoria={self.id_categoria})>"
+
+
+class RelatorioMensalEnvio(Base):
+    """
+    Relatório mensal automático de um usuário (um por mês de referência).
+
+    Criado quando o mês fecha, recebe o PDF gerado em lote e é entregue no
+    horário de notificação do usuário (gerente_financeiro.relatorios_lote).
+    O status permite retomar o lote de onde parou sem gerar ou enviar duas vezes.
+    """
+    __tablename__ = 'relatorios_mensais'
+    __table_args__ = (
+        Index('ux_relatorios_mensais_usuario_mes', 'id_usuario', 'mes_referencia', unique=True),
+        Index('ix_relatorios_mensais_status_agendado', 'status', 'agendado_para'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, ForeignKey('usuarios.id', ondelete='CASCADE'), nullable=False)
+    mes_referencia = Column(String(7), nullable=False)
+    # 'pendente' -> 'gerado' -> 'enviado' (ou 'falhou' após esgotar as tentativas)
+    status = Column(String(20), nullable=False, default='pendente')
+    canal = Column(String(20), nullable=False, default='telegram')
+    agendado_para = Column(DateTime, nullable=False)
+    tentativas = Column(Integer, nullable=False, default=0)
+    erro = Column(Text, nullable=True)
+    pdf = Column(LargeBinary, nullable=True)  # descartado após a entrega
+    gerado_em = Column(DateTime, nullable=True)
+    enviado_em = Column(DateTime, nullable=True)
+    criado_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<RelatorioMensalEnvio(usuario={self.id_usuario}, mes={self.mes_referencia}, status={self.status})>"
+
+
 # ==================== MODELS DE INVESTIMENTOS ====================
 
 class Investment(Base):
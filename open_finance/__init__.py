@@ -8,10 +8,17 @@ __author__ = "Maestro Financeiro Team"
 
 from .pluggy_client import PluggyClient
 from .bank_connector import BankConnector
-from .data_sync import DataSynchronizer
+from .data_sync import DataSynchronizer, get_data_synchronizer
+from .item_watcher import ItemReadinessWatcher, get_item_watcher
+from .connector_catalog import ConnectorCatalog, get_connector_catalog
 
 __all__ = [
     'PluggyClient',
     'BankConnector', 
-    'DataSynchronizer'
+    'DataSynchronizer',
+    'get_data_synchronizer',
+    'ItemReadinessWatcher',
+    'get_item_watcher',
+    'ConnectorCatalog',
+    'get_connector_catalog',
 ]
@@ -3,6 +3,7 @@
 Gerencia conexões de usuários com instituições financeiras
 """
 
+import asyncio
 import logging
 import time
 from typing import Dict, List, Optional
@@ -10,6 +11,14 @@ from datetime import datetime, timedelta
 from database.database import SessionLocal, engine
 from sqlalchemy import text
 from .pluggy_client import PluggyClient
+from . import read_model
+from .item_watcher import (
+    EVENT_ERROR,
+    EVENT_READY,
+    NotifyCallback,
+    classificar_status_item,
+    get_item_watcher,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -321,6 +330,7 @@ class BankConnector:
                     text("DELETE FROM bank_connections WHERE id = :connection_id"),
                     {"connection_id": connection_id}
                 )
+                read_model.remover_por_item(conn, connection['item_id'])
                 conn.commit()
             
             logger.info(f"✅ Conexão {connection_id} removida")
@@ -381,65 +391,94 @@ class BankConnector:
             logger.error(f"❌ Erro ao sincronizar contas: {e}")
             raise
 
+    @staticmethod
+    def erro_para_item(item: Dict) -> Optional[BankConnectorError]:
+        """Converte um item em estado final de falha/ação na exceção correspondente."""
+        status = item.get('status')
+        detail = item.get('statusDetail')
+        next_step = item.get('nextStep')
+        parameter_form = item.get('parameterForm') or {}
+        connector_insights = item.get('connectorInsights') or {}
+        provider_message = connector_insights.get('providerMessage')
+
+        if status == "WAITING_USER_INPUT":
+            message = (
+                detail
+                or provider_message
+                or (next_step if isinstance(next_step, str) else None)
+                or "O banco solicitou uma confirmação adicional."
+            )
+            form_items = parameter_form.get('items') if isinstance(parameter_form, dict) else None
+            if form_items:
+                return BankConnectorAdditionalAuthRequired(
+                    message,
+                    detail,
+                    item=item,
+                    form=parameter_form,
+                    next_step=next_step,
+                    insights=connector_insights,
+                )
+
+            # 🔴 CRÍTICO: Passar item completo para BankConnectorUserActionRequired
+            # A classe irá extrair redirectUrl ou construir manualmente
+            log_aviso(f"⏳ Aguardando confirmação do usuário... Item ID: {item.get('id')}")
+            log_aviso(f"   Item status: {item.get('status')}")
+            log_aviso(f"   NextStep: {next_step}")
+
+            return BankConnectorUserActionRequired(
+                message,
+                detail,
+                item=item
+            )
+
+        if classificar_status_item(item) == EVENT_ERROR:
+            return BankConnectorError(detail or "O banco rejeitou as credenciais informadas.")
+
+        return None
+
     def _wait_until_ready(self, item_id: str, timeout: int = 90, interval: int = 4) -> Dict:
-        """Espera a instituição responder com sucesso ou erro."""
+        """
+        Espera a instituição responder com sucesso ou erro.
+
+        ⚠️ Bloqueante: use apenas fora do event loop (scripts, threads).
+        Handlers do bot devem usar watch_until_ready.
+        """
         start = time.time()
         last_status = None
-        last_detail = None
 
         while time.time() - start < timeout:
             item = self.client.get_item(item_id)
             status = item.get('status')
-            detail = item.get('statusDetail')
-            next_step = item.get('nextStep')
-            parameter_form = item.get('parameterForm') or {}
-            connector_insights = item.get('connectorInsights') or {}
-            provider_message = connector_insights.get('providerMessage')
 
             if status != last_status:
-                log_destaque(f"⌛ Status item {item_id}: {status} (detail={detail}, next_step={next_step})")
+                log_destaque(f"⌛ Status item {item_id}: {status} (detail={item.get('statusDetail')}, next_step={item.get('nextStep')})")
                 last_status = status
-                last_detail = detail
 
-            if status in {"HEALTHY", "PARTIAL_SUCCESS"}:
+            if classificar_status_item(item) == EVENT_READY:
                 return item
 
-            if status == "WAITING_USER_INPUT":
-                message = (
-                    detail
-                    or provider_message
-                    or (next_step if isinstance(next_step, str) else None)
-                    or "O banco solicitou uma confirmação adicional."
-                )
-                form_items = parameter_form.get('items') if isinstance(parameter_form, dict) else None
-                if form_items:
-                    raise BankConnectorAdditionalAuthRequired(
-                        message,
-                        detail,
-                        item=item,
-                        form=parameter_form,
-                        next_step=next_step,
-                        insights=connector_insights,
-                    )
-
-                # 🔴 CRÍTICO: Passar item completo para BankConnectorUserActionRequired
-                # A classe irá extrair redirectUrl ou construir manualmente
-                log_aviso(f"⏳ Aguardando confirmação do usuário... Item ID: {item.get('id')}")
-                log_aviso(f"   Item status: {item.get('status')}")
-                log_aviso(f"   NextStep: {next_step}")
-                
-                raise BankConnectorUserActionRequired(
-                    message, 
-                    detail, 
-                    item=item
-                )
-
-            if status in {"LOGIN_ERROR", "INVALID_CREDENTIALS", "ERROR", "SUSPENDED"}:
-                raise BankConnectorError(detail or "O banco rejeitou as credenciais informadas.")
+            erro = self.erro_para_item(item)
+            if erro:
+                raise erro
 
             time.sleep(interval)
 
         raise BankConnectorTimeout("O banco ainda está processando sua autorização. Tente novamente em alguns minutos.")
+
+    def watch_until_ready(self, item_id: str, notify: NotifyCallback, timeout: Optional[float] = None) -> asyncio.Task:
+        """
+        Versão não bloqueante de _wait_until_ready.
+
+        Agenda a observação do item no event loop e retorna imediatamente.
+        ``notify(evento, item)`` é chamado uma única vez quando o item chega a
+        HEALTHY/UPDATED, WAITING_USER_INPUT, erro ou quando o tempo se esgota.
+        Use ``erro_para_item(item)`` no callback para obter a exceção equivalente.
+        """
+        return get_item_watcher().watch(item_id, notify, timeout)
+
+    def cancel_watch(self, item_id: str) -> bool:
+        """Cancela a observação em andamento de um item."""
+        return get_item_watcher().cancel(item_id)
     
     def list_accounts(self, user_id: int) -> List[Dict]:
         """Lista todas as contas bancárias de um usuário"""
@@ -525,14 +564,18 @@ class BankConnector:
                 for account_row in accounts:
                     account_db_id, account_id = account_row
                     
-                    # Buscar transações no Pluggy
-                    transactions = self.client.list_transactions(
+                    contexto = read_model.contexto_conta_bank_connector(conn, account_db_id)
+                    
+                    # Buscar transações no Pluggy em streaming (páginas baixadas em
+                    # paralelo) e gravar cada página assim que chega
+                    for transactions in self.client.iter_transaction_pages(
                         account_id=account_id,
                         from_date=from_date
-                    )
-                    
-                    # Salvar no banco
-                    for trans in transactions:
+                    ):
+                        if contexto:
+                            read_model.upsert_transacoes(
+                                conn, transactions, contexto, read_model.FONTE_BANK_CONNECTOR
+                            )
                         conn.execute(
                             text("""
                                 INSERT INTO bank_transactions
@@ -542,19 +585,21 @@ class BankConnector:
                                         :date, :type, :category, :merchant_name)
                                 ON CONFLICT (transaction_id) DO NOTHING
                             """),
-                            {
-                                "account_id": account_db_id,
-                                "transaction_id": trans['id'],
-                                "description": trans.get('description'),
-                                "amount": trans.get('amount'),
-                                "date": trans.get('date'),
-                                "type": trans.get('type'),
-                                "category": trans.get('category'),
-                                "merchant_name": trans.get('merchantName')
-                            }
+                            [
+                                {
+                                    "account_id": account_db_id,
+                                    "transaction_id": trans['id'],
+                                    "description": trans.get('description'),
+                                    "amount": trans.get('amount'),
+                                    "date": trans.get('date'),
+                                    "type": trans.get('type'),
+                                    "category": trans.get('category'),
+                                    "merchant_name": trans.get('merchantName')
+                                }
+                                for trans in transactions
+                            ]
                         )
-                    
-                    total_transactions += len(transactions)
+                        total_transactions += len(transactions)
                 
                 conn.commit()
             
@@ -570,25 +615,23 @@ class BankConnector:
         limit: int = 50,
         days: int = 30
     ) -> List[Dict]:
-        """Lista transações recentes de um usuário"""
+        """Lista transações recentes de um usuário (via read model, sem joins)"""
         with engine.connect() as conn:
             result = conn.execute(
                 text("""
                     SELECT 
-                        bt.description,
-                        bt.amount,
-                        bt.date,
-                        bt.type,
-                        bt.category,
-                        bt.merchant_name,
-                        ba.account_name,
-                        bc.connector_name
-                    FROM bank_transactions bt
-                    JOIN bank_accounts ba ON bt.account_id = ba.id
-                    JOIN bank_connections bc ON ba.connection_id = bc.id
-                    WHERE bc.user_id = :user_id
-                        AND bt.date >= CURRENT_DATE - INTERVAL ':days days'
-                    ORDER BY bt.date DESC, bt.created_at DESC
+                        oft.descricao,
+                        oft.valor,
+                        oft.data,
+                        oft.tipo,
+                        oft.categoria,
+                        oft.merchant_name,
+                        oft.conta_nome,
+                        oft.banco
+                    FROM open_finance_transacoes oft
+                    WHERE oft.id_usuario = (SELECT id FROM usuarios WHERE telegram_id = :user_id)
+                        AND oft.data >= CURRENT_DATE - make_interval(days => :days)
+                    ORDER BY oft.data DESC, oft.id DESC
                     LIMIT :limit
                 """),
                 {"user_id": user_id, "days": days, "limit": limit}
@@ -0,0 +1,208 @@
+"""
+🔗 Conciliação entre Lançamentos e Transações Bancárias
+Pareia lançamentos (manuais ou importados) com as transações do read model
+``open_finance_transacoes`` e persiste os vínculos em ``conciliacoes``.
+
+Dois estágios:
+  1. Vínculos exatos: transações Pluggy importadas/vinculadas a um lançamento
+     (``pluggy_transactions.id_lancamento``) — um único INSERT ... SELECT;
+  2. Pareamento automático: valor em centavos igual, mesmo sentido
+     (entrada/saída), datas dentro de uma janela e descrições similares.
+     Os dois lados são ordenados por (sentido, centavos, dia) e percorridos
+     em sort-merge, então cada registro só é comparado com os poucos
+     candidatos do mesmo valor dentro da janela.
+
+Leituras (contexto da IA, agregados) consultam o read model excluindo as
+transações conciliadas: cada compra é contada uma única vez.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import exists, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import Conciliacao, Lancamento, OpenFinanceTransacao
+from gerente_financeiro.similaridade import jaccard, tokens_descricao
+
+logger = logging.getLogger(__name__)
+
+JANELA_DIAS = 3
+LIMIAR_SIMILARIDADE = 0.3
+HORIZONTE_DIAS = 180
+
+METODO_IMPORTACAO = "importacao"
+METODO_AUTOMATICO = "automatica"
+
+_TIPOS_ENTRADA = {'Receita', 'Entrada'}
+
+
+@dataclass(frozen=True)
+class RegistroConciliavel:
+    chave: Hashable       # id do lançamento ou transaction_id
+    entrada: bool
+    centavos: int
+    dia: int              # date.toordinal()
+    tokens: frozenset
+
+    @classmethod
+    def criar(cls, chave, tipo: Optional[str], valor, data, descricao: Optional[str]) -> "RegistroConciliavel":
+        if isinstance(data, datetime):
+            data = data.date()
+        return cls(
+            chave=chave,
+            entrada=tipo in _TIPOS_ENTRADA,
+            centavos=int(round(abs(float(valor or 0)) * 100)),
+            dia=data.toordinal(),
+            tokens=tokens_descricao(descricao),
+        )
+
+    @property
+    def grupo(self) -> Tuple[bool, int]:
+        return self.entrada, self.centavos
+
+
+def parear(
+    lancamentos: Sequence[RegistroConciliavel],
+    transacoes: Sequence[RegistroConciliavel],
+    janela_dias: int = JANELA_DIAS,
+    limiar: float = LIMIAR_SIMILARIDADE,
+) -> List[Tuple[Hashable, Hashable, float]]:
+    """
+    Sort-merge dos dois lados por (sentido, centavos, dia).
+
+    Um par é aceito quando a descrição atinge o limiar ou, sem texto em
+    comum, quando ele é o único candidato possível dos dois lados e as datas
+    diferem em no máximo um dia (ex.: "almoço" digitado x "PAG*RESTAURANTE").
+
+    Returns:
+        Lista de (chave do lançamento, chave da transação, similaridade)
+    """
+    ordem = lambda r: (r.grupo, r.dia)
+    esquerda = sorted(lancamentos, key=ordem)
+    direita = sorted(transacoes, key=ordem)
+    pares = []
+    i = j = 0
+    while i < len(esquerda) and j < len(direita):
+        if esquerda[i].grupo < direita[j].grupo:
+            i += 1
+            continue
+        if esquerda[i].grupo > direita[j].grupo:
+            j += 1
+            continue
+
+        # Mesmo sentido e valor: delimita os dois blocos e pareia por janela de datas
+        grupo = esquerda[i].grupo
+        fim_i, fim_j = i, j
+        while fim_i < len(esquerda) and esquerda[fim_i].grupo == grupo:
+            fim_i += 1
+        while fim_j < len(direita) and direita[fim_j].grupo == grupo:
+            fim_j += 1
+        pares.extend(_parear_bloco(esquerda[i:fim_i], direita[j:fim_j], janela_dias, limiar))
+        i, j = fim_i, fim_j
+    return pares
+
+
+def _parear_bloco(bloco_l, bloco_t, janela_dias: int, limiar: float):
+    dias_l = [r.dia for r in bloco_l]
+    dias_t = [r.dia for r in bloco_t]
+    usados = set()
+    pares = []
+    for transacao in bloco_t:
+        inicio = bisect_left(dias_l, transacao.dia - janela_dias)
+        fim = bisect_right(dias_l, transacao.dia + janela_dias)
+        candidatos = [n for n in range(inicio, fim) if n not in usados]
+        if not candidatos:
+            continue
+
+        def pontuacao(n):
+            return jaccard(bloco_l[n].tokens, transacao.tokens), -abs(bloco_l[n].dia - transacao.dia)
+
+        melhor = max(candidatos, key=pontuacao)
+        similaridade, distancia = pontuacao(melhor)
+        aceito = similaridade >= limiar
+        if not aceito and len(candidatos) == 1 and -distancia <= 1:
+            lanc = bloco_l[melhor]
+            concorrentes = bisect_right(dias_t, lanc.dia + janela_dias) - bisect_left(dias_t, lanc.dia - janela_dias)
+            aceito = concorrentes == 1
+        if aceito:
+            usados.add(melhor)
+            pares.append((bloco_l[melhor].chave, transacao.chave, round(similaridade, 3)))
+    return pares
+
+
+def _vincular_importadas(db, id_usuario: int) -> int:
+    """Estágio 1: vínculos exatos criados pela importação/deduplicação da Pluggy."""
+    result = db.execute(text("""
+        INSERT INTO conciliacoes (id_usuario, id_lancamento, transaction_id, metodo, similaridade, criado_em)
+        SELECT oft.id_usuario, pt.id_lancamento, pt.pluggy_transaction_id, :metodo, 1.0, NOW()
+        FROM pluggy_transactions pt
+        JOIN open_finance_transacoes oft ON oft.transaction_id = pt.pluggy_transaction_id
+        WHERE oft.id_usuario = :id_usuario AND pt.id_lancamento IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """), {"id_usuario": id_usuario, "metodo": METODO_IMPORTACAO})
+    return result.rowcount or 0
+
+
+def conciliar_usuario(db, id_usuario: int, horizonte_dias: int = HORIZONTE_DIAS,
+                      janela_dias: int = JANELA_DIAS, limiar: float = LIMIAR_SIMILARIDADE) -> int:
+    """
+    Concilia os registros recentes de um usuário (ID interno).
+    A transação é do chamador (não faz commit).
+
+    Returns:
+        Quantidade de vínculos novos
+    """
+    novos = _vincular_importadas(db, id_usuario)
+
+    inicio = date.today() - timedelta(days=horizonte_dias)
+    lancamentos = [
+        RegistroConciliavel.criar(lanc_id, tipo, valor, data, descricao)
+        for lanc_id, tipo, valor, data, descricao in db.query(
+            Lancamento.id, Lancamento.tipo, Lancamento.valor, Lancamento.data_transacao, Lancamento.descricao
+        ).filter(
+            Lancamento.id_usuario == id_usuario,
+            Lancamento.data_transacao >= inicio - timedelta(days=janela_dias),
+            ~exists().where(Conciliacao.id_lancamento == Lancamento.id),
+        )
+        if data is not None
+    ]
+    transacoes = [
+        RegistroConciliavel.criar(tx_id, tipo, valor, data, f"{descricao or ''} {merchant or ''}")
+        for tx_id, tipo, valor, data, descricao, merchant in db.query(
+            OpenFinanceTransacao.transaction_id, OpenFinanceTransacao.tipo, OpenFinanceTransacao.valor,
+            OpenFinanceTransacao.data, OpenFinanceTransacao.descricao, OpenFinanceTransacao.merchant_name,
+        ).filter(
+            OpenFinanceTransacao.id_usuario == id_usuario,
+            OpenFinanceTransacao.data >= inicio,
+            ~exists().where(Conciliacao.transaction_id == OpenFinanceTransacao.transaction_id),
+        )
+    ]
+
+    pares = parear(lancamentos, transacoes, janela_dias, limiar)
+    if pares:
+        # RETURNING só traz as linhas inseridas: pares que perderam a corrida
+        # para outro processo (ON CONFLICT) não entram na contagem
+        inseridos = db.execute(
+            pg_insert(Conciliacao.__table__).values([
+                {
+                    "id_usuario": id_usuario,
+                    "id_lancamento": lanc_id,
+                    "transaction_id": tx_id,
+                    "metodo": METODO_AUTOMATICO,
+                    "similaridade": similaridade,
+                }
+                for lanc_id, tx_id, similaridade in pares
+            ]).on_conflict_do_nothing().returning(Conciliacao.__table__.c.id)
+        ).all()
+        novos += len(inseridos)
+
+    if novos:
+        logger.info(f"🔗 {novos} vínculo(s) de conciliação criados para o usuário {id_usuario}")
+    return novos
+
+
+__all__ = ['RegistroConciliavel', 'conciliar_usuario', 'parear']
@@ -0,0 +1,149 @@
+"""
+📚 Catálogo de Conectores Pluggy
+Mantém a lista de bancos disponíveis em memória e em disco, com TTL e
+atualização em background, para que o fluxo /conectar_banco não precise
+buscar ~500 conectores na API a cada usuário.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .pluggy_client import PLUGGY_CACHE_DIR, PluggyClient, PluggyClientError
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL_SECONDS = int(os.getenv("PLUGGY_CATALOG_TTL_SECONDS", str(24 * 3600)))
+
+
+class ConnectorCatalog:
+    """Catálogo persistente de conectores com atualização fora do caminho crítico."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], PluggyClient] = PluggyClient,
+        path: str = os.path.join(PLUGGY_CACHE_DIR, "connectors.json"),
+        ttl_seconds: int = CATALOG_TTL_SECONDS,
+    ):
+        self._client_factory = client_factory
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connectors: List[Dict] = []
+        self._oauth_connectors: List[Dict] = []
+        self._by_id: Dict[int, Dict] = {}
+        self._fetched_at: float = 0.0
+        self.version: Optional[str] = None
+        self._load_from_disk()
+
+    # ==================== LEITURA ====================
+
+    def is_stale(self) -> bool:
+        """True se o catálogo nunca foi carregado ou passou do TTL."""
+        return not self._connectors or (time.time() - self._fetched_at) >= self.ttl_seconds
+
+    def get_connectors(self, oauth_only: bool = False) -> List[Dict]:
+        """
+        Retorna os conectores do catálogo.
+
+        Dados vencidos continuam sendo servidos (a atualização acontece em
+        background); só há chamada síncrona à API se o catálogo estiver vazio.
+        """
+        if not self._connectors:
+            self.refresh()
+        return self._oauth_connectors if oauth_only else self._connectors
+
+    def get_connector(self, connector_id: int) -> Optional[Dict]:
+        """Busca um conector pelo ID em O(1)."""
+        if not self._by_id:
+            self.get_connectors()
+        return self._by_id.get(int(connector_id))
+
+    # ==================== ATUALIZAÇÃO ====================
+
+    def refresh(self) -> bool:
+        """Busca o catálogo na Pluggy e persiste em disco (bloqueante)."""
+        with self._lock:
+            try:
+                connectors = self._client_factory().get_connectors()
+            except PluggyClientError as e:
+                logger.error(f"❌ Falha ao atualizar catálogo de conectores: {e}")
+                if not self._connectors:
+                    raise
+                return False
+
+            self._set_connectors(connectors, time.time())
+            self._write_to_disk()
+            logger.info(f"📚 Catálogo de conectores atualizado: {len(connectors)} conectores (versão {self.version})")
+            return True
+
+    async def refresh_if_stale(self) -> bool:
+        """Atualiza o catálogo em uma thread se ele estiver vencido."""
+        if not self.is_stale():
+            return False
+        return await asyncio.to_thread(self.refresh)
+
+    def _set_connectors(self, connectors: List[Dict], fetched_at: float) -> None:
+        oauth = sorted((c for c in connectors if c.get("oauth")), key=lambda c: c.get("name") or "")
+        by_id = {}
+        for c in connectors:
+            try:
+                by_id[int(c["id"])] = c
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        # Troca atômica das referências: leitores nunca veem um estado parcial
+        self._connectors = connectors
+        self._oauth_connectors = oauth
+        self._by_id = by_id
+        self._fetched_at = fetched_at
+        ids = ",".join(str(c.get("id")) for c in oauth)
+        self.version = hashlib.md5(ids.encode()).hexdigest()[:12]
+
+    # ==================== PERSISTÊNCIA ====================
+
+    def _load_from_disk(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._set_connectors(data.get("connectors", []), float(data.get("fetched_at", 0)))
+            logger.info(f"📚 Catálogo de conectores carregado do disco ({len(self._connectors)} conectores)")
+        except (OSError, ValueError):
+            logger.debug("Catálogo de conectores ainda não existe em disco")
+
+    def _write_to_disk(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self._fetched_at, "connectors": self._connectors}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível persistir o catálogo de conectores: {e}")
+
+
+_catalog: Optional[ConnectorCatalog] = None
+
+
+def get_connector_catalog() -> ConnectorCatalog:
+    """Retorna a instância compartilhada do catálogo."""
+    global _catalog
+    if _catalog is None:
+        _catalog = ConnectorCatalog()
+    return _catalog
+
+
+async def job_atualizar_catalogo_conectores(context=None) -> None:
+    """Job do JobQueue: mantém o catálogo aquecido sem travar o event loop."""
+    try:
+        await get_connector_catalog().refresh_if_stale()
+    except Exception as e:
+        logger.error(f"❌ Erro no job de atualização do catálogo de conectores: {e}")
+
+
+__all__ = ['ConnectorCatalog', 'get_connector_catalog', 'job_atualizar_catalogo_conectores']
@@ -1,143 +1,325 @@
 """
 🔄 Sincronizador Automático de Dados Bancários
-Job que roda periodicamente para atualizar saldos e transações
+Agendador único de atualização dos items Pluggy, executado pelo JobQueue do bot.
+
+Cada ``PluggyItem`` tem um "próximo vencimento" numa fila de prioridade (heap).
+O vencimento vem de:
+  - atividade do usuário: quem usa o bot com frequência é atualizado mais vezes;
+  - defasagem: quanto mais tempo sem atualizar, mais cedo o item é escolhido;
+  - histórico de erros: LOGIN_ERROR/OUTDATED e falhas de rede recuam com
+    backoff exponencial em vez de serem repetidos a cada rodada.
+
+A cada tick, apenas uma cota proporcional ao número de items é processada e
+cada item recebe uma fase fixa (derivada do seu ID), espalhando as atualizações
+ao longo do tempo em vez de disparar todos os items na mesma hora.
 """
 
+import asyncio
+import heapq
 import logging
-from datetime import datetime
-from open_finance.bank_connector import BankConnector
+import math
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
 from telegram.ext import ContextTypes
+
 from database.database import get_db
-from models import PluggyItem
+from metricas import medir_job
+from models import PluggyItem, Usuario
+from .conciliacao import conciliar_usuario
+from .item_watcher import READY_STATUSES
 
 logger = logging.getLogger(__name__)
 
+# Status que entram no agendamento
+SYNCABLE_STATUSES = ['UPDATED', 'PARTIAL_SUCCESS', 'HEALTHY', 'UPDATING', 'LOGIN_ERROR', 'OUTDATED']
+# Status que exigem ação do usuário ou estão desatualizados na Pluggy: recuam com backoff
+BACKOFF_STATUSES = {'LOGIN_ERROR', 'OUTDATED'}
+
+# Intervalos por nível de atividade do usuário (segundos)
+INTERVALO_ATIVO = 4 * 3600        # usou o bot nos últimos 3 dias
+INTERVALO_REGULAR = 12 * 3600     # usou nos últimos 14 dias
+INTERVALO_INATIVO = 24 * 3600     # demais
+INTERVALO_PROCESSANDO = 15 * 60   # item ainda em UPDATING na Pluggy
+
+BACKOFF_BASE = 3600
+BACKOFF_MAX = 3 * 24 * 3600
+
+
+@dataclass
+class _ItemAgendado:
+    item_id: int
+    telegram_id: int
+    status: str
+    ultimo_login: Optional[date]
+    referencia: float  # Última atualização (ou tentativa) em epoch
+    falhas: int = 0
+
 
 class DataSynchronizer:
-    """Sincronizador automático de dados bancários"""
-    
-    def __init__(self):
-        self.connector = BankConnector()
-    
-    async def sync_all_connections(self, context: ContextTypes.DEFAULT_TYPE | None = None):
-        """
-        Sincroniza todas as conexões ativas
-        Chamado automaticamente via APScheduler
-        """
-        logger.info("🔄 Iniciando sincronização automática de dados bancários...")
-        
+    """Agendador de atualização dos items Pluggy com fila de prioridade."""
+
+    def __init__(
+        self,
+        tick_seconds: int = 60,
+        reload_seconds: int = 900,
+        max_concurrent: int = 3,
+        days: int = 7,
+    ):
+        self.tick_seconds = tick_seconds
+        self.reload_seconds = reload_seconds
+        self.max_concurrent = max_concurrent
+        self.days = days
+        self._itens: Dict[int, _ItemAgendado] = {}
+        self._vencimentos: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._ultimo_reload: Optional[float] = None
+        self._em_execucao = False
+
+    # ==================== PRIORIDADE ====================
+
+    @staticmethod
+    def _intervalo_por_atividade(ultimo_login) -> int:
+        if not ultimo_login:
+            return INTERVALO_INATIVO
+        dias = (datetime.now().date() - ultimo_login).days
+        if dias <= 3:
+            return INTERVALO_ATIVO
+        if dias <= 14:
+            return INTERVALO_REGULAR
+        return INTERVALO_INATIVO
+
+    @staticmethod
+    def _fase(item_id: int, intervalo: float) -> float:
+        """Deslocamento fixo por item (até 10% do intervalo) para não sincronizar todos juntos."""
+        return ((item_id * 2654435761) % 1000) / 1000 * 0.1 * intervalo
+
+    def _calcular_vencimento(self, estado: _ItemAgendado) -> float:
+        if estado.status in BACKOFF_STATUSES or estado.falhas:
+            expoente = max(estado.falhas - 1, 0)
+            intervalo = min(BACKOFF_BASE * (2 ** expoente), BACKOFF_MAX)
+        elif estado.status == 'UPDATING':
+            intervalo = INTERVALO_PROCESSANDO
+        else:
+            intervalo = self._intervalo_por_atividade(estado.ultimo_login)
+        return estado.referencia + intervalo + self._fase(estado.item_id, intervalo)
+
+    def _agendar(self, estado: _ItemAgendado) -> None:
+        vencimento = self._calcular_vencimento(estado)
+        self._itens[estado.item_id] = estado
+        self._vencimentos[estado.item_id] = vencimento
+        heapq.heappush(self._heap, (vencimento, estado.item_id))
+
+    def _descartar(self, item_id: int) -> None:
+        self._itens.pop(item_id, None)
+        self._vencimentos.pop(item_id, None)
+
+    def _retirar_vencidos(self, agora: float, limite: int) -> List[int]:
+        """Retira até ``limite`` items vencidos do heap (entradas obsoletas são ignoradas)."""
+        vencidos = []
+        while self._heap and len(vencidos) < limite:
+            vencimento, item_id = self._heap[0]
+            if self._vencimentos.get(item_id) != vencimento:
+                heapq.heappop(self._heap)  # Reagendado ou removido
+                continue
+            if vencimento > agora:
+                break
+            heapq.heappop(self._heap)
+            self._vencimentos.pop(item_id, None)
+            vencidos.append(item_id)
+        return vencidos
+
+    def _cota_por_tick(self) -> int:
+        """Capacidade suficiente para atualizar todos no ritmo mais rápido, distribuída por tick."""
+        return max(1, math.ceil(len(self._itens) * self.tick_seconds / INTERVALO_ATIVO))
+
+    # ==================== CARGA ====================
+
+    @staticmethod
+    def _consultar_itens() -> List[Tuple]:
+        """Lê do banco os items elegíveis (bloqueante, roda em thread)."""
         db = next(get_db())
         try:
-            # Buscar todas as conexões ativas do Pluggy
-            connections = (
-                db.query(PluggyItem)
-                .filter(PluggyItem.status.in_(['UPDATED', 'LOGIN_ERROR', 'OUTDATED']))
-                .order_by(PluggyItem.last_updated_at.asc())
-                .limit(100)
+            return (
+                db.query(PluggyItem.id, PluggyItem.status, PluggyItem.last_updated_at,
+                         Usuario.telegram_id, Usuario.ultimo_login)
+                .join(Usuario, Usuario.id == PluggyItem.id_usuario)
+                .filter(PluggyItem.status.in_(SYNCABLE_STATUSES))
                 .all()
             )
-            
-            if not connections:
-                logger.info("ℹ️ Nenhuma conexão para sincronizar")
+        finally:
+            db.close()
+
+    def _carregar_itens(self, rows: List[Tuple]) -> None:
+        """Mescla os items lidos do banco na agenda, preservando o histórico de falhas em memória."""
+        ativos = set()
+        for item_id, status, last_updated_at, telegram_id, ultimo_login in rows:
+            ativos.add(item_id)
+            anterior = self._itens.get(item_id)
+            if anterior and item_id in self._vencimentos:
+                # Já agendado: só atualiza metadados que influenciam a próxima rodada
+                anterior.ultimo_login = ultimo_login
+                continue
+            if anterior:
+                continue  # Em execução neste momento
+            if status in BACKOFF_STATUSES:
+                # Sem registro da última tentativa: conta a partir de agora, para
+                # que items com erro não furem a fila dos items saudáveis defasados
+                referencia = time.time()
+            else:
+                referencia = last_updated_at.timestamp() if last_updated_at else 0.0
+            self._agendar(_ItemAgendado(
+                item_id=item_id,
+                telegram_id=telegram_id,
+                status=status,
+                ultimo_login=ultimo_login,
+                referencia=referencia,
+                falhas=1 if status in BACKOFF_STATUSES else 0,
+            ))
+
+        for item_id in list(self._itens):
+            if item_id not in ativos:
+                self._descartar(item_id)
+
+        self._ultimo_reload = time.monotonic()
+        logger.info(f"🔄 Agenda Open Finance carregada: {len(self._itens)} items")
+
+    # ==================== EXECUÇÃO ====================
+
+    def _atualizar_item(self, item_id: int) -> Optional[Tuple[str, int]]:
+        """Consulta o item na Pluggy e, se pronto, sincroniza suas transações (bloqueante)."""
+        from .service import OpenFinanceService
+
+        db = next(get_db())
+        try:
+            item = db.get(PluggyItem, item_id)
+            if not item:
+                return None
+            service = OpenFinanceService(db)
+            item_data = service.client.get_item(item.pluggy_item_id)
+            item.status = item_data.get('status', item.status)
+            item.status_detail = str(item_data.get('statusDetail') or '') or None
+            item.execution_status = item_data.get('executionStatus', item.execution_status)
+
+            novas = 0
+            if item.status in READY_STATUSES:
+                novas = service.sync_transactions_for_item(item, days=self.days, commit=False)
+                item.last_updated_at = datetime.now()
+                # Sempre concilia: lançamentos digitados desde a última rodada
+                # podem casar com transações que já estavam no read model
+                conciliar_usuario(db, item.id_usuario)
+            db.commit()
+            return item.status, novas
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _processar(self, item_id: int, semaforo: asyncio.Semaphore, context) -> None:
+        estado = self._itens.get(item_id)
+        if not estado:
+            return
+        async with semaforo:
+            try:
+                resultado = await asyncio.to_thread(self._atualizar_item, item_id)
+            except Exception as e:
+                estado.falhas += 1
+                estado.referencia = time.time()
+                logger.warning(f"⚠️ Falha ao atualizar item {item_id} (tentativa {estado.falhas}): {e}")
+                self._agendar(estado)
                 return
-            
-            success_count = 0
-            error_count = 0
-            
-            for item in connections:
-                try:
-                    logger.info(f"🔄 Sincronizando {item.connector_name} (user {item.id_usuario})...")
-                    
-                    # O sync é feito via handler Open Finance
-                    # Aqui apenas logamos - a sincronização real acontece via /sincronizar
-                    # Este job é apenas um lembrete/verificação
-                    
-                    success_count += 1
-                    logger.info(f"✅ {item.connector_name} verificado")
-                    
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"❌ Erro ao verificar {item.connector_name}: {e}", exc_info=True)
-            
-            logger.info(
-                f"✅ Sincronização concluída: "
-                f"{success_count} sucesso, {error_count} erros"
+
+        if resultado is None:
+            self._descartar(item_id)
+            return
+
+        status, novas = resultado
+        estado.status = status
+        estado.referencia = time.time()
+        estado.falhas = estado.falhas + 1 if status in BACKOFF_STATUSES else 0
+        if status in SYNCABLE_STATUSES:
+            self._agendar(estado)
+        else:
+            self._descartar(item_id)
+
+        if novas and context is not None:
+            await self._notificar_novas(context, estado.telegram_id, novas)
+
+    @staticmethod
+    async def _notificar_novas(context, telegram_id: int, novas: int) -> None:
+        try:
+            await context.bot.send_message(
+                chat_id=telegram_id,
+                text=(
+                    f"🔔 *Nova\\(s\\) transação\\(ões\\)\\!*\n\n"
+                    f"Encontrei *{novas} nova\\(s\\) transação\\(ões\\)* nas suas contas\\.\n\n"
+                    f"Use /importar\\_transacoes para revisar e importar\\."
+                ),
+                parse_mode="MarkdownV2"
             )
-            
+        except Exception as e:
+            logger.error(f"❌ Erro ao notificar usuário {telegram_id}: {e}")
+
+    async def sync_all_connections(self, context: ContextTypes.DEFAULT_TYPE | None = None):
+        """
+        Tick do agendador (JobQueue): atualiza a cota de items vencidos.
+        Nunca propaga exceções para não derrubar o job.
+        """
+        if self._em_execucao:
+            logger.debug("Tick de sincronização anterior ainda em andamento")
+            return
+        self._em_execucao = True
+        try:
+            if self._ultimo_reload is None or time.monotonic() - self._ultimo_reload >= self.reload_seconds:
+                self._carregar_itens(await asyncio.to_thread(self._consultar_itens))
+
+            vencidos = self._retirar_vencidos(time.time(), self._cota_por_tick())
+            if not vencidos:
+                return
+
+            logger.info(f"🔄 Atualizando {len(vencidos)} item(s) Open Finance ({len(self._heap)} na fila)")
+            semaforo = asyncio.Semaphore(self.max_concurrent)
+            await asyncio.gather(*(self._processar(item_id, semaforo, context) for item_id in vencidos))
         except Exception as e:
             logger.error(f"❌ Erro na sincronização automática: {e}", exc_info=True)
-            # NÃO fazer raise - isso quebraria o job scheduler
         finally:
-            db.close()
-    
+            self._em_execucao = False
+
     async def sync_user_connections(self, user_id: int):
         """
-        Sincroniza todas as conexões de um usuário específico
-        
+        Antecipa a atualização de todas as conexões de um usuário específico
+
         Args:
             user_id: ID do usuário (telegram_id)
         """
-        logger.info(f"🔄 Sincronizando conexões do usuário {user_id}...")
-        
-        db = next(get_db())
-        try:
-            # Buscar conexões do usuário
-            from models import Usuario
-            usuario = db.query(Usuario).filter(Usuario.telegram_id == user_id).first()
-            
-            if not usuario:
-                logger.warning(f"⚠️ Usuário {user_id} não encontrado")
-                return
-            
-            connections = db.query(PluggyItem).filter(PluggyItem.id_usuario == usuario.id).all()
-            
-            for item in connections:
-                try:
-                    logger.info(f"✅ Conexão {item.connector_name} verificada")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao verificar {item.connector_name}: {e}")
-            
-            logger.info(f"✅ Sincronização do usuário {user_id} concluída")
-            
-        except Exception as e:
-            logger.error(f"❌ Erro ao sincronizar usuário {user_id}: {e}")
-            raise
-        finally:
-            db.close()
+        agora = time.time()
+        antecipados = 0
+        for estado in self._itens.values():
+            if estado.telegram_id == user_id and estado.item_id in self._vencimentos:
+                self._vencimentos[estado.item_id] = agora
+                heapq.heappush(self._heap, (agora, estado.item_id))
+                antecipados += 1
+        logger.info(f"🔄 {antecipados} conexão(ões) do usuário {user_id} antecipadas na fila")
+
+    def start(self, job_queue) -> None:
+        """Registra o tick no JobQueue do bot (único agendador de sincronização)."""
+        job_queue.run_repeating(
+            medir_job(self.sync_all_connections),
+            interval=self.tick_seconds,
+            first=30,
+            name="open_finance_sync_scheduler"
+        )
+
+
+_synchronizer: Optional[DataSynchronizer] = None
 
 
-# ==================== Funções para APScheduler ====================
-
-def schedule_daily_sync():
-    """
-    Configura job diário de sincronização
-    Chamar no startup do bot
-    """
-    from apscheduler.schedulers.asyncio import AsyncIOScheduler
-    from apscheduler.triggers.cron import CronTrigger
-    
-    scheduler = AsyncIOScheduler()
-    synchronizer = DataSynchronizer()
-    
-    # Sincronizar todos os dias às 6h da manhã
-    scheduler.add_job(
-        synchronizer.sync_all_connections,
-        trigger=CronTrigger(hour=6, minute=0),
-        id='daily_bank_sync',
-        name='Sincronização Diária de Bancos',
-        replace_existing=True
-    )
-    
-    # Também rodar a cada 6 horas
-    scheduler.add_job(
-        synchronizer.sync_all_connections,
-        trigger=CronTrigger(hour='*/6'),
-        id='periodic_bank_sync',
-        name='Sincronização Periódica de Bancos',
-        replace_existing=True
-    )
-    
-    scheduler.start()
-    logger.info("✅ Sincronização automática agendada")
-    
-    return scheduler
+def get_data_synchronizer() -> DataSynchronizer:
+    """Retorna a instância compartilhada do agendador."""
+    global _synchronizer
+    if _synchronizer is None:
+        _synchronizer = DataSynchronizer()
+    return _synchronizer
@@ -0,0 +1,206 @@
+"""
+⏳ Observador Assíncrono de Items Pluggy
+Acompanha o status de conexões bancárias sem bloquear o event loop do bot.
+
+Cada item observado é uma task asyncio que dorme entre as consultas (com
+backoff exponencial e jitter) e executa a chamada HTTP bloqueante em uma
+thread via ``asyncio.to_thread``. Assim, centenas de usuários conectando ao
+mesmo tempo custam apenas algumas tasks adormecidas no loop.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from .pluggy_client import PluggyClient
+
+logger = logging.getLogger(__name__)
+
+# Status finais reconhecidos (Pluggy usa UPDATED; conectores antigos retornam HEALTHY)
+READY_STATUSES = {"HEALTHY", "UPDATED", "PARTIAL_SUCCESS"}
+USER_INPUT_STATUSES = {"WAITING_USER_INPUT"}
+ERROR_STATUSES = {"LOGIN_ERROR", "INVALID_CREDENTIALS", "ERROR", "SUSPENDED"}
+
+# Eventos entregues ao callback de notificação
+EVENT_READY = "ready"
+EVENT_USER_INPUT = "user_input"
+EVENT_ERROR = "error"
+EVENT_TIMEOUT = "timeout"
+
+NotifyCallback = Callable[[str, Dict], Awaitable[None]]
+
+_SEM_PEDIDO = object()
+
+
+def classificar_status_item(item: Dict) -> Optional[str]:
+    """
+    Traduz o status de um item da Pluggy para um evento do observador.
+
+    Returns:
+        EVENT_READY, EVENT_USER_INPUT, EVENT_ERROR ou None (ainda processando)
+    """
+    status = (item or {}).get('status')
+    if status in READY_STATUSES:
+        return EVENT_READY
+    if status in USER_INPUT_STATUSES:
+        return EVENT_USER_INPUT
+    if status in ERROR_STATUSES:
+        return EVENT_ERROR
+    return None
+
+
+class ItemReadinessWatcher:
+    """Observa items da Pluggy em background e notifica quando atingem um estado final."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], PluggyClient] = PluggyClient,
+        initial_interval: float = 2.0,
+        max_interval: float = 30.0,
+        backoff: float = 1.6,
+        timeout: float = 600.0,
+    ):
+        self._client_factory = client_factory
+        self._client: Optional[PluggyClient] = None
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_client(self) -> PluggyClient:
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def _fetch_item(self, item_id: str) -> Dict:
+        return self._get_client().get_item(item_id)
+
+    def is_watching(self, item_id: str) -> bool:
+        """Indica se o item já possui um observador ativo."""
+        task = self._tasks.get(item_id)
+        return task is not None and not task.done()
+
+    def watch(self, item_id: str, notify: NotifyCallback, timeout: Optional[float] = None,
+              autorizacao_enviada: bool = False) -> asyncio.Task:
+        """
+        Inicia (ou reaproveita) a observação de um item.
+
+        Args:
+            item_id: ID do item na Pluggy
+            notify: Corrotina chamada uma única vez com (evento, item)
+            timeout: Tempo máximo de observação em segundos
+            autorizacao_enviada: O usuário já concluiu o pedido atual do banco ("Já autorizei"):
+                WAITING_USER_INPUT com o mesmo pedido continua sendo aguardado e só um
+                pedido novo (outro ``parameter``/URL) é notificado
+
+        Returns:
+            A task asyncio responsável pela observação
+        """
+        if self.is_watching(item_id):
+            logger.info(f"👀 Item {item_id} já está sendo observado")
+            return self._tasks[item_id]
+
+        task = asyncio.create_task(
+            self._run(item_id, notify, timeout or self.timeout, autorizacao_enviada),
+            name=f"pluggy_item_watch_{item_id}",
+        )
+        self._tasks[item_id] = task
+        task.add_done_callback(lambda t: self._forget(item_id, t))
+        return task
+
+    def _forget(self, item_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(item_id) is task:
+            self._tasks.pop(item_id, None)
+
+    def cancel(self, item_id: str) -> bool:
+        """Cancela a observação de um item. Retorna True se havia algo a cancelar."""
+        task = self._tasks.pop(item_id, None)
+        if task and not task.done():
+            task.cancel()
+            logger.info(f"🛑 Observação do item {item_id} cancelada")
+            return True
+        return False
+
+    async def shutdown(self) -> None:
+        """Cancela todas as observações pendentes (usado no desligamento do bot)."""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, item_id: str, notify: NotifyCallback, timeout: float,
+                   autorizacao_enviada: bool = False) -> Optional[str]:
+        start = time.monotonic()
+        interval = self.initial_interval
+        last_status = None
+        item: Dict = {}
+        pedido_respondido = _SEM_PEDIDO
+
+        try:
+            while time.monotonic() - start < timeout:
+                try:
+                    item = await asyncio.to_thread(self._fetch_item, item_id)
+                except Exception as e:
+                    # Falhas transitórias de rede não encerram a observação
+                    logger.warning(f"⚠️ Falha ao consultar item {item_id}: {e}")
+                    item = {}
+
+                status = item.get('status')
+                if status and status != last_status:
+                    logger.info(f"⌛ Status item {item_id}: {status} (detail={item.get('statusDetail')})")
+                    last_status = status
+
+                evento = classificar_status_item(item)
+                if evento == EVENT_USER_INPUT and autorizacao_enviada:
+                    # O banco ainda não processou a autorização que o usuário acabou de concluir
+                    if pedido_respondido is _SEM_PEDIDO:
+                        pedido_respondido = item.get('parameter')
+                    if item.get('parameter') == pedido_respondido:
+                        evento = None
+                if evento:
+                    await self._notify(notify, evento, item, item_id)
+                    return evento
+
+                # Backoff exponencial com jitter para espalhar as consultas
+                await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+                interval = min(interval * self.backoff, self.max_interval)
+
+            await self._notify(notify, EVENT_TIMEOUT, item, item_id)
+            return EVENT_TIMEOUT
+        except asyncio.CancelledError:
+            logger.debug(f"Observação do item {item_id} interrompida")
+            raise
+
+    @staticmethod
+    async def _notify(notify: NotifyCallback, evento: str, item: Dict, item_id: str) -> None:
+        try:
+            await notify(evento, item)
+        except Exception as e:
+            logger.error(f"❌ Erro ao notificar evento '{evento}' do item {item_id}: {e}", exc_info=True)
+
+
+_watcher: Optional[ItemReadinessWatcher] = None
+
+
+def get_item_watcher() -> ItemReadinessWatcher:
+    """Retorna a instância compartilhada do observador de items."""
+    global _watcher
+    if _watcher is None:
+        _watcher = ItemReadinessWatcher()
+    return _watcher
+
+
+__all__ = [
+    'ItemReadinessWatcher',
+    'get_item_watcher',
+    'classificar_status_item',
+    'EVENT_READY',
+    'EVENT_USER_INPUT',
+    'EVENT_ERROR',
+    'EVENT_TIMEOUT',
+]
@@ -7,19 +7,36 @@ gerenciando autenticação, requisições e tratamento de erros de API.
 Este módulo é agnóstico ao Telegram e ao nosso banco de dados.
 """
 import os
+import asyncio
+import itertools
 import logging
+import tempfile
+import threading
 import time
-from typing import Dict, List, Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
 from datetime import datetime, timedelta
 
+try:
+    import fcntl  # Lock entre processos (workers do gunicorn, bot + dashboard)
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
 import requests
 from requests import Response
 import json # Adicionado para o decode de erro
 
+import metricas
+
 # Configurações
 PLUGGY_CLIENT_ID = os.getenv("PLUGGY_CLIENT_ID")
 PLUGGY_CLIENT_SECRET = os.getenv("PLUGGY_CLIENT_SECRET")
 PLUGGY_BASE_URL = "https://api.pluggy.ai"
+TRANSACTIONS_PAGE_SIZE = 500
+# Quantas páginas de transações podem estar em voo ao mesmo tempo por conta
+TRANSACTIONS_PAGE_WINDOW = int(os.getenv("PLUGGY_PAGE_WINDOW", "4"))
+PLUGGY_CACHE_DIR = os.getenv("PLUGGY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "contacomigo_pluggy"))
 
 
 logger = logging.getLogger(__name__)
@@ -44,10 +61,6 @@ def log_aviso(msg):
 def log_destaque(msg):
     logger.info(f"\033[1;36m✨ {msg}\033[0m")
 
-# Cache em memória para a API Key
-_api_key_cache: Dict[str, any] = {"key": None, "expires_at": None}
-
-
 class PluggyClientError(Exception):
     """Exceção base para erros do cliente Pluggy."""
     def __init__(self, message: str, status_code: Optional[int] = None, details: Optional[Dict] = None):
@@ -55,20 +68,93 @@ class PluggyClientError(Exception):
         self.status_code = status_code
         self.details = details or {}
 
-class PluggyClient:
-    """Um cliente HTTP para a API da Pluggy."""
+class ApiKeyProvider:
+    """
+    Fornece a API Key da Pluggy compartilhada entre threads e processos.
+
+    - Em memória: leitura sem lock enquanto a chave estiver fresca.
+    - Em disco: a chave é persistida (permissão 0600) para que outros processos
+      reaproveitem a mesma autenticação.
+    - Renovação antecipada: a chave é trocada `refresh_margin` antes de expirar,
+      e apenas um processo/thread faz a chamada /auth por vez (flock + Lock).
+    """
 
-    def __init__(self, timeout: int = 45):
+    def __init__(
+        self,
+        ttl: timedelta = timedelta(hours=23),
+        refresh_margin: timedelta = timedelta(minutes=30),
+        cache_dir: str = PLUGGY_CACHE_DIR,
+        timeout: int = 45,
+    ):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
         self.timeout = timeout
-        self.api_key = self._get_api_key()
+        self._path = os.path.join(cache_dir, "api_key.json")
+        self._lock_path = os.path.join(cache_dir, "api_key.lock")
+        self._thread_lock = threading.Lock()
+        self._key: Optional[str] = None
+        self._expires_at: Optional[datetime] = None
 
-    def _get_api_key(self) -> str:
-        """Obtém uma API Key da Pluggy, utilizando um cache de 23 horas."""
-        now = datetime.now()
-        if _api_key_cache.get("key") and _api_key_cache.get("expires_at", now) > now:
-            log_destaque("API Key Pluggy recuperada do cache.")
-            return _api_key_cache["key"]
+    def _is_fresh(self, expires_at: Optional[datetime]) -> bool:
+        return bool(expires_at) and expires_at - self.refresh_margin > datetime.now()
+
+    def get(self) -> str:
+        """Retorna uma API Key válida, renovando se estiver perto de expirar."""
+        if self._key and self._is_fresh(self._expires_at):
+            return self._key
+
+        with self._thread_lock:
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            if self._key and self._is_fresh(self._expires_at):
+                return self._key
+
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    key, expires_at = self._read_disk()
+                    if key and self._is_fresh(expires_at):
+                        log_destaque("API Key Pluggy recuperada do cache compartilhado.")
+                    else:
+                        key, expires_at = self._request_new_key()
+                        self._write_disk(key, expires_at)
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            self._key, self._expires_at = key, expires_at
+            return key
+
+    def invalidate(self) -> None:
+        """Descarta a chave atual (ex.: após um 401 da API)."""
+        with self._thread_lock:
+            self._key = None
+            self._expires_at = None
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def _read_disk(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["key"], datetime.fromisoformat(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None, None
 
+    def _write_disk(self, key: str, expires_at: datetime) -> None:
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires_at": expires_at.isoformat()}, f)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            log_aviso(f"Não foi possível persistir a API Key da Pluggy: {e}")
+
+    def _request_new_key(self):
         log_destaque("🔑 Solicitando nova API Key da Pluggy...")
         if not PLUGGY_CLIENT_ID or not PLUGGY_CLIENT_SECRET:
             log_erro("PLUGGY_CLIENT_ID e PLUGGY_CLIENT_SECRET devem ser configurados.")
@@ -83,14 +169,33 @@ class PluggyClient:
             )
             response.raise_for_status()
             data = response.json()
-            _api_key_cache["key"] = data["apiKey"]
-            _api_key_cache["expires_at"] = now + timedelta(hours=23)
             log_sucesso("API Key da Pluggy obtida e cacheada com sucesso.")
-            return data["apiKey"]
+            return data["apiKey"], datetime.now() + self.ttl
         except requests.exceptions.RequestException as e:
             log_erro(f"Erro de rede ao obter API Key da Pluggy: {e}")
             raise PluggyClientError(f"Erro de rede ao autenticar com a Pluggy: {e}")
 
+
+# Provedor único por processo (o cache em disco cobre os demais processos)
+api_key_provider = ApiKeyProvider()
+
+
+class PluggyClient:
+    """Um cliente HTTP para a API da Pluggy."""
+
+    def __init__(self, timeout: int = 45, key_provider: Optional[ApiKeyProvider] = None):
+        self.timeout = timeout
+        # A chave é resolvida sob demanda: instanciar o cliente não faz I/O
+        self._key_provider = key_provider or api_key_provider
+
+    @property
+    def api_key(self) -> str:
+        return self._key_provider.get()
+
+    def _get_api_key(self) -> str:
+        """Obtém uma API Key da Pluggy através do provedor compartilhado."""
+        return self._key_provider.get()
+
     def _request(self, method: str, endpoint: str, **kwargs) -> Response:
         """Executa uma requisição autenticada para a API da Pluggy."""
         url = f"{PLUGGY_BASE_URL}{endpoint}"
@@ -100,32 +205,38 @@ class PluggyClient:
             **kwargs.pop("headers", {})
         }
 
-        try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=headers,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response
-        except requests.exceptions.HTTPError as e:
-            details = {}
+        # Rótulo pelo recurso (/items, /accounts...), sem IDs, para não explodir a cardinalidade
+        operacao = f"{method.upper()} /{endpoint.split('?')[0].strip('/').split('/')[0]}"
+        with metricas.cronometrar(metricas.EXTERNO_DURACAO, metricas.EXTERNO_ERROS,
+                                  servico="pluggy", operacao=operacao):
             try:
-                details = e.response.json()
-            except json.JSONDecodeError:
-                details = {"raw_response": e.response.text}
+                response = requests.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+                response.raise_for_status()
+                return response
+            except requests.exceptions.HTTPError as e:
+                details = {}
+                try:
+                    details = e.response.json()
+                except json.JSONDecodeError:
+                    details = {"raw_response": e.response.text}
             
-            logger.error(f"❌ Erro HTTP {e.response.status_code} em {method} {endpoint}: {details}")
-            raise PluggyClientError(
-                f"Erro na API Pluggy: {details.get('message', e.response.reason)}",
-                status_code=e.response.status_code,
-                details=details
-            )
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Erro de rede em {method} {endpoint}: {e}")
-            raise PluggyClientError(f"Erro de rede ao comunicar com a Pluggy: {e}")
+                logger.error(f"❌ Erro HTTP {e.response.status_code} em {method} {endpoint}: {details}")
+                if e.response.status_code in (401, 403):
+                    self._key_provider.invalidate()
+                raise PluggyClientError(
+                    f"Erro na API Pluggy: {details.get('message', e.response.reason)}",
+                    status_code=e.response.status_code,
+                    details=details
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"❌ Erro de rede em {method} {endpoint}: {e}")
+                raise PluggyClientError(f"Erro de rede ao comunicar com a Pluggy: {e}")
 
     # --- MÉTODOS DE SERVIÇO ---
 
@@ -171,27 +282,101 @@ class PluggyClient:
         log_sucesso(f"Detalhes do cartão de crédito {account_id} obtidos.")
         return response.json()
 
+    def _fetch_transactions_page(self, account_id: str, from_date: str, page: int, page_size: int = TRANSACTIONS_PAGE_SIZE) -> Dict:
+        """Busca uma única página de transações de uma conta."""
+        params = {
+            "accountId": account_id,
+            "from": from_date,
+            "pageSize": page_size,
+            "page": page
+        }
+        return self._request("GET", "/transactions", params=params).json()
+
+    def iter_transaction_pages(self, account_id: str, from_date: str, max_workers: int = TRANSACTIONS_PAGE_WINDOW) -> Iterator[List[Dict]]:
+        """
+        Gera as transações de uma conta página a página.
+
+        A primeira página revela ``totalPages``; as seguintes são buscadas em
+        paralelo numa janela limitada de ``max_workers`` requisições. As páginas
+        são entregues em ordem e no máximo ``max_workers`` ficam em memória.
+        """
+        log_destaque(f"Listando transações da conta {account_id} a partir de {from_date}...")
+        first = self._fetch_transactions_page(account_id, from_date, 1)
+        results = first.get("results", [])
+        if not results:
+            return
+        yield results
+
+        total_pages = first.get("totalPages", 1) or 1
+        if total_pages <= 1:
+            return
+
+        pending_pages = iter(range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pluggy_tx") as executor:
+            window: Deque[Future] = deque()
+            for page in itertools.islice(pending_pages, max_workers):
+                window.append(executor.submit(self._fetch_transactions_page, account_id, from_date, page))
+            try:
+                while window:
+                    data = window.popleft().result()
+                    next_page = next(pending_pages, None)
+                    if next_page is not None:
+                        window.append(executor.submit(self._fetch_transactions_page, account_id, from_date, next_page))
+                    page_results = data.get("results", [])
+                    if page_results:
+                        yield page_results
+            finally:
+                # Consumidor interrompeu (ou erro): descarta o que ainda não começou
+                for future in window:
+                    future.cancel()
+
+    async def aiter_transaction_pages(self, account_id: str, from_date: str, concurrency: int = TRANSACTIONS_PAGE_WINDOW) -> AsyncIterator[List[Dict]]:
+        """
+        Versão assíncrona de ``iter_transaction_pages``.
+
+        As requisições rodam em threads (``asyncio.to_thread``) com no máximo
+        ``concurrency`` páginas em voo, e cada página é entregue assim que fica
+        pronta para que a ingestão se sobreponha ao download das demais.
+        """
+        log_destaque(f"Listando transações da conta {account_id} a partir de {from_date} (assíncrono)...")
+        first = await asyncio.to_thread(self._fetch_transactions_page, account_id, from_date, 1)
+        results = first.get("results", [])
+        if not results:
+            return
+        yield results
+
+        total_pages = first.get("totalPages", 1) or 1
+        if total_pages <= 1:
+            return
+
+        pending_pages = iter(range(2, total_pages + 1))
+        in_flight = set()
+
+        def _schedule(page: int) -> None:
+            in_flight.add(asyncio.ensure_future(
+                asyncio.to_thread(self._fetch_transactions_page, account_id, from_date, page)
+            ))
+
+        for page in itertools.islice(pending_pages, max(1, concurrency)):
+            _schedule(page)
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    in_flight.discard(task)
+                    next_page = next(pending_pages, None)
+                    if next_page is not None:
+                        _schedule(next_page)
+                for task in done:
+                    page_results = task.result().get("results", [])
+                    if page_results:
+                        yield page_results
+        finally:
+            for task in in_flight:
+                task.cancel()
+
     def list_transactions(self, account_id: str, from_date: str) -> List[Dict]:
         """Lista TODAS as transações de uma conta a partir de uma data, tratando paginação."""
-        log_destaque(f"Listando transações da conta {account_id} a partir de {from_date}...")
-        all_transactions = []
-        page = 1
-        while True:
-            params = {
-                "accountId": account_id, 
-                "from": from_date, 
-                "pageSize": 500,
-                "page": page
-            }
-            response = self._request("GET", "/transactions", params=params)
-            data = response.json()
-            results = data.get("results", [])
-            if not results:
-                break
-            all_transactions.extend(results)
-            if data.get("totalPages", 1) > page:
-                page += 1
-            else:
-                break
+        all_transactions = [tx for page in self.iter_transaction_pages(account_id, from_date) for tx in page]
         log_sucesso(f"Total de {len(all_transactions)} transações encontradas para a conta {account_id}.")
         return all_transactions
@@ -0,0 +1,348 @@
+"""
+📖 Read Model de Transações Open Finance
+Mantém a tabela desnormalizada ``open_finance_transacoes`` (models.OpenFinanceTransacao).
+
+Existem duas origens de dados bancários no projeto: o schema ORM
+``pluggy_*`` (OpenFinanceService) e o schema SQL ``bank_*`` (BankConnector).
+A ingestão de ambos chama as funções deste módulo a cada página recebida,
+e as leituras (contexto da IA, listagens) consultam apenas o read model
+por (id_usuario, data).
+"""
+
+import logging
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import exists, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from gerente_financeiro.campos_derivados import campos_derivados_transacao
+from models import Conciliacao, OpenFinanceTransacao
+
+logger = logging.getLogger(__name__)
+
+FONTE_PLUGGY = "pluggy"
+FONTE_BANK_CONNECTOR = "bank_connector"
+
+CATEGORIA_PADRAO = "Outros"
+
+# Categorias da Pluggy (inglês) -> categorias do app (database.popular_dados_iniciais)
+CATEGORIAS_PLUGGY = {
+    "income": "Receitas",
+    "salary": "Receitas",
+    "retirement": "Receitas",
+    "entrepreneurial activities": "Receitas",
+    "government aid": "Receitas",
+    "non-recurring income": "Receitas",
+    "investments": "Investimentos",
+    "fixed income": "Investimentos",
+    "variable income": "Investimentos",
+    "same person transfer": "Transferência",
+    "transfers": "Transferência",
+    "transfer - pix": "Transferência",
+    "transfer - ted": "Transferência",
+    "transfer - doc": "Transferência",
+    "credit card payment": "Transferência",
+    "loans and financing": "Financeiro",
+    "interests charged": "Financeiro",
+    "late payment and overdraft costs": "Financeiro",
+    "bank fees": "Financeiro",
+    "taxes": "Financeiro",
+    "insurance": "Financeiro",
+    "groceries": "Alimentação",
+    "food and drinks": "Alimentação",
+    "eating out": "Alimentação",
+    "food delivery": "Alimentação",
+    "transportation": "Transporte",
+    "taxi and ride-hailing": "Transporte",
+    "public transportation": "Transporte",
+    "gas stations": "Transporte",
+    "parking": "Transporte",
+    "vehicle maintenance": "Transporte",
+    "housing": "Moradia",
+    "rent": "Moradia",
+    "utilities": "Moradia",
+    "water": "Moradia",
+    "electricity": "Moradia",
+    "gas": "Moradia",
+    "houseware": "Moradia",
+    "healthcare": "Saúde",
+    "pharmacy": "Saúde",
+    "wellness and fitness": "Saúde",
+    "education": "Educação",
+    "leisure": "Lazer",
+    "entertainment": "Lazer",
+    "gaming": "Lazer",
+    "tickets": "Lazer",
+    "travel": "Lazer",
+    "airport and airlines": "Lazer",
+    "accomodation": "Lazer",
+    "video streaming": "Lazer",
+    "music streaming": "Lazer",
+    "services": "Serviços",
+    "digital services": "Serviços",
+    "telecommunications": "Serviços",
+    "internet": "Serviços",
+    "mobile": "Serviços",
+    "shopping": "Compras",
+    "online shopping": "Compras",
+    "electronics": "Compras",
+    "clothing": "Compras",
+    "pet supplies": "Compras",
+    "donations": "Outros",
+}
+
+
+def normalizar_categoria(categoria: Optional[str]) -> str:
+    """Converte a categoria da Pluggy para uma categoria do app."""
+    if not categoria:
+        return CATEGORIA_PADRAO
+    chave = unicodedata.normalize("NFKD", categoria.strip().lower())
+    chave = "".join(c for c in chave if not unicodedata.combining(c))
+    if chave in CATEGORIAS_PLUGGY:
+        return CATEGORIAS_PLUGGY[chave]
+    # Subcategorias da Pluggy vêm como "Transfer - PIX", "Food and drinks - Bakery"...
+    prefixo = chave.split(" - ")[0]
+    return CATEGORIAS_PLUGGY.get(prefixo, categoria.strip())
+
+
+def _parse_data(valor) -> Optional[date]:
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(str(valor).replace('Z', '+00:00')).date()
+    except ValueError:
+        return datetime.strptime(str(valor)[:10], "%Y-%m-%d").date()
+
+
+def _montar_linha(tx: Dict, contexto: Dict, fonte: str) -> Optional[Dict]:
+    """Converte uma transação crua da Pluggy em uma linha do read model."""
+    data_tx = _parse_data(tx.get('date'))
+    if not tx.get('id') or data_tx is None:
+        return None
+
+    amount = float(tx.get('amount') or 0)
+    tipo_conta = contexto.get('tipo_conta')
+    # Em cartões de crédito a Pluggy envia gastos como valores positivos
+    is_saida = amount < 0 or (tipo_conta or '').upper() in ('CREDIT', 'CREDIT_CARD')
+    categoria_origem = tx.get('category')
+    descricao = tx.get('description') or tx.get('merchantName') or "Transação bancária"
+    valor = -abs(amount) if is_saida else abs(amount)
+
+    return {
+        "id_usuario": contexto['id_usuario'],
+        "fonte": fonte,
+        "transaction_id": tx['id'],
+        "item_id": contexto.get('item_id'),
+        "data": data_tx,
+        "descricao": descricao,
+        "merchant_name": tx.get('merchantName'),
+        "valor": valor,
+        "tipo": 'Saída' if is_saida else 'Entrada',
+        "categoria_origem": categoria_origem,
+        "categoria": normalizar_categoria(categoria_origem),
+        "banco": contexto.get('banco'),
+        "conta_nome": contexto.get('conta_nome'),
+        "tipo_conta": tipo_conta,
+        **campos_derivados_transacao(descricao, tx.get('merchantName'), valor, data_tx,
+                                     tipo_conta, contexto.get('conta_nome')),
+        "atualizado_em": datetime.now(),
+    }
+
+
+def upsert_transacoes(bind, transacoes: Iterable[Dict], contexto: Dict, fonte: str) -> int:
+    """
+    Insere/atualiza uma página de transações no read model (um único statement).
+
+    Args:
+        bind: Session ou Connection SQLAlchemy (a transação é do chamador)
+        transacoes: Transações cruas da Pluggy
+        contexto: id_usuario, item_id, banco, conta_nome e tipo_conta da conta
+        fonte: FONTE_PLUGGY ou FONTE_BANK_CONNECTOR
+    """
+    # Dicionário por ID: o Postgres rejeita ON CONFLICT atualizando a mesma linha duas vezes
+    por_id = {}
+    for tx in transacoes:
+        linha = _montar_linha(tx, contexto, fonte)
+        if linha:
+            por_id[linha['transaction_id']] = linha
+    linhas = list(por_id.values())
+    if not linhas:
+        return 0
+
+    stmt = pg_insert(OpenFinanceTransacao.__table__).values(linhas)
+    atualizaveis = {
+        col: stmt.excluded[col]
+        for col in linhas[0]
+        if col not in ("id_usuario", "transaction_id", "fonte")
+    }
+    bind.execute(stmt.on_conflict_do_update(index_elements=["transaction_id"], set_=atualizaveis))
+    return len(linhas)
+
+
+def contexto_conta_pluggy(account) -> Dict:
+    """Metadados desnormalizados de uma PluggyAccount (schema ORM)."""
+    item = account.item
+    return {
+        "id_usuario": item.id_usuario,
+        "item_id": item.pluggy_item_id,
+        "banco": item.connector_name,
+        "conta_nome": account.name,
+        "tipo_conta": account.type,
+    }
+
+
+def contexto_conta_bank_connector(conn, account_db_id: int) -> Optional[Dict]:
+    """Metadados desnormalizados de uma conta do schema ``bank_*``."""
+    row = conn.execute(
+        text("""
+            SELECT u.id, bc.item_id, bc.connector_name, ba.account_name, ba.account_type
+            FROM bank_accounts ba
+            JOIN bank_connections bc ON ba.connection_id = bc.id
+            JOIN usuarios u ON u.telegram_id = bc.user_id
+            WHERE ba.id = :account_id
+        """),
+        {"account_id": account_db_id}
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "id_usuario": row[0],
+        "item_id": row[1],
+        "banco": row[2],
+        "conta_nome": row[3],
+        "tipo_conta": row[4],
+    }
+
+
+def remover_por_item(bind, item_id: str) -> int:
+    """Remove do read model as transações de uma conexão desfeita."""
+    result = bind.execute(
+        text("DELETE FROM open_finance_transacoes WHERE item_id = :item_id"),
+        {"item_id": item_id}
+    )
+    return result.rowcount or 0
+
+
+def buscar_transacoes(db, id_usuario: int, dias: int = 90, limite: Optional[int] = None,
+                      apenas_nao_conciliadas: bool = False) -> List[OpenFinanceTransacao]:
+    """
+    Transações recentes do usuário, mais novas primeiro (varredura de índice).
+
+    Com ``apenas_nao_conciliadas``, omite as transações já vinculadas a um
+    lançamento (open_finance.conciliacao), para não contar a mesma compra duas vezes.
+    """
+    query = (
+        db.query(OpenFinanceTransacao)
+        .filter(
+            OpenFinanceTransacao.id_usuario == id_usuario,
+            OpenFinanceTransacao.data >= date.today() - timedelta(days=dias),
+        )
+        .order_by(OpenFinanceTransacao.data.desc(), OpenFinanceTransacao.id.desc())
+    )
+    if apenas_nao_conciliadas:
+        query = query.filter(~exists().where(Conciliacao.transaction_id == OpenFinanceTransacao.transaction_id))
+    if limite:
+        query = query.limit(limite)
+    return query.all()
+
+
+def reconstruir_read_model(bind, id_usuario: Optional[int] = None) -> None:
+    """
+    Popula o read model a partir das tabelas de origem (backfill de dados antigos).
+
+    As categorias passam pelo mesmo ``normalizar_categoria`` da ingestão
+    (ver ``_normalizar_categorias``). Estabelecimento, meio de pagamento e
+    itens ficam para scripts/backfill_campos_derivados.py.
+    """
+    filtro_pluggy = "AND pi.id_usuario = :id_usuario" if id_usuario else ""
+    filtro_bank = "AND u.id = :id_usuario" if id_usuario else ""
+    params = {"id_usuario": id_usuario} if id_usuario else {}
+
+    bind.execute(text(f"""
+        INSERT INTO open_finance_transacoes
+            (id_usuario, fonte, transaction_id, item_id, data, descricao, merchant_name,
+             valor, tipo, categoria_origem, categoria, banco, conta_nome, tipo_conta, mes_referencia, atualizado_em)
+        SELECT pi.id_usuario, '{FONTE_PLUGGY}', pt.pluggy_transaction_id, pi.pluggy_item_id, pt.date,
+               pt.description, pt.merchant_name,
+               CASE WHEN pt.type = 'Saída' OR pt.amount < 0 THEN -ABS(pt.amount) ELSE ABS(pt.amount) END,
+               CASE WHEN pt.type = 'Saída' OR pt.amount < 0 THEN 'Saída' ELSE 'Entrada' END,
+               pt.category, COALESCE(pt.category, '{CATEGORIA_PADRAO}'),
+               pi.connector_name, pa.name, pa.type, to_char(pt.date, 'YYYY-MM'), NOW()
+        FROM pluggy_transactions pt
+        JOIN pluggy_accounts pa ON pt.id_account = pa.id
+        JOIN pluggy_items pi ON pa.id_item = pi.id
+        WHERE TRUE {filtro_pluggy}
+        ON CONFLICT (transaction_id) DO NOTHING
+    """), params)
+
+    try:
+        # Savepoint: se o schema bank_* não existir, a transação externa continua válida
+        with bind.begin_nested():
+            bind.execute(text(f"""
+            INSERT INTO open_finance_transacoes
+                (id_usuario, fonte, transaction_id, item_id, data, descricao, merchant_name,
+                 valor, tipo, categoria_origem, categoria, banco, conta_nome, tipo_conta, mes_referencia, atualizado_em)
+            SELECT u.id, '{FONTE_BANK_CONNECTOR}', bt.transaction_id, bc.item_id, bt.date,
+                   COALESCE(bt.description, bt.merchant_name, 'Transação bancária'), bt.merchant_name,
+                   bt.amount,
+                   CASE WHEN bt.amount < 0 THEN 'Saída' ELSE 'Entrada' END,
+                   bt.category, COALESCE(bt.category, '{CATEGORIA_PADRAO}'),
+                   bc.connector_name, ba.account_name, ba.account_type, to_char(bt.date, 'YYYY-MM'), NOW()
+            FROM bank_transactions bt
+            JOIN bank_accounts ba ON bt.account_id = ba.id
+            JOIN bank_connections bc ON ba.connection_id = bc.id
+            JOIN usuarios u ON u.telegram_id = bc.user_id
+            WHERE TRUE {filtro_bank}
+            ON CONFLICT (transaction_id) DO NOTHING
+            """), params)
+    except Exception as e:
+        # Schema bank_* é opcional (criado sob demanda pelo BankConnector)
+        logger.info(f"ℹ️ Backfill do schema bank_* ignorado: {e}")
+
+    _normalizar_categorias(bind, id_usuario)
+
+
+def _normalizar_categorias(bind, id_usuario: Optional[int] = None) -> int:
+    """
+    Reaplica ``normalizar_categoria`` às linhas copiadas em SQL pelo backfill.
+
+    Um UPDATE por categoria de origem distinta (algumas dezenas), em vez de
+    linha a linha; linhas já normalizadas pela ingestão não são tocadas.
+    """
+    filtro = "AND id_usuario = :id_usuario" if id_usuario else ""
+    params = {"id_usuario": id_usuario} if id_usuario else {}
+
+    origens = bind.execute(text(f"""
+        SELECT DISTINCT categoria_origem FROM open_finance_transacoes
+        WHERE categoria_origem IS NOT NULL {filtro}
+    """), params).scalars().all()
+
+    atualizadas = 0
+    for origem in origens:
+        result = bind.execute(text(f"""
+            UPDATE open_finance_transacoes SET categoria = :categoria
+            WHERE categoria_origem = :origem AND categoria <> :categoria {filtro}
+        """), {**params, "origem": origem, "categoria": normalizar_categoria(origem)})
+        atualizadas += result.rowcount or 0
+    if atualizadas:
+        logger.info(f"📖 Categorias normalizadas no read model: {atualizadas} transações")
+    return atualizadas
+
+
+__all__ = [
+    'normalizar_categoria',
+    'upsert_transacoes',
+    'contexto_conta_pluggy',
+    'contexto_conta_bank_connector',
+    'remover_por_item',
+    'buscar_transacoes',
+    'reconstruir_read_model',
+    'FONTE_PLUGGY',
+    'FONTE_BANK_CONNECTOR',
+]
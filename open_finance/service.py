@@ -16,12 +16,14 @@ Utiliza o PluggyClient para buscar dados da API e os repositórios (models)
 para persistir e consultar dados no banco de dados local.
 """
 import logging
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from sqlalchemy.orm import Session, joinedload
 from datetime import datetime, timedelta
 
 from .pluggy_client import PluggyClient, PluggyClientError
 from models import Usuario, PluggyItem, PluggyAccount, PluggyTransaction
+from . import read_model
+from .conciliacao import conciliar_usuario
 
 logger = logging.getLogger(__name__)
 
@@ -48,14 +50,35 @@ def log_destaque(msg):
 
 import asyncio
 
+def _existing_transaction_ids(session: Session, page: List[Dict]) -> set:
+    """Retorna, em uma única consulta, os IDs da página que já estão no banco."""
+    ids = [tx['id'] for tx in page]
+    if not ids:
+        return set()
+    rows = session.query(PluggyTransaction.pluggy_transaction_id).filter(
+        PluggyTransaction.pluggy_transaction_id.in_(ids)
+    ).all()
+    return {row[0] for row in rows}
+
+
 async def _fetch_and_process_transactions(client: PluggyClient, account: PluggyAccount, from_date: str, session: Session) -> int:
-    """Função auxiliar para buscar e processar transações de UMA conta de forma assíncrona."""
+    """
+    Função auxiliar para buscar e processar transações de UMA conta de forma assíncrona.
+
+    As páginas chegam em streaming (download em paralelo com janela limitada)
+    e cada uma é gravada assim que recebida, mantendo a memória constante
+    mesmo em cargas históricas grandes.
+    """
     new_tx_count = 0
     try:
-        transactions_data = await asyncio.to_thread(client.list_transactions, account.pluggy_account_id, from_date)
-        for tx_data in transactions_data:
-            existing_tx = session.query(PluggyTransaction).filter(PluggyTransaction.pluggy_transaction_id == tx_data['id']).first()
-            if not existing_tx:
+        contexto = read_model.contexto_conta_pluggy(account)
+        async for page in client.aiter_transaction_pages(account.pluggy_account_id, from_date):
+            read_model.upsert_transacoes(session, page, contexto, read_model.FONTE_PLUGGY)
+            existing_ids = _existing_transaction_ids(session, page)
+            for tx_data in page:
+                if tx_data['id'] in existing_ids:
+                    continue
+                existing_ids.add(tx_data['id'])
                 date_str = tx_data['date']
                 try:
                     date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
@@ -74,6 +97,8 @@ async def _fetch_and_process_transactions(client: PluggyClient, account: PluggyA
                 )
                 session.add(new_tx)
                 new_tx_count += 1
+            # Envia a página ao banco antes de aguardar a próxima
+            session.flush()
         log_sucesso(f"{new_tx_count} novas transações sincronizadas para a conta {account.pluggy_account_id}.")
     except PluggyClientError as e:
         log_erro(f"Erro ao sincronizar conta {account.pluggy_account_id}: {e}")
@@ -223,46 +248,61 @@ class OpenFinanceService:
             return {"accounts": 0, "new_transactions": 0}
 
         total_new_txns = 0
-        from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-
         for conn in connections:
-            accounts = self.db.query(PluggyAccount).filter(PluggyAccount.id_item == conn.id).all()
-            for acc in accounts:
-                try:
-                    transactions_data = self.client.list_transactions(acc.pluggy_account_id, from_date)
-                    for tx_data in transactions_data:
-                        if _is_pix_credito_inter(tx_data):
-                            continue  # Ignora transação do Inter Pix no crédito
-                        existing_tx = self.db.query(PluggyTransaction).filter(PluggyTransaction.pluggy_transaction_id == tx_data['id']).first()
-                        if not existing_tx:
-                            date_str = tx_data['date']
-                            try:
-                                date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
-                            except ValueError:
-                                date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-                            # Corrige tipo e valor para cartão de crédito
-                            is_credit_card = _is_credit_card(acc)
-                            valor = abs(tx_data['amount'])
-                            tipo = 'Saída' if is_credit_card else ('Saída' if tx_data['amount'] < 0 else 'Entrada')
-                            new_tx = PluggyTransaction(
-                                id_account=acc.id,
-                                pluggy_transaction_id=tx_data['id'],
-                                description=tx_data['description'],
-                                amount=valor,
-                                date=date_obj,
-                                type=tipo,
-                                category=tx_data.get('category'),
-                                merchant_name=tx_data.get('merchantName')
-                            )
-                            self.db.add(new_tx)
-                            total_new_txns += 1
-                    log_sucesso(f"{len(transactions_data)} transações sincronizadas para a conta {acc.pluggy_account_id}.")
-                except PluggyClientError as e:
-                    log_erro(f"Erro ao sincronizar transações para a conta {acc.pluggy_account_id}: {e}")
-                    continue
+            total_new_txns += self.sync_transactions_for_item(conn, days=days, commit=False)
         self.db.commit()
         log_sucesso(f"Sincronização concluída: {len(connections)} conexões, {total_new_txns} novas transações para o usuário {user_id}.")
         return {"accounts": len(connections), "new_transactions": total_new_txns}
+
+    def sync_transactions_for_item(self, conn: PluggyItem, days: int = 60, commit: bool = True) -> int:
+        """Sincroniza as transações de todas as contas de um item. Retorna o número de novas transações."""
+        new_txns = 0
+        from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        accounts = self.db.query(PluggyAccount).filter(PluggyAccount.id_item == conn.id).all()
+        for acc in accounts:
+            try:
+                account_tx_count = 0
+                is_credit_card = _is_credit_card(acc)
+                contexto = read_model.contexto_conta_pluggy(acc)
+                # Páginas chegam em streaming: cada uma é gravada antes da próxima
+                for page in self.client.iter_transaction_pages(acc.pluggy_account_id, from_date):
+                    # Ignora transação do Inter Pix no crédito
+                    page = [tx for tx in page if not _is_pix_credito_inter(tx)]
+                    read_model.upsert_transacoes(self.db, page, contexto, read_model.FONTE_PLUGGY)
+                    existing_ids = _existing_transaction_ids(self.db, page)
+                    account_tx_count += len(page)
+                    for tx_data in page:
+                        if tx_data['id'] in existing_ids:
+                            continue
+                        existing_ids.add(tx_data['id'])
+                        date_str = tx_data['date']
+                        try:
+                            date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00')).date()
+                        except ValueError:
+                            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+                        # Corrige tipo e valor para cartão de crédito
+                        valor = abs(tx_data['amount'])
+                        tipo = 'Saída' if is_credit_card else ('Saída' if tx_data['amount'] < 0 else 'Entrada')
+                        new_tx = PluggyTransaction(
+                            id_account=acc.id,
+                            pluggy_transaction_id=tx_data['id'],
+                            description=tx_data['description'],
+                            amount=valor,
+                            date=date_obj,
+                            type=tipo,
+                            category=tx_data.get('category'),
+                            merchant_name=tx_data.get('merchantName')
+                        )
+                        self.db.add(new_tx)
+                        new_txns += 1
+                    self.db.flush()
+                log_sucesso(f"{account_tx_count} transações sincronizadas para a conta {acc.pluggy_account_id}.")
+            except PluggyClientError as e:
+                log_erro(f"Erro ao sincronizar transações para a conta {acc.pluggy_account_id}: {e}")
+                continue
+        if commit:
+            self.db.commit()
+        return new_txns
         
     def get_pending_transactions(self, user_id: int) -> List[PluggyTransaction]:
         """Busca transações do Open Finance que ainda não foram importadas para os lançamentos principais."""
@@ -281,3 +321,190 @@ class OpenFinanceService:
         )
         log_destaque(f"{len(pendentes)} transações pendentes encontradas para o usuário {user_id}.")
         return pendentes
+
+    def _pending_query(self, usuario_id: int):
+        """Consulta base (colunas, sem ORM) das transações pendentes de importação."""
+        return (
+            self.db.query(
+                PluggyTransaction.id,
+                PluggyTransaction.description,
+                PluggyTransaction.amount,
+                PluggyTransaction.date,
+                PluggyTransaction.type,
+                PluggyTransaction.merchant_name,
+                PluggyItem.connector_name,
+            )
+            .join(PluggyAccount, PluggyTransaction.id_account == PluggyAccount.id)
+            .join(PluggyItem, PluggyAccount.id_item == PluggyItem.id)
+            .filter(PluggyItem.id_usuario == usuario_id)
+            .filter(PluggyTransaction.imported_to_lancamento == False)
+        )
+
+    def get_pending_summary(self, user_id: int, limit: int = 10) -> Tuple[int, List[Dict]]:
+        """Retorna (total, primeiras transações) pendentes sem carregar objetos ORM."""
+        usuario = self.get_user_by_telegram_id(user_id)
+        if not usuario:
+            log_aviso(f"Usuário {user_id} não encontrado ao buscar transações pendentes.")
+            return 0, []
+        query = self._pending_query(usuario.id)
+        total = query.count()
+        amostra = [
+            {"description": row.description, "amount": float(row.amount or 0)}
+            for row in query.order_by(PluggyTransaction.date.desc()).limit(limit)
+        ]
+        return total, amostra
+
+    @staticmethod
+    def _tipo_lancamento(amount: float, tx_type: Optional[str]) -> str:
+        """Entrada/Saída a partir do tipo gravado na sincronização ou do sinal do valor."""
+        if tx_type in ('Entrada', 'Saída'):
+            return tx_type
+        if tx_type == 'DEBIT' or amount < 0:
+            return 'Saída'
+        return 'Entrada'
+
+    def import_pending_transactions(self, user_id: int, batch_size: int = 500,
+                                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+        """
+        Importa as transações pendentes para ``lancamentos`` em lotes set-based.
+
+        Para cada lote: categoriza tudo com as categorias carregadas uma única vez,
+        deduplica contra os lançamentos existentes com uma só consulta por faixa de
+        datas, insere os lançamentos em massa (RETURNING id) e marca as transações
+        como importadas. Cada lote é commitado, então uma importação interrompida
+        pode ser retomada sem duplicar nada.
+
+        Args:
+            user_id: Telegram ID do usuário
+            batch_size: Transações por lote
+            progress: Callback opcional chamado com (processadas, total) após cada lote
+        """
+        from sqlalchemy import insert, update
+        from models import Lancamento
+        from gerente_financeiro.services import (
+            _categorizar_com_mapa_inteligente,
+            _get_all_categories_and_subcategories,
+        )
+        from gerente_financeiro.campos_derivados import campos_derivados_lancamento
+        from gerente_financeiro.merchant_memory import get_merchant_memory
+
+        stats = {"total": 0, "imported": 0, "duplicates": 0}
+        usuario = self.get_user_by_telegram_id(user_id)
+        if not usuario:
+            log_aviso(f"Usuário {user_id} não encontrado ao importar transações.")
+            return stats
+
+        base_query = self._pending_query(usuario.id)
+        stats["total"] = base_query.count()
+        if not stats["total"]:
+            return stats
+
+        mapas = _get_all_categories_and_subcategories(self.db)
+        memoria = get_merchant_memory()
+        categorias_memo: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]] = {}
+        processadas = 0
+        ultimo_id = 0
+
+        while True:
+            # Paginação por chave: lotes estáveis mesmo com as flags mudando entre commits
+            lote = (
+                base_query.filter(PluggyTransaction.id > ultimo_id)
+                .order_by(PluggyTransaction.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not lote:
+                break
+            ultimo_id = lote[-1].id
+
+            # 1) Dedupe: uma única consulta cobrindo a faixa de datas do lote. Só contam
+            #    lançamentos ainda sem transação vinculada, e cada um absorve no máximo uma
+            #    transação: compras idênticas no mesmo dia continuam sendo lançamentos distintos
+            datas = [row.date for row in lote]
+            inicio = datetime.combine(min(datas), datetime.min.time())
+            fim = datetime.combine(max(datas), datetime.max.time())
+            ja_vinculados = self.db.query(PluggyTransaction.id_lancamento).filter(
+                PluggyTransaction.id_lancamento.isnot(None)
+            )
+            existentes: Dict[tuple, List[int]] = {}
+            for lanc_id, desc, valor, data in self.db.query(
+                Lancamento.id, Lancamento.descricao, Lancamento.valor, Lancamento.data_transacao
+            ).filter(
+                Lancamento.id_usuario == usuario.id,
+                Lancamento.data_transacao.between(inicio, fim),
+                Lancamento.id.notin_(ja_vinculados),
+            ).order_by(Lancamento.id):
+                if data is not None:
+                    chave = ((desc or '').strip().lower(), round(float(valor), 2), data.date())
+                    existentes.setdefault(chave, []).append(lanc_id)
+
+            # 2) Categorização do lote (memória de estabelecimentos, depois regras), memoizada por (texto, tipo)
+            novos, origem_ids, vinculos = [], [], []
+            for row in lote:
+                amount = float(row.amount or 0)
+                descricao = (row.description or '').strip()
+                tipo = self._tipo_lancamento(amount, row.type)
+                chave = (descricao.lower(), round(abs(amount), 2), row.date)
+
+                candidatos = existentes.get(chave)
+                if candidatos:
+                    vinculos.append({"id": row.id, "imported_to_lancamento": True, "id_lancamento": candidatos.pop(0)})
+                    stats["duplicates"] += 1
+                    continue
+
+                tipo_categoria = 'Receita' if tipo == 'Entrada' else 'Despesa'
+                texto = f"{descricao} {row.merchant_name or ''}".lower()
+                memo_key = (texto, tipo_categoria)
+                if memo_key not in categorias_memo:
+                    categorias_memo[memo_key] = (
+                        memoria.consultar(self.db, usuario.id, row.merchant_name or descricao)
+                        or _categorizar_com_mapa_inteligente(texto, tipo_categoria, self.db, mapas)
+                    )
+                id_categoria, id_subcategoria = categorias_memo[memo_key]
+
+                data_transacao = datetime.combine(row.date, datetime.min.time())
+                forma_pagamento = row.connector_name or 'Desconhecido'
+                novos.append({
+                    "id_usuario": usuario.id,
+                    "descricao": descricao,
+                    "valor": abs(amount),
+                    "tipo": tipo,
+                    "data_transacao": data_transacao,
+                    "forma_pagamento": forma_pagamento,
+                    "id_categoria": id_categoria,
+                    "id_subcategoria": id_subcategoria,
+                    # INSERT em massa não dispara os eventos do ORM: derivados vão explícitos
+                    **campos_derivados_lancamento(descricao, forma_pagamento, data_transacao),
+                })
+                origem_ids.append(row.id)
+
+            # 3) Inserção em massa com os IDs na mesma ordem dos parâmetros
+            if novos:
+                lancamento_ids = self.db.scalars(
+                    insert(Lancamento).returning(Lancamento.id, sort_by_parameter_order=True),
+                    novos,
+                ).all()
+                vinculos.extend(
+                    {"id": tx_id, "imported_to_lancamento": True, "id_lancamento": lanc_id}
+                    for tx_id, lanc_id in zip(origem_ids, lancamento_ids)
+                )
+                stats["imported"] += len(novos)
+
+            # 4) Marca o lote como importado (UPDATE em massa por chave primária)
+            if vinculos:
+                self.db.execute(update(PluggyTransaction), vinculos)
+            self.db.commit()
+
+            processadas += len(lote)
+            if progress:
+                progress(processadas, stats["total"])
+
+        # Vincula as transações importadas aos lançamentos criados (e concilia o restante)
+        conciliar_usuario(self.db, usuario.id)
+        self.db.commit()
+
+        log_sucesso(
+            f"Importação concluída para o usuário {user_id}: {stats['imported']} lançamentos, "
+            f"{stats['duplicates']} duplicadas."
+        )
+        return stats
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+scripts/backfill_campos_derivados.py
+
+Preenche os campos derivados (gerente_financeiro/campos_derivados.py) de
+lançamentos e transações Open Finance gravados antes da migration 004:
+estabelecimento normalizado, meio de pagamento, mês/dia locais e itens.
+
+Modo de uso:
+  # Todos os usuários
+  python scripts/backfill_campos_derivados.py
+
+  # Apenas um usuário (usuarios.id)
+  python scripts/backfill_campos_derivados.py --usuario 42
+
+Processa em lotes por chave primária; linhas já preenchidas são ignoradas,
+então o script pode ser interrompido e executado de novo.
+"""
+import argparse
+import sys
+import logging
+
+from sqlalchemy import update
+
+from database.database import get_db, criar_tabelas
+from gerente_financeiro.campos_derivados import campos_derivados_lancamento, campos_derivados_transacao
+from models import Lancamento, OpenFinanceTransacao
+
+logger = logging.getLogger("backfill_campos_derivados")
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+TAMANHO_LOTE = 1000
+
+
+def _backfill_lancamentos(db, id_usuario=None) -> int:
+    total, ultimo_id = 0, 0
+    while True:
+        query = db.query(
+            Lancamento.id, Lancamento.descricao, Lancamento.forma_pagamento, Lancamento.data_transacao
+        ).filter(Lancamento.id > ultimo_id, Lancamento.meio_pagamento.is_(None))
+        if id_usuario:
+            query = query.filter(Lancamento.id_usuario == id_usuario)
+        lote = query.order_by(Lancamento.id).limit(TAMANHO_LOTE).all()
+        if not lote:
+            return total
+        db.execute(update(Lancamento), [
+            {"id": lanc_id, **campos_derivados_lancamento(descricao, forma_pagamento, data)}
+            for lanc_id, descricao, forma_pagamento, data in lote
+        ])
+        db.commit()
+        total += len(lote)
+        ultimo_id = lote[-1][0]
+
+
+def _backfill_transacoes(db, id_usuario=None) -> int:
+    total, ultimo_id = 0, 0
+    while True:
+        query = db.query(
+            OpenFinanceTransacao.id, OpenFinanceTransacao.descricao, OpenFinanceTransacao.merchant_name,
+            OpenFinanceTransacao.valor, OpenFinanceTransacao.data,
+            OpenFinanceTransacao.tipo_conta, OpenFinanceTransacao.conta_nome,
+        ).filter(OpenFinanceTransacao.id > ultimo_id, OpenFinanceTransacao.meio_pagamento.is_(None))
+        if id_usuario:
+            query = query.filter(OpenFinanceTransacao.id_usuario == id_usuario)
+        lote = query.order_by(OpenFinanceTransacao.id).limit(TAMANHO_LOTE).all()
+        if not lote:
+            return total
+        db.execute(update(OpenFinanceTransacao), [
+            {"id": tx_id, **campos_derivados_transacao(descricao, merchant, float(valor or 0), data, tipo_conta, conta_nome)}
+            for tx_id, descricao, merchant, valor, data, tipo_conta, conta_nome in lote
+        ])
+        db.commit()
+        total += len(lote)
+        ultimo_id = lote[-1][0]
+
+
+def main(id_usuario=None):
+    criar_tabelas()
+    db = next(get_db())
+    try:
+        lancamentos = _backfill_lancamentos(db, id_usuario)
+        transacoes = _backfill_transacoes(db, id_usuario)
+        logger.info(f"Campos derivados preenchidos: {lancamentos} lançamentos, {transacoes} transações.")
+        return 0
+    except Exception as e:
+        logger.error(f"Erro durante backfill: {e}")
+        db.rollback()
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill dos campos derivados de lançamentos e transações')
+    parser.add_argument('--usuario', type=int, default=None, help='ID interno do usuário (usuarios.id)')
+    args = parser.parse_args()
+    sys.exit(main(id_usuario=args.usuario))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+scripts/backfill_openfinance_read_model.py
+
+Popula a tabela `open_finance_transacoes` (read model) a partir das tabelas
+de origem `pluggy_transactions` e `bank_transactions`.
+
+Modo de uso:
+  # Todos os usuários
+  python scripts/backfill_openfinance_read_model.py
+
+  # Apenas um usuário (usuarios.id)
+  python scripts/backfill_openfinance_read_model.py --usuario 42
+
+Transações já presentes no read model não são duplicadas; as categorias
+da Pluggy são convertidas para as do app, como na sincronização.
+"""
+import argparse
+import sys
+import logging
+
+from database.database import get_db, criar_tabelas
+from open_finance.read_model import reconstruir_read_model
+
+logger = logging.getLogger("backfill_openfinance_read_model")
+logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+
+def main(id_usuario=None):
+    criar_tabelas()
+    db = next(get_db())
+    try:
+        reconstruir_read_model(db, id_usuario)
+        db.commit()
+        logger.info("Read model Open Finance populado com sucesso.")
+        return 0
+    except Exception as e:
+        logger.error(f"Erro durante backfill: {e}")
+        db.rollback()
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill do read model de transações Open Finance')
+    parser.add_argument('--usuario', type=int, default=None, help='ID interno do usuário (usuarios.id)')
+    args = parser.parse_args()
+    sys.exit(main(id_usuario=args.usuario))
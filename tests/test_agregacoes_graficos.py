@@ -0,0 +1,50 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from gerente_financeiro.agregacoes_graficos import agregar, intervalo_do_periodo
+from models import Base, Categoria, Lancamento, Usuario
+
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, Categoria.__table__, Lancamento.__table__])
+    sessao = Session(engine)
+    sessao.add_all([
+        Usuario(id=1, telegram_id=10, nome_completo='Ana'),
+        Categoria(id=1, nome='Alimentação'),
+        Categoria(id=2, nome='Transporte'),
+    ])
+    # Como gravam o fluxo manual, o OCR e a importação Open Finance: tipo Entrada/Saída, valor positivo
+    linhas = [
+        (1, 'Salário', 3000.00, 'Entrada', datetime(2025, 2, 5, 9), None, 'Pix'),
+        (2, 'Mercado', 250.00, 'Saída', datetime(2025, 2, 10, 18), 1, 'Cartão de Crédito'),
+        (3, 'Uber', 40.00, 'Saída', datetime(2025, 3, 1, 8), 2, 'Pix'),
+        (4, 'Padaria', 10.00, 'Saída', datetime(2025, 3, 1, 9), 1, 'Pix'),
+    ]
+    for id_, descricao, valor, tipo, momento, categoria, forma in linhas:
+        sessao.add(Lancamento(id=id_, id_usuario=1, descricao=descricao, valor=valor, tipo=tipo,
+                              data_transacao=momento, id_categoria=categoria, forma_pagamento=forma))
+    sessao.commit()
+    yield sessao
+    sessao.close()
+
+
+def test_agregados_usam_os_tipos_gravados(db):
+    assert agregar(db, 1, 'categoria') == {'grupos': ['Alimentação', 'Transporte'], 'valores': [260.0, 40.0]}
+    assert agregar(db, 1, 'forma_pagamento') == {'grupos': ['Cartão de Crédito', 'Pix'], 'valores': [250.0, 50.0]}
+    assert agregar(db, 1, 'mes') == {'grupos': ['2025-02', '2025-03'], 'valores': [2750.0, -50.0]}
+    fluxo = agregar(db, 1, 'fluxo_caixa')
+    assert fluxo['entradas'] == [3000.0, 0.0, 0.0]
+    assert fluxo['saidas'] == [0.0, 250.0, 50.0]
+
+
+def test_periodo_do_menu_filtra_os_agregados(db):
+    inicio, fim = intervalo_do_periodo('mes', hoje=date(2025, 3, 20))
+    assert (inicio, fim) == (date(2025, 3, 1), date(2025, 3, 20))
+    assert agregar(db, 1, 'categoria', inicio, fim) == {'grupos': ['Transporte', 'Alimentação'], 'valores': [40.0, 10.0]}
+    assert intervalo_do_periodo('12m', hoje=date(2025, 3, 20))[0] == date(2024, 4, 1)
+    assert intervalo_do_periodo('tudo') == (None, None)
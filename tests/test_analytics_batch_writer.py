@@ -0,0 +1,64 @@
+import asyncio
+
+from analytics.batch_writer import AnalyticsBatchWriter
+
+
+class _BackendFalso:
+    def __init__(self):
+        self.lotes = []
+
+    def write_batch(self, commands, errors):
+        self.lotes.append((len(commands), len(errors)))
+
+
+def test_fila_limitada_descarta_e_parar_grava_o_restante():
+    backend = _BackendFalso()
+    writer = AnalyticsBatchWriter(backend, flush_ms=60_000, batch_size=1000, max_fila=3)
+
+    async def cenario():
+        for i in range(5):
+            writer.track_command_usage(i, f'u{i}', 'start')
+        await writer.parar()
+
+    asyncio.run(cenario())
+
+    assert backend.lotes == [(3, 0)]
+    assert writer.stats()['descartados'] == 2
+    assert writer.stats()['gravados'] == 3
+
+
+def test_lote_com_evento_invalido_e_dividido_e_so_ele_e_descartado(monkeypatch):
+    import analytics.batch_writer as batch_writer
+
+    class _BackendRejeita(_BackendFalso):
+        def write_batch(self, commands, errors):
+            if any(evento['command'] == 'quebrado' for evento in commands):
+                raise ValueError('DataError')
+            super().write_batch(commands, errors)
+
+    monkeypatch.setattr(batch_writer, 'MAX_TENTATIVAS', 2)
+    backend = _BackendRejeita()
+    writer = AnalyticsBatchWriter(backend, flush_ms=60_000, batch_size=1000)
+
+    async def cenario():
+        for comando in ('start', 'saldo', 'quebrado', 'extrato'):
+            writer.track_command_usage(1, 'u', comando)
+        for _ in range(10):
+            await writer.flush()
+        writer.track_command_usage(1, 'u', 'depois')
+        await writer.flush()
+
+    asyncio.run(cenario())
+
+    stats = writer.stats()
+    assert (stats['gravados'], stats['descartados'], stats['em_retentativa']) == (4, 1, 0)
+    assert sum(sketch.count for sketch in writer.latencias_recentes().values()) == 5
+
+
+def test_timestamp_e_dia_do_comando_usam_o_mesmo_relogio():
+    writer = AnalyticsBatchWriter(_BackendFalso(), flush_ms=60_000, batch_size=1000)
+    writer.track_command_usage(1, 'u', 'start')
+
+    evento = writer._comandos[0]
+    assert evento['dia'] == evento['timestamp'].date()
+    assert evento['momento'] == evento['timestamp']
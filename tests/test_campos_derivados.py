@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from gerente_financeiro.campos_derivados import campos_derivados_lancamento
+from models import Base, Categoria, Lancamento, Usuario
+
+
+def test_campos_derivados_usam_dia_local():
+    # 01:30 UTC de 1º de abril ainda é 31 de março em São Paulo
+    campos = campos_derivados_lancamento(
+        'PAG*IFOOD 123 SAO PAULO', 'Pix', datetime(2025, 4, 1, 1, 30, tzinfo=timezone.utc)
+    )
+    assert campos['mes_referencia'] == '2025-03'
+    assert campos['dia_referencia'].day == 31
+    assert campos['meio_pagamento'] == 'Pix'
+    assert campos['merchant_key'].startswith('ifood')
+
+
+def test_lancamento_sem_data_usa_o_mesmo_dia_local_nos_derivados():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, Categoria.__table__, Lancamento.__table__])
+    with Session(engine) as db:
+        db.add(Usuario(id=1, telegram_id=10, nome_completo='Ana'))
+        db.add(Lancamento(id=1, id_usuario=1, descricao='Padaria', valor=10, tipo='Saída'))
+        db.commit()
+        lancamento = db.get(Lancamento, 1)
+
+        assert lancamento.data_transacao.tzinfo is None
+        assert lancamento.dia_referencia == lancamento.data_transacao.date()
+        assert lancamento.mes_referencia == lancamento.data_transacao.strftime('%Y-%m')
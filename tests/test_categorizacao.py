@@ -0,0 +1,38 @@
+from gerente_financeiro.categorizacao import MotorCategorizacao, normalizar_texto
+
+
+def _motor():
+    return MotorCategorizacao(
+        [
+            (('Alimentação', 'Delivery'), ['uber eats', 'ifood']),
+            (('Alimentação', 'Bares e Lanches'), ['bar', 'cafe']),
+            (('Alimentação', 'Padaria'), ['panific*']),
+            (('Transporte', 'App de Transporte'), ['uber']),
+        ],
+        negativas={('Alimentação', 'Bares e Lanches'): ['cafe da manha corporativo']},
+    )
+
+
+def test_normalizar_texto_remove_acentos():
+    assert normalizar_texto('Café PÃO de Açúcar') == 'cafe pao de acucar'
+
+
+def test_respeita_limite_de_palavra_e_acentos():
+    motor = _motor()
+    assert motor.classificar('BAR DO ZÉ') == ('Alimentação', 'Bares e Lanches')
+    assert motor.classificar('Barbearia do Zé') is None
+    assert motor.classificar('Café expresso') == ('Alimentação', 'Bares e Lanches')
+
+
+def test_prefixo_e_prioridade_deterministica():
+    motor = _motor()
+    assert motor.classificar('Panificadora Central') == ('Alimentação', 'Padaria')
+    # 'uber eats' (declarado antes) vence 'uber', independente da posição
+    assert motor.classificar('UBER EATS pedido') == ('Alimentação', 'Delivery')
+    assert motor.classificar('uber trip ifood') == ('Alimentação', 'Delivery')
+    assert motor.classificar('Uber trip') == ('Transporte', 'App de Transporte')
+
+
+def test_negativas_anulam_regra():
+    motor = _motor()
+    assert motor.classificar('cafe da manha corporativo') is None
@@ -0,0 +1,8 @@
+from gerente_financeiro.categorizacao_ia import CatalogoCategorias, interpretar_resposta
+
+
+def test_interpretar_resposta_em_lote_ignora_codigos_invalidos():
+    catalogo = CatalogoCategorias('', '', {'1': (10, None), '1.1': (10, 101)})
+    texto = '```json\n[{"i": 0, "c": "1.1"}, {"i": 1, "c": "9.9"}, {"i": 5, "c": "1"}, {"i": 2, "c": "1"}]\n```'
+    assert interpretar_resposta(texto, catalogo, 3) == [(10, 101), None, (10, None)]
+    assert interpretar_resposta('sem json', catalogo, 2) == [None, None]
@@ -0,0 +1,59 @@
+from datetime import date
+
+from open_finance.conciliacao import RegistroConciliavel, parear
+
+
+def _reg(chave, tipo, valor, dia, descricao):
+    return RegistroConciliavel.criar(chave, tipo, valor, date(2025, 3, dia), descricao)
+
+
+def test_pareia_por_valor_janela_e_descricao():
+    lancamentos = [
+        _reg(1, 'Despesa', 59.90, 10, 'Netflix'),
+        _reg(2, 'Despesa', 50.00, 12, 'almoço'),
+        _reg(3, 'Despesa', 50.00, 20, 'mercado bairro'),
+        _reg(4, 'Receita', 100.00, 5, 'pix recebido'),
+    ]
+    transacoes = [
+        _reg('a', 'Saída', -59.90, 11, 'NETFLIX.COM 0123'),
+        _reg('b', 'Saída', -50.00, 13, 'PAG*RESTAURANTE X'),
+        _reg('c', 'Saída', -100.00, 5, 'pix recebido'),   # sentido diferente
+        _reg('d', 'Saída', -50.00, 28, 'mercado bairro'),  # fora da janela
+    ]
+    assert {(l, t) for l, t, _ in parear(lancamentos, transacoes)} == {(1, 'a'), (2, 'b')}
+
+
+def test_sem_texto_em_comum_exige_candidato_unico():
+    lancamentos = [_reg(1, 'Despesa', 30.00, 10, 'uber'), _reg(2, 'Despesa', 30.00, 11, 'cinema')]
+    transacoes = [_reg('a', 'Saída', -30.00, 10, 'PAG*XYZ')]
+    assert parear(lancamentos, transacoes) == []
+
+
+def test_conta_apenas_os_vinculos_realmente_inseridos(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    import open_finance.conciliacao as conciliacao
+    from models import Base, Conciliacao, Lancamento, OpenFinanceTransacao, Usuario
+
+    # Estágio 1 usa NOW() do PostgreSQL; o pareamento é forçado para simular a corrida
+    monkeypatch.setattr(conciliacao, '_vincular_importadas', lambda db, id_usuario: 0)
+    monkeypatch.setattr(conciliacao, 'parear', lambda *args: [(1, 'a', 1.0), (2, 'b', 1.0)])
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[
+        Usuario.__table__, Lancamento.__table__, OpenFinanceTransacao.__table__, Conciliacao.__table__,
+    ])
+    with Session(engine) as db:
+        db.add(Usuario(id=1, telegram_id=10))
+        for n, tx_id in ((1, 'a'), (2, 'b'), (3, 'z')):
+            db.add(Lancamento(id=n, id_usuario=1, descricao='x', valor=10, tipo='Saída',
+                              data_transacao=date.today()))
+            db.add(OpenFinanceTransacao(id_usuario=1, fonte='pluggy', transaction_id=tx_id, data=date.today(),
+                                        descricao='x', valor=-10, tipo='Saída', categoria='Outros'))
+        # Outro processo já vinculou o lançamento 1: o ON CONFLICT descarta esse par
+        db.add(Conciliacao(id_usuario=1, id_lancamento=1, transaction_id='z', metodo='automatica'))
+        db.commit()
+
+        assert conciliacao.conciliar_usuario(db, 1) == 1
+        assert db.query(Conciliacao).count() == 2
@@ -0,0 +1,26 @@
+from datetime import date
+
+from analytics import rollups
+from analytics.dashboard_app import _tendencias_uso
+
+
+def test_tendencias_usam_o_mesmo_dia_utc_dos_rollups(monkeypatch):
+    hoje = date(2026, 3, 31)
+    monkeypatch.setattr(rollups, 'hoje_utc', lambda: hoje)
+    monkeypatch.setattr(rollups, 'serie', lambda session, desde, por_hora=True: (
+        [] if por_hora else [{'period': hoje, 'count': 9, 'error_rate': 0}]
+    ))
+    monkeypatch.setattr(rollups, 'por_comando', lambda session, desde, ate=None: [])
+    consultas = []
+
+    def usuarios_por_dia(session, desde):
+        consultas.append(desde)
+        return {hoje: 4, date(2026, 3, 2): 2}
+
+    monkeypatch.setattr(rollups, 'usuarios_por_dia', usuarios_por_dia)
+
+    dias = _tendencias_uso(None)['daily_stats']
+
+    assert consultas == [date(2026, 3, 2)]
+    assert dias[0] == {'date': '2026-03-02', 'total_commands': 0, 'active_users': 2, 'error_rate': 0}
+    assert dias[-1] == {'date': '2026-03-31', 'total_commands': 9, 'active_users': 4, 'error_rate': 0}
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+
+from open_finance.data_sync import (
+    BACKOFF_BASE, INTERVALO_ATIVO, INTERVALO_INATIVO, DataSynchronizer,
+)
+
+
+def _linha(item_id, status='UPDATED', horas_atras=None, ultimo_login=None, telegram_id=None):
+    atualizado = datetime.now() - timedelta(hours=horas_atras) if horas_atras is not None else None
+    return (item_id, status, atualizado, telegram_id or item_id * 10, ultimo_login)
+
+
+def test_itens_mais_defasados_vencem_primeiro_e_erros_recuam():
+    sync = DataSynchronizer()
+    hoje = date.today()
+    sync._carregar_itens([
+        _linha(1, horas_atras=5, ultimo_login=hoje),       # ativo, já passou das 4h
+        _linha(2, horas_atras=30, ultimo_login=None),      # inativo, passou das 24h há mais tempo
+        _linha(3, horas_atras=1, ultimo_login=hoje),       # ativo, ainda no prazo
+        _linha(4, status='LOGIN_ERROR', horas_atras=48),   # erro: conta a partir de agora
+    ])
+
+    vencidos = sync._retirar_vencidos(time.time(), limite=10)
+
+    assert vencidos == [2, 1]
+    assert sync._vencimentos[3] > time.time()
+    assert sync._vencimentos[4] >= time.time() + BACKOFF_BASE
+
+
+def test_intervalo_depende_da_atividade_do_usuario():
+    hoje = date.today()
+    assert DataSynchronizer._intervalo_por_atividade(hoje) == INTERVALO_ATIVO
+    assert DataSynchronizer._intervalo_por_atividade(hoje - timedelta(days=60)) == INTERVALO_INATIVO
+    assert DataSynchronizer._intervalo_por_atividade(None) == INTERVALO_INATIVO
+
+
+def test_tick_carrega_a_agenda_atualiza_vencidos_e_recua_falhas():
+    sync = DataSynchronizer(tick_seconds=INTERVALO_ATIVO)  # cota de um tick cobre todos os items
+    sync._consultar_itens = lambda: [_linha(1, horas_atras=30), _linha(2, horas_atras=30)]
+    atualizados = []
+
+    def atualizar(item_id):
+        atualizados.append(item_id)
+        if item_id == 2:
+            raise ConnectionError("pluggy fora do ar")
+        return 'UPDATED', 0
+
+    sync._atualizar_item = atualizar
+
+    # Primeiro tick: a agenda é carregada mesmo logo após o boot
+    asyncio.run(sync.sync_all_connections())
+
+    assert sorted(atualizados) == [1, 2]
+    assert sync._itens[1].falhas == 0
+    assert sync._itens[2].falhas == 1
+    # Sucesso volta ao intervalo normal; a falha recua com backoff
+    assert sync._vencimentos[1] >= time.time() + INTERVALO_INATIVO - 5
+    assert time.time() + BACKOFF_BASE - 5 <= sync._vencimentos[2] < time.time() + INTERVALO_INATIVO
+
+
+def test_cota_por_tick_espalha_as_atualizacoes():
+    sync = DataSynchronizer(tick_seconds=60)
+    sync._carregar_itens([_linha(n, horas_atras=100) for n in range(1, 481)])
+
+    assert sync._cota_por_tick() == 2
+    assert len(sync._retirar_vencidos(time.time(), sync._cota_por_tick())) == 2
+
+
+def test_item_pronto_e_conciliado_mesmo_sem_transacoes_novas(monkeypatch):
+    import open_finance.data_sync as data_sync
+    import open_finance.service as service
+
+    class _Item:
+        id_usuario, pluggy_item_id, status = 7, 'pluggy-1', 'UPDATING'
+        status_detail = execution_status = last_updated_at = None
+
+    class _Sessao:
+        def get(self, modelo, item_id):
+            return _Item()
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    class _Servico:
+        def __init__(self, db):
+            self.client = self
+
+        def get_item(self, pluggy_item_id):
+            return {'status': 'UPDATED'}
+
+        def sync_transactions_for_item(self, item, days, commit):
+            return 0
+
+    conciliados = []
+    monkeypatch.setattr(data_sync, 'get_db', lambda: iter([_Sessao()]))
+    monkeypatch.setattr(service, 'OpenFinanceService', _Servico)
+    monkeypatch.setattr(data_sync, 'conciliar_usuario', lambda db, id_usuario: conciliados.append(id_usuario))
+
+    assert DataSynchronizer()._atualizar_item(1) == ('UPDATED', 0)
+    assert conciliados == [7]
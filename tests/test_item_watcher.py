@@ -0,0 +1,67 @@
+import asyncio
+
+from open_finance.item_watcher import (
+    EVENT_ERROR, EVENT_READY, EVENT_TIMEOUT, EVENT_USER_INPUT, ItemReadinessWatcher, classificar_status_item,
+)
+
+
+class _ClienteFalso:
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+
+    def get_item(self, item_id):
+        # Repete a última resposta quando a lista acaba
+        return self.respostas.pop(0) if len(self.respostas) > 1 else self.respostas[0]
+
+
+def _observar(respostas, **kwargs):
+    watcher = ItemReadinessWatcher(lambda: _ClienteFalso(respostas), initial_interval=0, timeout=1)
+    eventos = []
+
+    async def notificar(evento, item):
+        eventos.append((evento, item.get('status')))
+
+    async def rodar():
+        return await watcher.watch('item-1', notificar, **kwargs)
+
+    return asyncio.run(rodar()), eventos
+
+
+def test_classificacao_dos_status():
+    assert classificar_status_item({'status': 'UPDATED'}) == EVENT_READY
+    assert classificar_status_item({'status': 'WAITING_USER_INPUT'}) == EVENT_USER_INPUT
+    assert classificar_status_item({'status': 'LOGIN_ERROR'}) == EVENT_ERROR
+    assert classificar_status_item({'status': 'UPDATING'}) is None
+    assert classificar_status_item(None) is None
+
+
+def test_sem_autorizacao_enviada_pedido_do_banco_encerra_a_observacao():
+    pedido = {'status': 'WAITING_USER_INPUT', 'parameter': {'data': 'https://banco/oauth/1'}}
+    assert _observar([pedido, {'status': 'UPDATED'}]) == (EVENT_USER_INPUT, [(EVENT_USER_INPUT, 'WAITING_USER_INPUT')])
+
+
+def test_apos_ja_autorizei_aguarda_ate_o_item_ficar_pronto():
+    pedido = {'status': 'WAITING_USER_INPUT', 'parameter': {'data': 'https://banco/oauth/1'}}
+    respostas = [pedido, pedido, {'status': 'UPDATING'}, {'status': 'UPDATED'}]
+    assert _observar(respostas, autorizacao_enviada=True) == (EVENT_READY, [(EVENT_READY, 'UPDATED')])
+
+
+def test_apos_ja_autorizei_um_pedido_novo_e_notificado():
+    primeiro = {'status': 'WAITING_USER_INPUT', 'parameter': {'data': 'https://banco/oauth/1'}}
+    novo = {'status': 'WAITING_USER_INPUT', 'parameter': {'data': 'https://banco/oauth/2'}}
+    evento, _ = _observar([primeiro, novo], autorizacao_enviada=True)
+    assert evento == EVENT_USER_INPUT
+
+
+def test_tempo_esgotado_notifica_timeout():
+    watcher = ItemReadinessWatcher(lambda: _ClienteFalso([{'status': 'UPDATING'}]), initial_interval=0, timeout=0)
+    eventos = []
+
+    async def notificar(evento, item):
+        eventos.append(evento)
+
+    async def rodar():
+        return await watcher.watch('item-1', notificar)
+
+    assert asyncio.run(rodar()) == EVENT_TIMEOUT
+    assert eventos == [EVENT_TIMEOUT]
@@ -0,0 +1,20 @@
+import random
+
+from analytics.latency_sketch import PRECISAO_RELATIVA, LatencySketch
+
+
+def test_sketch_mesclado_e_serializado_mantem_percentis():
+    aleatorio = random.Random(7)
+    latencias = [aleatorio.lognormvariate(6, 1.2) for _ in range(4000)]
+    a, b = LatencySketch(), LatencySketch()
+    for i, latencia in enumerate(latencias):
+        (a if i % 2 else b).add(latencia)
+
+    sketch = LatencySketch.from_bytes(a.merge(b).to_bytes())
+    latencias.sort()
+
+    assert sketch.count == 4000
+    for q in (0.5, 0.95, 0.99):
+        exato = latencias[int(q * (len(latencias) - 1))]
+        assert abs(sketch.quantile(q) - exato) <= exato * PRECISAO_RELATIVA * 1.5
+    assert sketch.count_above(1e9) == 0
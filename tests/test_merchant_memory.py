@@ -0,0 +1,38 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from gerente_financeiro.merchant_memory import MerchantMemory, normalizar_merchant
+
+
+def test_normalizar_merchant_remove_ruido_bancario():
+    assert normalizar_merchant('COMPRA CARTAO - PADARIA SÃO JOSÉ LTDA 12/03') == 'padaria sao jose'
+    assert normalizar_merchant('PIX 123456') == ''
+
+
+def _memoria_com_usuario_em_cache():
+    memoria = MerchantMemory()
+    memoria._por_usuario[1] = {}
+    return memoria
+
+
+def test_cache_so_muda_depois_do_commit():
+    memoria = _memoria_com_usuario_em_cache()
+    db = Session(create_engine('sqlite://'))
+
+    memoria._memorizar_apos_commit(db, 1, 'padaria sao jose', (10, 101))
+    assert memoria._por_usuario[1] == {}
+
+    db.commit()
+    assert memoria._por_usuario[1] == {'padaria sao jose': (10, 101)}
+
+
+def test_rollback_descarta_o_aprendizado_pendente():
+    memoria = _memoria_com_usuario_em_cache()
+    db = Session(create_engine('sqlite://'))
+    db.connection()  # abre a transação para o rollback ser real
+
+    memoria._memorizar_apos_commit(db, 1, 'padaria sao jose', (10, 101))
+    db.rollback()
+    db.commit()
+
+    assert memoria._por_usuario[1] == {}
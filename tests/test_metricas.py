@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import metricas
+from metricas import RegistroMetricas
+
+
+def test_exportacao_no_formato_texto():
+    registro = RegistroMetricas()
+    erros = registro.contador("t_erros_total", "Erros.", ("comando",))
+    duracao = registro.histograma("t_duracao_seconds", "Duração.", ("comando",), buckets=(0.1, 1))
+    erros.inc(comando='diz "oi"')
+    for valor in (0.05, 0.5, 3):
+        duracao.observe(valor, comando="extrato")
+    registro.registrar_coletor(lambda: [("t_fila", "gauge", "Fila.", [({}, 7)])])
+
+    texto = registro.exportar()
+
+    assert "# TYPE t_erros_total counter" in texto
+    assert 't_erros_total{comando="diz \\"oi\\""} 1' in texto
+    assert 't_duracao_seconds_bucket{comando="extrato",le="0.1"} 1' in texto
+    assert 't_duracao_seconds_bucket{comando="extrato",le="1"} 2' in texto
+    assert 't_duracao_seconds_bucket{comando="extrato",le="+Inf"} 3' in texto
+    assert 't_duracao_seconds_count{comando="extrato"} 3' in texto
+    assert "t_fila 7" in texto
+    assert texto.endswith("\n")
+
+
+def test_medir_job_registra_duracao_e_falha():
+    async def job_quebrado(context):
+        raise RuntimeError("falhou")
+
+    contexto = SimpleNamespace(job=SimpleNamespace(name="job_teste_metricas"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(metricas.medir_job(job_quebrado)(contexto))
+
+    assert metricas.JOB_FALHAS.valor(job="job_teste_metricas") == 1
+    assert metricas.JOB_DURACAO.contagem(job="job_teste_metricas") == 1
+
+
+def test_taxa_de_acerto_dos_caches_registrados():
+    metricas.registrar_cache("cache_teste", lambda: {"hits": 3, "misses": 1})
+
+    texto = metricas.exportar()
+
+    assert 'maestrofin_cache_hits_total{cache="cache_teste"} 3' in texto
+    assert 'maestrofin_cache_hit_ratio{cache="cache_teste"} 0.75' in texto
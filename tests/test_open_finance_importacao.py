@@ -0,0 +1,52 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import open_finance.service as service
+from models import (
+    Base, Categoria, Lancamento, MerchantCategoria, PluggyAccount, PluggyItem,
+    PluggyTransaction, Subcategoria, Usuario,
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # A conciliação usa SQL do PostgreSQL (NOW(), ON CONFLICT) e é coberta em test_conciliacao
+    monkeypatch.setattr(service, 'conciliar_usuario', lambda db, id_usuario: 0)
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[
+        Usuario.__table__, Categoria.__table__, Subcategoria.__table__, Lancamento.__table__,
+        MerchantCategoria.__table__, PluggyItem.__table__, PluggyAccount.__table__, PluggyTransaction.__table__,
+    ])
+    sessao = Session(engine)
+    sessao.add_all([
+        Usuario(id=1, telegram_id=10, nome_completo='Ana'),
+        PluggyItem(id=1, id_usuario=1, pluggy_item_id='item', connector_id='1', connector_name='Nubank', status='UPDATED'),
+        PluggyAccount(id=1, id_item=1, pluggy_account_id='conta', type='BANK', name='Conta'),
+    ])
+    sessao.commit()
+    yield sessao
+    sessao.close()
+
+
+def _transacao(id_, pluggy_id, descricao, valor, dia):
+    return PluggyTransaction(id=id_, id_account=1, pluggy_transaction_id=pluggy_id, description=descricao,
+                             amount=valor, date=dia, type='DEBIT')
+
+
+def test_compras_identicas_no_mesmo_lote_viram_lancamentos_distintos(db):
+    dia = date(2025, 3, 10)
+    # Lançamento digitado antes: absorve só uma das três transações idênticas
+    db.add(Lancamento(id=1, id_usuario=1, descricao='Café', valor=5, tipo='Saída',
+                      data_transacao=datetime(2025, 3, 10)))
+    db.add_all([_transacao(n, f'tx{n}', 'Café', -5, dia) for n in (1, 2, 3)])
+    db.commit()
+
+    stats = service.OpenFinanceService(db).import_pending_transactions(10)
+
+    assert stats == {"total": 3, "imported": 2, "duplicates": 1}
+    vinculos = [tx.id_lancamento for tx in db.query(PluggyTransaction).order_by(PluggyTransaction.id)]
+    assert vinculos[0] == 1 and len(set(vinculos)) == 3
+    assert db.query(Lancamento).count() == 3
@@ -0,0 +1,41 @@
+import re
+from datetime import date
+
+from gerente_financeiro.pdf_generator import LINHAS_POR_TABELA, generate_period_pdf
+
+LANCAMENTOS_POR_MES = 3 * LINHAS_POR_TABELA
+
+
+def _lancamentos(mes, montados, lidos):
+    # Registra quantos meses já tinham sido montados quando o extrato deste começou a ser lido
+    lidos.append(len(montados))
+    for n in range(LANCAMENTOS_POR_MES):
+        yield date(2025, mes, 1 + n % 28), f'Compra {n}', 'Alimentação', 'Saída', 10 + n
+
+
+def _meses(montados, lidos):
+    for mes in range(1, 13):
+        montados.append(mes)
+        yield {'rotulo': f'{mes:02d}/2025', 'receitas': 5000, 'despesas': 3000,
+               'lancamentos': _lancamentos(mes, montados, lidos)}
+
+
+def test_relatorio_de_doze_meses_sob_demanda():
+    montados, lidos = [], []
+    contexto = {
+        'usuario_nome': 'Ana', 'periodo_extenso': 'Ano de 2025',
+        'receita_total': 60000, 'despesa_total': 36000, 'saldo_mes': 24000, 'taxa_poupanca': 40.0,
+        'resumo_mensal': [(f'{m:02d}/2025', 5000, 3000) for m in range(1, 13)],
+        'gastos_agrupados': [('Alimentação', 36000)],
+    }
+
+    arquivo = generate_period_pdf(contexto, _meses(montados, lidos))
+    pdf = arquivo.read()
+
+    assert pdf.startswith(b'%PDF') and pdf.rstrip().endswith(b'%%EOF')
+    assert montados == list(range(1, 13))
+    # Cada mês só é montado depois que o extrato do anterior foi desenhado
+    assert lidos == list(range(1, 13))
+    # Capa + resumo, e pelo menos uma página por tabela de extrato
+    paginas = len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+    assert paginas >= 2 + 12 * (LANCAMENTOS_POR_MES // LINHAS_POR_TABELA)
@@ -0,0 +1,44 @@
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import Base, OpenFinanceTransacao, Usuario
+from open_finance.read_model import _normalizar_categorias, normalizar_categoria
+
+
+def _linha(transaction_id, categoria_origem, categoria, id_usuario=1):
+    return OpenFinanceTransacao(
+        id_usuario=id_usuario, fonte='pluggy', transaction_id=transaction_id, data=date(2025, 3, 10),
+        descricao='Compra', valor=-10, tipo='Saída', categoria_origem=categoria_origem, categoria=categoria,
+    )
+
+
+def test_normalizar_categoria_da_pluggy():
+    assert normalizar_categoria('Food and drinks - Bakery') == 'Alimentação'
+    assert normalizar_categoria('Transfer - PIX') == 'Transferência'
+    assert normalizar_categoria(None) == 'Outros'
+
+
+def test_backfill_converte_categorias_como_a_ingestao():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, OpenFinanceTransacao.__table__])
+    with Session(engine) as db:
+        db.add_all([Usuario(id=1, telegram_id=10), Usuario(id=2, telegram_id=20)])
+        db.add_all([
+            # Copiadas em SQL pelo backfill: categoria ainda em inglês
+            _linha('a', 'Groceries', 'Groceries'),
+            _linha('b', 'Transfer - PIX', 'Transfer - PIX'),
+            _linha('c', None, 'Outros'),
+            # Já normalizada pela ingestão
+            _linha('d', 'Groceries', 'Alimentação'),
+            # Outro usuário fica de fora do filtro
+            _linha('e', 'Groceries', 'Groceries', id_usuario=2),
+        ])
+        db.commit()
+
+        assert _normalizar_categorias(db, id_usuario=1) == 2
+
+        categorias = dict(db.query(OpenFinanceTransacao.transaction_id, OpenFinanceTransacao.categoria))
+        assert categorias == {'a': 'Alimentação', 'b': 'Transferência', 'c': 'Outros',
+                              'd': 'Alimentação', 'e': 'Groceries'}
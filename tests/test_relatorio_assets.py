@@ -0,0 +1,12 @@
+from gerente_financeiro.relatorio_assets import RegistroAssetsRelatorio
+
+
+def test_html_so_e_usado_por_backend_html(tmp_path, monkeypatch):
+    monkeypatch.setenv("BUILD_STAMP", "abc1234def")
+    registro = RegistroAssetsRelatorio(pdf_backend='weasyprint')
+    assert registro.usa_html
+    assert not RegistroAssetsRelatorio(pdf_backend='reportlab').usa_html
+
+    html = registro.renderizar_html({'mes_nome': 'Março', 'ano': 2025, 'has_data': True})
+    assert 'abc1234' in html
+    assert all(imagem.data_uri.startswith(f"data:{imagem.mime};base64,") for imagem in registro.imagens)
@@ -0,0 +1,40 @@
+from datetime import date
+
+from gerente_financeiro.relatorio_dados import periodo_historico
+
+
+def test_periodo_historico_e_meio_aberto_e_cruza_o_ano():
+    assert periodo_historico(3, 2025) == (date(2024, 10, 1), date(2025, 4, 1))
+    assert periodo_historico(12, 2025, meses=1) == (date(2025, 12, 1), date(2026, 1, 1))
+
+
+def test_contexto_do_mes_com_tipos_gravados():
+    from datetime import datetime
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from gerente_financeiro.relatorio_dados import montar_contexto_relatorio
+    from models import Base, Categoria, Lancamento, Usuario
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, Categoria.__table__, Lancamento.__table__])
+    with Session(engine) as db:
+        usuario = Usuario(id=1, telegram_id=10, nome_completo='Ana')
+        db.add_all([usuario, Categoria(id=1, nome='Alimentação'), Categoria(id=2, nome='Transferência')])
+        for id_, descricao, valor, tipo, dia, categoria in [
+            (1, 'Salário', 3000.00, 'Entrada', 5, None),
+            (2, 'Mercado', 250.00, 'Saída', 10, 1),
+            (3, 'Padaria', 30.00, 'Saída', 12, 1),
+            (4, 'Para poupança', 500.00, 'Saída', 15, 2),
+        ]:
+            db.add(Lancamento(id=id_, id_usuario=1, descricao=descricao, valor=valor, tipo=tipo,
+                              data_transacao=datetime(2025, 3, dia, 12), id_categoria=categoria))
+        db.commit()
+
+        contexto = montar_contexto_relatorio(db, usuario, 3, 2025)
+
+    assert contexto['receita_total'] == 3000.0
+    assert contexto['despesa_total'] == 280.0
+    assert contexto['gastos_agrupados'] == [('Alimentação', 280.0)]
+    assert [d['descricao'] for d in contexto['lista_despesas']] == ['Mercado', 'Padaria']
@@ -0,0 +1,16 @@
+from datetime import date
+
+import pytest
+
+from gerente_financeiro.relatorio_handler import periodo_dos_argumentos
+
+
+def test_periodo_dos_argumentos_ano_e_intervalo():
+    hoje = date(2026, 10, 19)
+    assert periodo_dos_argumentos(['ano', '2025'], hoje)[:2] == (date(2025, 1, 1), date(2026, 1, 1))
+    assert periodo_dos_argumentos(['ano'], hoje)[:2] == (date(2026, 1, 1), date(2026, 11, 1))
+    assert periodo_dos_argumentos(['2025-03', '2025-01'], hoje)[:2] == (date(2025, 1, 1), date(2025, 4, 1))
+    assert periodo_dos_argumentos(['passado'], hoje) is None
+    for args in (['ano', '99999'], ['ano', '1850'], ['2025-01', '9999-12']):
+        with pytest.raises(ValueError):
+            periodo_dos_argumentos(args, hoje)
@@ -0,0 +1,44 @@
+from datetime import date, datetime, time
+
+from gerente_financeiro.relatorios_lote import horario_entrega, mes_fechado
+
+
+def test_mes_fechado_vira_o_ano():
+    assert mes_fechado(date(2026, 1, 2)) == (12, 2025)
+
+
+def test_entrega_no_horario_local_do_usuario_e_nunca_no_passado():
+    madrugada = datetime(2026, 10, 1, 5, 30)  # 02:30 em São Paulo (UTC-3)
+    assert horario_entrega(time(9, 0), date(2026, 10, 1), madrugada) == datetime(2026, 10, 1, 12, 0)
+    assert horario_entrega(time(1, 0), date(2026, 10, 1), madrugada) == madrugada
+
+
+def test_pdf_do_lote_traz_a_pizza_de_gastos():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from gerente_financeiro.pdf_generator import generate_financial_pdf
+    from gerente_financeiro.relatorio_dados import (
+        agregar_historico_usuarios, buscar_maiores_despesas_usuarios, contexto_de_agregados, contexto_pdf,
+    )
+    from models import Base, Categoria, Lancamento, Usuario
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, Categoria.__table__, Lancamento.__table__])
+    with Session(engine) as db:
+        usuario = Usuario(id=1, telegram_id=10, nome_completo='Ana')
+        db.add_all([usuario, Categoria(id=1, nome='Alimentação'), Categoria(id=2, nome='Transporte')])
+        for id_, valor, tipo, categoria in [(1, 3000, 'Entrada', None), (2, 250, 'Saída', 1), (3, 40, 'Saída', 2)]:
+            db.add(Lancamento(id=id_, id_usuario=1, descricao=f'L{id_}', valor=valor, tipo=tipo,
+                              data_transacao=datetime(2025, 3, 10, 12), id_categoria=categoria))
+        db.commit()
+
+        # Mesmo caminho de _carregar_lote: agregados de vários usuários de uma vez
+        linhas = agregar_historico_usuarios(db, [1], 3, 2025)
+        maiores = buscar_maiores_despesas_usuarios(db, [1], 3, 2025)
+        contexto = contexto_de_agregados(usuario, 3, 2025, linhas[1], maiores[1])
+        pdf_context = contexto_pdf(contexto, date(2025, 3, 1))
+
+    # A pizza do PDF é desenhada pelo ReportLab a partir destes totais
+    assert pdf_context['gastos_agrupados'] == [('Alimentação', 250.0), ('Transporte', 40.0)]
+    assert generate_financial_pdf(pdf_context).startswith(b'%PDF')
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from gerente_financeiro.relatorios_worker import CacheRelatorios, RelatorioPronto, versao_dados_mes
+from models import Base, Categoria, Lancamento, Usuario
+
+
+def test_cache_relatorios_descarta_versoes_antigas_do_mes():
+    cache = CacheRelatorios()
+    cache.set((1, '2025-03', 'v1'), RelatorioPronto(b'pdf-v1', 'r.pdf', ''))
+    cache.set((1, '2025-02', 'v1'), RelatorioPronto(b'pdf-fev', 'r.pdf', ''))
+    cache.set((1, '2025-03', 'v2'), RelatorioPronto(b'pdf-v2', 'r.pdf', ''))
+
+    assert cache.get((1, '2025-03', 'v1')) is None
+    assert cache.get((1, '2025-03', 'v2')).pdf_bytes == b'pdf-v2'
+    assert cache.get((1, '2025-02', 'v1')).pdf_bytes == b'pdf-fev'
+
+
+def test_versao_do_mes_muda_quando_um_valor_e_editado():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[Usuario.__table__, Categoria.__table__, Lancamento.__table__])
+    with Session(engine) as db:
+        db.add(Usuario(id=1, telegram_id=10, nome_completo='Ana'))
+        db.add(Lancamento(id=1, id_usuario=1, descricao='Mercado', valor=250.00, tipo='Saída',
+                          data_transacao=datetime(2025, 3, 10, 18)))
+        db.commit()
+        versao = versao_dados_mes(db, 10, '2025-03')
+
+        db.get(Lancamento, 1).valor = 260.00
+        db.commit()
+
+        assert versao is not None
+        assert versao_dados_mes(db, 10, '2025-03') != versao
+        assert versao_dados_mes(db, 10, '2025-04') is None
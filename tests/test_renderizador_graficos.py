@@ -0,0 +1,32 @@
+from gerente_financeiro.renderizador_graficos import CacheGraficos
+
+
+def test_cache_graficos_invalida_apenas_o_usuario():
+    cache = CacheGraficos(ttl_segundos=60)
+    cache.set(1, ('pizza', 'categoria', 'abc'), b'png-1')
+    cache.set(2, ('pizza', 'categoria', 'abc'), b'png-2')
+
+    cache.invalidar(1)
+
+    assert cache.get(1, ('pizza', 'categoria', 'abc')) is None
+    assert cache.get(2, ('pizza', 'categoria', 'abc')) == b'png-2'
+
+
+def test_falha_de_um_desenho_nao_derruba_o_pool():
+    import asyncio
+
+    from gerente_financeiro.renderizador_graficos import RenderizadorGraficos
+
+    renderizador = RenderizadorGraficos(max_processos=1)
+
+    async def rodar():
+        pool = renderizador._get_pool()
+        assert await renderizador._renderizar(1, ('invalido',), int, 'x') is None
+        assert renderizador._get_pool() is pool
+        return await renderizador.grafico_relatorio(1, {'Mercado': 120.0, 'Transporte': 40.0})
+
+    try:
+        png = asyncio.run(rodar())
+    finally:
+        renderizador.encerrar()
+    assert png.startswith(b'\x89PNG')
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from analytics.rollups import agregar_eventos
+
+
+def test_agregar_eventos_soma_por_hora_e_dia_com_histograma():
+    t = datetime(2026, 3, 1, 10, 15)
+    comandos = [
+        {'timestamp': t, 'command': 'relatorio', 'success': True, 'execution_time_ms': 80},
+        {'timestamp': t.replace(minute=50), 'command': 'relatorio', 'success': False, 'execution_time_ms': 4000},
+        {'timestamp': t.replace(hour=11), 'command': 'relatorio', 'success': True, 'execution_time_ms': 40000},
+    ]
+    horas, dias = agregar_eventos(comandos, [{'timestamp': t, 'command': None}])
+
+    dez = horas[(datetime(2026, 3, 1, 10), 'relatorio')]
+    assert (dez['total'], dez['successes'], dez['latency_max_ms']) == (2, 1, 4000)
+    assert (dez['b_100'], dez['b_5000']) == (1, 1)
+    assert horas[(datetime(2026, 3, 1, 10), '')]['error_logs'] == 1
+    dia = dias[(t.date(), 'relatorio')]
+    assert (dia['total'], dia['latency_sum_ms'], dia['b_inf']) == (3, 44080, 1)
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from gerente_financeiro.services import salvar_transacoes_generica
+from models import (
+    Base, Categoria, Conta, ItemLancamento, Lancamento, MerchantCategoria, Subcategoria, Usuario,
+)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine, tables=[
+        Usuario.__table__, Conta.__table__, Categoria.__table__, Subcategoria.__table__,
+        Lancamento.__table__, ItemLancamento.__table__, MerchantCategoria.__table__,
+    ])
+    sessao = Session(engine)
+    usuario = Usuario(id=1, telegram_id=10, nome_completo='Ana')
+    sessao.add_all([usuario, Conta(id=1, id_usuario=1, nome='Nubank', tipo='Conta Corrente')])
+    sessao.commit()
+    yield sessao
+    sessao.close()
+
+
+def _salvar(db, transacoes):
+    usuario = db.get(Usuario, 1)
+    return asyncio.run(salvar_transacoes_generica(db, usuario, transacoes, conta_id=1, tipo_origem='extrato'))
+
+
+def test_transacao_sem_data_e_salva_hoje_e_deduplicada(db):
+    lote = [
+        {'descricao': 'Padaria Central', 'valor': -12.5, 'data_transacao': None},
+        {'descricao': 'Padaria Central', 'valor': -12.5},
+        {'descricao': 'Mercado', 'valor': -80.0, 'data_transacao': '10/03/2025'},
+    ]
+
+    sucesso, _, stats = _salvar(db, lote)
+
+    assert sucesso
+    assert (stats['salvas'], stats['duplicadas'], stats['erro']) == (2, 1, 0)
+    datas = dict(db.query(Lancamento.descricao, Lancamento.data_transacao))
+    assert datas['Padaria Central'].date() == date.today()
+    assert datas['Mercado'].date() == date(2025, 3, 10)
+
+    # Reenvio do mesmo extrato: tudo vira duplicata, inclusive a linha sem data
+    _, _, stats = _salvar(db, lote)
+    assert (stats['salvas'], stats['duplicadas']) == (0, 3)
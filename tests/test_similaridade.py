@@ -0,0 +1,12 @@
+from gerente_financeiro.similaridade import IndiceQuaseDuplicatas
+
+
+def test_indice_quase_duplicatas_encontra_descricoes_similares():
+    indice = IndiceQuaseDuplicatas(limiar=0.6)
+    indice.adicionar_varios([
+        (1, 'NETFLIX.COM 0123 ASSINATURA'),
+        (2, 'Netflix com assinatura'),
+        (3, 'POSTO SHELL AV PAULISTA'),
+    ])
+    assert [chave for chave, _ in indice.similares('netflix com assinatura')] == [1, 2]
+    assert sorted(sorted(g) for g in indice.agrupar()) == [[1, 2], [3]]